@@ -13,10 +13,78 @@ class Config:
     
     # Database
     DB_NAME = os.getenv("DB_NAME", "supbot.db")
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 4))  # 0 — одно общее соединение
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+    DB_JOURNAL_MODE = os.getenv("DB_JOURNAL_MODE", "WAL")
+    DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+    DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", 30000))
+    DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", 268435456))
+    DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 256))
     
     # Working hours
     WORK_HOURS_START = int(os.getenv("WORK_HOURS_START", 8))
     WORK_HOURS_END = int(os.getenv("WORK_HOURS_END", 22))
+    SLOT_GRANULARITY_MINUTES = int(os.getenv("SLOT_GRANULARITY_MINUTES", 30))  # 5, 15, 30 или 60
+    
+    # Как часто планировщик ищет брони без задач (созданные сайтом и т.п.), минуты
+    SCHEDULER_SWEEP_MINUTES = int(os.getenv("SCHEDULER_SWEEP_MINUTES", 10))
+    
+    # Исходящие сообщения Telegram (лимиты: ~30 сообщений/с всего, ~1/с в чат);
+    # OUTBOX_POLL_SECONDS — как часто забирать сообщения других процессов
+    OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", 4))
+    OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 5))
+    OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", 5))
+    TG_GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", 30))
+    TG_CHAT_RATE = float(os.getenv("TG_CHAT_RATE", 1))
+    
+    # Внешние HTTP-запросы (YooKassa, погода)
+    HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 10))
+    HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 100))
+    HTTP_LIMIT_PER_HOST = int(os.getenv("HTTP_LIMIT_PER_HOST", 10))
+    HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 2))
+    
+    # Кэш погоды: TTL и период stale-while-revalidate (секунды),
+    # точность округления координат, период фонового обновления по локациям
+    # (минуты, 0 — отключено)
+    WEATHER_CACHE_TTL = float(os.getenv("WEATHER_CACHE_TTL", 600))
+    WEATHER_STALE_TTL = float(os.getenv("WEATHER_STALE_TTL", 1800))
+    WEATHER_COORD_PRECISION = int(os.getenv("WEATHER_COORD_PRECISION", 2))
+    WEATHER_PREFETCH_MINUTES = float(os.getenv("WEATHER_PREFETCH_MINUTES", 0))
+    
+    # Период сверки балансов партнеров с операциями (часы, 0 — отключено)
+    WALLET_RECONCILE_HOURS = float(os.getenv("WALLET_RECONCILE_HOURS", 24))
+    
+    # Общий кэш репозиториев (core.data): TTL записи (секунды), как часто
+    # сверять счетчики cache_versions (секунды) и размер кэша
+    DATA_CACHE_TTL = float(os.getenv("DATA_CACHE_TTL", 300))
+    DATA_CACHE_CHECK_SECONDS = float(os.getenv("DATA_CACHE_CHECK_SECONDS", 1))
+    DATA_CACHE_SIZE = int(os.getenv("DATA_CACHE_SIZE", 2048))
+    # TTL по видам справочников (секунды): изменения и так видны по
+    # cache_versions, TTL лишь ограничивает срок жизни записи
+    DATA_CACHE_TTL_LOCATIONS = float(os.getenv("DATA_CACHE_TTL_LOCATIONS", 3600))
+    DATA_CACHE_TTL_BOARDS = float(os.getenv("DATA_CACHE_TTL_BOARDS", 900))
+    DATA_CACHE_TTL_PARTNERS = float(os.getenv("DATA_CACHE_TTL_PARTNERS", 600))
+    DATA_CACHE_TTL_ADMINS = float(os.getenv("DATA_CACHE_TTL_ADMINS", 600))
+    
+    # Mini App API: max-age каталога (секунды), максимальный размер страницы
+    # и срок действия initData Telegram (секунды)
+    MINIAPP_CACHE_SECONDS = int(os.getenv("MINIAPP_CACHE_SECONDS", 60))
+    MINIAPP_PAGE_SIZE = int(os.getenv("MINIAPP_PAGE_SIZE", 50))
+    MINIAPP_INIT_DATA_TTL = int(os.getenv("MINIAPP_INIT_DATA_TTL", 86400))
+    
+    # Правила цен (services/pricing.py) в JSON — пусто: правила по умолчанию;
+    # число кэшируемых таблиц цен доска/день/длительность
+    PRICING_RULES = os.getenv("PRICING_RULES", "")
+    PRICE_TABLE_CACHE_SIZE = int(os.getenv("PRICE_TABLE_CACHE_SIZE", 1024))
+    
+    # Удержание места на время оформления брони (services/holds.py), секунды;
+    # продлевается на каждом шаге выбора
+    HOLD_TTL_SECONDS = int(os.getenv("HOLD_TTL_SECONDS", 600))
+    
+    # Кэш занятости (services/occupancy.py): число карт доска/день в памяти
+    # и сколько часов хранить журнал изменений occupancy_changes
+    OCCUPANCY_CACHE_MAPS = int(os.getenv("OCCUPANCY_CACHE_MAPS", 20000))
+    OCCUPANCY_LOG_HOURS = int(os.getenv("OCCUPANCY_LOG_HOURS", 24))
     
     # Payment timeout (minutes)
     PAYMENT_TIMEOUT_MINUTES = int(os.getenv("PAYMENT_TIMEOUT_MINUTES", 30))
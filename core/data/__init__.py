@@ -0,0 +1,11 @@
+"""Общий слой доступа к данным: репозитории, кэш, синхронный мост"""
+from core.data.cache import VersionedCache
+from core.data.repository import (
+    AdminRepository, BookingRepository, BoardRepository, DataStore, LocationRepository, PartnerRepository, get_store
+)
+from core.data.sync import apply_sqlite_pragmas, get_sync_store, run_sync
+
+__all__ = [
+    "VersionedCache", "DataStore", "get_store", "get_sync_store", "run_sync", "apply_sqlite_pragmas",
+    "LocationRepository", "BoardRepository", "PartnerRepository", "AdminRepository", "BookingRepository",
+]
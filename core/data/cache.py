@@ -0,0 +1,84 @@
+"""Общий read-through кэш с инвалидацией по cache_versions
+
+Каждая запись помнит версии таблиц, из которых собрана. Версии ведут
+триггеры в самой БД (core/schema.py, миграция cache_versions сайта),
+поэтому запись бота сбрасывает кэш сайта и Mini App, и наоборот: процесс
+сверяет версии не чаще раза в check_interval секунд одним запросом
+к маленькой таблице.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Tuple
+from core.database import Database
+from config import Config
+
+
+class VersionedCache:
+    """LRU-кэш с TTL, записи которого устаревают при смене версий таблиц"""
+
+    def __init__(
+        self,
+        db: Database,
+        ttl: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        check_interval: Optional[float] = None
+    ):
+        self.db = db
+        self.ttl = Config.DATA_CACHE_TTL if ttl is None else ttl
+        self.max_entries = max_entries or Config.DATA_CACHE_SIZE
+        self.check_interval = Config.DATA_CACHE_CHECK_SECONDS if check_interval is None else check_interval
+        # ключ -> (истекает, версии таблиц, значение)
+        self._entries: "OrderedDict[Hashable, Tuple[float, Tuple[int, ...], Any]]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._checked = float("-inf")
+        self.hits = 0
+        self.misses = 0
+
+    async def versions(self) -> Dict[str, int]:
+        """Текущие версии таблиц (перечитываются не чаще check_interval)"""
+        now = time.monotonic()
+        if now - self._checked >= self.check_interval:
+            rows = await self.db.fetchall("SELECT name, version FROM cache_versions")
+            self._versions = {row['name']: row['version'] for row in rows}
+            self._checked = now
+        return self._versions
+
+    async def get_or_load(
+        self,
+        key: Hashable,
+        tables: Iterable[str],
+        loader: Callable[[], Awaitable[Any]],
+        ttl: Optional[float] = None
+    ) -> Any:
+        """Значение из кэша или результат loader()
+
+        ttl — срок жизни записи вместо общего (у каждого вида данных свой).
+        Версии фиксируются до загрузки: если таблица изменится во время
+        loader(), запись сразу окажется устаревшей.
+        """
+        versions = await self.versions()
+        stamp = tuple(versions.get(table, 0) for table in tables)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic() and entry[1] == stamp:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+        self.misses += 1
+        value = await loader()
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), stamp, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self):
+        """Сброс после записи в этом процессе: версии перечитываются сразу
+
+        Сами версии в БД уже увеличили триггеры в транзакции записи.
+        """
+        self._checked = float("-inf")
+
+    def clear(self):
+        self._entries.clear()
+        self.invalidate()
@@ -0,0 +1,195 @@
+"""Репозитории локаций, досок, партнеров и бронирований
+
+Общий слой доступа к данным для бота, сайта и Mini App. Справочные
+данные (локации, доски, фото досок, партнеры, админы) читаются через
+общий VersionedCache, у каждого вида данных свой TTL (DATA_CACHE_TTL_*);
+брони меняются слишком часто и читаются напрямую. Значения из кэша
+общие для всех вызывающих — их нельзя изменять.
+"""
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional
+from config import Config
+from core.database import Database
+from core.data.cache import VersionedCache
+
+
+class _Repository:
+    # Имя настройки Config с TTL записей репозитория (None — общий DATA_CACHE_TTL)
+    ttl_setting: Optional[str] = None
+
+    def __init__(self, store: "DataStore"):
+        self.db = store.db
+        self.cache = store.cache
+        self.ttl = getattr(Config, self.ttl_setting) if self.ttl_setting else None
+
+    def _cached(self, key: Hashable, tables: Iterable[str], loader: Callable[[], Awaitable[Any]]):
+        return self.cache.get_or_load(key, tables, loader, ttl=self.ttl)
+
+
+class LocationRepository(_Repository):
+    """Локации"""
+    ttl_setting = "DATA_CACHE_TTL_LOCATIONS"
+
+    async def active(self) -> List[Dict[str, Any]]:
+        """Активные локации по алфавиту"""
+        return await self._cached(
+            ("locations", "active"), ("locations",),
+            lambda: self.db.fetchall("SELECT * FROM locations WHERE is_active = 1 ORDER BY name")
+        )
+
+    async def get(self, location_id: int) -> Optional[Dict[str, Any]]:
+        return await self._cached(
+            ("location", location_id), ("locations",),
+            lambda: self.db.fetchone("SELECT * FROM locations WHERE id = ?", (location_id,))
+        )
+
+    async def page(self, after_id: int = 0, limit: int = 50) -> List[Dict[str, Any]]:
+        """Страница активных локаций по id после курсора after_id"""
+        return await self._cached(
+            ("locations", "page", after_id, limit), ("locations",),
+            lambda: self.db.fetchall(
+                "SELECT * FROM locations WHERE is_active = 1 AND id > ? ORDER BY id LIMIT ?",
+                (after_id, limit)
+            )
+        )
+
+
+class BoardRepository(_Repository):
+    """Доски"""
+    ttl_setting = "DATA_CACHE_TTL_BOARDS"
+
+    async def by_location(self, location_id: int) -> List[Dict[str, Any]]:
+        """Активные доски локации по алфавиту"""
+        return await self._cached(
+            ("boards", "location", location_id), ("boards",),
+            lambda: self.db.fetchall(
+                "SELECT * FROM boards WHERE location_id = ? AND is_active = 1 ORDER BY name",
+                (location_id,)
+            )
+        )
+
+    async def get(self, board_id: int) -> Optional[Dict[str, Any]]:
+        return await self._cached(
+            ("board", board_id), ("boards",),
+            lambda: self.db.fetchone("SELECT * FROM boards WHERE id = ?", (board_id,))
+        )
+
+    async def page(self, location_id: int, after_id: int = 0, limit: int = 50) -> List[Dict[str, Any]]:
+        """Страница активных досок локации по id после курсора after_id"""
+        return await self._cached(
+            ("boards", "page", location_id, after_id, limit), ("boards",),
+            lambda: self.db.fetchall(
+                """SELECT * FROM boards
+                   WHERE location_id = ? AND is_active = 1 AND id > ?
+                   ORDER BY id LIMIT ?""",
+                (location_id, after_id, limit)
+            )
+        )
+
+    async def active(self) -> List[Dict[str, Any]]:
+        """Активные доски активных локаций (одним запросом для всех локаций)"""
+        return await self._cached(
+            ("boards", "active"), ("boards", "locations"),
+            lambda: self.db.fetchall(
+                """SELECT b.* FROM boards b
+                   JOIN locations l ON l.id = b.location_id
+                   WHERE b.is_active = 1 AND l.is_active = 1
+                   ORDER BY b.location_id, b.name"""
+            )
+        )
+
+    async def images(self, board_id: int) -> List[Dict[str, Any]]:
+        """Фото доски в порядке добавления"""
+        return await self._cached(
+            ("board_images", board_id), ("board_images",),
+            lambda: self.db.fetchall(
+                "SELECT id, file_id FROM board_images WHERE board_id = ? ORDER BY created_at, id",
+                (board_id,)
+            )
+        )
+
+
+class PartnerRepository(_Repository):
+    """Партнеры"""
+    ttl_setting = "DATA_CACHE_TTL_PARTNERS"
+
+    async def get(self, partner_id: int) -> Optional[Dict[str, Any]]:
+        return await self._cached(
+            ("partner", partner_id), ("partners",),
+            lambda: self.db.fetchone("SELECT * FROM partners WHERE id = ?", (partner_id,))
+        )
+
+    async def by_telegram(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        return await self._cached(
+            ("partner", "telegram", telegram_id), ("partners",),
+            lambda: self.db.fetchone("SELECT * FROM partners WHERE telegram_id = ?", (telegram_id,))
+        )
+
+    async def approved(self, telegram_id: int, active: bool = False) -> Optional[Dict[str, Any]]:
+        """Одобренный (при active=True — еще и активный) партнер по Telegram ID или None"""
+        partner = await self.by_telegram(telegram_id)
+        if not partner or not partner['is_approved'] or (active and not partner['is_active']):
+            return None
+        return partner
+
+
+class AdminRepository(_Repository):
+    """Администраторы (таблица admins и ADMIN_IDS из конфига)"""
+    ttl_setting = "DATA_CACHE_TTL_ADMINS"
+
+    async def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        return await self._cached(
+            ("admin", user_id), ("admins",),
+            lambda: self.db.fetchone("SELECT * FROM admins WHERE user_id = ?", (user_id,))
+        )
+
+    async def is_admin(self, user_id: int) -> bool:
+        return user_id in Config.ADMIN_IDS or await self.get(user_id) is not None
+
+
+class BookingRepository(_Repository):
+    """Бронирования (без кэша)"""
+
+    async def get(self, booking_id: int) -> Optional[Dict[str, Any]]:
+        return await self.db.fetchone("SELECT * FROM bookings WHERE id = ?", (booking_id,))
+
+    async def mark_paid(self, booking_id: int, payment_id: str) -> bool:
+        """Активация брони после оплаты; False — брони нет"""
+        cursor = await self.db.execute(
+            "UPDATE bookings SET status = 'active', payment_id = ? WHERE id = ?",
+            (payment_id, booking_id)
+        )
+        return cursor.rowcount > 0
+
+
+class DataStore:
+    """Репозитории над одним экземпляром БД с общим кэшем"""
+
+    def __init__(self, db: Database, cache: Optional[VersionedCache] = None):
+        self.db = db
+        self.cache = cache or VersionedCache(db)
+        self.locations = LocationRepository(self)
+        self.boards = BoardRepository(self)
+        self.partners = PartnerRepository(self)
+        self.admins = AdminRepository(self)
+        self.bookings = BookingRepository(self)
+
+    def invalidate(self):
+        """Хук после записи в справочные таблицы в обход репозиториев
+
+        Версии в БД увеличивают триггеры (их видят и другие процессы);
+        хук заставляет этот процесс перечитать их сразу, а не через
+        DATA_CACHE_CHECK_SECONDS, чтобы следующий экран показал изменения.
+        """
+        self.cache.invalidate()
+
+
+_stores: "weakref.WeakKeyDictionary[Database, DataStore]" = weakref.WeakKeyDictionary()
+
+
+def get_store(db: Database) -> DataStore:
+    """Общие репозитории для экземпляра БД"""
+    store = _stores.get(db)
+    if store is None:
+        store = _stores[db] = DataStore(db)
+    return store
@@ -0,0 +1,53 @@
+"""Репозитории из синхронных приложений (Flask, Django)
+
+На процесс — один фоновый поток с event loop: в нем живут Database и его
+пул соединений, а обработчики запросов из любых потоков ждут результат
+через run_sync. Соединения sqlite3, открытые самим приложением (Django),
+получают те же PRAGMA через apply_sqlite_pragmas.
+"""
+import asyncio
+import sqlite3
+import threading
+from typing import Any, Awaitable, Optional
+from core.database import Database, sqlite_pragmas
+from core.data.repository import DataStore
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_store: Optional[DataStore] = None
+_loop_lock = threading.Lock()
+_store_lock = threading.Lock()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="data-loop", daemon=True).start()
+            _loop = loop
+    return _loop
+
+
+def run_sync(coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+    """Выполнение корутины в общем цикле с ожиданием результата"""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result(timeout)
+
+
+def get_sync_store(db_path: Optional[str] = None) -> DataStore:
+    """Репозитории процесса для синхронного кода
+
+    Соединения открываются при первом вызове; db_path учитывается только в нем.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            db = Database(db_path)
+            run_sync(db.connect())
+            _store = DataStore(db)
+    return _store
+
+
+def apply_sqlite_pragmas(conn: sqlite3.Connection, db_path: str):
+    """Те же PRAGMA, что у соединений Database"""
+    for pragma in sqlite_pragmas(db_path):
+        conn.execute(pragma)
@@ -1,100 +1,379 @@
 """Асинхронная обертка для работы с SQLite"""
+import asyncio
+import contextvars
+import itertools
+import time
 import aiosqlite
 import logging
-from typing import Optional, List, Dict, Any
+from collections import OrderedDict
+from collections.abc import Mapping
+from contextlib import asynccontextmanager
+from typing import Optional, List, Dict, Any, AsyncIterator, Callable, Tuple
 from config import Config
 
 logger = logging.getLogger(__name__)
 
 
+class PoolStats:
+    """Метрики ожидания соединений пула"""
+
+    def __init__(self):
+        self.acquired = 0
+        self.waited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait: float):
+        """Учет одного получения соединения"""
+        self.acquired += 1
+        if wait > 0.001:
+            self.waited += 1
+        self.total_wait += wait
+        if wait > self.max_wait:
+            self.max_wait = wait
+
+    def as_dict(self) -> Dict[str, Any]:
+        avg = self.total_wait / self.acquired if self.acquired else 0.0
+        return {
+            "acquired": self.acquired,
+            "waited": self.waited,
+            "avg_wait_ms": round(avg * 1000, 3),
+            "max_wait_ms": round(self.max_wait * 1000, 3),
+        }
+
+
+class Row(Mapping):
+    """Строка результата: кортеж значений и общий для запроса индекс колонок
+
+    Поддерживает row['name'], row.get('name'), dict(row) и row[0],
+    но не создает отдельный словарь на каждую строку. При повторяющихся
+    именах колонок (JOIN без псевдонимов) по имени доступно последнее
+    значение, как в dict от fetchone; len() и итерация идут по именам,
+    все значения — по номеру.
+    """
+
+    __slots__ = ("_index", "_values")
+
+    def __init__(self, index: Dict[str, int], values: tuple):
+        self._index = index
+        self._values = values
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return self._values[key]
+        return self._values[self._index[key]]
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __repr__(self):
+        return f"Row({dict(self)!r})"
+
+
+def sqlite_pragmas(db_path: str) -> List[str]:
+    """PRAGMA для каждого нового соединения (общие для бота, сайта и Mini App)"""
+    pragmas = [
+        "PRAGMA foreign_keys = ON",
+        f"PRAGMA busy_timeout = {int(Config.DB_BUSY_TIMEOUT_MS)}",
+    ]
+    if db_path != ":memory:":
+        pragmas += [
+            f"PRAGMA journal_mode = {Config.DB_JOURNAL_MODE}",
+            f"PRAGMA synchronous = {Config.DB_SYNCHRONOUS}",
+            f"PRAGMA mmap_size = {int(Config.DB_MMAP_SIZE)}",
+        ]
+    return pragmas
+
+
 class Database:
-    """Класс для работы с базой данных"""
-    
-    def __init__(self, db_path: Optional[str] = None):
+    """Класс для работы с базой данных
+
+    В пуловом режиме (pool_size > 0) держит одно соединение-писатель,
+    доступ к которому сериализован, и pool_size соединений для чтения.
+    В WAL-режиме читатели не блокируются писателем, поэтому тяжелые
+    отчеты не задерживают обработку бронирований.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, pool_size: Optional[int] = None):
         self.db_path = db_path or Config.DB_NAME
+        if pool_size is None:
+            pool_size = Config.DB_POOL_SIZE
+        # In-memory БД у каждого соединения своя — пул для нее не имеет смысла
+        if self.db_path == ":memory:":
+            pool_size = 0
+        self.pool_size = max(0, pool_size)
         self._connection: Optional[aiosqlite.Connection] = None
-    
+        self._write_lock = asyncio.Lock()
+        self._readers: List[aiosqlite.Connection] = []
+        self._read_pool: Optional[asyncio.Queue] = None
+        self._write_stats = PoolStats()
+        self._read_stats = PoolStats()
+        # Текущая транзакция задачи: [соединение, глубина вложенности, after_commit-колбэки]
+        self._tx = contextvars.ContextVar(f"db_tx_{id(self)}", default=None)
+        self._savepoint_ids = itertools.count(1)
+        # Индексы колонок по тексту запроса (LRU): (число колонок, индекс)
+        self._row_index: "OrderedDict[str, Tuple[int, Dict[str, int]]]" = OrderedDict()
+
+    async def _open_connection(self) -> aiosqlite.Connection:
+        """Открытие соединения с настройкой PRAGMA"""
+        conn = await aiosqlite.connect(
+            self.db_path,
+            timeout=Config.DB_BUSY_TIMEOUT_MS / 1000,
+            # Кэш подготовленных выражений sqlite3, ключ — текст запроса
+            cached_statements=Config.DB_STATEMENT_CACHE_SIZE
+        )
+        for pragma in sqlite_pragmas(self.db_path):
+            await conn.execute(pragma)
+        await conn.commit()
+        return conn
+
     async def connect(self):
         """Подключение к базе данных"""
         if self._connection is None:
-            self._connection = await aiosqlite.connect(
-                self.db_path,
-                timeout=30.0
-            )
-            # Включить поддержку foreign keys
-            await self._connection.execute("PRAGMA foreign_keys = ON")
-            await self._connection.commit()
-            logger.info(f"Connected to database: {self.db_path}")
-    
+            self._connection = await self._open_connection()
+            if self.pool_size:
+                self._read_pool = asyncio.Queue()
+                for _ in range(self.pool_size):
+                    reader = await self._open_connection()
+                    self._readers.append(reader)
+                    self._read_pool.put_nowait(reader)
+            logger.info(f"Connected to database: {self.db_path} (read pool: {self.pool_size})")
+
     async def close(self):
         """Закрытие соединения"""
+        for reader in self._readers:
+            await reader.close()
+        self._readers = []
+        self._read_pool = None
         if self._connection:
             await self._connection.close()
             self._connection = None
             logger.info("Database connection closed")
-    
-    async def execute(self, query: str, parameters: tuple = ()) -> aiosqlite.Cursor:
-        """Выполнение запроса"""
+
+    @asynccontextmanager
+    async def _writer(self):
+        """Эксклюзивный доступ к соединению-писателю"""
+        tx = self._tx.get()
+        if tx is not None:
+            # Блокировка уже удерживается открытой транзакцией
+            yield tx[0]
+            return
         if self._connection is None:
             await self.connect()
-        try:
-            cursor = await self._connection.execute(query, parameters)
-            await self._connection.commit()
-            return cursor
-        except Exception as e:
-            logger.error(f"Database error: {e}, Query: {query}, Params: {parameters}")
-            raise
-    
-    async def executemany(self, query: str, parameters: List[tuple]) -> aiosqlite.Cursor:
-        """Выполнение запроса с несколькими параметрами"""
+        started = time.monotonic()
+        async with self._write_lock:
+            self._write_stats.record(time.monotonic() - started)
+            yield self._connection
+
+    @asynccontextmanager
+    async def _reader(self):
+        """Соединение для чтения из пула (или писатель без пула)"""
+        tx = self._tx.get()
+        if tx is not None:
+            # Внутри транзакции читаем свои же незафиксированные записи
+            yield tx[0]
+            return
         if self._connection is None:
             await self.connect()
+        if self._read_pool is None:
+            async with self._writer() as conn:
+                yield conn
+            return
+        started = time.monotonic()
+        conn = await asyncio.wait_for(self._read_pool.get(), timeout=Config.DB_POOL_TIMEOUT)
+        self._read_stats.record(time.monotonic() - started)
         try:
-            cursor = await self._connection.executemany(query, parameters)
-            await self._connection.commit()
-            return cursor
-        except Exception as e:
-            logger.error(f"Database error: {e}, Query: {query}")
-            raise
-    
+            yield conn
+        finally:
+            self._read_pool.put_nowait(conn)
+
+    def in_transaction(self) -> bool:
+        """Выполняется ли текущая задача внутри transaction()"""
+        return self._tx.get() is not None
+
+    def after_commit(self, callback: Callable[[], Any]):
+        """Вызов callback после фиксации текущей транзакции (или сразу вне ее)
+
+        При откате транзакции или SAVEPOINT, внутри которого callback
+        зарегистрирован, он не вызывается.
+        """
+        tx = self._tx.get()
+        if tx is None:
+            callback()
+        else:
+            tx[2].append(callback)
+
+    @asynccontextmanager
+    async def transaction(self, immediate: bool = False):
+        """Явная транзакция: один COMMIT в конце блока
+
+        Запросы execute/executemany внутри блока не фиксируются по
+        отдельности. Вложенные вызовы открывают SAVEPOINT, так что
+        ошибка во внутреннем блоке откатывает только его изменения.
+        immediate=True сразу берет блокировку записи (BEGIN IMMEDIATE).
+        """
+        tx = self._tx.get()
+        if tx is not None:
+            conn = tx[0]
+            name = f"sp_{next(self._savepoint_ids)}"
+            await conn.execute(f"SAVEPOINT {name}")
+            tx[1] += 1
+            callbacks = len(tx[2])
+            try:
+                yield self
+            except BaseException:
+                del tx[2][callbacks:]
+                await conn.execute(f"ROLLBACK TO SAVEPOINT {name}")
+                await conn.execute(f"RELEASE SAVEPOINT {name}")
+                raise
+            else:
+                await conn.execute(f"RELEASE SAVEPOINT {name}")
+            finally:
+                tx[1] -= 1
+            return
+
+        async with self._writer() as conn:
+            await conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            # [соединение, глубина вложенности, колбэки after_commit]
+            tx = [conn, 1, []]
+            token = self._tx.set(tx)
+            try:
+                yield self
+            except BaseException:
+                await conn.rollback()
+                raise
+            else:
+                await conn.commit()
+            finally:
+                self._tx.reset(token)
+        for callback in tx[2]:
+            callback()
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Метрики ожидания соединений"""
+        return {
+            "pool_size": self.pool_size,
+            "readers_idle": self._read_pool.qsize() if self._read_pool else 0,
+            "read": self._read_stats.as_dict(),
+            "write": self._write_stats.as_dict(),
+        }
+
+    async def execute(self, query: str, parameters: tuple = ()) -> aiosqlite.Cursor:
+        """Выполнение запроса (фиксируется сразу, если нет открытой транзакции)"""
+        async with self._writer() as conn:
+            try:
+                cursor = await conn.execute(query, parameters)
+                if not self.in_transaction():
+                    await conn.commit()
+                if query.lstrip()[:5].upper() == "ALTER":
+                    self._row_index.clear()
+                return cursor
+            except Exception as e:
+                logger.error(f"Database error: {e}, Query: {query}, Params: {parameters}")
+                raise
+
+    async def executemany(self, query: str, parameters: List[tuple]) -> aiosqlite.Cursor:
+        """Выполнение запроса с несколькими параметрами"""
+        async with self._writer() as conn:
+            try:
+                cursor = await conn.executemany(query, parameters)
+                if not self.in_transaction():
+                    await conn.commit()
+                return cursor
+            except Exception as e:
+                logger.error(f"Database error: {e}, Query: {query}")
+                raise
+
+    def _index_for(self, query: str, description) -> Dict[str, int]:
+        """Индекс колонок для запроса, общий для всех его строк"""
+        cached = self._row_index.get(query)
+        # Число колонок сверяется с description, а не с индексом: при
+        # повторяющихся именах в индексе их меньше
+        if cached is not None and cached[0] == len(description):
+            self._row_index.move_to_end(query)
+            return cached[1]
+        index = {d[0]: i for i, d in enumerate(description)}
+        self._row_index[query] = (len(description), index)
+        if len(self._row_index) > Config.DB_STATEMENT_CACHE_SIZE:
+            self._row_index.popitem(last=False)
+        return index
+
     async def fetchone(self, query: str, parameters: tuple = ()) -> Optional[Dict[str, Any]]:
         """Получение одной записи"""
-        if self._connection is None:
-            await self.connect()
-        try:
-            cursor = await self._connection.execute(query, parameters)
-            row = await cursor.fetchone()
-            if row is None:
-                return None
-            columns = [description[0] for description in cursor.description]
-            return dict(zip(columns, row))
-        except Exception as e:
-            logger.error(f"Database error: {e}, Query: {query}, Params: {parameters}")
-            raise
-    
-    async def fetchall(self, query: str, parameters: tuple = ()) -> List[Dict[str, Any]]:
-        """Получение всех записей"""
-        if self._connection is None:
-            await self.connect()
-        try:
-            cursor = await self._connection.execute(query, parameters)
-            rows = await cursor.fetchall()
-            columns = [description[0] for description in cursor.description]
-            return [dict(zip(columns, row)) for row in rows]
-        except Exception as e:
-            logger.error(f"Database error: {e}, Query: {query}, Params: {parameters}")
-            raise
-    
-    async def execute_script(self, script: str):
-        """Выполнение SQL скрипта"""
-        if self._connection is None:
-            await self.connect()
-        try:
-            await self._connection.executescript(script)
-            await self._connection.commit()
-        except Exception as e:
-            logger.error(f"Database script error: {e}")
-            raise
+        async with self._reader() as conn:
+            try:
+                cursor = await conn.execute(query, parameters)
+                row = await cursor.fetchone()
+                if row is None:
+                    return None
+                columns = [description[0] for description in cursor.description]
+                return dict(zip(columns, row))
+            except Exception as e:
+                logger.error(f"Database error: {e}, Query: {query}, Params: {parameters}")
+                raise
+
+    async def fetchall(self, query: str, parameters: tuple = (), as_rows: bool = False) -> List[Dict[str, Any]]:
+        """Получение всех записей
 
+        as_rows=True возвращает легкие Row вместо словарей — для списков,
+        которые только читаются (клавиатуры, каталоги).
+        """
+        async with self._reader() as conn:
+            try:
+                cursor = await conn.execute(query, parameters)
+                rows = await cursor.fetchall()
+                if as_rows:
+                    index = self._index_for(query, cursor.description)
+                    return [Row(index, row) for row in rows]
+                columns = [description[0] for description in cursor.description]
+                return [dict(zip(columns, row)) for row in rows]
+            except Exception as e:
+                logger.error(f"Database error: {e}, Query: {query}, Params: {parameters}")
+                raise
 
+    async def fetchall_iter(self, query: str, parameters: tuple = (), chunk_size: int = 500) -> AsyncIterator[Row]:
+        """Потоковое чтение большого результата порциями по chunk_size
 
+        Соединение из пула занято до конца итерации; при досрочном выходе
+        используйте contextlib.aclosing, чтобы сразу вернуть его в пул.
+        Без пула результат читается целиком, иначе запись внутри цикла
+        ждала бы освобождения того же соединения.
+        """
+        if self._read_pool is None and not self.in_transaction():
+            for row in await self.fetchall(query, parameters, as_rows=True):
+                yield row
+            return
+        async with self._reader() as conn:
+            try:
+                cursor = await conn.execute(query, parameters)
+            except Exception as e:
+                logger.error(f"Database error: {e}, Query: {query}, Params: {parameters}")
+                raise
+            try:
+                index = self._index_for(query, cursor.description)
+                while True:
+                    chunk = await cursor.fetchmany(chunk_size)
+                    if not chunk:
+                        break
+                    for row in chunk:
+                        yield Row(index, row)
+            finally:
+                await cursor.close()
+
+    async def execute_script(self, script: str):
+        """Выполнение SQL скрипта"""
+        if self.in_transaction():
+            # executescript сам выполняет COMMIT и разорвал бы транзакцию
+            raise RuntimeError("execute_script cannot run inside a transaction")
+        async with self._writer() as conn:
+            try:
+                await conn.executescript(script)
+                await conn.commit()
+                # DDL мог изменить набор колонок у SELECT *
+                self._row_index.clear()
+            except Exception as e:
+                logger.error(f"Database script error: {e}")
+                raise
@@ -0,0 +1,159 @@
+"""Общий асинхронный HTTP-клиент для внешних API (YooKassa, погода)
+
+Одна aiohttp-сессия на процесс: пул соединений с keep-alive, ограничение
+одновременных запросов на хост, таймауты и повторы с экспоненциальной
+задержкой и случайным разбросом (jitter). Синхронный requests в обработчиках
+блокировал event loop aiogram на время запроса.
+"""
+import asyncio
+import json
+import logging
+import random
+from typing import Any, Dict, Optional
+import aiohttp
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Ответы, после которых запрос имеет смысл повторить
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HttpError(Exception):
+    """Ответ с кодом ошибки (после всех повторов)"""
+
+    def __init__(self, status: int, body: str, url: str):
+        super().__init__(f"HTTP {status} for {url}: {body[:200]}")
+        self.status = status
+        self.body = body
+        self.url = url
+
+
+class HttpClient:
+    """Пул соединений с повторами запросов"""
+
+    def __init__(
+        self,
+        timeout: Optional[float] = None,
+        limit: Optional[int] = None,
+        limit_per_host: Optional[int] = None,
+        retries: Optional[int] = None,
+        backoff: float = 0.5
+    ):
+        self.timeout = timeout if timeout is not None else Config.HTTP_TIMEOUT
+        self.limit = limit or Config.HTTP_POOL_SIZE
+        self.limit_per_host = limit_per_host or Config.HTTP_LIMIT_PER_HOST
+        self.retries = retries if retries is not None else Config.HTTP_RETRIES
+        self.backoff = backoff
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        # Сессия привязана к event loop — при смене цикла создаем новую,
+        # закрыв прежнюю
+        if self._session is None or self._session.closed or self._loop is not loop:
+            if self._session is not None and self._loop is not loop:
+                await self._close_stale(self._session, self._loop)
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=300,
+                keepalive_timeout=30
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            self._loop = loop
+        return self._session
+
+    @staticmethod
+    async def _close_stale(session: aiohttp.ClientSession, loop: Optional[asyncio.AbstractEventLoop]):
+        """Закрытие сессии прежнего event loop — в нем самом: соединения
+        привязаны к циклу, в котором открыты"""
+        if session.closed:
+            return
+        try:
+            if loop is None or loop.is_closed():
+                # Закрыть соединения через закрытый цикл уже нельзя
+                session.detach()
+            elif loop.is_running():
+                # Цикл работает в другом потоке
+                await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(session.close(), loop))
+            else:
+                await asyncio.to_thread(loop.run_until_complete, session.close())
+        except Exception as e:
+            logger.warning(f"Failed to close HTTP session of a previous event loop: {e!r}")
+
+    async def close(self):
+        """Закрытие сессии (при остановке бота)"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _delay(self, attempt: int) -> float:
+        # Full jitter: случайная задержка от 0 до backoff * 2^attempt
+        return random.uniform(0, self.backoff * (2 ** attempt))
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        params: Optional[Dict[str, Any]] = None,
+        json_body: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        auth: Optional[aiohttp.BasicAuth] = None,
+        timeout: Optional[float] = None,
+        retries: Optional[int] = None
+    ) -> Any:
+        """Запрос с разбором JSON-ответа
+
+        Повторяются сетевые ошибки, таймауты и ответы 429/5xx. Для POST
+        повтор безопасен, только если API идемпотентно (у YooKassa —
+        заголовок Idempotence-Key, одинаковый для всех попыток).
+        """
+        retries = self.retries if retries is None else retries
+        request_timeout = aiohttp.ClientTimeout(total=timeout) if timeout else None
+        attempt = 0
+        while True:
+            try:
+                session = await self._get_session()
+                async with session.request(
+                    method, url, params=params, json=json_body, headers=headers,
+                    auth=auth, timeout=request_timeout
+                ) as response:
+                    body = await response.text()
+                    if response.status in RETRY_STATUSES and attempt < retries:
+                        retry_after = response.headers.get("Retry-After")
+                        delay = float(retry_after) if retry_after and retry_after.isdigit() else self._delay(attempt)
+                        logger.warning(f"HTTP {response.status} from {url}, retry in {delay:.2f}s")
+                    elif response.status >= 400:
+                        raise HttpError(response.status, body, url)
+                    else:
+                        return json.loads(body) if body else None
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt >= retries:
+                    raise
+                delay = self._delay(attempt)
+                logger.warning(f"HTTP {method} {url} failed ({e!r}), retry in {delay:.2f}s")
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def get_json(self, url: str, **kwargs) -> Any:
+        return await self.request("GET", url, **kwargs)
+
+    async def post_json(self, url: str, json_body: Dict[str, Any], **kwargs) -> Any:
+        return await self.request("POST", url, json_body=json_body, **kwargs)
+
+
+_client: Optional[HttpClient] = None
+
+
+def get_http_client() -> HttpClient:
+    """Общий HTTP-клиент процесса"""
+    global _client
+    if _client is None:
+        _client = HttpClient()
+    return _client
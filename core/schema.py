@@ -105,6 +105,44 @@ async def init_db(db: Database):
     CREATE INDEX IF NOT EXISTS idx_bookings_status ON bookings(status);
     CREATE INDEX IF NOT EXISTS idx_bookings_user ON bookings(user_id);
 
+    -- Группы мультиброни: id группы выдает AUTOINCREMENT, без коллизий
+    -- между процессами (bookings.group_id)
+    CREATE TABLE IF NOT EXISTS booking_groups (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    -- Отложенные задачи по броням (notifications/job_queue.py)
+    CREATE TABLE IF NOT EXISTS scheduled_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        booking_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        due_at TIMESTAMP NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (booking_id, kind)
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_jobs_status_due ON scheduled_jobs(status, due_at);
+
+    -- Исходящие сообщения Telegram (notifications/outbox.py)
+    CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id INTEGER NOT NULL,
+        text TEXT NOT NULL,
+        parse_mode TEXT,
+        reply_markup TEXT,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER DEFAULT 0,
+        last_error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        sent_at TIMESTAMP
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_outbox_status ON outbox(status, id);
+
     -- Partner wallet operations
     CREATE TABLE IF NOT EXISTS partner_wallet_ops (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -155,6 +193,14 @@ async def init_db(db: Database):
         FOREIGN KEY (partner_id) REFERENCES partners(id) ON DELETE CASCADE
     );
 
+    -- Expenses (ручные расходы площадки, как на сайте)
+    CREATE TABLE IF NOT EXISTS expenses (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date TEXT NOT NULL,
+        amount REAL NOT NULL,
+        description TEXT
+    );
+
     -- Board images
     CREATE TABLE IF NOT EXISTS board_images (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -182,9 +228,22 @@ async def init_db(db: Database):
         FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
         FOREIGN KEY (booking_id) REFERENCES bookings(id) ON DELETE SET NULL
     );
+    
+    -- Сводка оценок: сумма и число отзывов по доске, локации и партнеру
+    -- (обновляется ReviewService при создании и удалении отзыва, при
+    -- удалении броней, досок и пользователей — RATING_STATS_TRIGGERS_SQL)
+    CREATE TABLE IF NOT EXISTS rating_stats (
+        scope TEXT NOT NULL CHECK(scope IN ('board', 'location', 'partner')),
+        scope_id INTEGER NOT NULL,
+        rating_sum INTEGER NOT NULL DEFAULT 0,
+        rating_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (scope, scope_id)
+    ) WITHOUT ROWID;
     """
     
     await db.execute_script(schema_sql)
+    for query in CAPACITY_HOLDS_SQL:
+        await db.execute(query)
     
     # Миграция: добавление поля payment_deadline если его нет
     try:
@@ -202,5 +261,561 @@ async def init_db(db: Database):
         # Колонка уже существует, это нормально
         pass
     
+    # Миграция: абсолютные минуты начала/конца брони (start_at/end_at),
+    # чтобы запросы на пересечения шли по индексу, а не по выражению
+    # start_time * 60 + start_minute + duration
+    for column in ("start_at", "end_at"):
+        try:
+            await db.execute(f"ALTER TABLE bookings ADD COLUMN {column} INTEGER")
+            logger.info(f"Added {column} column to bookings table")
+        except Exception:
+            # Колонка уже существует, это нормально
+            pass
+    
+    # Сайт хранит длительность почасовых броней в часах, бот — в минутах
+    await db.execute(
+        f"""UPDATE bookings 
+           SET start_at = {_START_AT_SQL.format(row='bookings')},
+               end_at = {_START_AT_SQL.format(row='bookings')} + {_DURATION_MINUTES_SQL.format(row='bookings')}
+           WHERE start_at IS NULL AND start_time IS NOT NULL"""
+    )
+    await db.execute(BOOKING_END_REPAIR_SQL)
+    # Триггеры прежних версий считали duration только минутами
+    await db.execute("DROP TRIGGER IF EXISTS trg_bookings_time_insert")
+    await db.execute("DROP TRIGGER IF EXISTS trg_bookings_time_update")
+    await db.execute_script(_TIME_INDEX_SQL)
+    
+    # Балансы партнеров и сотрудников и финансовые итоги по дням ведутся
+    # триггерами в той же транзакции, что и операция. Таблицы, триггеры и
+    # первичное заполнение создаются атомарно: запись между созданием
+    # триггера и заполнением учлась бы дважды
+    for trigger, ledger_sql, balances_table, backfill_sql in _LEDGERS:
+        async with db.transaction(immediate=True):
+            if not await db.fetchone(
+                "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = ?", (trigger,)
+            ):
+                for query in ledger_sql:
+                    await db.execute(query)
+                await db.execute(f"DELETE FROM {balances_table}")
+                await db.execute(backfill_sql)
+                logger.info(f"Ledger table {balances_table} created")
+    for query in WALLET_CHECKPOINT_TRIGGERS_SQL:
+        await db.execute(query)
+    
+    # Счетчики изменений таблиц для общего кэша (core.data) и витрины сайта
+    for query in CACHE_VERSIONS_SQL:
+        await db.execute(query)
+    for query in CATALOG_VERSIONS_SQL:
+        await db.execute(query)
+    
+    # Журнал изменений занятости досок для кэша services/occupancy.py
+    for query in OCCUPANCY_CHANGES_SQL:
+        await db.execute(query)
+    
+    # Первичное заполнение rating_stats по уже существующим отзывам
+    if not await db.fetchone("SELECT 1 FROM rating_stats LIMIT 1"):
+        async with db.transaction():
+            for query in _RATING_STATS_BACKFILL:
+                await db.execute(query)
+    for query in RATING_STATS_TRIGGERS_SQL:
+        await db.execute(query)
+    
     logger.info("Database schema initialized successfully")
 
+
+# Временные удержания мест на время оформления брони (services/holds.py):
+# одно на пользователя, учитываются в занятости до expires_at. Используется
+# и миграцией сайта
+CAPACITY_HOLDS_SQL = (
+    """CREATE TABLE IF NOT EXISTS capacity_holds (
+        user_id INTEGER PRIMARY KEY,
+        board_id INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        start_at INTEGER NOT NULL,
+        end_at INTEGER NOT NULL,
+        quantity INTEGER NOT NULL DEFAULT 1,
+        expires_at REAL NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_capacity_holds_board ON capacity_holds(board_id, expires_at)",
+)
+
+# Минута начала брони от 1970-01-01 (см. services.availability.epoch_minutes)
+_START_AT_SQL = (
+    "(CAST(ROUND(julianday(date({row}.date)) - 2440587.5) AS INTEGER) * 1440"
+    " + {row}.start_time * 60 + COALESCE({row}.start_minute, 0))"
+)
+
+# Длительность брони в минутах. Бот хранит минуты (не меньше 30), сайт —
+# часы почасовых броней; payment_method сайт позже меняет на 'card', так что
+# по нему старые брони сайта не отличить. Меньше 30 — значит часы.
+_DURATION_MINUTES_SQL = (
+    "(CASE WHEN {row}.payment_method = 'site' OR {row}.duration < 30"
+    " THEN {row}.duration * 60 ELSE {row}.duration END)"
+)
+
+# Исправление end_at броней сайта, заполненных прежней миграцией как минуты
+BOOKING_END_REPAIR_SQL = """UPDATE bookings SET end_at = start_at + duration * 60
+    WHERE start_time IS NOT NULL AND duration < 30 AND end_at - start_at = duration"""
+
+# Индекс истечения оплаты (планировщик бота, sweep задач)
+BOOKING_DEADLINE_INDEX_SQL = (
+    "CREATE INDEX IF NOT EXISTS idx_bookings_status_deadline ON bookings(status, payment_deadline)"
+)
+
+# Текущий баланс партнера (credit - debit) и контрольные точки сверки
+WALLET_LEDGER_SQL = (
+    """CREATE TABLE IF NOT EXISTS wallet_balances (
+        partner_id INTEGER PRIMARY KEY,
+        credit REAL NOT NULL DEFAULT 0,
+        debit REAL NOT NULL DEFAULT 0,
+        last_op_id INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    """CREATE TABLE IF NOT EXISTS wallet_checkpoints (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        partner_id INTEGER NOT NULL,
+        op_id INTEGER NOT NULL,
+        credit REAL NOT NULL,
+        debit REAL NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_wallet_checkpoints_partner ON wallet_checkpoints(partner_id, id)",
+    """CREATE TRIGGER IF NOT EXISTS trg_wallet_ops_insert AFTER INSERT ON partner_wallet_ops
+    BEGIN
+        INSERT INTO wallet_balances (partner_id, credit, debit, last_op_id, updated_at)
+        VALUES (NEW.partner_id,
+                CASE WHEN NEW.type = 'credit' THEN NEW.amount ELSE 0 END,
+                CASE WHEN NEW.type = 'debit' THEN NEW.amount ELSE 0 END,
+                NEW.id, CURRENT_TIMESTAMP)
+        ON CONFLICT (partner_id) DO UPDATE SET
+            credit = credit + excluded.credit,
+            debit = debit + excluded.debit,
+            last_op_id = MAX(last_op_id, excluded.last_op_id),
+            updated_at = excluded.updated_at;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_wallet_ops_update
+    AFTER UPDATE OF partner_id, type, amount ON partner_wallet_ops
+    BEGIN
+        UPDATE wallet_balances SET
+            credit = credit - CASE WHEN OLD.type = 'credit' THEN OLD.amount ELSE 0 END,
+            debit = debit - CASE WHEN OLD.type = 'debit' THEN OLD.amount ELSE 0 END,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE partner_id = OLD.partner_id;
+        INSERT INTO wallet_balances (partner_id, credit, debit, last_op_id, updated_at)
+        VALUES (NEW.partner_id,
+                CASE WHEN NEW.type = 'credit' THEN NEW.amount ELSE 0 END,
+                CASE WHEN NEW.type = 'debit' THEN NEW.amount ELSE 0 END,
+                NEW.id, CURRENT_TIMESTAMP)
+        ON CONFLICT (partner_id) DO UPDATE SET
+            credit = credit + excluded.credit,
+            debit = debit + excluded.debit,
+            updated_at = excluded.updated_at;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_wallet_ops_delete AFTER DELETE ON partner_wallet_ops
+    BEGIN
+        UPDATE wallet_balances SET
+            credit = credit - CASE WHEN OLD.type = 'credit' THEN OLD.amount ELSE 0 END,
+            debit = debit - CASE WHEN OLD.type = 'debit' THEN OLD.amount ELSE 0 END,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE partner_id = OLD.partner_id;
+    END""",
+)
+
+# Контрольные точки сверки (services/wallet_ledger.py) хранят суммы на
+# момент операции op_id. Изменение или удаление уже учтенной операции
+# делает их неверными: такие точки удаляются, и следующая сверка
+# досчитывает партнера от более ранней точки или с нуля. Отдельные
+# триггеры — чтобы добавить их и в уже созданные БД
+WALLET_CHECKPOINT_TRIGGERS_SQL = (
+    """CREATE TRIGGER IF NOT EXISTS trg_wallet_ops_update_checkpoints
+    AFTER UPDATE OF partner_id, type, amount ON partner_wallet_ops
+    BEGIN
+        DELETE FROM wallet_checkpoints
+        WHERE partner_id IN (OLD.partner_id, NEW.partner_id) AND op_id >= OLD.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_wallet_ops_delete_checkpoints
+    AFTER DELETE ON partner_wallet_ops
+    BEGIN
+        DELETE FROM wallet_checkpoints
+        WHERE partner_id = OLD.partner_id AND op_id >= OLD.id;
+    END""",
+)
+
+WALLET_BALANCES_BACKFILL_SQL = """
+    INSERT INTO wallet_balances (partner_id, credit, debit, last_op_id)
+    SELECT partner_id,
+           COALESCE(SUM(CASE WHEN type = 'credit' THEN amount END), 0),
+           COALESCE(SUM(CASE WHEN type = 'debit' THEN amount END), 0),
+           MAX(id)
+    FROM partner_wallet_ops
+    GROUP BY partner_id
+"""
+
+# Начисления сотрудникам (комиссия за брони) и их накопленный итог.
+# employee_wallet_ops совпадает с таблицей сайта (webapp/app.py)
+EMPLOYEE_LEDGER_SQL = (
+    """CREATE TABLE IF NOT EXISTS employee_wallet_ops (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        employee_telegram_id TEXT NOT NULL,
+        booking_id INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        src TEXT DEFAULT 'booking_commission',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(booking_id) REFERENCES bookings(id) ON DELETE CASCADE
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_employee_ops_emp ON employee_wallet_ops(employee_telegram_id)",
+    """CREATE TABLE IF NOT EXISTS employee_balances (
+        employee_telegram_id TEXT PRIMARY KEY,
+        earned REAL NOT NULL DEFAULT 0,
+        ops_count INTEGER NOT NULL DEFAULT 0,
+        last_op_id INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS trg_employee_ops_insert AFTER INSERT ON employee_wallet_ops
+    BEGIN
+        INSERT INTO employee_balances (employee_telegram_id, earned, ops_count, last_op_id, updated_at)
+        VALUES (NEW.employee_telegram_id, NEW.amount, 1, NEW.id, CURRENT_TIMESTAMP)
+        ON CONFLICT (employee_telegram_id) DO UPDATE SET
+            earned = earned + excluded.earned,
+            ops_count = ops_count + 1,
+            last_op_id = MAX(last_op_id, excluded.last_op_id),
+            updated_at = excluded.updated_at;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_employee_ops_update
+    AFTER UPDATE OF employee_telegram_id, amount ON employee_wallet_ops
+    BEGIN
+        UPDATE employee_balances SET
+            earned = earned - OLD.amount, ops_count = ops_count - 1,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE employee_telegram_id = OLD.employee_telegram_id;
+        INSERT INTO employee_balances (employee_telegram_id, earned, ops_count, last_op_id, updated_at)
+        VALUES (NEW.employee_telegram_id, NEW.amount, 1, NEW.id, CURRENT_TIMESTAMP)
+        ON CONFLICT (employee_telegram_id) DO UPDATE SET
+            earned = earned + excluded.earned,
+            ops_count = ops_count + 1,
+            updated_at = excluded.updated_at;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_employee_ops_delete AFTER DELETE ON employee_wallet_ops
+    BEGIN
+        UPDATE employee_balances SET
+            earned = earned - OLD.amount, ops_count = ops_count - 1,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE employee_telegram_id = OLD.employee_telegram_id;
+    END""",
+)
+
+EMPLOYEE_BALANCES_BACKFILL_SQL = """
+    INSERT INTO employee_balances (employee_telegram_id, earned, ops_count, last_op_id)
+    SELECT employee_telegram_id, SUM(amount), COUNT(*), MAX(id)
+    FROM employee_wallet_ops
+    GROUP BY employee_telegram_id
+"""
+
+# Финансовые итоги по дням и партнерам (partner_id = 0 — без партнера,
+# например расходы площадки). Отчет за любой период суммирует строки
+# daily_finance_rollup вместо полного прохода по броням и операциям.
+#   income          — брони в статусах active/completed, по дате брони;
+#   partner_payout  — начисления партнерам за брони, по дате операции;
+#   employee_payout — начисления сотрудникам, по дате брони;
+#   expenses        — ручные расходы.
+FINANCE_INCOME_STATUSES = ('active', 'completed')
+
+_BOOKING_PARTNER_SQL = "COALESCE({row}.partner_id, (SELECT partner_id FROM boards WHERE id = {row}.board_id), 0)"
+
+# Источник: (таблица, столбец итога, день, партнер, сумма, FROM, условие);
+# {row} — NEW или OLD в триггере
+_FINANCE_SOURCES = (
+    ("bookings", "income", "{row}.date", _BOOKING_PARTNER_SQL, "{row}.amount", "",
+     f"{{row}}.status IN {FINANCE_INCOME_STATUSES}", "status, amount, date, partner_id, board_id"),
+    ("partner_wallet_ops", "partner_payout", "date({row}.created_at)", "{row}.partner_id", "{row}.amount", "",
+     "{row}.type = 'credit' AND {row}.booking_id IS NOT NULL AND {row}.created_at IS NOT NULL", "partner_id, type, amount, booking_id, created_at"),
+    ("employee_wallet_ops", "employee_payout", "b.date", _BOOKING_PARTNER_SQL.format(row="b"), "{row}.amount",
+     "FROM bookings b", "b.id = {row}.booking_id", "booking_id, amount"),
+    ("expenses", "expenses", "{row}.date", "0", "{row}.amount", "", "1", "date, amount"),
+)
+
+
+def _rollup_apply(column: str, day: str, partner: str, amount: str, source: str, cond: str,
+                  row: str, sign: str) -> str:
+    """Добавление (sign='') или вычитание (sign='-') строки row в итоги"""
+    fmt = lambda sql: sql.replace("{row}", row)
+    return f"""
+        INSERT INTO daily_finance_rollup (day, partner_id, {column})
+        SELECT {fmt(day)}, {fmt(partner)}, {sign}{fmt(amount)} {source} WHERE {fmt(cond)}
+        ON CONFLICT (day, partner_id) DO UPDATE SET {column} = {column} + excluded.{column};"""
+
+
+def _finance_triggers():
+    for table, column, day, partner, amount, source, cond, columns in _FINANCE_SOURCES:
+        add = lambda row, sign: _rollup_apply(column, day, partner, amount, source, cond, row, sign)
+        yield f"""CREATE TRIGGER IF NOT EXISTS trg_finance_{table}_insert AFTER INSERT ON {table}
+    BEGIN{add("NEW", "")}
+    END"""
+        yield f"""CREATE TRIGGER IF NOT EXISTS trg_finance_{table}_update
+    AFTER UPDATE OF {columns} ON {table}
+    BEGIN{add("OLD", "-")}{add("NEW", "")}
+    END"""
+        yield f"""CREATE TRIGGER IF NOT EXISTS trg_finance_{table}_delete AFTER DELETE ON {table}
+    BEGIN{add("OLD", "-")}
+    END"""
+
+
+# Начисления сотрудникам по брони {row}
+_EMPLOYEE_BY_BOOKING = ("employee_payout", "{row}.date", _BOOKING_PARTNER_SQL, "e.amount",
+                        "FROM employee_wallet_ops e", "e.booking_id = {row}.id")
+
+FINANCE_ROLLUP_SQL = (
+    """CREATE TABLE IF NOT EXISTS daily_finance_rollup (
+        day TEXT NOT NULL,
+        partner_id INTEGER NOT NULL DEFAULT 0,
+        income REAL NOT NULL DEFAULT 0,
+        partner_payout REAL NOT NULL DEFAULT 0,
+        employee_payout REAL NOT NULL DEFAULT 0,
+        expenses REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, partner_id)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS idx_finance_rollup_partner ON daily_finance_rollup(partner_id, day)",
+    *_finance_triggers(),
+    # Начисления сотрудникам учтены по дате и партнеру брони: при их смене
+    # переносим, при удалении брони — списываем до каскадного удаления
+    # операций (после него бронь уже не найти)
+    f"""CREATE TRIGGER IF NOT EXISTS trg_finance_bookings_move_employee
+    AFTER UPDATE OF date, partner_id, board_id ON bookings
+    BEGIN{_rollup_apply(*_EMPLOYEE_BY_BOOKING, "OLD", "-")}{_rollup_apply(*_EMPLOYEE_BY_BOOKING, "NEW", "")}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS trg_finance_bookings_drop_employee BEFORE DELETE ON bookings
+    BEGIN{_rollup_apply(*_EMPLOYEE_BY_BOOKING, "OLD", "-")}
+    END""",
+)
+
+# Итоги по сырым таблицам, сгруппированные как daily_finance_rollup;
+# {where} — фильтр по day (для сверки и пересчета периода)
+FINANCE_RAW_SQL = f"""
+    SELECT day, partner_id,
+           SUM(income) AS income, SUM(partner_payout) AS partner_payout,
+           SUM(employee_payout) AS employee_payout, SUM(expenses) AS expenses
+    FROM (
+        SELECT b.date AS day, {_BOOKING_PARTNER_SQL.format(row="b")} AS partner_id,
+               b.amount AS income, 0 AS partner_payout, 0 AS employee_payout, 0 AS expenses
+        FROM bookings b WHERE b.status IN {FINANCE_INCOME_STATUSES}
+        UNION ALL
+        SELECT date(o.created_at), o.partner_id, 0, o.amount, 0, 0
+        FROM partner_wallet_ops o
+        WHERE o.type = 'credit' AND o.booking_id IS NOT NULL AND o.created_at IS NOT NULL
+        UNION ALL
+        SELECT b.date, {_BOOKING_PARTNER_SQL.format(row="b")}, 0, 0, e.amount, 0
+        FROM employee_wallet_ops e JOIN bookings b ON b.id = e.booking_id
+        UNION ALL
+        SELECT x.date, 0, 0, 0, 0, x.amount FROM expenses x
+    )
+    {{where}}
+    GROUP BY day, partner_id
+"""
+
+FINANCE_ROLLUP_BACKFILL_SQL = (
+    "INSERT INTO daily_finance_rollup (day, partner_id, income, partner_payout, employee_payout, expenses) "
+    + FINANCE_RAW_SQL.format(where="")
+)
+
+# (триггер-маркер, DDL, таблица итогов, первичное заполнение)
+_LEDGERS = (
+    ("trg_wallet_ops_insert", WALLET_LEDGER_SQL, "wallet_balances", WALLET_BALANCES_BACKFILL_SQL),
+    ("trg_employee_ops_insert", EMPLOYEE_LEDGER_SQL, "employee_balances", EMPLOYEE_BALANCES_BACKFILL_SQL),
+    ("trg_finance_expenses_insert", FINANCE_ROLLUP_SQL, "daily_finance_rollup", FINANCE_ROLLUP_BACKFILL_SQL),
+)
+
+# Таблицы, изменения которых сбрасывают кэши (core.data, витрина сайта):
+# имя -> столбцы, обновление которых считается изменением. Используется и
+# миграцией cache_versions сайта
+CACHE_VERSION_TABLES = {
+    "partners": ("name", "is_active"),
+    "locations": ("name", "latitude", "longitude", "kind", "is_active", "partner_id"),
+    "boards": ("name", "price", "total", "is_active", "location_id", "partner_id"),
+    "daily_boards": ("name", "daily_price", "address", "is_active", "partner_id"),
+}
+
+
+def _cache_version_sql():
+    yield """CREATE TABLE IF NOT EXISTS cache_versions (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    )"""
+    for table, columns in CACHE_VERSION_TABLES.items():
+        yield f"INSERT OR IGNORE INTO cache_versions (name, version) VALUES ('{table}', 0)"
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            target = f"UPDATE OF {', '.join(columns)}" if event == "UPDATE" else event
+            yield f"""CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_version
+    AFTER {target} ON {table}
+    BEGIN
+        UPDATE cache_versions SET version = version + 1 WHERE name = '{table}';
+    END"""
+
+
+CACHE_VERSIONS_SQL = tuple(_cache_version_sql())
+
+# Справочники бота (core.data). Репозитории кэшируют строки partners,
+# locations и boards целиком (SELECT *), поэтому версия растет при
+# обновлении любого столбца (комиссия, контакты, вместимость и т.д.), а не
+# только тех, что нужны витрине. Таблицы только бота — со своими счетчиками.
+# Отдельные триггеры к тем же счетчикам cache_versions; используются и
+# миграциями сайта
+CATALOG_VERSION_ROW_TABLES = ("partners", "locations", "boards")
+CATALOG_VERSION_TABLES = {
+    "admins": ("user_id", "level"),
+    "board_images": ("board_id", "file_id"),
+}
+
+
+def _catalog_version_sql():
+    for table in CATALOG_VERSION_ROW_TABLES:
+        # Прежние версии триггера срабатывали только на часть столбцов
+        yield f"DROP TRIGGER IF EXISTS trg_{table}_update_catalog_version"
+        yield f"""CREATE TRIGGER trg_{table}_update_catalog_version
+    AFTER UPDATE ON {table}
+    BEGIN
+        UPDATE cache_versions SET version = version + 1 WHERE name = '{table}';
+    END"""
+    for table, columns in CATALOG_VERSION_TABLES.items():
+        yield f"INSERT OR IGNORE INTO cache_versions (name, version) VALUES ('{table}', 0)"
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            target = f"UPDATE OF {', '.join(columns)}" if event == "UPDATE" else event
+            yield f"""CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_version
+    AFTER {target} ON {table}
+    BEGIN
+        UPDATE cache_versions SET version = version + 1 WHERE name = '{table}';
+    END"""
+
+
+CATALOG_VERSIONS_SQL = tuple(_catalog_version_sql())
+
+# Статусы броней, которые занимают доску (как в запросах занятости BookingService)
+_OCCUPYING = "('waiting_partner', 'active', 'waiting_card', 'waiting_cash')"
+
+
+def _occupancy_change(row: str, sign: str) -> str:
+    return f"""INSERT INTO occupancy_changes (board_id, start_at, end_at, delta)
+        SELECT {row}.board_id, {row}.start_at, {row}.end_at, {sign}IFNULL({row}.quantity, 0)
+        WHERE {row}.board_id IS NOT NULL AND {row}.start_at IS NOT NULL
+        AND {row}.status IN {_OCCUPYING};"""
+
+
+# Журнал изменений занятости: триггеры на bookings пишут +quantity, когда
+# бронь начинает занимать интервал доски, и -quantity, когда перестает
+# (отмена, завершение, перенос, удаление). Кэш занятости любого процесса
+# применяет новые записи по seq, не перечитывая брони. Вставка бота без
+# start_at проходит через trg_bookings_time_insert, то есть через UPDATE.
+# Используется и миграцией сайта.
+OCCUPANCY_CHANGES_SQL = (
+    """CREATE TABLE IF NOT EXISTS occupancy_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        board_id INTEGER NOT NULL,
+        start_at INTEGER NOT NULL,
+        end_at INTEGER NOT NULL,
+        delta INTEGER NOT NULL,
+        changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS trg_bookings_occupancy_insert AFTER INSERT ON bookings
+    BEGIN
+        {_occupancy_change('NEW', '')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS trg_bookings_occupancy_update
+    AFTER UPDATE OF board_id, status, start_at, end_at, quantity ON bookings
+    WHEN OLD.board_id IS NOT NEW.board_id OR OLD.start_at IS NOT NEW.start_at
+        OR OLD.end_at IS NOT NEW.end_at OR OLD.quantity IS NOT NEW.quantity
+        OR (IFNULL(OLD.status, '') IN {_OCCUPYING}) <> (IFNULL(NEW.status, '') IN {_OCCUPYING})
+    BEGIN
+        {_occupancy_change('OLD', '-')}
+        {_occupancy_change('NEW', '')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS trg_bookings_occupancy_delete AFTER DELETE ON bookings
+    BEGIN
+        {_occupancy_change('OLD', '-')}
+    END""",
+)
+
+# Доска, локация и партнер отзыва определяются через бронь (как в ReviewService)
+_RATING_STATS_SELECT = {
+    "board": """SELECT 'board', b.board_id, SUM(r.rating), COUNT(*)
+       FROM reviews r JOIN bookings b ON b.id = r.booking_id
+       WHERE b.board_id {cond} GROUP BY b.board_id""",
+    "location": """SELECT 'location', brd.location_id, SUM(r.rating), COUNT(*)
+       FROM reviews r JOIN bookings b ON b.id = r.booking_id
+       JOIN boards brd ON brd.id = b.board_id
+       WHERE brd.location_id {cond} GROUP BY brd.location_id""",
+    "partner": """SELECT 'partner', b.partner_id, SUM(r.rating), COUNT(*)
+       FROM reviews r JOIN bookings b ON b.id = r.booking_id
+       WHERE b.partner_id {cond} GROUP BY b.partner_id""",
+}
+_RATING_STATS_INSERT = "INSERT INTO rating_stats (scope, scope_id, rating_sum, rating_count) "
+
+_RATING_STATS_BACKFILL = tuple(
+    _RATING_STATS_INSERT + select.format(cond="IS NOT NULL") for select in _RATING_STATS_SELECT.values()
+)
+
+
+def _rating_stats_refresh(scope: str, scope_id: str) -> str:
+    """Пересчет строки сводки по отзывам (scope_id — SQL-выражение)"""
+    return f"""DELETE FROM rating_stats WHERE scope = '{scope}' AND scope_id = {scope_id};
+        {_RATING_STATS_INSERT}{_RATING_STATS_SELECT[scope].format(cond=f"= {scope_id}")};"""
+
+
+# ReviewService меняет сводку вместе с отзывом, но удаление брони, доски или
+# пользователя меняет отзывы через внешние ключи (booking_id SET NULL,
+# board_id SET NULL, отзывы пользователя CASCADE) мимо сервиса. Триггеры
+# пересчитывают затронутые строки сводки (для пользователя — всю сводку:
+# его брони и отзывы удаляются каскадом в неизвестном порядке)
+RATING_STATS_TRIGGERS_SQL = (
+    f"""CREATE TRIGGER IF NOT EXISTS trg_bookings_delete_rating_stats AFTER DELETE ON bookings
+    BEGIN
+        {_rating_stats_refresh('board', 'OLD.board_id')}
+        {_rating_stats_refresh('location', '(SELECT location_id FROM boards WHERE id = OLD.board_id)')}
+        {_rating_stats_refresh('partner', 'OLD.partner_id')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS trg_boards_delete_rating_stats AFTER DELETE ON boards
+    BEGIN
+        {_rating_stats_refresh('board', 'OLD.id')}
+        {_rating_stats_refresh('location', 'OLD.location_id')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS trg_partners_delete_rating_stats AFTER DELETE ON partners
+    BEGIN
+        {_rating_stats_refresh('partner', 'OLD.id')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS trg_users_delete_rating_stats AFTER DELETE ON users
+    BEGIN
+        DELETE FROM rating_stats;
+        {' '.join(query + ';' for query in _RATING_STATS_BACKFILL)}
+    END""",
+)
+
+_TIME_INDEX_SQL = f"""
+    CREATE INDEX IF NOT EXISTS idx_bookings_board_date_status ON bookings(board_id, date, status);
+    CREATE INDEX IF NOT EXISTS idx_bookings_status_start ON bookings(status, start_at);
+    CREATE INDEX IF NOT EXISTS idx_bookings_status_end ON bookings(status, end_at);
+    {BOOKING_DEADLINE_INDEX_SQL};
+
+    -- Заполнение start_at/end_at для вставок, которые не передали их явно
+    CREATE TRIGGER IF NOT EXISTS trg_bookings_time_insert AFTER INSERT ON bookings
+    WHEN NEW.start_at IS NULL AND NEW.start_time IS NOT NULL
+    BEGIN
+        UPDATE bookings
+        SET start_at = {_START_AT_SQL.format(row='NEW')},
+            end_at = {_START_AT_SQL.format(row='NEW')} + {_DURATION_MINUTES_SQL.format(row='NEW')}
+        WHERE id = NEW.id;
+    END;
+
+    -- Единица duration берется из прежнего интервала (минут на единицу):
+    -- сайт и бот хранят ее по-разному, а payment_method меняется
+    CREATE TRIGGER IF NOT EXISTS trg_bookings_time_update
+    AFTER UPDATE OF date, start_time, start_minute, duration ON bookings
+    WHEN NEW.start_at IS OLD.start_at AND NEW.start_time IS NOT NULL
+    BEGIN
+        UPDATE bookings
+        SET start_at = {_START_AT_SQL.format(row='NEW')},
+            end_at = {_START_AT_SQL.format(row='NEW')} + CASE
+                WHEN OLD.end_at > OLD.start_at AND OLD.duration > 0
+                THEN NEW.duration * ((OLD.end_at - OLD.start_at) / OLD.duration)
+                ELSE {_DURATION_MINUTES_SQL.format(row='NEW')} END
+        WHERE id = NEW.id;
+    END;
+"""
+
@@ -12,8 +12,8 @@ from __future__ import annotations
 from typing import Optional, Set
 from datetime import datetime
 import logging
-import aiohttp
 from aiogram import Bot
+from services.weather_service import get_weather_cache
 
 logger = logging.getLogger(__name__)
 
@@ -51,22 +51,8 @@ async def get_weather(lat: float, lon: float, api_key: Optional[str]) -> str:
     if not api_key or lat is None or lon is None:
         return ""
 
-    url = "https://api.openweathermap.org/data/2.5/weather"
-    params = {
-        "lat": lat,
-        "lon": lon,
-        "appid": api_key,
-        "units": "metric",
-        "lang": "ru",
-    }
-
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=params, timeout=5) as resp:
-                if resp.status != 200:
-                    return ""
-                data = await resp.json()
-    except Exception:
+    data = await get_weather_cache().get(lat, lon, api_key)
+    if not data:
         return ""
 
     temp = round(data.get("main", {}).get("temp", 0))
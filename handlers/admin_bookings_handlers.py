@@ -6,6 +6,7 @@ from aiogram.types import CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
 from keyboards import new_admin_menu as admin_menu, new_main_menu as user_menu
+from notifications.job_queue import sync_booking_jobs
 
 logger = logging.getLogger(__name__)
 
@@ -88,6 +89,7 @@ def register_admin_bookings(router: Router, db):
         user_id, board_id, date_iso, start_h, start_m = row
 
         await db.execute("UPDATE bookings SET status='active' WHERE id=?", (bid,), commit=True)
+        await sync_booking_jobs(db, bid)
         await cq.answer("✅ Подтверждено")
 
         if cq.message:
@@ -119,6 +121,7 @@ def register_admin_bookings(router: Router, db):
         bid = int(cq.data.split(":")[1])
         row = await db.execute("SELECT user_id FROM bookings WHERE id=?", (bid,), fetch="one")
         await db.execute("UPDATE bookings SET status='canceled' WHERE id=?", (bid,), commit=True)
+        await sync_booking_jobs(db, bid)
         await cq.answer("❌ Отменено")
         if cq.message:
             try:
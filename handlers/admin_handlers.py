@@ -5,6 +5,7 @@ from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKe
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from core.database import Database
+from services.wallet_ledger import WalletLedger
 from keyboards.admin import get_admin_menu, get_partner_action_keyboard, get_withdraw_action_keyboard
 from keyboards.user import get_back_keyboard
 from keyboards.common import get_confirm_keyboard
@@ -105,15 +106,7 @@ def register_admin_handlers(router: Router, db: Database, bot=None, notification
         )
         
         # Баланс партнера
-        wallet_ops = await db.fetchall(
-            """SELECT 
-                   SUM(CASE WHEN type = 'credit' THEN amount ELSE 0 END) as credits,
-                   SUM(CASE WHEN type = 'debit' THEN amount ELSE 0 END) as debits
-               FROM partner_wallet_ops 
-               WHERE partner_id = ?""",
-            (partner_id,)
-        )
-        balance = (wallet_ops[0]['credits'] or 0) - (wallet_ops[0]['debits'] or 0)
+        balance = await WalletLedger(db).get_balance(partner_id)
         
         text = f"👤 <b>Партнер: {partner['name']}</b>\n\n"
         text += f"ID: {partner['id']}\n"
@@ -312,15 +305,7 @@ def register_admin_handlers(router: Router, db: Database, bot=None, notification
             return
         
         # Проверяем баланс партнера
-        wallet_ops = await db.fetchall(
-            """SELECT 
-                   SUM(CASE WHEN type = 'credit' THEN amount ELSE 0 END) as credits,
-                   SUM(CASE WHEN type = 'debit' THEN amount ELSE 0 END) as debits
-               FROM partner_wallet_ops 
-               WHERE partner_id = ?""",
-            (request['partner_id'],)
-        )
-        balance = (wallet_ops[0]['credits'] or 0) - (wallet_ops[0]['debits'] or 0)
+        balance = await WalletLedger(db).get_balance(request['partner_id'])
         
         if balance < request['amount']:
             await callback.message.edit_text(
@@ -602,7 +587,8 @@ def register_admin_handlers(router: Router, db: Database, bot=None, notification
             return
         
         try:
-            await db.execute("DELETE FROM reviews WHERE id = ?", (review_id,))
+            from services.review_service import ReviewService
+            await ReviewService(db).delete_review(review_id)
             text = f"✅ Отзыв #{review_id} удален!"
             keyboard = get_back_keyboard("admin:reviews")
             try:
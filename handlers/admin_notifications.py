@@ -4,6 +4,7 @@ from aiogram.utils.keyboard import InlineKeyboardMarkup, InlineKeyboardButton
 
 from config import ADMIN_IDS           # ADMIN_IDS = [12345678, 87654321]
 from core.database import Database     # ваш класс для работы с БД
+from notifications.job_queue import sync_booking_jobs
 
 logger = logging.getLogger(__name__)
 
@@ -67,6 +68,7 @@ def register_admin_notifications(router: Router, db: Database):
             "UPDATE bookings SET status = 'active' WHERE id = ?",
             (booking_id,), commit=True
         )
+        await sync_booking_jobs(db, booking_id)
 
         # убираем кнопки из админского сообщения
         try:
@@ -110,6 +112,7 @@ def register_admin_notifications(router: Router, db: Database):
             "UPDATE bookings SET status = 'canceled' WHERE id = ?",
             (booking_id,), commit=True
         )
+        await sync_booking_jobs(db, booking_id)
 
         # убираем кнопки
         try:
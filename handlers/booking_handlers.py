@@ -1,22 +1,37 @@
 """Обработчики бронирований"""
 import logging
 from datetime import date, datetime, timedelta
+from typing import Optional
 from aiogram import Router, F
 from aiogram.types import CallbackQuery, Message
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from core.database import Database
+from core.data import get_store
 from services.booking_service import BookingService
+from services.holds import get_holds
+from services.occupancy import get_occupancy
+from services.pricing import get_price_engine
 from keyboards.user import (
     get_booking_type_keyboard, get_locations_keyboard, get_boards_keyboard,
     get_payment_method_keyboard, get_back_keyboard, get_time_keyboard,
-    get_duration_keyboard, get_quantity_keyboard, get_date_keyboard
+    get_duration_keyboard, get_quantity_keyboard, get_date_keyboard,
+    get_search_presets_keyboard, get_search_results_keyboard,
+    DATE_KEYBOARD_DAYS, MIN_DURATION_MINUTES
 )
 from utils.date_parser import parse_date, is_date_valid
 from config import Config
 
 logger = logging.getLogger(__name__)
 
+# Удержание места при выборе времени, пока длительность еще не выбрана
+MIN_HOLD_MINUTES = MIN_DURATION_MINUTES
+
+# Экран поиска: сколько вариантов показывать и на сколько дней расширять
+# поиск, если в выбранный день свободных досок нет
+SEARCH_RESULTS = 6
+SEARCH_WIDEN_DAYS = 7
+
 
 class BookingStates(StatesGroup):
     """Состояния для процесса бронирования"""
@@ -32,6 +47,56 @@ class BookingStates(StatesGroup):
 def register_booking_handlers(router: Router, db: Database, bot=None):
     """Регистрация обработчиков бронирований"""
     booking_service = BookingService(db)
+    store = get_store(db)
+    holds = get_holds(db)
+    occupancy = get_occupancy(db)
+    
+    async def date_keyboard(board_id: int, capacity: int, booking_type: str = "regular"):
+        """Клавиатура дат; дни без свободного времени помечены (по кэшу занятости)"""
+        if booking_type != "regular":
+            return get_date_keyboard()
+        today = date.today()
+        free = await occupancy.free_days(
+            [board_id], {board_id: capacity}, today, DATE_KEYBOARD_DAYS, MIN_DURATION_MINUTES
+        )
+        days = (today + timedelta(days=i) for i in range(DATE_KEYBOARD_DAYS))
+        return get_date_keyboard(full_days=[day for day in days if day not in free])
+    
+    async def free_hours(board_id: int, capacity: int, booking_date: date):
+        """Часы, с которых доска свободна хотя бы минимальную длительность"""
+        return await occupancy.free_hours([board_id], {board_id: capacity}, booking_date, MIN_DURATION_MINUTES)
+    
+    async def price_text(
+        board_id: int,
+        base_price: float,
+        capacity: int,
+        booking_date: Optional[date] = None,
+        start: Optional[int] = None,
+        user_id: Optional[int] = None
+    ) -> str:
+        """Строка цены часа по движку цен (по нему же считается сумма брони)
+
+        С началом слота — цена часа этого слота; с одной датой — диапазон по
+        рабочим часам дня; без даты — диапазон на сегодня.
+        """
+        day = booking_date or date.today()
+        timeline = await booking_service.get_day_timeline(
+            board_id, day, capacity=capacity, exclude_hold_user=user_id
+        )
+        engine = get_price_engine()
+        if start is not None:
+            unit = engine.quote(board_id, base_price, day, timeline, start, 60).unit_price
+            return f"💰 Цена: {unit:.0f}₽/час"
+        table = engine.table(board_id, base_price, day, timeline, 60)
+        prices = [
+            price for minute, price in table.prices.items()
+            if Config.WORK_HOURS_START * 60 <= minute < Config.WORK_HOURS_END * 60
+        ] or list(table.prices.values())
+        label = "Цена" if booking_date else "Цена сегодня"
+        low, high = min(prices), max(prices)
+        if low == high:
+            return f"💰 {label}: {low:.0f}₽/час"
+        return f"💰 {label}: {low:.0f}–{high:.0f}₽/час"
     
     # Создаем notification_service если bot передан
     notification_service = None
@@ -42,11 +107,13 @@ def register_booking_handlers(router: Router, db: Database, bot=None):
     @router.message(F.text == "🆕 Новая бронь")
     async def new_booking(message: Message, state: FSMContext):
         """Начало процесса бронирования"""
+        await holds.release(message.from_user.id)
         text = "📅 <b>Выберите тип бронирования:</b>\n\n"
         text += "• <b>Обычная бронь</b> - бронирование на конкретную дату и время\n"
         text += "• <b>Мгновенная бронь</b> - бронирование на сегодня\n"
         text += "• <b>Суточная аренда</b> - аренда на сутки\n"
-        text += "• <b>Мультибронь</b> - несколько досок одновременно"
+        text += "• <b>Мультибронь</b> - несколько досок одновременно\n"
+        text += "• <b>Найти свободное время</b> - лучшие свободные доски локации в одно нажатие"
         
         await message.answer(text, reply_markup=get_booking_type_keyboard())
     
@@ -58,9 +125,7 @@ def register_booking_handlers(router: Router, db: Database, bot=None):
         await state.update_data(booking_type="regular")
         
         # Получаем активные локации
-        locations = await db.fetchall(
-            "SELECT * FROM locations WHERE is_active = 1 ORDER BY name"
-        )
+        locations = await store.locations.active()
         
         if not locations:
             await callback.message.edit_text(
@@ -80,9 +145,7 @@ def register_booking_handlers(router: Router, db: Database, bot=None):
         await state.update_data(booking_type="instant", booking_date=date.today().strftime("%Y-%m-%d"))
         
         # Получаем активные локации
-        locations = await db.fetchall(
-            "SELECT * FROM locations WHERE is_active = 1 ORDER BY name"
-        )
+        locations = await store.locations.active()
         
         if not locations:
             await callback.message.edit_text(
@@ -103,9 +166,7 @@ def register_booking_handlers(router: Router, db: Database, bot=None):
         await state.update_data(booking_type="daily")
         
         # Получаем активные локации
-        locations = await db.fetchall(
-            "SELECT * FROM locations WHERE is_active = 1 ORDER BY name"
-        )
+        locations = await store.locations.active()
         
         if not locations:
             await callback.message.edit_text(
@@ -119,6 +180,113 @@ def register_booking_handlers(router: Router, db: Database, bot=None):
         text += "📍 <b>Выберите локацию:</b>"
         await callback.message.edit_text(text, reply_markup=get_locations_keyboard(locations))
     
+    @router.callback_query(F.data == "booking_type:search")
+    async def booking_type_search(callback: CallbackQuery, state: FSMContext):
+        """Поиск свободного времени сразу по всем доскам локации"""
+        await callback.answer()
+        await holds.release(callback.from_user.id)
+        await state.set_state(BookingStates.choosing_location)
+        await state.update_data(booking_type="regular")
+        
+        locations = await store.locations.active()
+        if not locations:
+            await callback.message.edit_text(
+                "❌ К сожалению, сейчас нет доступных локаций.\nПопробуйте позже.",
+                reply_markup=get_back_keyboard("back_to_menu")
+            )
+            return
+        
+        text = "🔎 <b>Найти свободное время</b>\n\n"
+        text += "📍 <b>Выберите локацию:</b>"
+        await callback.message.edit_text(text, reply_markup=get_locations_keyboard(locations, prefix="find_loc"))
+    
+    @router.callback_query(F.data.startswith("find_loc:"))
+    async def search_location_chosen(callback: CallbackQuery, state: FSMContext):
+        """Выбор дня и желаемого времени поиска"""
+        await callback.answer()
+        location_id = int(callback.data.split(":")[1])
+        await state.update_data(location_id=location_id)
+        
+        text = "🔎 <b>Когда хотите покататься?</b>\n\n"
+        text += "Подберем свободные доски локации, ближайшие к этому времени."
+        await callback.message.edit_text(text, reply_markup=get_search_presets_keyboard(location_id))
+    
+    @router.callback_query(F.data.startswith("find:"))
+    async def search_results(callback: CallbackQuery, state: FSMContext):
+        """Лучшие свободные слоты локации на час (BookingService.search_slots)"""
+        await callback.answer()
+        try:
+            # callback.data = "find:3:2025-06-07:840"
+            _, location_id, day_str, minute = callback.data.split(":")
+            location_id, preferred = int(location_id), int(minute)
+            day = datetime.strptime(day_str, "%Y-%m-%d").date()
+        except ValueError as e:
+            logger.error(f"Error parsing search callback data '{callback.data}': {e}")
+            return
+        
+        options = await booking_service.search_slots(
+            location_id, day, day, 60, preferred_start=preferred, limit=SEARCH_RESULTS
+        )
+        text = "🔎 <b>Свободные доски</b>\n\n"
+        if not options:
+            # В выбранный день мест нет — ищем в ближайшие дни
+            options = await booking_service.search_slots(
+                location_id, day, day + timedelta(days=SEARCH_WIDEN_DAYS - 1), 60,
+                preferred_start=preferred, limit=SEARCH_RESULTS
+            )
+            text += f"На {day.strftime('%d.%m.%Y')} мест нет, ближайшие варианты:\n\n"
+        if not options:
+            await callback.message.edit_text(
+                "❌ Свободных досок в ближайшие дни нет. Попробуйте другую локацию.",
+                reply_markup=get_search_presets_keyboard(location_id)
+            )
+            return
+        
+        text += "Нажмите на вариант, чтобы забронировать (1 доска, длительность выберете дальше):"
+        await callback.message.edit_text(text, reply_markup=get_search_results_keyboard(options, location_id))
+    
+    @router.callback_query(F.data.startswith("pick:"))
+    async def search_slot_picked(callback: CallbackQuery, state: FSMContext):
+        """Бронь найденного слота: удержание места и сразу выбор длительности"""
+        await callback.answer()
+        try:
+            # callback.data = "pick:5:2025-06-07:14:0"
+            _, board_id, day_str, hour, minute = callback.data.split(":")
+            board_id, hour, minute = int(board_id), int(hour), int(minute)
+            booking_date = datetime.strptime(day_str, "%Y-%m-%d").date()
+        except ValueError as e:
+            logger.error(f"Error parsing slot callback data '{callback.data}': {e}")
+            return
+        
+        board = await store.boards.get(board_id)
+        if not board:
+            await callback.message.edit_text("❌ Доска не найдена.")
+            return
+        
+        hold = await holds.hold(callback.from_user.id, board_id, booking_date, hour * 60 + minute, MIN_HOLD_MINUTES)
+        if hold is None:
+            await callback.message.edit_text(
+                "❌ Это время только что заняли. Выберите другой вариант.",
+                reply_markup=get_search_presets_keyboard(board['location_id'])
+            )
+            return
+        
+        await state.update_data(
+            booking_type="regular", location_id=board['location_id'],
+            board_id=board_id, board_price=board['price'], board_name=board['name'],
+            board_quantity=board['quantity'], booking_date=booking_date.strftime("%Y-%m-%d"),
+            start_time=hour, start_minute=minute
+        )
+        await state.set_state(BookingStates.choosing_duration)
+        
+        text = f"✅ <b>{board['name']}</b>\n"
+        text += f"📅 {booking_date.strftime('%d.%m.%Y')} ⏰ {hour}:{minute:02d}\n"
+        text += await price_text(
+            board_id, board['price'], board['quantity'], booking_date, hour * 60 + minute, callback.from_user.id
+        ) + "\n\n"
+        text += "⏱ Выберите длительность аренды:"
+        await callback.message.edit_text(text, reply_markup=get_duration_keyboard())
+    
     @router.callback_query(F.data.startswith("location:"))
     async def location_chosen(callback: CallbackQuery, state: FSMContext):
         """Выбор локации"""
@@ -128,12 +296,7 @@ def register_booking_handlers(router: Router, db: Database, bot=None):
         await state.set_state(BookingStates.choosing_board)
         
         # Получаем доски для локации
-        boards = await db.fetchall(
-            """SELECT * FROM boards 
-               WHERE location_id = ? AND is_active = 1 
-               ORDER BY name""",
-            (location_id,)
-        )
+        boards = await store.boards.by_location(location_id)
         
         if not boards:
             await callback.message.edit_text(
@@ -142,7 +305,7 @@ def register_booking_handlers(router: Router, db: Database, bot=None):
             )
             return
         
-        location = await db.fetchone("SELECT name FROM locations WHERE id = ?", (location_id,))
+        location = await store.locations.get(location_id)
         text = f"🏄 <b>Выберите доску для локации \"{location['name']}\":</b>"
         await callback.message.edit_text(text, reply_markup=get_boards_keyboard(boards))
     
@@ -151,7 +314,7 @@ def register_booking_handlers(router: Router, db: Database, bot=None):
         """Выбор доски"""
         await callback.answer()
         board_id = int(callback.data.split(":")[1])
-        board = await db.fetchone("SELECT * FROM boards WHERE id = ?", (board_id,))
+        board = await store.boards.get(board_id)
         
         if not board:
             await callback.message.edit_text("❌ Доска не найдена.")
@@ -160,13 +323,13 @@ def register_booking_handlers(router: Router, db: Database, bot=None):
         data = await state.get_data()
         booking_type = data.get("booking_type", "regular")
         
-        await state.update_data(board_id=board_id, board_price=board['price'], board_name=board['name'])
+        await state.update_data(
+            board_id=board_id, board_price=board['price'], board_name=board['name'],
+            board_quantity=board['quantity']
+        )
         
         # Получаем фото доски
-        images = await db.fetchall(
-            "SELECT file_id FROM board_images WHERE board_id = ? ORDER BY created_at LIMIT 1",
-            (board_id,)
-        )
+        images = await store.boards.images(board_id)
         
         # Для мгновенной брони пропускаем выбор даты
         if booking_type == "instant":
@@ -185,7 +348,7 @@ def register_booking_handlers(router: Router, db: Database, bot=None):
             if not available_slots:
                 text = f"⚡ <b>Мгновенная бронь</b>\n\n"
                 text += f"Доска: {board['name']}\n"
-                text += f"💰 Цена: {board['price']:.0f}₽/час\n\n"
+                text += await price_text(board_id, board['price'], board['quantity'], today) + "\n\n"
                 text += "❌ К сожалению, на сегодня нет доступных временных слотов для этой доски.\n"
                 text += "Попробуйте выбрать другую доску или сделайте обычную бронь."
                 await callback.message.edit_text(text, reply_markup=get_back_keyboard("back_to_boards"))
@@ -194,11 +357,13 @@ def register_booking_handlers(router: Router, db: Database, bot=None):
             # Создаем клавиатуру с доступными временами
             from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
             buttons = []
-            for hour, minute in available_slots:
-                buttons.append([InlineKeyboardButton(
+            for i, (hour, minute) in enumerate(available_slots):
+                if i % 4 == 0:
+                    buttons.append([])
+                buttons[-1].append(InlineKeyboardButton(
                     text=f"{hour}:{minute:02d}",
                     callback_data=f"time:{hour}:{minute}"
-                )])
+                ))
             buttons.append([InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_boards")])
             time_keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
             
@@ -206,7 +371,7 @@ def register_booking_handlers(router: Router, db: Database, bot=None):
             text += f"Доска: {board['name']}\n"
             if board.get('description'):
                 text += f"{board['description']}\n\n"
-            text += f"💰 Цена: {board['price']:.0f}₽/час\n"
+            text += await price_text(board_id, board['price'], board['quantity'], today) + "\n"
             text += f"📅 Дата: {today.strftime('%d.%m.%Y')} (сегодня)\n\n"
             text += "⏰ <b>Выберите доступное время:</b>"
             
@@ -253,11 +418,12 @@ def register_booking_handlers(router: Router, db: Database, bot=None):
         
         # Для обычной брони - выбираем дату
         await state.set_state(BookingStates.choosing_date)
+        date_kb = await date_keyboard(board_id, board['quantity'])
         
         text = f"📅 <b>Доска: {board['name']}</b>\n"
         if board.get('description'):
             text += f"{board['description']}\n\n"
-        text += f"💰 Цена: {board['price']:.0f}₽/час\n\n"
+        text += await price_text(board_id, board['price'], board['quantity']) + "\n\n"
         text += "Выберите дату бронирования:"
         
         # Если есть фото, отправляем его с текстом
@@ -267,25 +433,24 @@ def register_booking_handlers(router: Router, db: Database, bot=None):
                     chat_id=callback.from_user.id,
                     photo=images[0]['file_id'],
                     caption=text,
-                    reply_markup=get_date_keyboard()
+                    reply_markup=date_kb
                 )
                 await callback.message.delete()
                 return
             except Exception as e:
                 logger.error(f"Error sending board photo: {e}")
                 # Если не удалось отправить фото, отправляем текст
-                await callback.message.edit_text(text, reply_markup=get_date_keyboard())
+                await callback.message.edit_text(text, reply_markup=date_kb)
         else:
-            await callback.message.edit_text(text, reply_markup=get_date_keyboard())
+            await callback.message.edit_text(text, reply_markup=date_kb)
     
     @router.callback_query(F.data == "back_to_locations")
     async def back_to_locations(callback: CallbackQuery, state: FSMContext):
         """Возврат к выбору локации"""
         await callback.answer()
+        await holds.release(callback.from_user.id)
         await state.set_state(BookingStates.choosing_location)
-        locations = await db.fetchall(
-            "SELECT * FROM locations WHERE is_active = 1 ORDER BY name"
-        )
+        locations = await store.locations.active()
         text = "📍 <b>Выберите локацию:</b>"
         await callback.message.edit_text(text, reply_markup=get_locations_keyboard(locations))
     
@@ -293,18 +458,14 @@ def register_booking_handlers(router: Router, db: Database, bot=None):
     async def back_to_boards(callback: CallbackQuery, state: FSMContext):
         """Возврат к выбору досок"""
         await callback.answer()
+        await holds.release(callback.from_user.id)
         await state.set_state(BookingStates.choosing_board)
         data = await state.get_data()
         location_id = data.get("location_id")
         
         if location_id:
-            boards = await db.fetchall(
-                """SELECT * FROM boards 
-                   WHERE location_id = ? AND is_active = 1 
-                   ORDER BY name""",
-                (location_id,)
-            )
-            location = await db.fetchone("SELECT name FROM locations WHERE id = ?", (location_id,))
+            boards = await store.boards.by_location(location_id)
+            location = await store.locations.get(location_id)
             text = f"🏄 <b>Выберите доску для локации \"{location['name']}\":</b>"
             await callback.message.edit_text(text, reply_markup=get_boards_keyboard(boards))
     
@@ -338,10 +499,22 @@ def register_booking_handlers(router: Router, db: Database, bot=None):
                 text += f"📅 Дата начала: {booking_date.strftime('%d.%m.%Y')}\n"
                 text += f"⏱ Длительность: 24 часа\n\n"
                 text += "⏰ Выберите время начала (или используйте 00:00):"
-            else:
-                text = f"📅 <b>Дата: {booking_date.strftime('%d.%m.%Y')}</b>\n\n"
-                text += "⏰ Выберите время начала аренды:"
-            await callback.message.edit_text(text, reply_markup=get_time_keyboard())
+                await callback.message.edit_text(text, reply_markup=get_time_keyboard())
+                return
+            
+            # Только часы со свободными досками
+            board_id, capacity = data.get("board_id"), data.get("board_quantity", 1)
+            hours = await free_hours(board_id, capacity, booking_date)
+            if not hours:
+                await state.set_state(BookingStates.choosing_date)
+                await callback.message.edit_text(
+                    f"❌ На {booking_date.strftime('%d.%m.%Y')} свободного времени нет. Выберите другую дату.",
+                    reply_markup=await date_keyboard(board_id, capacity)
+                )
+                return
+            text = f"📅 <b>Дата: {booking_date.strftime('%d.%m.%Y')}</b>\n\n"
+            text += "⏰ Выберите время начала аренды:"
+            await callback.message.edit_text(text, reply_markup=get_time_keyboard(hours))
             
         except (ValueError, IndexError) as e:
             logger.error(f"Error parsing date from callback data '{callback.data}': {e}")
@@ -383,6 +556,21 @@ def register_booking_handlers(router: Router, db: Database, bot=None):
         
         booking_type = data.get("booking_type", "regular")
         
+        # Место удерживается за пользователем, пока он выбирает длительность
+        # и количество: занятое время обнаруживается сразу, а не при создании брони
+        hold = await holds.hold(
+            callback.from_user.id, data.get("board_id"), booking_date, hour * 60 + minute,
+            1440 if booking_type == "daily" else MIN_HOLD_MINUTES
+        )
+        if hold is None:
+            await callback.message.edit_text(
+                "❌ На это время свободных досок нет. Выберите другое время.",
+                reply_markup=get_time_keyboard(
+                    await free_hours(data.get("board_id"), data.get("board_quantity", 1), booking_date)
+                )
+            )
+            return
+        
         await state.update_data(start_time=hour, start_minute=minute)
         
         # Для суточной аренды - фиксированная длительность 1440 минут (24 часа), пропускаем выбор длительности
@@ -409,15 +597,19 @@ def register_booking_handlers(router: Router, db: Database, bot=None):
     async def back_to_date(callback: CallbackQuery, state: FSMContext):
         """Возврат к выбору даты"""
         await callback.answer()
+        await holds.release(callback.from_user.id)
         await state.set_state(BookingStates.choosing_date)
         data = await state.get_data()
         board_name = data.get("board_name", "Доска")
         board_price = data.get("board_price", 0)
         
         text = f"📅 <b>Доска: {board_name}</b>\n"
-        text += f"💰 Цена: {board_price:.0f}₽/час\n\n"
+        text += await price_text(data.get("board_id"), board_price, data.get("board_quantity", 1)) + "\n\n"
         text += "Выберите дату бронирования:"
-        await callback.message.edit_text(text, reply_markup=get_date_keyboard())
+        keyboard = await date_keyboard(
+            data.get("board_id"), data.get("board_quantity", 1), data.get("booking_type", "regular")
+        )
+        await callback.message.edit_text(text, reply_markup=keyboard)
     
     @router.callback_query(F.data.startswith("duration:"), BookingStates.choosing_duration)
     async def duration_chosen(callback: CallbackQuery, state: FSMContext):
@@ -439,17 +631,33 @@ def register_booking_handlers(router: Router, db: Database, bot=None):
             )
             return
         
+        # Удержание переносится на выбранную длительность
+        board_id = data.get("board_id")
+        start = start_time * 60 + data.get("start_minute", 0)
+        user_id = callback.from_user.id
+        if await holds.hold(user_id, board_id, booking_date, start, duration) is None:
+            await callback.message.edit_text(
+                "❌ На эту длительность свободных досок нет. Выберите меньшую длительность.",
+                reply_markup=get_duration_keyboard()
+            )
+            return
+        
         await state.update_data(duration=duration)
         
-        # Получаем доску для проверки доступного количества
-        board_id = data.get("board_id")
-        board = await db.fetchone("SELECT * FROM boards WHERE id = ?", (board_id,))
-        max_quantity = board['quantity'] if board else 5
+        # Доступное количество — за вычетом чужих броней и удержаний
+        timeline = await booking_service.get_day_timeline(board_id, booking_date, exclude_hold_user=user_id)
+        max_quantity = timeline.free(start, start + duration) if timeline else 1
         
         await state.set_state(BookingStates.choosing_quantity)
         
         duration_text = f"{duration // 60} ч" if duration >= 60 else f"{duration} мин"
-        text = f"⏱ <b>Длительность: {duration_text}</b>\n\n"
+        text = f"⏱ <b>Длительность: {duration_text}</b>\n"
+        if timeline:
+            quote = get_price_engine().quote(
+                board_id, data.get("board_price", 0), booking_date, timeline, start, duration
+            )
+            text += f"💰 {quote.unit_price:.0f}₽/час, {quote.amount:.0f}₽ за доску\n"
+        text += "\n"
         text += f"📊 Выберите количество досок (доступно: {max_quantity}):"
         await callback.message.edit_text(text, reply_markup=get_quantity_keyboard(max_quantity))
     
@@ -457,6 +665,7 @@ def register_booking_handlers(router: Router, db: Database, bot=None):
     async def back_to_time(callback: CallbackQuery, state: FSMContext):
         """Возврат к выбору времени"""
         await callback.answer()
+        await holds.release(callback.from_user.id)
         await state.set_state(BookingStates.choosing_time)
         data = await state.get_data()
         booking_date_str = data.get("booking_date")
@@ -475,11 +684,13 @@ def register_booking_handlers(router: Router, db: Database, bot=None):
             if available_slots:
                 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
                 buttons = []
-                for hour, minute in available_slots:
-                    buttons.append([InlineKeyboardButton(
+                for i, (hour, minute) in enumerate(available_slots):
+                    if i % 4 == 0:
+                        buttons.append([])
+                    buttons[-1].append(InlineKeyboardButton(
                         text=f"{hour}:{minute:02d}",
                         callback_data=f"time:{hour}:{minute}"
-                    )])
+                    ))
                 buttons.append([InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_boards")])
                 time_keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
                 
@@ -489,10 +700,13 @@ def register_booking_handlers(router: Router, db: Database, bot=None):
                 await callback.message.edit_text(text, reply_markup=time_keyboard)
                 return
         
-        # Для обычной брони - стандартная клавиатура
+        # Для обычной брони - свободные часы по кэшу занятости
+        hours = None
+        if booking_type == "regular" and board_id:
+            hours = await free_hours(board_id, data.get("board_quantity", 1), booking_date)
         text = f"📅 <b>Дата: {booking_date.strftime('%d.%m.%Y')}</b>\n\n"
         text += "⏰ Выберите время начала аренды:"
-        await callback.message.edit_text(text, reply_markup=get_time_keyboard())
+        await callback.message.edit_text(text, reply_markup=get_time_keyboard(hours))
     
     @router.callback_query(F.data.startswith("quantity:"), BookingStates.choosing_quantity)
     async def quantity_chosen(callback: CallbackQuery, state: FSMContext):
@@ -513,56 +727,66 @@ def register_booking_handlers(router: Router, db: Database, bot=None):
         user_id = callback.from_user.id
         
         # Получаем информацию о доске и партнере
-        board = await db.fetchone("SELECT * FROM boards WHERE id = ?", (board_id,))
+        board = await store.boards.get(board_id)
         if not board:
             await callback.message.edit_text("❌ Доска не найдена.")
             return
         
         partner_id = board.get("partner_id")
         location_id = board.get("location_id")
-        
-        # Проверка доступности
-        is_available = await booking_service.check_board_availability(
-            board_id, booking_date, start_time, start_minute, duration, quantity
-        )
-        
-        if not is_available:
-            await callback.message.edit_text(
-                "❌ Выбранное количество досок недоступно на это время. Попробуйте выбрать другое время или количество.",
-                reply_markup=get_back_keyboard("back_to_duration")
-            )
-            return
+        start = start_time * 60 + start_minute
         
         # Получаем тип бронирования
         booking_type = data.get("booking_type", "regular")
         
-        # Расчет стоимости
-        if booking_type == "daily":
-            # Для суточной аренды: цена × 24 часа × количество
-            amount = board_price * 24 * quantity
-        else:
-            # Для обычной аренды: цена × часы × количество
-            hours = duration / 60.0
-            amount = board_price * hours * quantity
-        
         # Создание бронирования
         try:
             # Для мгновенной брони статус будет изменен после оплаты на 'active'
             initial_status = "waiting_partner" if booking_type != "instant" else "waiting_partner"
             
-            booking_id = await booking_service.create_booking(
-                user_id=user_id,
-                board_id=board_id,
-                board_name=board_name,
-                booking_date=booking_date,
-                start_time=start_time,
-                start_minute=start_minute,
-                duration=duration,
-                quantity=quantity,
-                amount=amount,
-                partner_id=partner_id,
-                status=initial_status
-            )
+            # Время истечения оплаты записывается вместе с бронированием
+            payment_deadline = datetime.now() + timedelta(minutes=Config.PAYMENT_TIMEOUT_MINUTES)
+            
+            # Проверка, бронь и снятие удержания — одной транзакцией BEGIN IMMEDIATE;
+            # собственное удержание пользователя место не занимает
+            async with db.transaction(immediate=True):
+                timeline = await booking_service.get_day_timeline(
+                    board_id, booking_date, capacity=board.get("quantity"), exclude_hold_user=user_id
+                )
+                available = timeline.free(start, start + duration) >= quantity
+                if available:
+                    # Расчет стоимости по той же шкале занятости
+                    if booking_type == "daily":
+                        # Для суточной аренды: цена × 24 часа × количество
+                        amount = board_price * 24 * quantity
+                    else:
+                        # Для обычной аренды: цена часа по правилам движка цен × часы × количество
+                        amount = get_price_engine().quote(
+                            board_id, board_price, booking_date, timeline, start, duration, quantity
+                        ).amount
+                    booking_id = await booking_service.create_booking(
+                        user_id=user_id,
+                        board_id=board_id,
+                        board_name=board_name,
+                        booking_date=booking_date,
+                        start_time=start_time,
+                        start_minute=start_minute,
+                        duration=duration,
+                        quantity=quantity,
+                        amount=amount,
+                        partner_id=partner_id,
+                        status=initial_status,
+                        payment_deadline=payment_deadline
+                    )
+                    await holds.release(user_id)
+            
+            if not available:
+                await holds.extend(user_id)
+                await callback.message.edit_text(
+                    "❌ Выбранное количество досок недоступно на это время. Попробуйте выбрать другое время или количество.",
+                    reply_markup=get_back_keyboard("back_to_duration")
+                )
+                return
             
             # Сохраняем booking_type для последующей проверки при оплате
             await state.update_data(booking_type=booking_type)
@@ -570,16 +794,6 @@ def register_booking_handlers(router: Router, db: Database, bot=None):
             await state.update_data(booking_id=booking_id, amount=amount)
             await state.set_state(BookingStates.choosing_payment)
             
-            # Устанавливаем время истечения оплаты
-            from config import Config
-            payment_deadline = datetime.now() + timedelta(minutes=Config.PAYMENT_TIMEOUT_MINUTES)
-            
-            # Обновляем бронирование с временем истечения оплаты
-            await db.execute(
-                "UPDATE bookings SET payment_deadline = ? WHERE id = ?",
-                (payment_deadline, booking_id)
-            )
-            
             # Форматируем время истечения для отображения
             deadline_str = payment_deadline.strftime("%H:%M")
             minutes_left = Config.PAYMENT_TIMEOUT_MINUTES
@@ -616,6 +830,7 @@ def register_booking_handlers(router: Router, db: Database, bot=None):
     async def back_to_duration(callback: CallbackQuery, state: FSMContext):
         """Возврат к выбору длительности"""
         await callback.answer()
+        await holds.extend(callback.from_user.id)
         await state.set_state(BookingStates.choosing_duration)
         text = "⏱ Выберите длительность аренды:"
         await callback.message.edit_text(text, reply_markup=get_duration_keyboard())
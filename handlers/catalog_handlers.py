@@ -3,6 +3,7 @@ import logging
 from aiogram import Router, F
 from aiogram.types import CallbackQuery, Message, InlineKeyboardMarkup, InlineKeyboardButton
 from core.database import Database
+from core.data import get_store
 from keyboards.user import get_back_keyboard
 from services.review_service import ReviewService
 
@@ -12,13 +13,12 @@ logger = logging.getLogger(__name__)
 def register_catalog_handlers(router: Router, db: Database, bot=None):
     """Регистрация обработчиков каталога"""
     review_service = ReviewService(db)
+    store = get_store(db)
     
     @router.message(F.text == "📚 Каталог")
     async def catalog_menu(message: Message):
         """Меню каталога"""
-        locations = await db.fetchall(
-            "SELECT * FROM locations WHERE is_active = 1 ORDER BY name"
-        )
+        locations = await store.locations.active()
         
         text = "📚 <b>Каталог локаций и досок</b>\n\n"
         text += f"Доступно локаций: {len(locations)}\n\n"
@@ -42,17 +42,12 @@ def register_catalog_handlers(router: Router, db: Database, bot=None):
         await callback.answer()
         location_id = int(callback.data.split(":")[-1])
         
-        location = await db.fetchone("SELECT * FROM locations WHERE id = ?", (location_id,))
+        location = await store.locations.get(location_id)
         if not location:
             await callback.message.edit_text("❌ Локация не найдена.", reply_markup=get_back_keyboard())
             return
         
-        boards = await db.fetchall(
-            """SELECT * FROM boards 
-               WHERE location_id = ? AND is_active = 1 
-               ORDER BY name""",
-            (location_id,)
-        )
+        boards = await store.boards.by_location(location_id)
         
         text = f"📍 <b>{location['name']}</b>\n\n"
         if location.get('address'):
@@ -71,10 +66,10 @@ def register_catalog_handlers(router: Router, db: Database, bot=None):
         text += "Выберите доску для просмотра:"
         
         buttons = []
+        # Рейтинги всех показываемых досок одним запросом
+        ratings = await review_service.get_ratings("board", [board['id'] for board in boards[:20]])
         for board in boards[:20]:
-            # Получаем рейтинг для доски
-            avg_rating = await review_service.get_average_rating(board_id=board['id'])
-            review_count = await review_service.get_review_count(board_id=board['id'])
+            avg_rating, review_count = ratings.get(board['id'], (None, 0))
             
             board_text = f"🏄 {board['name']} - {board['price']:.0f}₽/ч"
             if avg_rating and review_count > 0:
@@ -99,16 +94,15 @@ def register_catalog_handlers(router: Router, db: Database, bot=None):
         await callback.answer()
         board_id = int(callback.data.split(":")[-1])
         
-        board = await db.fetchone("SELECT * FROM boards WHERE id = ?", (board_id,))
+        board = await store.boards.get(board_id)
         if not board:
             await callback.message.edit_text("❌ Доска не найдена.", reply_markup=get_back_keyboard())
             return
         
-        location = await db.fetchone("SELECT * FROM locations WHERE id = ?", (board['location_id'],))
+        location = await store.locations.get(board['location_id'])
         
         # Получаем отзывы и рейтинг
-        avg_rating = await review_service.get_average_rating(board_id=board_id)
-        review_count = await review_service.get_review_count(board_id=board_id)
+        avg_rating, review_count = await review_service.get_rating(board_id=board_id)
         
         text = f"🏄 <b>{board['name']}</b>\n\n"
         text += f"📍 Локация: {location['name'] if location else 'Не указана'}\n"
@@ -125,10 +119,7 @@ def register_catalog_handlers(router: Router, db: Database, bot=None):
             text += f"\n📝 Описание:\n{board['description']}\n"
         
         # Проверяем наличие фото
-        images = await db.fetchall(
-            "SELECT file_id FROM board_images WHERE board_id = ? LIMIT 1",
-            (board_id,)
-        )
+        images = await store.boards.images(board_id)
         
         buttons = [
             [InlineKeyboardButton(text="🆕 Забронировать", callback_data=f"booking_from_catalog:{board_id}")],
@@ -172,16 +163,13 @@ def register_catalog_handlers(router: Router, db: Database, bot=None):
         await callback.answer()
         board_id = int(callback.data.split(":")[-1])
         
-        images = await db.fetchall(
-            "SELECT file_id FROM board_images WHERE board_id = ?",
-            (board_id,)
-        )
+        images = await store.boards.images(board_id)
         
         if not images:
             await callback.answer("У этой доски нет фото.", show_alert=True)
             return
         
-        board = await db.fetchone("SELECT name FROM boards WHERE id = ?", (board_id,))
+        board = await store.boards.get(board_id)
         text = f"🖼️ <b>Фото доски: {board['name']}</b>\n\n"
         text += f"Всего фото: {len(images)}"
         
@@ -213,9 +201,7 @@ def register_catalog_handlers(router: Router, db: Database, bot=None):
         """Меню каталога (из callback)"""
         await callback.answer()
         
-        locations = await db.fetchall(
-            "SELECT * FROM locations WHERE is_active = 1 ORDER BY name"
-        )
+        locations = await store.locations.active()
         
         text = "📚 <b>Каталог локаций и досок</b>\n\n"
         text += f"Доступно локаций: {len(locations)}\n\n"
@@ -246,7 +232,7 @@ def register_catalog_handlers(router: Router, db: Database, bot=None):
         from aiogram.fsm.state import State, StatesGroup
         from handlers.booking_handlers import BookingStates
         
-        board = await db.fetchone("SELECT * FROM boards WHERE id = ?", (board_id,))
+        board = await store.boards.get(board_id)
         if not board:
             await callback.message.edit_text("❌ Доска не найдена.", reply_markup=get_back_keyboard())
             return
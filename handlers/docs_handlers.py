@@ -4,8 +4,8 @@ from aiogram import Router, F
 from aiogram.types import CallbackQuery, Message, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from core.database import Database
+from core.data import get_store
 from keyboards.user import get_back_keyboard
-from config import Config
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +33,7 @@ def get_docs_menu_keyboard(user_role: str = "user") -> InlineKeyboardMarkup:
 
 def register_docs_handlers(router: Router, db: Database, bot=None):
     """Регистрация обработчиков документации"""
+    store = get_store(db)
     
     @router.message(F.text == "📖 Документация")
     async def docs_menu(message: Message):
@@ -40,8 +41,8 @@ def register_docs_handlers(router: Router, db: Database, bot=None):
         user_id = message.from_user.id
         
         # Определяем роль пользователя
-        is_admin = user_id in Config.ADMIN_IDS or await db.fetchone("SELECT * FROM admins WHERE user_id = ?", (user_id,))
-        is_partner = await db.fetchone("SELECT * FROM partners WHERE telegram_id = ? AND is_approved = 1", (user_id,))
+        is_admin = await store.admins.is_admin(user_id)
+        is_partner = await store.partners.approved(user_id)
         
         if is_admin:
             role = "admin"
@@ -149,7 +150,7 @@ def register_docs_handlers(router: Router, db: Database, bot=None):
         user_id = callback.from_user.id
         
         # Проверка прав администратора
-        is_admin = user_id in Config.ADMIN_IDS or await db.fetchone("SELECT * FROM admins WHERE user_id = ?", (user_id,))
+        is_admin = await store.admins.is_admin(user_id)
         if not is_admin:
             await callback.message.edit_text("❌ У вас нет доступа к этой документации.")
             return
@@ -198,8 +199,8 @@ def register_docs_handlers(router: Router, db: Database, bot=None):
         user_id = callback.from_user.id
         
         # Определяем роль пользователя
-        is_admin = user_id in Config.ADMIN_IDS or await db.fetchone("SELECT * FROM admins WHERE user_id = ?", (user_id,))
-        is_partner = await db.fetchone("SELECT * FROM partners WHERE telegram_id = ? AND is_approved = 1", (user_id,))
+        is_admin = await store.admins.is_admin(user_id)
+        is_partner = await store.partners.approved(user_id)
         
         if is_admin:
             role = "admin"
@@ -3,12 +3,14 @@
 
 import logging
 from datetime import date
-from typing import Optional, Dict, Any, List, Tuple
+from typing import Optional, Dict, Any
 
 from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
+from services.finance_rollup import FinanceRollup
+
 logger = logging.getLogger(__name__)
 finance_router = Router()
 _db: Any = None
@@ -20,121 +22,31 @@ BTN_TURNOVER_MONTH = "📅 Оборот за месяц"
 BTN_ADD_EXPENSE = "➕ Добавить расход"
 BTN_BACK = "🔙 Назад"
 
-# Статусы броней, которые считаем
-GOOD_STATUSES = ("active", "completed")
-
 
 class ExpenseFSM(StatesGroup):
     amount = State()
     desc = State()
 
 
-async def _ensure_expenses_table(db):
-    """Создаёт таблицу расходов, если её нет."""
-    await db.execute(
-        """
-        CREATE TABLE IF NOT EXISTS expenses (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date TEXT NOT NULL,
-            amount REAL NOT NULL,
-            description TEXT
-        )
-        """,
-        commit=True
-    )
-
-
-def _date_filters(
-    prefix: str,
-    date_from: Optional[str],
-    date_to: Optional[str],
-    column: str = "date"
-) -> Tuple[str, List[Any]]:
-    """
-    Универсальный фильтр по дате:
-      prefix — алиас таблицы, column — имя колонки с датой.
-    """
-    clauses, params = [], []
-    if date_from:
-        clauses.append(f"{prefix}.{column} >= ?")
-        params.append(date_from)
-    if date_to:
-        clauses.append(f"{prefix}.{column} <= ?")
-        params.append(date_to)
-    if not clauses:
-        return "", []
-    return " AND " + " AND ".join(clauses), params
-
-
 async def get_finance_stats(
     db,
     date_from: Optional[str] = None,
     date_to: Optional[str] = None
 ) -> Dict[str, Any]:
-    # гарантируем таблицу расходов
-    await _ensure_expenses_table(db)
-
-    # 1) Доход из броней
-    bk_clause, bk_params = _date_filters("b", date_from, date_to, "date")
-    placeholders = ",".join("?" for _ in GOOD_STATUSES)
-    params = list(GOOD_STATUSES) + bk_params
-
-    row = await db.execute(
-        f"""
-        SELECT COALESCE(SUM(b.amount),0)
-          FROM bookings b
-         WHERE b.status IN ({placeholders})
-           {bk_clause}
-        """,
-        tuple(params),
-        fetch="one"
-    )
-    income = float(row[0] or 0.0)
-
-    # 2) Расходы вручную
-    exp_clause, exp_params = _date_filters("e", date_from, date_to, "date")
-    row = await db.execute(
-        f"SELECT COALESCE(SUM(e.amount),0) FROM expenses e WHERE 1=1{exp_clause}",
-        tuple(exp_params),
-        fetch="one"
-    )
-    expenses = float(row[0] or 0.0)
-
-    # 3) Выплаты партнёрам (по completed-броням)
-    # фильтруем по дате в колонке created_at
-    part_clause, part_params = _date_filters("o", date_from, date_to, "created_at")
-    row = await db.execute(
-        f"""
-        SELECT COALESCE(SUM(o.amount),0)
-          FROM partner_wallet_ops o
-         WHERE o.type = 'credit'
-           AND o.src  = 'booking_completed'
-           {part_clause}
-        """,
-        tuple(part_params),
-        fetch="one"
-    )
-    partner_payout = float(row[0] or 0.0)
-
-    # 4) Выплаты сотрудникам
-    emp_clause, emp_params = _date_filters("b", date_from, date_to, "date")
-    row = await db.execute(
-        f"""
-        SELECT COALESCE(SUM(e.amount),0)
-          FROM employee_wallet_ops e
-          JOIN bookings b ON e.booking_id = b.id
-         WHERE 1=1
-           {emp_clause}
-        """,
-        tuple(emp_params),
-        fetch="one"
-    )
-    employee_payout = float(row[0] or 0.0)
+    """
+    Финансы за период по daily_finance_rollup (итоги по дням ведут
+    триггеры), без прохода по всей истории броней и операций.
+    """
+    totals = await FinanceRollup(db).get_totals(date_from, date_to)
+    income = totals["income"]
+    expenses = totals["expenses"]
+    partner_payout = totals["partner_payout"]
+    employee_payout = totals["employee_payout"]
 
-    # 5) Комиссия площадки = остаток
+    # Комиссия площадки = остаток
     platform_commission = income - partner_payout - employee_payout - expenses
 
-    # 6) Процентные доли
+    # Процентные доли
     pct = lambda x: (x / income * 100) if income else 0.0
     perc = {
         "partner": pct(partner_payout),
@@ -227,7 +139,6 @@ def register_finance_handlers(dp: Router, db):
 
     @finance_router.message(F.text == BTN_ADD_EXPENSE)
     async def start_add_expense(msg: types.Message, state: FSMContext):
-        await _ensure_expenses_table(_db)
         await state.set_state(ExpenseFSM.amount)
         await msg.answer("📥 Введите сумму расхода:", reply_markup=types.ReplyKeyboardRemove())
 
@@ -251,8 +162,7 @@ def register_finance_handlers(dp: Router, db):
         await _db.execute(
             "INSERT INTO expenses (date, amount, description) "
             "VALUES (date('now'), ?, ?)",
-            (amt, desc),
-            commit=True
+            (amt, desc)
         )
         await msg.answer(f"✅ Расход {amt:.2f} ₽ добавлен («{desc}»)", reply_markup=kb())
         await state.clear()
@@ -6,8 +6,13 @@ from aiogram.types import CallbackQuery, Message, InlineKeyboardMarkup, InlineKe
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from core.database import Database
-from services.booking_service import BookingService
-from keyboards.user import get_back_keyboard, get_date_keyboard, get_time_keyboard, get_quantity_keyboard
+from core.data import get_store
+from services.booking_service import BookingService, ReservationError, ReservationItem
+from services.occupancy import get_occupancy
+from keyboards.user import (
+    get_back_keyboard, get_date_keyboard, get_time_keyboard, get_quantity_keyboard,
+    DATE_KEYBOARD_DAYS, MIN_DURATION_MINUTES
+)
 from utils.date_parser import parse_date, is_date_valid
 from config import Config
 
@@ -26,9 +31,31 @@ class MultiBookingStates(StatesGroup):
     choosing_payment = State()
 
 
+def _reservation_items(board_ids, board_quantities, booking_date, start_time, start_minute, duration):
+    """Позиции групповой брони из данных FSM"""
+    start = start_time * 60 + (start_minute or 0)
+    return [
+        ReservationItem(board_id, board_quantities.get(board_id, 1), booking_date, start, duration)
+        for board_id in board_ids
+    ]
+
+
+def _reservation_error_text(error: ReservationError) -> str:
+    if error.board_name:
+        return f"❌ Доска '{error.board_name}' недоступна на выбранное время."
+    return "❌ Одна из выбранных досок больше недоступна."
+
+
 def register_multi_booking_handlers(router: Router, db: Database, bot=None):
     """Регистрация обработчиков мультиброни"""
     booking_service = BookingService(db)
+    store = get_store(db)
+    occupancy = get_occupancy(db)
+    
+    async def board_capacities(board_ids) -> dict:
+        """Количество мест выбранных досок (boards.quantity) из кэша справочников"""
+        boards = [await store.boards.get(board_id) for board_id in board_ids]
+        return {board['id']: board['quantity'] for board in boards if board}
     
     @router.callback_query(F.data == "booking_type:multi")
     async def booking_type_multi(callback: CallbackQuery, state: FSMContext):
@@ -37,9 +64,7 @@ def register_multi_booking_handlers(router: Router, db: Database, bot=None):
         await state.set_state(MultiBookingStates.choosing_location)
         await state.update_data(booking_type="multi", selected_boards=[])
         
-        locations = await db.fetchall(
-            "SELECT * FROM locations WHERE is_active = 1 ORDER BY name"
-        )
+        locations = await store.locations.active()
         
         if not locations:
             await callback.message.edit_text(
@@ -62,12 +87,7 @@ def register_multi_booking_handlers(router: Router, db: Database, bot=None):
         await state.update_data(location_id=location_id)
         await state.set_state(MultiBookingStates.choosing_boards)
         
-        boards = await db.fetchall(
-            """SELECT * FROM boards 
-               WHERE location_id = ? AND is_active = 1 
-               ORDER BY name""",
-            (location_id,)
-        )
+        boards = await store.boards.by_location(location_id)
         
         if not boards:
             await callback.message.edit_text(
@@ -76,7 +96,7 @@ def register_multi_booking_handlers(router: Router, db: Database, bot=None):
             )
             return
         
-        location = await db.fetchone("SELECT name FROM locations WHERE id = ?", (location_id,))
+        location = await store.locations.get(location_id)
         text = f"🎯 <b>Мультибронь</b>\n\n"
         text += f"📍 Локация: {location['name']}\n\n"
         text += "Выберите доски (можно выбрать несколько):"
@@ -127,14 +147,9 @@ def register_multi_booking_handlers(router: Router, db: Database, bot=None):
         
         # Обновляем клавиатуру
         location_id = data.get("location_id")
-        boards = await db.fetchall(
-            """SELECT * FROM boards 
-               WHERE location_id = ? AND is_active = 1 
-               ORDER BY name""",
-            (location_id,)
-        )
+        boards = await store.boards.by_location(location_id)
         
-        location = await db.fetchone("SELECT name FROM locations WHERE id = ?", (location_id,))
+        location = await store.locations.get(location_id)
         text = f"🎯 <b>Мультибронь</b>\n\n"
         text += f"📍 Локация: {location['name']}\n\n"
         text += "Выберите доски (можно выбрать несколько):"
@@ -173,14 +188,23 @@ def register_multi_booking_handlers(router: Router, db: Database, bot=None):
         
         await state.set_state(MultiBookingStates.choosing_date)
         
+        # Дни, когда хотя бы одна из досок занята весь день, помечаются
+        capacities = await board_capacities(selected_board_ids)
+        today = date.today()
+        free = await occupancy.free_days(
+            selected_board_ids, capacities, today, DATE_KEYBOARD_DAYS, MIN_DURATION_MINUTES
+        )
+        days = (today + timedelta(days=i) for i in range(DATE_KEYBOARD_DAYS))
+        keyboard = get_date_keyboard(full_days=[day for day in days if day not in free])
+        
         text = f"🎯 <b>Мультибронь</b>\n\n"
         text += f"Выбрано досок: {len(selected_board_ids)}\n\n"
         text += "Выберите дату бронирования (для всех досок одинаковую):"
         
         try:
-            await callback.message.edit_text(text, reply_markup=get_date_keyboard())
+            await callback.message.edit_text(text, reply_markup=keyboard)
         except:
-            await callback.message.answer(text, reply_markup=get_date_keyboard())
+            await callback.message.answer(text, reply_markup=keyboard)
     
     @router.callback_query(F.data.startswith("date:"), MultiBookingStates.choosing_date)
     async def multi_date_chosen(callback: CallbackQuery, state: FSMContext):
@@ -198,6 +222,19 @@ def register_multi_booking_handlers(router: Router, db: Database, bot=None):
                 )
                 return
             
+            # Часы, когда свободны все выбранные доски
+            selected_board_ids = (await state.get_data()).get("selected_board_ids", [])
+            hours = await occupancy.free_hours(
+                selected_board_ids, await board_capacities(selected_board_ids),
+                booking_date, MIN_DURATION_MINUTES
+            )
+            if not hours:
+                await callback.message.edit_text(
+                    "❌ На эту дату нет времени, когда свободны все выбранные доски. Выберите другую дату.",
+                    reply_markup=get_date_keyboard()
+                )
+                return
+            
             await state.update_data(booking_date=booking_date.strftime("%Y-%m-%d"))
             await state.set_state(MultiBookingStates.choosing_time)
             
@@ -205,7 +242,7 @@ def register_multi_booking_handlers(router: Router, db: Database, bot=None):
             text += f"📅 Дата: {booking_date.strftime('%d.%m.%Y')}\n\n"
             text += "⏰ Выберите время начала (для всех досок одинаковое):"
             
-            await callback.message.edit_text(text, reply_markup=get_time_keyboard())
+            await callback.message.edit_text(text, reply_markup=get_time_keyboard(hours))
         except (ValueError, IndexError) as e:
             logger.error(f"Error parsing date: {e}")
             await callback.message.edit_text(
@@ -268,53 +305,7 @@ def register_multi_booking_handlers(router: Router, db: Database, bot=None):
         await state.update_data(board_quantities=board_quantities)
         await state.set_state(MultiBookingStates.confirming)
         
-        # Показываем подтверждение
-        booking_date_str = data.get("booking_date")
-        booking_date = datetime.strptime(booking_date_str, "%Y-%m-%d").date()
-        
-        boards_data = []
-        total_amount = 0
-        
-        for board_id in selected_board_ids:
-            board = await db.fetchone("SELECT * FROM boards WHERE id = ?", (board_id,))
-            if not board:
-                continue
-            
-            quantity = board_quantities.get(board_id, 1)
-            hours = duration / 60.0
-            amount = board['price'] * hours * quantity
-            total_amount += amount
-            
-            boards_data.append({
-                'id': board_id,
-                'name': board['name'],
-                'price': board['price'],
-                'quantity': quantity,
-                'amount': amount,
-                'partner_id': board.get('partner_id')
-            })
-        
-        text = f"🎯 <b>Подтверждение мультиброни</b>\n\n"
-        text += f"📅 Дата: {booking_date.strftime('%d.%m.%Y')}\n"
-        text += f"⏰ Время: {start_time}:{start_minute:02d}\n"
-        text += f"⏱ Длительность: {duration} минут\n\n"
-        text += "<b>Выбранные доски:</b>\n"
-        
-        for board in boards_data:
-            text += f"• {board['name']} x{board['quantity']} = {board['amount']:.2f}₽\n"
-        
-        text += f"\n💰 <b>Итого: {total_amount:.2f}₽</b>"
-        
-        buttons = [
-            [InlineKeyboardButton(text="✅ Подтвердить", callback_data="multi:confirm")],
-            [InlineKeyboardButton(text="🔙 Назад", callback_data="multi:back_to_boards")],
-        ]
-        keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
-        
-        try:
-            await callback.message.edit_text(text, reply_markup=keyboard)
-        except:
-            await callback.message.answer(text, reply_markup=keyboard)
+        await _multi_show_confirm(callback, state, db)
     
     async def _multi_show_confirm(callback: CallbackQuery, state: FSMContext, db: Database):
         """Подтверждение мультиброни"""
@@ -332,28 +323,21 @@ def register_multi_booking_handlers(router: Router, db: Database, bot=None):
         
         booking_date = datetime.strptime(booking_date_str, "%Y-%m-%d").date()
         
-        # Получаем информацию о досках
-        boards_data = []
-        total_amount = 0
-        
-        for board_id in selected_board_ids:
-            board = await db.fetchone("SELECT * FROM boards WHERE id = ?", (board_id,))
-            if not board:
-                continue
-            
-            quantity = board_quantities.get(board_id, 1)
-            hours = duration / 60.0
-            amount = board['price'] * hours * quantity
-            total_amount += amount
-            
-            boards_data.append({
-                'id': board_id,
-                'name': board['name'],
-                'price': board['price'],
-                'quantity': quantity,
-                'amount': amount,
-                'partner_id': board.get('partner_id')
-            })
+        # Доски и занятость — по одному запросу, цены — движком цен
+        try:
+            lines = await booking_service.quote_reservation(
+                _reservation_items(selected_board_ids, board_quantities, booking_date, start_time, start_minute, duration)
+            )
+        except ReservationError as e:
+            await callback.message.edit_text(
+                _reservation_error_text(e), reply_markup=get_back_keyboard("multi:back_to_boards")
+            )
+            return
+        boards_data = [
+            {'name': line.board['name'], 'quantity': line.item.quantity, 'amount': line.amount}
+            for line in lines
+        ]
+        total_amount = sum(line.amount for line in lines)
         
         text = f"🎯 <b>Подтверждение мультиброни</b>\n\n"
         text += f"📅 Дата: {booking_date.strftime('%d.%m.%Y')}\n"
@@ -392,59 +376,17 @@ def register_multi_booking_handlers(router: Router, db: Database, bot=None):
         
         booking_date = datetime.strptime(booking_date_str, "%Y-%m-%d").date()
         
-        # Генерируем group_id (используем timestamp)
-        import time
-        group_id = int(time.time())
-        
-        booking_ids = []
-        total_amount = 0
-        
-        # Проверяем доступность всех досок
-        for board_id in selected_board_ids:
-            board = await db.fetchone("SELECT * FROM boards WHERE id = ?", (board_id,))
-            if not board:
-                continue
-            
-            quantity = board_quantities.get(board_id, 1)
-            
-            # Проверка доступности
-            is_available = await booking_service.check_board_availability(
-                board_id, booking_date, start_time, start_minute, duration, quantity
-            )
-            
-            if not is_available:
-                await callback.message.edit_text(
-                    f"❌ Доска '{board['name']}' недоступна на выбранное время.\n"
-                    "Попробуйте выбрать другое время или убрать эту доску.",
-                    reply_markup=get_back_keyboard("multi:back_to_boards")
-                )
-                return
-        
-        # Создаем бронирования для каждой доски
+        # Все доски проверяются по одному снимку занятости и записываются
+        # одной транзакцией BEGIN IMMEDIATE: либо вся группа, либо ничего
         try:
-            for board_id in selected_board_ids:
-                board = await db.fetchone("SELECT * FROM boards WHERE id = ?", (board_id,))
-                if not board:
-                    continue
-                
-                quantity = board_quantities.get(board_id, 1)
-                hours = duration / 60.0
-                amount = board['price'] * hours * quantity
-                total_amount += amount
-                
-                # Создаем бронирование с group_id
-                cursor = await db.execute(
-                    """INSERT INTO bookings 
-                       (user_id, board_id, board_name, date, start_time, start_minute, 
-                        duration, quantity, amount, status, partner_id, group_id, payment_deadline)
-                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                    (
-                        user_id, board_id, board['name'], booking_date, start_time, start_minute,
-                        duration, quantity, amount, "waiting_partner", board.get('partner_id'),
-                        group_id, datetime.now() + timedelta(minutes=Config.PAYMENT_TIMEOUT_MINUTES)
-                    )
-                )
-                booking_ids.append(cursor.lastrowid)
+            reservation = await booking_service.reserve(
+                user_id,
+                _reservation_items(selected_board_ids, board_quantities, booking_date, start_time, start_minute, duration),
+                payment_deadline=datetime.now() + timedelta(minutes=Config.PAYMENT_TIMEOUT_MINUTES)
+            )
+            booking_ids = reservation.booking_ids
+            group_id = reservation.group_id
+            total_amount = reservation.total_amount
             
             # Сохраняем данные для оплаты
             await state.update_data(
@@ -466,6 +408,11 @@ def register_multi_booking_handlers(router: Router, db: Database, bot=None):
             except:
                 await callback.message.answer(text, reply_markup=get_payment_method_keyboard())
                 
+        except ReservationError as e:
+            await callback.message.edit_text(
+                _reservation_error_text(e) + "\nПопробуйте выбрать другое время или убрать эту доску.",
+                reply_markup=get_back_keyboard("multi:back_to_boards")
+            )
         except Exception as e:
             logger.error(f"Error creating multi-booking: {e}")
             await callback.message.edit_text("❌ Ошибка при создании мультиброни. Попробуйте еще раз.")
@@ -479,14 +426,9 @@ def register_multi_booking_handlers(router: Router, db: Database, bot=None):
         location_id = data.get("location_id")
         
         if location_id:
-            boards = await db.fetchall(
-                """SELECT * FROM boards 
-                   WHERE location_id = ? AND is_active = 1 
-                   ORDER BY name""",
-                (location_id,)
-            )
+            boards = await store.boards.by_location(location_id)
             
-            location = await db.fetchone("SELECT name FROM locations WHERE id = ?", (location_id,))
+            location = await store.locations.get(location_id)
             text = f"🎯 <b>Мультибронь</b>\n\n"
             text += f"📍 Локация: {location['name']}\n\n"
             text += "Выберите доски (можно выбрать несколько):"
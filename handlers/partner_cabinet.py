@@ -11,6 +11,7 @@ from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.utils.markdown import hbold
 from helpers.wallet import get_employee_balance
 from core.database import Database
+from notifications.job_queue import sync_booking_jobs
 from helpers.wallet import get_partner_balance, get_employee_balance
 from handlers.partner_fsm_handlers import AddDailyBoardFSM, partner_fsm_router
 
@@ -198,6 +199,7 @@ def register_partner_cabinet(dp: Router, db: Database):
             "AND status IN ('waiting_partner','waiting_card','waiting_cash')",
             (oid,), commit=True
         )
+        await sync_booking_jobs(db, oid)
         await cq.message.answer(f"✅ Бронь #{oid} подтверждена.")
 
     @router.callback_query(F.data.startswith("cancel_booking_"))
@@ -209,6 +211,7 @@ def register_partner_cabinet(dp: Router, db: Database):
             "AND status IN ('waiting_partner','waiting_card','waiting_cash')",
             (oid,), commit=True
         )
+        await sync_booking_jobs(db, oid)
         await cq.message.answer(f"❌ Бронь #{oid} отменена.")
         # оповестить пользователя
         row = await db.execute(
@@ -459,7 +462,7 @@ def register_partner_cabinet(dp: Router, db: Database):
         await cq.answer()
         pid = await db.get_partner_id_by_telegram(cq.from_user.id)
         row = await db.execute(
-            "SELECT COALESCE(SUM(amount),0) FROM partner_wallet_ops WHERE partner_id = ? AND type='credit'",
+            "SELECT COALESCE((SELECT credit FROM wallet_balances WHERE partner_id = ?), 0)",
             (pid,), fetch="one"
         )
         await cq.message.answer(f"📊 Доход: {row[0]:.2f} ₽")
@@ -5,12 +5,15 @@ from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKe
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from core.database import Database
+from core.data import get_store
 from keyboards.partner import (
     get_partner_menu, get_location_management_keyboard,
     get_board_management_keyboard, get_booking_action_keyboard, get_board_edit_keyboard,
     get_board_images_keyboard, get_reviews_menu_keyboard, get_board_management_keyboard_with_reviews
 )
 from keyboards.user import get_back_keyboard
+from notifications.job_queue import sync_booking_jobs
+from services.wallet_ledger import EmployeeLedger, credit_completed_booking
 from keyboards.common import get_confirm_keyboard
 
 logger = logging.getLogger(__name__)
@@ -40,6 +43,9 @@ class PartnerStates(StatesGroup):
 
 def register_partner_handlers(router: Router, db: Database, bot=None, notification_service=None):
     """Регистрация партнерских обработчиков"""
+    # Правки локаций, досок и фото сразу видны в каталоге и бронировании
+    # этого процесса; другие процессы узнают о них по cache_versions
+    store = get_store(db)
     
     @router.callback_query(F.data == "partner:locations")
     async def partner_locations(callback: CallbackQuery):
@@ -47,10 +53,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         await callback.answer()
         user_id = callback.from_user.id
         
-        partner = await db.fetchone(
-            "SELECT id FROM partners WHERE telegram_id = ? AND is_approved = 1",
-            (user_id,)
-        )
+        partner = await store.partners.approved(user_id)
         
         if not partner:
             await callback.message.edit_text("❌ У вас нет доступа.")
@@ -111,10 +114,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         address = message.text.strip()
         user_id = message.from_user.id
         
-        partner = await db.fetchone(
-            "SELECT id FROM partners WHERE telegram_id = ? AND is_approved = 1",
-            (user_id,)
-        )
+        partner = await store.partners.approved(user_id)
         
         if not partner:
             await message.answer("❌ Ошибка доступа.")
@@ -130,6 +130,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
                    VALUES (?, ?, ?, 1)""",
                 (location_name, address, partner['id'])
             )
+            store.invalidate()
             
             text = f"✅ Локация <b>{location_name}</b> успешно добавлена!"
             await message.answer(text, reply_markup=get_back_keyboard("partner:locations"))
@@ -220,6 +221,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         
         try:
             await db.execute("UPDATE locations SET name = ? WHERE id = ?", (new_name, location_id))
+            store.invalidate()
             await message.answer(f"✅ Название изменено на <b>{new_name}</b>!", reply_markup=get_back_keyboard(f"partner:location:{location_id}"))
             await state.clear()
         except Exception as e:
@@ -250,6 +252,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         
         try:
             await db.execute("UPDATE locations SET address = ? WHERE id = ?", (new_address, location_id))
+            store.invalidate()
             await message.answer(f"✅ Адрес изменен на <b>{new_address}</b>!", reply_markup=get_back_keyboard(f"partner:location:{location_id}"))
             await state.clear()
         except Exception as e:
@@ -301,6 +304,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         
         try:
             await db.execute("DELETE FROM locations WHERE id = ?", (location_id,))
+            store.invalidate()
             
             await callback.message.edit_text(
                 f"✅ Локация <b>{location['name']}</b> удалена!",
@@ -316,10 +320,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         await callback.answer()
         user_id = callback.from_user.id
         
-        partner = await db.fetchone(
-            "SELECT id FROM partners WHERE telegram_id = ? AND is_approved = 1",
-            (user_id,)
-        )
+        partner = await store.partners.approved(user_id)
         
         if not partner:
             await callback.message.edit_text("❌ У вас нет доступа.")
@@ -385,8 +386,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         # Добавляем информацию об отзывах, если есть
         from services.review_service import ReviewService
         review_service = ReviewService(db)
-        avg_rating = await review_service.get_average_rating(board_id=board_id)
-        review_count = await review_service.get_review_count(board_id=board_id)
+        avg_rating, review_count = await review_service.get_rating(board_id=board_id)
         
         if avg_rating and review_count > 0:
             text += f"\n\n⭐ Рейтинг: {avg_rating:.1f}/5 ({review_count} отзывов)"
@@ -408,10 +408,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         await callback.answer()
         user_id = callback.from_user.id
         
-        partner = await db.fetchone(
-            "SELECT id FROM partners WHERE telegram_id = ? AND is_approved = 1",
-            (user_id,)
-        )
+        partner = await store.partners.approved(user_id)
         
         if not partner:
             await callback.message.edit_text("❌ У вас нет доступа.")
@@ -560,6 +557,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
                    VALUES (?, ?, ?, ?, ?, ?, ?, 1)""",
                 (board_name, description, price, total, quantity, partner_id, location_id)
             )
+            store.invalidate()
             
             text = f"✅ Доска <b>{board_name}</b> успешно добавлена!"
             if description and user_description == '-':
@@ -603,6 +601,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         
         try:
             await db.execute("DELETE FROM boards WHERE id = ?", (board_id,))
+            store.invalidate()
             
             await callback.message.edit_text(
                 f"✅ Доска <b>{board['name']}</b> удалена!",
@@ -619,10 +618,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         board_id = int(callback.data.split(":")[-1])
         
         user_id = callback.from_user.id
-        partner = await db.fetchone(
-            "SELECT id FROM partners WHERE telegram_id = ? AND is_approved = 1",
-            (user_id,)
-        )
+        partner = await store.partners.approved(user_id)
         
         if not partner:
             await callback.message.edit_text("❌ У вас нет доступа.")
@@ -694,10 +690,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         board_id = int(callback.data.split(":")[-1])
         
         user_id = callback.from_user.id
-        partner = await db.fetchone(
-            "SELECT id FROM partners WHERE telegram_id = ? AND is_approved = 1",
-            (user_id,)
-        )
+        partner = await store.partners.approved(user_id)
         
         if not partner:
             try:
@@ -753,6 +746,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
                 "INSERT INTO board_images (board_id, file_id) VALUES (?, ?)",
                 (board_id, file_id)
             )
+            store.invalidate()
             
             board = await db.fetchone("SELECT name FROM boards WHERE id = ?", (board_id,))
             await message.answer(f"✅ Фото добавлено для доски <b>{board['name']}</b>!\n\nМожете добавить еще фото или нажать 'Назад'.")
@@ -767,10 +761,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         board_id = int(callback.data.split(":")[-1])
         
         user_id = callback.from_user.id
-        partner = await db.fetchone(
-            "SELECT id FROM partners WHERE telegram_id = ? AND is_approved = 1",
-            (user_id,)
-        )
+        partner = await store.partners.approved(user_id)
         
         if not partner:
             try:
@@ -849,6 +840,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         
         try:
             await db.execute("DELETE FROM board_images WHERE id = ?", (image_id,))
+            store.invalidate()
             
             board = await db.fetchone("SELECT name FROM boards WHERE id = ?", (board_id,))
             text = f"✅ Фото удалено для доски <b>{board['name']}</b>!"
@@ -914,6 +906,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         
         try:
             await db.execute("UPDATE boards SET name = ? WHERE id = ?", (new_name, board_id))
+            store.invalidate()
             await message.answer(f"✅ Название изменено на <b>{new_name}</b>!", reply_markup=get_back_keyboard(f"partner:board:{board_id}"))
             await state.clear()
         except Exception as e:
@@ -948,6 +941,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         
         try:
             await db.execute("UPDATE boards SET price = ? WHERE id = ?", (new_price, board_id))
+            store.invalidate()
             await message.answer(f"✅ Цена изменена на <b>{new_price:.0f}₽/час</b>!", reply_markup=get_back_keyboard(f"partner:board:{board_id}"))
             await state.clear()
         except Exception as e:
@@ -975,6 +969,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         
         try:
             await db.execute("UPDATE boards SET description = ? WHERE id = ?", (new_description, board_id))
+            store.invalidate()
             text = "✅ Описание обновлено!" if new_description else "✅ Описание удалено!"
             await message.answer(text, reply_markup=get_back_keyboard(f"partner:board:{board_id}"))
             await state.clear()
@@ -1016,6 +1011,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
                 "UPDATE boards SET total = ?, quantity = ? WHERE id = ?",
                 (new_total, new_total, board_id)
             )
+            store.invalidate()
             await message.answer(f"✅ Количество изменено на <b>{new_total}</b>!", reply_markup=get_back_keyboard(f"partner:board:{board_id}"))
             await state.clear()
         except Exception as e:
@@ -1028,10 +1024,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         await callback.answer()
         user_id = callback.from_user.id
         
-        partner = await db.fetchone(
-            "SELECT id FROM partners WHERE telegram_id = ? AND is_approved = 1",
-            (user_id,)
-        )
+        partner = await store.partners.approved(user_id)
         
         if not partner:
             await callback.message.edit_text("❌ У вас нет доступа.")
@@ -1125,6 +1118,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
                 "UPDATE bookings SET status = 'active' WHERE id = ?",
                 (booking_id,)
             )
+            await sync_booking_jobs(db, booking_id)
             
             booking = await db.fetchone(
                 "SELECT * FROM bookings WHERE id = ?",
@@ -1152,54 +1146,25 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         booking_id = int(callback.data.split(":")[-1])
         
         try:
-            await db.execute(
-                "UPDATE bookings SET status = 'completed' WHERE id = ?",
-                (booking_id,)
-            )
+            booking = await db.fetchone("SELECT * FROM bookings WHERE id = ?", (booking_id,))
+            if not booking or booking['status'] == 'completed':
+                await callback.message.edit_text("❌ Бронирование не найдено или уже завершено.")
+                return
+            
+            # Статус и начисления (партнеру и сотруднику) — одной транзакцией
+            async with db.transaction():
+                await db.execute(
+                    "UPDATE bookings SET status = 'completed' WHERE id = ?",
+                    (booking_id,)
+                )
+                # Начисляем средства партнеру (если не Telegram Pay)
+                if booking.get('payment_method') != 'telegram' and booking.get('partner_id'):
+                    await credit_completed_booking(db, booking)
+            await sync_booking_jobs(db, booking_id)
             
             text = f"✅ Бронирование #{booking_id} завершено!"
             await callback.message.edit_text(text, reply_markup=get_back_keyboard("partner:bookings"))
             
-            # Начисляем средства партнеру (если не Telegram Pay)
-            if booking.get('payment_method') != 'telegram' and booking.get('partner_id'):
-                try:
-                    from config import Config
-                    partner_id = booking['partner_id']
-                    amount = booking['amount']
-                    
-                    # Получаем комиссию платформы
-                    platform_commission = Config.PLATFORM_COMMISSION_PERCENT
-                    partner_amount = amount * (1 - platform_commission / 100)
-                    
-                    # Если есть сотрудник, вычитаем его комиссию
-                    if booking.get('employee_id'):
-                        employee = await db.fetchone(
-                            "SELECT commission_percent FROM employees WHERE id = ?",
-                            (booking['employee_id'],)
-                        )
-                        if employee:
-                            employee_commission = employee['commission_percent']
-                            employee_amount = partner_amount * (employee_commission / 100)
-                            partner_amount -= employee_amount
-                            
-                            # Начисляем сотруднику
-                            await db.execute(
-                                """INSERT INTO partner_wallet_ops (partner_id, type, amount, src, booking_id)
-                                   VALUES (?, 'credit', ?, ?, ?)""",
-                                (booking['employee_id'], employee_amount, f"Комиссия за бронирование #{booking_id}", booking_id)
-                            )
-                    
-                    # Начисляем партнеру
-                    await db.execute(
-                        """INSERT INTO partner_wallet_ops (partner_id, type, amount, src, booking_id)
-                           VALUES (?, 'credit', ?, ?, ?)""",
-                        (partner_id, partner_amount, f"Бронирование #{booking_id}", booking_id)
-                    )
-                    
-                    logger.info(f"Credited {partner_amount:.2f} to partner {partner_id} for booking {booking_id}")
-                except Exception as e:
-                    logger.error(f"Error crediting partner wallet: {e}")
-            
         except Exception as e:
             logger.error(f"Error completing booking: {e}")
             await callback.message.edit_text("❌ Ошибка при завершении бронирования.")
@@ -1261,6 +1226,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
                 "UPDATE bookings SET status = 'canceled' WHERE id = ?",
                 (booking_id,)
             )
+            await sync_booking_jobs(db, booking_id)
             
             text = f"✅ Бронирование #{booking_id} отменено!"
             await callback.message.edit_text(text, reply_markup=get_back_keyboard("partner:bookings"))
@@ -1283,10 +1249,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         user_id = callback.from_user.id
         
         # Проверяем права партнера
-        partner = await db.fetchone(
-            "SELECT id FROM partners WHERE telegram_id = ? AND is_approved = 1 AND is_active = 1",
-            (user_id,)
-        )
+        partner = await store.partners.approved(user_id, active=True)
         
         if not partner:
             await callback.message.edit_text("❌ У вас нет доступа к партнерской панели.")
@@ -1298,8 +1261,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         from services.review_service import ReviewService
         review_service = ReviewService(db)
         
-        avg_rating = await review_service.get_average_rating(partner_id=partner_id)
-        review_count = await review_service.get_review_count(partner_id=partner_id)
+        avg_rating, review_count = await review_service.get_rating(partner_id=partner_id)
         
         text = "⭐ <b>Отзывы</b>\n\n"
         if review_count > 0:
@@ -1325,10 +1287,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         await callback.answer()
         user_id = callback.from_user.id
         
-        partner = await db.fetchone(
-            "SELECT id FROM partners WHERE telegram_id = ? AND is_approved = 1 AND is_active = 1",
-            (user_id,)
-        )
+        partner = await store.partners.approved(user_id, active=True)
         
         if not partner:
             await callback.message.edit_text("❌ У вас нет доступа.")
@@ -1338,10 +1297,10 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         from services.review_service import ReviewService
         review_service = ReviewService(db)
         
-        # Получаем все отзывы
-        reviews = await review_service.get_reviews_by_partner(partner_id, limit=1000)
+        # Итоги из сводки rating_stats и распределение одним GROUP BY
+        avg, total = await review_service.get_rating(partner_id=partner_id)
         
-        if not reviews:
+        if not total:
             text = "📊 <b>Статистика отзывов</b>\n\n"
             text += "У вас пока нет отзывов."
             keyboard = get_back_keyboard("partner:reviews")
@@ -1351,11 +1310,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
                 await callback.message.answer(text, reply_markup=keyboard)
             return
         
-        # Подсчитываем статистику
-        total = len(reviews)
-        ratings = [r['rating'] for r in reviews]
-        avg = sum(ratings) / len(ratings) if ratings else 0
-        rating_counts = {i: ratings.count(i) for i in range(1, 6)}
+        rating_counts = await review_service.get_rating_distribution(partner_id)
         
         text = "📊 <b>Статистика отзывов</b>\n\n"
         text += f"Всего отзывов: {total}\n"
@@ -1379,10 +1334,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         await callback.answer()
         user_id = callback.from_user.id
         
-        partner = await db.fetchone(
-            "SELECT id FROM partners WHERE telegram_id = ? AND is_approved = 1 AND is_active = 1",
-            (user_id,)
-        )
+        partner = await store.partners.approved(user_id, active=True)
         
         if not partner:
             await callback.message.edit_text("❌ У вас нет доступа.")
@@ -1496,10 +1448,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         await state.clear()
         user_id = callback.from_user.id
         
-        partner = await db.fetchone(
-            "SELECT * FROM partners WHERE telegram_id = ? AND is_approved = 1",
-            (user_id,)
-        )
+        partner = await store.partners.approved(user_id)
         
         text = f"💼 <b>Партнерская панель</b>\n\n"
         text += f"Партнер: {partner['name']}\n"
@@ -1514,10 +1463,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         await callback.answer()
         user_id = callback.from_user.id
         
-        partner = await db.fetchone(
-            "SELECT id FROM partners WHERE telegram_id = ? AND is_approved = 1 AND is_active = 1",
-            (user_id,)
-        )
+        partner = await store.partners.approved(user_id, active=True)
         
         if not partner:
             await callback.message.edit_text("❌ У вас нет доступа.")
@@ -1525,9 +1471,17 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         
         partner_id = partner['id']
         
-        # Получаем список сотрудников
+        # Сотрудники с именем, числом броней и начислениями — одним запросом
         employees = await db.fetchall(
-            "SELECT * FROM employees WHERE partner_id = ? ORDER BY created_at DESC",
+            """SELECT e.id, e.telegram_id, e.commission_percent,
+                      u.full_name,
+                      COALESCE(eb.earned, 0) AS earned,
+                      (SELECT COUNT(*) FROM bookings b WHERE b.employee_id = e.id) AS bookings_count
+               FROM employees e
+               LEFT JOIN users u ON u.id = e.telegram_id
+               LEFT JOIN employee_balances eb ON eb.employee_telegram_id = CAST(e.telegram_id AS TEXT)
+               WHERE e.partner_id = ?
+               ORDER BY e.created_at DESC""",
             (partner_id,)
         )
         
@@ -1540,19 +1494,11 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         else:
             text += "<b>Список сотрудников:</b>\n\n"
             for emp in employees:
-                # Получаем информацию о пользователе
-                user = await db.fetchone("SELECT full_name, username FROM users WHERE id = ?", (emp['telegram_id'],))
-                user_name = user.get('full_name', f"ID: {emp['telegram_id']}") if user else f"ID: {emp['telegram_id']}"
-                
-                # Статистика по сотруднику
-                bookings_count = await db.fetchone(
-                    "SELECT COUNT(*) as count FROM bookings WHERE employee_id = ?",
-                    (emp['id'],)
-                )
-                
+                user_name = emp['full_name'] or f"ID: {emp['telegram_id']}"
                 text += f"👤 {user_name}\n"
                 text += f"   Комиссия: {emp['commission_percent']}%\n"
-                text += f"   Бронирований: {bookings_count['count'] if bookings_count else 0}\n"
+                text += f"   Бронирований: {emp['bookings_count']}\n"
+                text += f"   Начислено: {emp['earned']:.2f} ₽\n"
                 text += f"   ID: {emp['telegram_id']}\n\n"
         
         buttons = [
@@ -1560,8 +1506,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         ]
         
         for emp in employees[:10]:
-            user = await db.fetchone("SELECT full_name FROM users WHERE id = ?", (emp['telegram_id'],))
-            emp_name = user.get('full_name', f"ID {emp['telegram_id']}") if user else f"ID {emp['telegram_id']}"
+            emp_name = emp['full_name'] or f"ID {emp['telegram_id']}"
             buttons.append([InlineKeyboardButton(
                 text=f"👤 {emp_name}",
                 callback_data=f"partner:employee:{emp['id']}"
@@ -1600,10 +1545,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         
         user_id = message.from_user.id
         
-        partner = await db.fetchone(
-            "SELECT id FROM partners WHERE telegram_id = ? AND is_approved = 1 AND is_active = 1",
-            (user_id,)
-        )
+        partner = await store.partners.approved(user_id, active=True)
         
         if not partner:
             await message.answer("❌ У вас нет доступа.")
@@ -1658,10 +1600,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         employee_id = int(callback.data.split(":")[-1])
         user_id = callback.from_user.id
         
-        partner = await db.fetchone(
-            "SELECT id FROM partners WHERE telegram_id = ? AND is_approved = 1 AND is_active = 1",
-            (user_id,)
-        )
+        partner = await store.partners.approved(user_id, active=True)
         
         if not partner:
             await callback.message.edit_text("❌ У вас нет доступа.")
@@ -1684,15 +1623,13 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         username = user.get('username', '') if user else ''
         
         # Статистика
-        bookings_count = await db.fetchone(
-            "SELECT COUNT(*) as count FROM bookings WHERE employee_id = ?",
-            (employee_id,)
-        )
-        
-        completed_bookings = await db.fetchone(
-            "SELECT COUNT(*) as count FROM bookings WHERE employee_id = ? AND status = 'completed'",
+        stats = await db.fetchone(
+            """SELECT COUNT(*) AS total,
+                      COALESCE(SUM(status = 'completed'), 0) AS completed
+               FROM bookings WHERE employee_id = ?""",
             (employee_id,)
         )
+        earned = await EmployeeLedger(db).get_balance(employee['telegram_id'])
         
         text = f"👤 <b>Сотрудник</b>\n\n"
         text += f"Имя: {user_name}\n"
@@ -1701,10 +1638,12 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         text += f"Telegram ID: {employee['telegram_id']}\n"
         text += f"Комиссия: {employee['commission_percent']}%\n\n"
         text += f"<b>Статистика:</b>\n"
-        text += f"Всего бронирований: {bookings_count['count'] if bookings_count else 0}\n"
-        text += f"Завершено: {completed_bookings['count'] if completed_bookings else 0}\n"
+        text += f"Всего бронирований: {stats['total'] if stats else 0}\n"
+        text += f"Завершено: {stats['completed'] if stats else 0}\n"
+        text += f"Начислено: {earned:.2f} ₽\n"
         
         buttons = [
+            [InlineKeyboardButton(text="📄 Выписка", callback_data=f"partner:employee_statement:{employee_id}:0")],
             [InlineKeyboardButton(text="✏️ Изменить комиссию", callback_data=f"partner:employee_commission:{employee_id}")],
             [InlineKeyboardButton(text="🗑️ Удалить", callback_data=f"partner:employee_delete:{employee_id}")],
             [InlineKeyboardButton(text="🔙 Назад", callback_data="partner:employees")],
@@ -1716,6 +1655,54 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         except:
             await callback.message.answer(text, reply_markup=keyboard)
     
+    @router.callback_query(F.data.startswith("partner:employee_statement:"))
+    async def partner_employee_statement(callback: CallbackQuery):
+        """Выписка начислений сотрудника (постранично, от новых к старым)"""
+        await callback.answer()
+        _, _, employee_id, before_id = callback.data.split(":")
+        employee_id = int(employee_id)
+        before_id = int(before_id) or None
+        
+        employee = await db.fetchone(
+            """SELECT e.telegram_id FROM employees e
+               JOIN partners p ON p.id = e.partner_id
+               WHERE e.id = ? AND p.telegram_id = ? AND p.is_approved = 1 AND p.is_active = 1""",
+            (employee_id, callback.from_user.id)
+        )
+        if not employee:
+            await callback.message.edit_text("❌ Сотрудник не найден.")
+            return
+        
+        ledger = EmployeeLedger(db)
+        ops, next_cursor = await ledger.get_statement(employee['telegram_id'], limit=10, before_id=before_id)
+        
+        text = "📄 <b>Выписка сотрудника</b>\n\n"
+        text += f"Начислено всего: {await ledger.get_balance(employee['telegram_id']):.2f} ₽\n\n"
+        if not ops:
+            text += "Начислений пока нет."
+        for op in ops:
+            booking = f"бронь #{op['booking_id']}" if op['booking_id'] else op['src']
+            text += f"• {str(op['created_at'])[:16]} — +{op['amount']:.2f} ₽ ({booking})\n"
+        
+        buttons = []
+        if next_cursor:
+            buttons.append([InlineKeyboardButton(
+                text="➡️ Ранее",
+                callback_data=f"partner:employee_statement:{employee_id}:{next_cursor}"
+            )])
+        if before_id:
+            buttons.append([InlineKeyboardButton(
+                text="⬅️ К последним",
+                callback_data=f"partner:employee_statement:{employee_id}:0"
+            )])
+        buttons.append([InlineKeyboardButton(text="🔙 Назад", callback_data=f"partner:employee:{employee_id}")])
+        keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
+        
+        try:
+            await callback.message.edit_text(text, reply_markup=keyboard)
+        except:
+            await callback.message.answer(text, reply_markup=keyboard)
+    
     @router.callback_query(F.data.startswith("partner:employee_delete:"))
     async def partner_employee_delete(callback: CallbackQuery):
         """Удаление сотрудника"""
@@ -1792,10 +1779,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         employee_id = data.get("employee_id")
         user_id = message.from_user.id
         
-        partner = await db.fetchone(
-            "SELECT id FROM partners WHERE telegram_id = ? AND is_approved = 1 AND is_active = 1",
-            (user_id,)
-        )
+        partner = await store.partners.approved(user_id, active=True)
         
         if not partner:
             await message.answer("❌ У вас нет доступа.")
@@ -1837,10 +1821,7 @@ def register_partner_handlers(router: Router, db: Database, bot=None, notificati
         await state.clear()
         user_id = callback.from_user.id
         
-        partner = await db.fetchone(
-            "SELECT * FROM partners WHERE telegram_id = ? AND is_approved = 1",
-            (user_id,)
-        )
+        partner = await store.partners.approved(user_id)
         
         if not partner:
             await callback.message.edit_text("❌ У вас нет доступа к партнерской панели.")
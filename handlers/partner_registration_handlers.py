@@ -115,7 +115,7 @@ def register_partner_registration_handlers(router: Router, db: Database, bot=Non
                     
                     for admin_id in Config.ADMIN_IDS:
                         try:
-                            await bot.send_message(chat_id=admin_id, text=admin_text)
+                            await notification_service.outbox.enqueue(chat_id=admin_id, text=admin_text)
                         except Exception as e:
                             logger.error(f"Error notifying admin {admin_id}: {e}")
                 except Exception as e:
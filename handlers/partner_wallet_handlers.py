@@ -5,6 +5,7 @@ from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKe
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from core.database import Database
+from services.wallet_ledger import WalletLedger
 from keyboards.user import get_back_keyboard
 from keyboards.common import get_confirm_keyboard
 
@@ -35,18 +36,10 @@ def register_partner_wallet_handlers(router: Router, db: Database, bot=None):
             return
         
         # Расчет баланса
-        wallet_ops = await db.fetchall(
-            """SELECT 
-                   SUM(CASE WHEN type = 'credit' THEN amount ELSE 0 END) as credits,
-                   SUM(CASE WHEN type = 'debit' THEN amount ELSE 0 END) as debits
-               FROM partner_wallet_ops 
-               WHERE partner_id = ?""",
-            (partner['id'],)
-        )
-        
-        credits = wallet_ops[0]['credits'] or 0
-        debits = wallet_ops[0]['debits'] or 0
-        balance = credits - debits
+        totals = await WalletLedger(db).get_totals(partner['id'])
+        credits = totals['credit']
+        debits = totals['debit']
+        balance = totals['balance']
         
         # Последние операции
         recent_ops = await db.fetchall(
@@ -103,15 +96,7 @@ def register_partner_wallet_handlers(router: Router, db: Database, bot=None):
             return
         
         # Проверяем баланс
-        wallet_ops = await db.fetchall(
-            """SELECT 
-                   SUM(CASE WHEN type = 'credit' THEN amount ELSE 0 END) as credits,
-                   SUM(CASE WHEN type = 'debit' THEN amount ELSE 0 END) as debits
-               FROM partner_wallet_ops 
-               WHERE partner_id = ?""",
-            (partner['id'],)
-        )
-        balance = (wallet_ops[0]['credits'] or 0) - (wallet_ops[0]['debits'] or 0)
+        balance = await WalletLedger(db).get_balance(partner['id'])
         
         if balance <= 0:
             await callback.message.edit_text(
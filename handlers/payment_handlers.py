@@ -7,6 +7,7 @@ from aiogram.fsm.context import FSMContext
 from config import Config
 from core.database import Database
 from services.payment_service import PaymentService
+from notifications.job_queue import sync_booking_jobs
 from keyboards.user import get_payment_method_keyboard, get_back_keyboard
 
 logger = logging.getLogger(__name__)
@@ -33,6 +34,7 @@ def register_payment_handlers(router: Router, db: Database, bot=None, notificati
                 "UPDATE bookings SET status = 'active', payment_method = 'telegram', payment_id = ? WHERE id = ?",
                 (payment.telegram_payment_charge_id, booking_id)
             )
+            await sync_booking_jobs(db, booking_id)
             
             booking = await db.fetchone("SELECT * FROM bookings WHERE id = ?", (booking_id,))
             
@@ -6,6 +6,7 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from core.database import Database
 from services.review_service import ReviewService
+from notifications.outbox import get_outbox
 from keyboards.user import get_back_keyboard
 
 logger = logging.getLogger(__name__)
@@ -168,7 +169,7 @@ def register_review_handlers(router: Router, db: Database, bot=None):
                             partner_text += f"Комментарий: {comment}\n"
                         partner_text += f"\nБронирование: #{booking_id}"
                         
-                        await bot.send_message(
+                        await get_outbox(bot, db).enqueue(
                             chat_id=partner['telegram_id'],
                             text=partner_text
                         )
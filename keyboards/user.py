@@ -2,6 +2,11 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
 
+# Сколько дней показывает get_date_keyboard
+DATE_KEYBOARD_DAYS = 14
+# Самая короткая длительность get_duration_keyboard
+MIN_DURATION_MINUTES = 30
+
 
 def get_main_menu() -> ReplyKeyboardMarkup:
     """Главное меню пользователя"""
@@ -26,6 +31,7 @@ def get_booking_type_keyboard() -> InlineKeyboardMarkup:
             [InlineKeyboardButton(text="⚡ Мгновенная бронь", callback_data="booking_type:instant")],
             [InlineKeyboardButton(text="🌙 Суточная аренда", callback_data="booking_type:daily")],
             [InlineKeyboardButton(text="📦 Мультибронь", callback_data="booking_type:multi")],
+            [InlineKeyboardButton(text="🔎 Найти свободное время", callback_data="booking_type:search")],
             [InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_menu")],
         ]
     )
@@ -56,13 +62,13 @@ def get_payment_method_keyboard() -> InlineKeyboardMarkup:
     return keyboard
 
 
-def get_locations_keyboard(locations: list) -> InlineKeyboardMarkup:
+def get_locations_keyboard(locations: list, prefix: str = "location") -> InlineKeyboardMarkup:
     """Клавиатура с локациями"""
     buttons = []
     for loc in locations:
         buttons.append([InlineKeyboardButton(
             text=f"📍 {loc['name']}",
-            callback_data=f"location:{loc['id']}"
+            callback_data=f"{prefix}:{loc['id']}"
         )])
     buttons.append([InlineKeyboardButton(text="🔙 Назад", callback_data="back_booking")])
     return InlineKeyboardMarkup(inline_keyboard=buttons)
@@ -81,15 +87,19 @@ def get_boards_keyboard(boards: list) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def get_date_keyboard() -> InlineKeyboardMarkup:
-    """Клавиатура для выбора даты (ближайшие 14 дней)"""
+def get_date_keyboard(full_days=()) -> InlineKeyboardMarkup:
+    """Клавиатура для выбора даты (ближайшие 14 дней)
+    
+    full_days — даты без свободного времени, они помечаются.
+    """
     from datetime import date, timedelta
     
     buttons = []
     today = date.today()
+    full_days = set(full_days)
     
     # Создаем кнопки на 14 дней вперед
-    for i in range(14):
+    for i in range(DATE_KEYBOARD_DAYS):
         booking_date = today + timedelta(days=i)
         day_name = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"][booking_date.weekday()]
         
@@ -102,6 +112,9 @@ def get_date_keyboard() -> InlineKeyboardMarkup:
         elif i == 1:
             date_text = f"Завтра ({booking_date.day:02d}.{booking_date.month:02d})"
         
+        if booking_date in full_days:
+            date_text = f"🚫 {date_text} — мест нет"
+        
         buttons.append([InlineKeyboardButton(
             text=date_text,
             callback_data=f"date:{booking_date.strftime('%Y-%m-%d')}"
@@ -111,11 +124,58 @@ def get_date_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def get_time_keyboard() -> InlineKeyboardMarkup:
-    """Клавиатура для выбора времени"""
+def get_search_presets_keyboard(location_id: int) -> InlineKeyboardMarkup:
+    """Быстрый поиск свободного времени: день и желаемое время одной кнопкой"""
+    from datetime import date, datetime, timedelta
+    
+    today = date.today()
+    tomorrow = today + timedelta(days=1)
+    saturday = today + timedelta(days=(5 - today.weekday()) % 7)
+    sunday = today + timedelta(days=(6 - today.weekday()) % 7)
+    now = datetime.now()
+    presets = [
+        ("⚡ Сегодня, ближайшее", today, now.hour * 60 + now.minute),
+        ("🌅 Завтра утром", tomorrow, 9 * 60),
+        ("🌇 Завтра вечером", tomorrow, 18 * 60),
+        ("🏖 Суббота днем", saturday, 14 * 60),
+        ("🏖 Воскресенье днем", sunday, 14 * 60),
+    ]
+    buttons = [
+        [InlineKeyboardButton(
+            text=text,
+            callback_data=f"find:{location_id}:{day.strftime('%Y-%m-%d')}:{minute}"
+        )]
+        for text, day, minute in presets
+    ]
+    buttons.append([InlineKeyboardButton(text="🔙 Назад", callback_data="booking_type:search")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+def get_search_results_keyboard(options: list, location_id: int) -> InlineKeyboardMarkup:
+    """Найденные слоты (services.booking_service.SlotOption): бронь в одно нажатие"""
+    buttons = []
+    for option in options:
+        hour, minute = divmod(option.start, 60)
+        day_name = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"][option.booking_date.weekday()]
+        buttons.append([InlineKeyboardButton(
+            text=f"{option.board_name} · {day_name} {option.booking_date.strftime('%d.%m')} "
+                 f"{hour}:{minute:02d} · {option.amount:.0f}₽",
+            callback_data=f"pick:{option.board_id}:{option.booking_date.strftime('%Y-%m-%d')}:{hour}:{minute}"
+        )])
+    buttons.append([InlineKeyboardButton(text="🔙 Назад", callback_data=f"find_loc:{location_id}")])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+def get_time_keyboard(hours=None) -> InlineKeyboardMarkup:
+    """Клавиатура для выбора времени
+    
+    hours — только эти часы (например, свободные по кэшу занятости).
+    """
     buttons = []
     # Время с 8:00 до 22:00 с интервалом в 1 час
     for hour in range(8, 23):
+        if hours is not None and hour not in hours:
+            continue
         buttons.append([InlineKeyboardButton(
             text=f"{hour}:00",
             callback_data=f"time:{hour}:0"
@@ -127,7 +187,7 @@ def get_time_keyboard() -> InlineKeyboardMarkup:
 def get_duration_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура для выбора длительности"""
     durations = [
-        (30, "30 мин"),
+        (MIN_DURATION_MINUTES, "30 мин"),
         (60, "1 час"),
         (90, "1.5 часа"),
         (120, "2 часа"),
@@ -0,0 +1,224 @@
+"""Очередь отложенных задач по бронированиям
+
+Задачи хранятся в таблице scheduled_jobs (переживают перезапуск), а в памяти
+держится min-heap по времени срабатывания: планировщик спит ровно до
+ближайшей задачи и просыпается раньше, если появилась более ранняя.
+
+Виды задач:
+    complete — завершение активной брони в end_at;
+    expire   — отмена неоплаченной брони в payment_deadline;
+    remind   — напоминание за час до start_at.
+"""
+import asyncio
+import heapq
+import logging
+import weakref
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from core.database import Database
+from services.availability import from_epoch_minutes
+
+logger = logging.getLogger(__name__)
+
+JOB_COMPLETE = "complete"
+JOB_EXPIRE = "expire"
+JOB_REMIND = "remind"
+
+WAITING_PAYMENT_STATUSES = ('waiting_partner', 'waiting_card', 'waiting_cash')
+REMINDER_BEFORE = timedelta(hours=1)
+
+
+def as_datetime(value) -> datetime:
+    """Значение TIMESTAMP из SQLite (строка или datetime) как datetime"""
+    return value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+
+
+class JobQueue:
+    """Персистентная очередь задач с индексом в памяти"""
+
+    def __init__(self, db: Database):
+        self.db = db
+        self._heap: List[Tuple[datetime, int, str, int]] = []
+        # Актуальное время задачи; записи heap с другим временем устарели
+        self._pending: Dict[int, datetime] = {}
+        self._wakeup = asyncio.Event()
+
+    async def load(self):
+        """Загрузка невыполненных задач из БД (при старте)"""
+        rows = await self.db.fetchall(
+            "SELECT id, booking_id, kind, due_at FROM scheduled_jobs WHERE status = 'pending' ORDER BY due_at"
+        )
+        self._heap = []
+        self._pending = {}
+        for row in rows:
+            due = as_datetime(row['due_at'])
+            self._pending[row['id']] = due
+            self._heap.append((due, row['id'], row['kind'], row['booking_id']))
+        heapq.heapify(self._heap)
+        logger.info(f"Loaded {len(self._heap)} pending jobs")
+
+    async def refresh(self) -> int:
+        """Подхват задач, поставленных или отмененных другими процессами
+
+        Сайт и Mini App пишут scheduled_jobs в своей копии очереди, которую
+        никто не выполняет; бот при sweep добирает такие строки в свой heap.
+
+        Returns:
+            Количество добавленных (или перенесенных) задач
+        """
+        rows = await self.db.fetchall(
+            "SELECT id, booking_id, kind, due_at FROM scheduled_jobs WHERE status = 'pending'"
+        )
+        pending = set()
+        added = 0
+        for row in rows:
+            pending.add(row['id'])
+            due = as_datetime(row['due_at'])
+            if self._pending.get(row['id']) != due:
+                self._push(row['id'], row['kind'], row['booking_id'], due)
+                added += 1
+        for job_id in set(self._pending) - pending:
+            del self._pending[job_id]
+        return added
+
+    async def schedule(self, booking_id: int, kind: str, due: datetime):
+        """Постановка (или перенос) задачи; одна задача каждого вида на бронь"""
+        await self.db.execute(
+            """INSERT INTO scheduled_jobs (booking_id, kind, due_at, status, attempts)
+               VALUES (?, ?, ?, 'pending', 0)
+               ON CONFLICT (booking_id, kind) DO UPDATE SET
+                   due_at = excluded.due_at, status = 'pending', attempts = 0""",
+            (booking_id, kind, due)
+        )
+        row = await self.db.fetchone(
+            "SELECT id FROM scheduled_jobs WHERE booking_id = ? AND kind = ?",
+            (booking_id, kind)
+        )
+        self._push(row['id'], kind, booking_id, due)
+
+    def _push(self, job_id: int, kind: str, booking_id: int, due: datetime):
+        self._pending[job_id] = due
+        heapq.heappush(self._heap, (due, job_id, kind, booking_id))
+        if self._heap[0][1] == job_id:
+            # Новая задача раньше той, до которой спит планировщик
+            self.wake()
+
+    async def cancel(self, booking_id: int, kinds: Optional[Tuple[str, ...]] = None):
+        """Отмена задач брони (всех или указанных видов)"""
+        query = "SELECT id FROM scheduled_jobs WHERE booking_id = ? AND status = 'pending'"
+        params: tuple = (booking_id,)
+        if kinds:
+            query += f" AND kind IN ({', '.join('?' * len(kinds))})"
+            params += tuple(kinds)
+        rows = await self.db.fetchall(query, params)
+        if not rows:
+            return
+        ids = [row['id'] for row in rows]
+        await self.db.execute(
+            f"UPDATE scheduled_jobs SET status = 'canceled' WHERE id IN ({', '.join('?' * len(ids))})",
+            tuple(ids)
+        )
+        for job_id in ids:
+            self._pending.pop(job_id, None)
+
+    def next_due(self) -> Optional[datetime]:
+        """Время ближайшей актуальной задачи"""
+        while self._heap and self._pending.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: Optional[datetime] = None) -> List[Tuple[int, str, int]]:
+        """Извлечение наступивших задач: [(job_id, kind, booking_id)]"""
+        now = now or datetime.now()
+        due_jobs = []
+        while True:
+            due = self.next_due()
+            if due is None or due > now:
+                break
+            _, job_id, kind, booking_id = heapq.heappop(self._heap)
+            del self._pending[job_id]
+            due_jobs.append((job_id, kind, booking_id))
+        return due_jobs
+
+    async def mark_done(self, job_id: int):
+        """Отметка о выполнении; задачу, перенесенную на будущее во время
+        выполнения, не трогаем"""
+        await self.db.execute(
+            "UPDATE scheduled_jobs SET status = 'done' WHERE id = ? AND status = 'pending' AND due_at <= ?",
+            (job_id, datetime.now())
+        )
+
+    async def retry_later(self, job_id: int, kind: str, booking_id: int, max_attempts: int = 5):
+        """Повтор задачи после ошибки с растущей задержкой"""
+        row = await self.db.fetchone("SELECT attempts FROM scheduled_jobs WHERE id = ?", (job_id,))
+        attempts = (row['attempts'] if row else 0) + 1
+        if attempts >= max_attempts:
+            await self.db.execute(
+                "UPDATE scheduled_jobs SET status = 'failed', attempts = ? WHERE id = ?",
+                (attempts, job_id)
+            )
+            logger.error(f"Job {job_id} ({kind}) for booking {booking_id} failed after {attempts} attempts")
+            return
+        due = datetime.now() + timedelta(minutes=attempts)
+        await self.db.execute(
+            "UPDATE scheduled_jobs SET due_at = ?, attempts = ? WHERE id = ?",
+            (due, attempts, job_id)
+        )
+        self._push(job_id, kind, booking_id, due)
+
+    def wake(self):
+        """Досрочное пробуждение ожидающего wait()"""
+        self._wakeup.set()
+
+    async def wait(self, timeout: Optional[float]):
+        """Сон до таймаута или до появления более ранней задачи"""
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+_queues: "weakref.WeakKeyDictionary[Database, JobQueue]" = weakref.WeakKeyDictionary()
+
+
+def get_job_queue(db: Database) -> JobQueue:
+    """Общая очередь задач для экземпляра БД"""
+    queue = _queues.get(db)
+    if queue is None:
+        queue = _queues[db] = JobQueue(db)
+    return queue
+
+
+async def sync_booking_jobs(db: Database, booking_id: int) -> bool:
+    """Приведение задач брони в соответствие с ее текущим статусом
+
+    Вызывается после создания брони и смены статуса. Сами задачи при
+    выполнении еще раз проверяют бронь, так что лишняя задача безопасна.
+
+    Returns:
+        True, если задача поставлена (или перенесена)
+    """
+    queue = get_job_queue(db)
+    booking = await db.fetchone(
+        "SELECT status, start_at, end_at, payment_deadline FROM bookings WHERE id = ?",
+        (booking_id,)
+    )
+    if not booking:
+        await queue.cancel(booking_id)
+        return False
+
+    status = booking['status']
+    if status in WAITING_PAYMENT_STATUSES and booking['payment_deadline']:
+        await queue.schedule(booking_id, JOB_EXPIRE, as_datetime(booking['payment_deadline']))
+        return True
+    if status == 'active' and booking['end_at'] is not None:
+        await queue.cancel(booking_id, (JOB_EXPIRE,))
+        await queue.schedule(booking_id, JOB_COMPLETE, from_epoch_minutes(booking['end_at']))
+        remind_at = from_epoch_minutes(booking['start_at']) - REMINDER_BEFORE
+        if remind_at > datetime.now():
+            await queue.schedule(booking_id, JOB_REMIND, remind_at)
+        return True
+    if status not in WAITING_PAYMENT_STATUSES:
+        await queue.cancel(booking_id)
+    return False
@@ -1,21 +1,54 @@
 """Планировщик уведомлений и фоновых задач"""
 import asyncio
 import logging
+import time
 from datetime import datetime
 from core.database import Database
+from notifications.outbox import get_outbox
+from notifications.job_queue import (
+    JOB_COMPLETE, JOB_EXPIRE, JOB_REMIND, WAITING_PAYMENT_STATUSES,
+    get_job_queue, sync_booking_jobs, as_datetime
+)
+from services.availability import from_epoch_minutes, now_epoch_minutes
 from services.booking_service import BookingService
+from services.holds import get_holds
+from services.occupancy import prune_occupancy_changes
+from services.wallet_ledger import WalletLedger, credit_completed_booking
 from config import Config
 
 logger = logging.getLogger(__name__)
 
+# Брони без нужной задачи (созданные сайтом, до обновления и т.п.).
+# Только те, для которых sync_booking_jobs что-то поставит: у активной
+# брони известен конец, у ожидающей оплаты — срок оплаты. Брони сайта без
+# срока оплаты и суточные брони без end_at иначе выбирались бы каждый раз
+MISSING_JOBS_SQL = """SELECT b.id FROM bookings b 
+    WHERE (b.status = 'active' AND b.end_at IS NOT NULL
+           OR b.status IN ('waiting_partner', 'waiting_card', 'waiting_cash')
+           AND b.payment_deadline IS NOT NULL)
+    AND NOT EXISTS (
+        SELECT 1 FROM scheduled_jobs j 
+        WHERE j.booking_id = b.id 
+        AND j.kind = CASE WHEN b.status = 'active' THEN 'complete' ELSE 'expire' END
+    )"""
+
 
 class NotificationScheduler:
-    """Планировщик для автоматических задач"""
+    """Планировщик для автоматических задач
+
+    Выполняет задачи из JobQueue в момент их наступления: спит до
+    ближайшей задачи, а не опрашивает таблицу bookings раз в минуту.
+    Реже (SCHEDULER_SWEEP_MINUTES) ищет брони, для которых задачи еще
+    не поставлены, — например, созданные сайтом в другом процессе, и
+    удаляет просроченные удержания мест и старые записи журнала занятости.
+    Раз в WALLET_RECONCILE_HOURS сверяет балансы партнеров с операциями.
+    """
     
     def __init__(self, db: Database, bot=None):
         self.db = db
         self.bot = bot
         self.booking_service = BookingService(db)
+        self.jobs = get_job_queue(db)
         self._running = False
     
     async def start(self):
@@ -23,54 +56,94 @@ class NotificationScheduler:
         self._running = True
         logger.info("Notification scheduler started")
         
+        await self.jobs.load()
+        sweep_interval = Config.SCHEDULER_SWEEP_MINUTES * 60
+        next_sweep = 0.0
+        reconcile_interval = Config.WALLET_RECONCILE_HOURS * 3600
+        next_reconcile = time.monotonic() + reconcile_interval
+        
         while self._running:
             try:
-                await self._check_and_complete_bookings()
-                await self._check_and_cancel_expired_payments()
-                await self._check_and_send_reminders()
-                await asyncio.sleep(60)  # Проверяем каждые 60 секунд
+                if time.monotonic() >= next_sweep:
+                    await self._sweep_missing_jobs()
+                    await get_holds(self.db).sweep()
+                    await prune_occupancy_changes(self.db)
+                    next_sweep = time.monotonic() + sweep_interval
+                
+                if reconcile_interval and time.monotonic() >= next_reconcile:
+                    next_reconcile = time.monotonic() + reconcile_interval
+                    await WalletLedger(self.db).reconcile()
+                
+                for job_id, kind, booking_id in self.jobs.pop_due():
+                    await self._run_job(job_id, kind, booking_id)
+                
+                timeout = next_sweep - time.monotonic()
+                if reconcile_interval:
+                    timeout = min(timeout, next_reconcile - time.monotonic())
+                due = self.jobs.next_due()
+                if due is not None:
+                    timeout = min(timeout, (due - datetime.now()).total_seconds())
+                await self.jobs.wait(max(0.0, timeout))
             except Exception as e:
                 logger.error(f"Error in scheduler: {e}")
-                await asyncio.sleep(60)
+                await asyncio.sleep(5)
     
     async def stop(self):
         """Остановка планировщика"""
         self._running = False
+        self.jobs.wake()
         logger.info("Notification scheduler stopped")
     
-    async def _check_and_complete_bookings(self):
-        """Проверка и завершение истекших бронирований"""
+    async def _sweep_missing_jobs(self):
+        """Подхват задач других процессов и постановка задач для броней без них
+
+        Список читается целиком: sync_booking_jobs сама читает бронь, и при
+        DB_POOL_SIZE=1 потоковое чтение заняло бы единственное соединение.
+        """
+        refreshed = await self.jobs.refresh()
+        if refreshed:
+            logger.info(f"Picked up {refreshed} jobs scheduled by other processes")
+        count = 0
+        for booking in await self.db.fetchall(MISSING_JOBS_SQL, as_rows=True):
+            if await sync_booking_jobs(self.db, booking['id']):
+                count += 1
+        if count:
+            logger.info(f"Scheduled jobs for {count} bookings found by sweep")
+    
+    async def _run_job(self, job_id: int, kind: str, booking_id: int):
+        """Выполнение задачи; при ошибке задача повторяется позже"""
         try:
-            bookings = await self.booking_service.get_active_bookings_to_complete()
-            
-            for booking in bookings:
-                user_id = booking['user_id']
-                await self._complete_booking(booking['id'])
-                
-                # Уведомляем пользователя о завершении и предлагаем оставить отзыв
-                if self.bot:
-                    try:
-                        from notifications.notification_service import NotificationService
-                        notification_service = NotificationService(self.bot, self.db)
-                        await notification_service.notify_user_booking_completed(user_id, booking['id'])
-                    except Exception as e:
-                        logger.error(f"Error sending completion notification: {e}")
-                
+            if kind == JOB_COMPLETE:
+                await self._complete_booking(booking_id)
+            elif kind == JOB_EXPIRE:
+                await self._cancel_expired_booking(booking_id)
+            elif kind == JOB_REMIND:
+                await self._send_reminder(booking_id)
+            else:
+                logger.warning(f"Unknown job kind {kind} (job {job_id})")
+            await self.jobs.mark_done(job_id)
         except Exception as e:
-            logger.error(f"Error checking bookings: {e}")
+            logger.error(f"Error running job {job_id} ({kind}) for booking {booking_id}: {e}")
+            await self.jobs.retry_later(job_id, kind, booking_id)
     
     async def _complete_booking(self, booking_id: int):
         """Завершение бронирования и начисление средств партнеру"""
-        try:
-            booking = await self.db.fetchone(
-                "SELECT * FROM bookings WHERE id = ?",
-                (booking_id,)
-            )
-            
-            if not booking:
-                return
-            
-            # Обновляем статус
+        booking = await self.db.fetchone(
+            "SELECT * FROM bookings WHERE id = ?",
+            (booking_id,)
+        )
+        
+        # Бронь могли завершить вручную или перенести
+        if not booking or booking['status'] != 'active':
+            return
+        if booking['end_at'] is not None and booking['end_at'] > now_epoch_minutes():
+            await sync_booking_jobs(self.db, booking_id)
+            return
+        
+        # Смена статуса и начисления фиксируются одной транзакцией:
+        # при ошибке начисления бронь останется активной, а задача
+        # будет повторена
+        async with self.db.transaction():
             await self.db.execute(
                 "UPDATE bookings SET status = 'completed' WHERE id = ?",
                 (booking_id,)
@@ -79,126 +152,82 @@ class NotificationScheduler:
             # Если платеж не через Telegram, начисляем средства партнеру
             if booking['payment_method'] != 'telegram' and booking['partner_id']:
                 await self._credit_partner_wallet(booking)
-            
-            logger.info(f"Booking {booking_id} completed automatically")
-            
-        except Exception as e:
-            logger.error(f"Error completing booking {booking_id}: {e}")
+        
+        logger.info(f"Booking {booking_id} completed automatically")
+        
+        # Уведомляем пользователя о завершении и предлагаем оставить отзыв
+        if self.bot:
+            try:
+                from notifications.notification_service import NotificationService
+                notification_service = NotificationService(self.bot, self.db)
+                await notification_service.notify_user_booking_completed(booking['user_id'], booking_id)
+            except Exception as e:
+                logger.error(f"Error sending completion notification: {e}")
     
     async def _credit_partner_wallet(self, booking: dict):
-        """Начисление средств на кошелек партнера"""
-        try:
-            partner_id = booking['partner_id']
-            amount = booking['amount']
-            
-            # Получаем комиссию платформы
-            platform_commission = Config.PLATFORM_COMMISSION_PERCENT
-            partner_amount = amount * (1 - platform_commission / 100)
-            
-            # Если есть сотрудник, вычитаем его комиссию
-            if booking.get('employee_id'):
-                employee = await self.db.fetchone(
-                    "SELECT commission_percent FROM employees WHERE id = ?",
-                    (booking['employee_id'],)
-                )
-                if employee:
-                    employee_commission = employee['commission_percent']
-                    employee_amount = partner_amount * (employee_commission / 100)
-                    partner_amount -= employee_amount
-                    
-                    # Начисляем сотруднику
-                    await self.db.execute(
-                        """INSERT INTO partner_wallet_ops (partner_id, type, amount, src, booking_id)
-                           VALUES (?, 'credit', ?, ?, ?)""",
-                        (booking['employee_id'], employee_amount, f"Комиссия за бронирование #{booking['id']}", booking['id'])
-                    )
-            
-            # Начисляем партнеру
-            await self.db.execute(
-                """INSERT INTO partner_wallet_ops (partner_id, type, amount, src, booking_id)
-                   VALUES (?, 'credit', ?, ?, ?)""",
-                (partner_id, partner_amount, f"Бронирование #{booking['id']}", booking['id'])
-            )
-            
-            logger.info(f"Credited {partner_amount:.2f} to partner {partner_id} for booking {booking['id']}")
-            
-        except Exception as e:
-            logger.error(f"Error crediting partner wallet: {e}")
-    
-    async def _check_and_cancel_expired_payments(self):
-        """Проверка и отмена просроченных неоплаченных бронирований"""
-        try:
-            now = datetime.now()
-            
-            # Получаем бронирования, у которых истек срок оплаты и они еще не оплачены
-            expired_bookings = await self.db.fetchall(
-                """SELECT * FROM bookings 
-                   WHERE payment_deadline IS NOT NULL 
-                   AND payment_deadline < ? 
-                   AND status IN ('waiting_partner', 'waiting_card', 'waiting_cash')""",
-                (now,)
-            )
-            
-            for booking in expired_bookings:
-                await self._cancel_expired_booking(booking['id'])
-                
-        except Exception as e:
-            logger.error(f"Error checking expired payments: {e}")
+        """Начисление средств на кошелек партнера и сотрудника
+        
+        Вызывается внутри транзакции завершения брони, поэтому ошибки
+        не перехватываются: они должны откатить всю операцию.
+        """
+        await credit_completed_booking(self.db, booking)
     
     async def _cancel_expired_booking(self, booking_id: int):
         """Отмена просроченного бронирования"""
-        try:
-            booking = await self.db.fetchone(
-                "SELECT * FROM bookings WHERE id = ?",
-                (booking_id,)
-            )
-            
-            if not booking:
-                return
-            
-            # Обновляем статус на отмененный
-            await self.db.execute(
-                "UPDATE bookings SET status = 'canceled' WHERE id = ?",
-                (booking_id,)
-            )
-            
-            logger.info(f"Booking {booking_id} canceled due to payment timeout")
-            
-            # Отправляем уведомление пользователю (если есть бот)
-            if self.bot:
-                try:
-                    user = await self.db.fetchone(
-                        "SELECT id FROM users WHERE id = ?",
-                        (booking['user_id'],)
+        booking = await self.db.fetchone(
+            "SELECT * FROM bookings WHERE id = ?",
+            (booking_id,)
+        )
+        
+        # Бронь уже оплачена/отменена или срок оплаты продлен
+        if not booking or booking['status'] not in WAITING_PAYMENT_STATUSES:
+            return
+        if not booking['payment_deadline'] or as_datetime(booking['payment_deadline']) > datetime.now():
+            await sync_booking_jobs(self.db, booking_id)
+            return
+        
+        # Обновляем статус на отмененный
+        await self.db.execute(
+            "UPDATE bookings SET status = 'canceled' WHERE id = ?",
+            (booking_id,)
+        )
+        
+        logger.info(f"Booking {booking_id} canceled due to payment timeout")
+        
+        # Отправляем уведомление пользователю (если есть бот)
+        if self.bot:
+            try:
+                user = await self.db.fetchone(
+                    "SELECT id FROM users WHERE id = ?",
+                    (booking['user_id'],)
+                )
+                if user:
+                    text = f"⏰ <b>Бронирование #{booking_id} отменено</b>\n\n"
+                    text += "К сожалению, время на оплату истекло.\n"
+                    text += "Ваше бронирование было автоматически отменено.\n\n"
+                    text += "Вы можете создать новое бронирование в любое время."
+                    
+                    await get_outbox(self.bot, self.db).enqueue(
+                        chat_id=booking['user_id'],
+                        text=text
                     )
-                    if user:
-                        text = f"⏰ <b>Бронирование #{booking_id} отменено</b>\n\n"
-                        text += "К сожалению, время на оплату истекло.\n"
-                        text += "Ваше бронирование было автоматически отменено.\n\n"
-                        text += "Вы можете создать новое бронирование в любое время."
-                        
-                        await self.bot.send_message(
-                            chat_id=booking['user_id'],
-                            text=text
-                        )
-                except Exception as e:
-                    logger.error(f"Error sending expiration notification to user: {e}")
-            
-        except Exception as e:
-            logger.error(f"Error canceling expired booking {booking_id}: {e}")
+            except Exception as e:
+                logger.error(f"Error sending expiration notification to user: {e}")
     
-    async def _check_and_send_reminders(self):
-        """Проверка и отправка напоминаний о предстоящих бронированиях"""
-        try:
-            if not self.bot:
-                return
-            
-            from notifications.reminder_service import send_booking_reminders
-            sent = await send_booking_reminders(self.bot, self.db)
-            
-            if sent:
-                logger.info(f"Sent booking reminders to {len(sent)} users")
-                
-        except Exception as e:
-            logger.error(f"Error sending booking reminders: {e}")
-
+    async def _send_reminder(self, booking_id: int):
+        """Напоминание о брони, которая скоро начнется"""
+        if not self.bot:
+            return
+        
+        booking = await self.db.fetchone(
+            "SELECT user_id, status, start_at FROM bookings WHERE id = ?",
+            (booking_id,)
+        )
+        # После начала брони напоминание уже не нужно (например, бот был выключен)
+        if not booking or booking['status'] != 'active' or booking['start_at'] is None:
+            return
+        if from_epoch_minutes(booking['start_at']) <= datetime.now():
+            return
+        
+        from notifications.reminder_service import send_booking_reminder_for_user
+        await send_booking_reminder_for_user(self.bot, self.db, booking['user_id'], booking_id)
@@ -3,16 +3,59 @@ import logging
 from typing import Optional
 from aiogram import Bot
 from core.database import Database
+from notifications.outbox import enqueue_message, get_outbox
 
 logger = logging.getLogger(__name__)
 
 
+def partner_new_booking_text(booking) -> str:
+    text = f"📋 <b>Новое бронирование #{booking['id']}</b>\n\n"
+    text += f"Доска: {booking['board_name']}\n"
+    text += f"Дата: {booking['date']}\n"
+    text += f"Время: {booking['start_time']}:{booking['start_minute'] or 0:02d}\n"
+    text += f"Длительность: {booking['duration']} минут\n"
+    text += f"Количество: {booking['quantity']}\n"
+    text += f"Сумма: {booking['amount']:.2f}₽\n\n"
+    text += "Используйте /partner для управления бронированием."
+    return text
+
+
+def admin_new_booking_text(booking) -> str:
+    text = f"📋 <b>Новое бронирование #{booking['id']}</b>\n\n"
+    text += f"Пользователь: {booking['user_id']}\n"
+    text += f"Доска: {booking['board_name']}\n"
+    text += f"Сумма: {booking['amount']:.2f}₽\n"
+    text += f"Статус: {booking['status']}"
+    return text
+
+
+async def enqueue_new_booking_notifications(db: Database, booking_id: int):
+    """Уведомления партнеру и админам о новой брони из процесса без бота
+    (Mini App): сообщения пишутся в outbox, отправляет их бот"""
+    from config import Config
+    booking = await db.fetchone(
+        """SELECT b.*, p.telegram_id AS partner_telegram_id
+           FROM bookings b LEFT JOIN partners p ON p.id = b.partner_id
+           WHERE b.id = ?""",
+        (booking_id,)
+    )
+    if not booking:
+        return
+    if booking['partner_telegram_id']:
+        await enqueue_message(db, booking['partner_telegram_id'], partner_new_booking_text(booking))
+    admin_text = admin_new_booking_text(booking)
+    for admin_id in Config.ADMIN_IDS:
+        await enqueue_message(db, admin_id, admin_text)
+
+
 class NotificationService:
     """Сервис для отправки уведомлений"""
     
     def __init__(self, bot: Bot, db: Database):
         self.bot = bot
         self.db = db
+        # Отправка идет через очередь с учетом лимитов Telegram
+        self.outbox = get_outbox(bot, db)
     
     async def notify_partner_new_booking(self, partner_id: int, booking_id: int):
         """Уведомление партнеру о новом бронировании"""
@@ -35,18 +78,9 @@ class NotificationService:
                 logger.warning(f"Booking {booking_id} not found")
                 return
             
-            text = f"📋 <b>Новое бронирование #{booking_id}</b>\n\n"
-            text += f"Доска: {booking['board_name']}\n"
-            text += f"Дата: {booking['date']}\n"
-            text += f"Время: {booking['start_time']}:{booking['start_minute']:02d}\n"
-            text += f"Длительность: {booking['duration']} минут\n"
-            text += f"Количество: {booking['quantity']}\n"
-            text += f"Сумма: {booking['amount']:.2f}₽\n\n"
-            text += "Используйте /partner для управления бронированием."
-            
-            await self.bot.send_message(
+            await self.outbox.enqueue(
                 chat_id=partner['telegram_id'],
-                text=text
+                text=partner_new_booking_text(booking)
             )
         except Exception as e:
             logger.error(f"Error sending notification to partner: {e}")
@@ -68,7 +102,7 @@ class NotificationService:
             text += f"Время: {booking['start_time']}:{booking['start_minute']:02d}\n\n"
             text += "Ждем вас!"
             
-            await self.bot.send_message(
+            await self.outbox.enqueue(
                 chat_id=user_id,
                 text=text
             )
@@ -94,7 +128,7 @@ class NotificationService:
                 text += f"\nПричина: {reason}\n"
             text += "\nЕсли вы уже произвели оплату, средства будут возвращены."
             
-            await self.bot.send_message(
+            await self.outbox.enqueue(
                 chat_id=user_id,
                 text=text
             )
@@ -114,16 +148,12 @@ class NotificationService:
             if not booking:
                 return
             
-            text = f"📋 <b>Новое бронирование #{booking_id}</b>\n\n"
-            text += f"Пользователь: {booking['user_id']}\n"
-            text += f"Доска: {booking['board_name']}\n"
-            text += f"Сумма: {booking['amount']:.2f}₽\n"
-            text += f"Статус: {booking['status']}"
+            text = admin_new_booking_text(booking)
             
             # Отправляем всем админам
             for admin_id in Config.ADMIN_IDS:
                 try:
-                    await self.bot.send_message(
+                    await self.outbox.enqueue(
                         chat_id=admin_id,
                         text=text
                     )
@@ -147,7 +177,7 @@ class NotificationService:
             text += f"Добро пожаловать в SUPFLOT, {partner['name']}!\n\n"
             text += f"Используйте команду /partner для доступа к партнерской панели."
             
-            await self.bot.send_message(
+            await self.outbox.enqueue(
                 chat_id=partner['telegram_id'],
                 text=text
             )
@@ -179,7 +209,7 @@ class NotificationService:
                 [InlineKeyboardButton(text="📋 Мои брони", callback_data="my_bookings")]
             ])
             
-            await self.bot.send_message(
+            await self.outbox.enqueue(
                 chat_id=user_id,
                 text=text,
                 reply_markup=keyboard
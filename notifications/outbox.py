@@ -0,0 +1,275 @@
+"""Исходящая очередь сообщений Telegram
+
+Обработчики и планировщик не вызывают bot.send_message напрямую, а кладут
+сообщение в outbox (таблица outbox в БД) и сразу продолжают работу.
+Рабочие задачи отправляют сообщения с соблюдением лимитов Telegram:
+общий token bucket (~30 сообщений/с) и bucket на каждый чат (~1 сообщение/с).
+Сообщения одного чата уходят строго по порядку. TelegramRetryAfter
+приостанавливает отправку на указанное время, сетевые ошибки повторяются
+с экспоненциальной задержкой. Неотправленные сообщения переживают
+перезапуск: при старте они загружаются из БД (доставка «хотя бы один раз»).
+
+Сообщение, поставленное внутри db.transaction(), попадает в очередь
+отправки только после фиксации транзакции: при откате оно не уйдет.
+Сообщения других процессов (Mini App, сайт — enqueue_message без бота)
+рабочие забирают из таблицы раз в OUTBOX_POLL_SECONDS.
+"""
+import asyncio
+import logging
+import random
+import time
+import weakref
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Set
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup
+from core.database import Database
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Сколько бакетов чатов держать в памяти
+_MAX_CHAT_BUCKETS = 10000
+
+
+class TokenBucket:
+    """Ограничитель частоты: rate токенов в секунду, запас capacity"""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self) -> float:
+        """Взять токен; 0 — успех, иначе сколько секунд ждать"""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        """Дождаться и взять токен"""
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+async def enqueue_message(
+    db: Database,
+    chat_id: int,
+    text: str,
+    parse_mode: Optional[str] = None,
+    markup: Optional[str] = None
+) -> int:
+    """Запись сообщения в таблицу outbox (из любого процесса, без бота)"""
+    cursor = await db.execute(
+        "INSERT INTO outbox (chat_id, text, parse_mode, reply_markup) VALUES (?, ?, ?, ?)",
+        (chat_id, text, parse_mode, markup)
+    )
+    return cursor.lastrowid
+
+
+class Outbox:
+    """Персистентная очередь исходящих сообщений с ограничением частоты"""
+
+    def __init__(self, bot: Bot, db: Database):
+        self.bot = bot
+        self.db = db
+        self._global = TokenBucket(Config.TG_GLOBAL_RATE, Config.TG_GLOBAL_RATE)
+        self._chat_buckets: "OrderedDict[int, TokenBucket]" = OrderedDict()
+        # Очереди сообщений по чатам и очередь чатов, готовых к отправке
+        self._chats: Dict[int, Deque[list]] = {}
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._paused_until = 0.0
+        self._workers: List[asyncio.Task] = []
+        # id сообщений в очередях и у рабочих (чтобы не взять строку дважды)
+        self._queued: Set[int] = set()
+
+    async def start(self, workers: Optional[int] = None):
+        """Загрузка неотправленных сообщений и запуск рабочих задач"""
+        if self._workers:
+            return
+        await self.db.execute(
+            "DELETE FROM outbox WHERE status = 'sent' AND sent_at < datetime('now', '-7 days')"
+        )
+        restored = await self.load_pending()
+        if restored:
+            logger.info(f"Outbox: {restored} pending messages restored")
+        for _ in range(workers or Config.OUTBOX_WORKERS):
+            self._workers.append(asyncio.create_task(self._worker()))
+        if Config.OUTBOX_POLL_SECONDS > 0:
+            self._workers.append(asyncio.create_task(self._poll()))
+
+    async def load_pending(self) -> int:
+        """Постановка в очередь неотправленных сообщений из таблицы, которых
+        еще нет в памяти (после перезапуска или записанных другим процессом)"""
+        rows = await self.db.fetchall(
+            """SELECT id, chat_id, text, parse_mode, reply_markup, attempts
+               FROM outbox WHERE status = 'pending' ORDER BY id"""
+        )
+        count = 0
+        for row in rows:
+            if row['id'] not in self._queued:
+                self._push([row['id'], row['chat_id'], row['text'], row['parse_mode'],
+                            row['reply_markup'], row['attempts']])
+                count += 1
+        return count
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(Config.OUTBOX_POLL_SECONDS)
+            try:
+                await self.load_pending()
+            except Exception as e:
+                logger.error(f"Outbox: error loading pending messages: {e}")
+
+    async def stop(self):
+        """Остановка рабочих задач; неотправленное останется в БД"""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def enqueue(
+        self,
+        chat_id: int,
+        text: str,
+        parse_mode: Optional[str] = None,
+        reply_markup: Optional[InlineKeyboardMarkup] = None
+    ) -> int:
+        """Поставить сообщение в очередь (без ожидания отправки)
+
+        Внутри транзакции — в очередь отправки после ее фиксации.
+        """
+        markup = reply_markup.model_dump_json(exclude_none=True) if reply_markup else None
+        outbox_id = await enqueue_message(self.db, chat_id, text, parse_mode, markup)
+        self.db.after_commit(lambda: self._push([outbox_id, chat_id, text, parse_mode, markup, 0]))
+        return outbox_id
+
+    def pending_count(self) -> int:
+        return sum(len(messages) for messages in self._chats.values())
+
+    def _push(self, message: list):
+        # message: [outbox_id, chat_id, text, parse_mode, reply_markup, attempts]
+        if message[0] in self._queued:
+            return
+        self._queued.add(message[0])
+        chat_id = message[1]
+        messages = self._chats.get(chat_id)
+        if messages is None:
+            # Чат появился в очереди — передаем его рабочим
+            messages = self._chats[chat_id] = deque()
+            self._ready.put_nowait(chat_id)
+        messages.append(message)
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(Config.TG_CHAT_RATE)
+            if len(self._chat_buckets) > _MAX_CHAT_BUCKETS:
+                self._chat_buckets.popitem(last=False)
+        else:
+            self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    def _ready_later(self, chat_id: int, delay: float):
+        asyncio.get_running_loop().call_later(delay, self._ready.put_nowait, chat_id)
+
+    async def _worker(self):
+        # Каждый чат в каждый момент обрабатывает только один рабочий:
+        # chat_id находится либо в _ready, либо у рабочего, либо в call_later
+        while True:
+            chat_id = await self._ready.get()
+            messages = self._chats.get(chat_id)
+            if not messages:
+                self._chats.pop(chat_id, None)
+                continue
+
+            wait = self._chat_bucket(chat_id).try_acquire()
+            if wait:
+                self._ready_later(chat_id, wait)
+                continue
+
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            await self._global.acquire()
+
+            message = messages.popleft()
+            try:
+                delay = await self._send(message)
+            except Exception as e:
+                # Например, ошибка записи статуса в БД — рабочий не должен падать
+                logger.error(f"Outbox: error delivering message {message[0]}: {e}")
+                delay = 5.0
+            if delay is not None:
+                messages.appendleft(message)
+                self._ready_later(chat_id, delay)
+                continue
+            self._queued.discard(message[0])
+            if messages:
+                self._ready.put_nowait(chat_id)
+            else:
+                del self._chats[chat_id]
+
+    async def _send(self, message: list) -> Optional[float]:
+        """Отправка; None — сообщение обработано, иначе задержка до повтора"""
+        outbox_id, chat_id, text, parse_mode, markup, attempts = message
+        kwargs = {}
+        if parse_mode:
+            kwargs['parse_mode'] = parse_mode
+        if markup:
+            kwargs['reply_markup'] = InlineKeyboardMarkup.model_validate_json(markup)
+        try:
+            await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+        except TelegramRetryAfter as e:
+            # Флуд-контроль: останавливаем всю отправку, попытка не засчитывается
+            self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            logger.warning(f"Outbox: flood control, retry after {e.retry_after}s")
+            return float(e.retry_after)
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Бот заблокирован, чат не найден и т.п. — повтор не поможет
+            await self._finish(outbox_id, 'failed', str(e))
+            logger.warning(f"Outbox: message {outbox_id} to {chat_id} rejected: {e}")
+            return None
+        except Exception as e:
+            attempts = message[5] = attempts + 1
+            if attempts >= Config.OUTBOX_MAX_ATTEMPTS:
+                await self._finish(outbox_id, 'failed', str(e))
+                logger.error(f"Outbox: message {outbox_id} to {chat_id} failed: {e}")
+                return None
+            await self.db.execute(
+                "UPDATE outbox SET attempts = ?, last_error = ? WHERE id = ?",
+                (attempts, str(e), outbox_id)
+            )
+            return min(60.0, 2 ** attempts) + random.uniform(0, 1)
+        await self._finish(outbox_id, 'sent')
+        return None
+
+    async def _finish(self, outbox_id: int, status: str, error: Optional[str] = None):
+        await self.db.execute(
+            "UPDATE outbox SET status = ?, last_error = ?, sent_at = ? WHERE id = ?",
+            (status, error, datetime.now(), outbox_id)
+        )
+
+
+_outboxes: "weakref.WeakKeyDictionary[Bot, Outbox]" = weakref.WeakKeyDictionary()
+
+
+def get_outbox(bot: Bot, db: Database) -> Outbox:
+    """Общая исходящая очередь для бота"""
+    outbox = _outboxes.get(bot)
+    if outbox is None:
+        outbox = _outboxes[bot] = Outbox(bot, db)
+    return outbox
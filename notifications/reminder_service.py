@@ -4,9 +4,20 @@ from datetime import datetime, timedelta
 from typing import List, Optional
 from aiogram import Bot
 from core.database import Database
+from notifications.outbox import get_outbox
+from services.availability import now_epoch_minutes
 
 logger = logging.getLogger(__name__)
 
+# Брони, начинающиеся в окне (from, to]: диапазон по индексу (status, start_at)
+REMINDER_SQL = """
+    SELECT b.*, u.id as user_id 
+    FROM bookings b
+    JOIN users u ON b.user_id = u.id
+    WHERE b.status = 'active'
+    AND b.start_at > ? AND b.start_at <= ?
+"""
+
 
 async def send_booking_reminders(bot: Bot, db: Database) -> List[int]:
     """
@@ -23,27 +34,17 @@ async def send_booking_reminders(bot: Bot, db: Database) -> List[int]:
         Список ID пользователей, которым отправлены напоминания
     """
     try:
-        now = datetime.now()
-        reminder_time = now + timedelta(hours=1)
-        
         # Находим бронирования, которые начинаются через час
-        # Проверяем на сегодня и время совпадает с reminder_time
-        target_minutes = reminder_time.hour * 60 + reminder_time.minute
-        
-        bookings = await db.fetchall("""
-            SELECT b.*, u.id as user_id 
-            FROM bookings b
-            JOIN users u ON b.user_id = u.id
-            WHERE b.status = 'active'
-            AND DATE(b.date) = DATE('now')
-            AND (b.start_time * 60 + COALESCE(b.start_minute, 0)) = ?
-        """, (target_minutes,))
+        # (в пределах текущей минуты)
+        target = now_epoch_minutes(datetime.now() + timedelta(hours=1))
+        bookings = await db.fetchall(REMINDER_SQL, (target - 1, target))
         
         if not bookings:
             logger.debug("No bookings to remind about")
             return []
         
         sent_to = []
+        outbox = get_outbox(bot, db)
         
         for booking in bookings:
             try:
@@ -57,14 +58,14 @@ async def send_booking_reminders(bot: Bot, db: Database) -> List[int]:
                 if booking.get('quantity', 1) > 1:
                     message += f"📊 Количество: {booking['quantity']}\n"
                 
-                # Отправляем напоминание
-                await bot.send_message(
+                # Ставим напоминание в очередь отправки
+                await outbox.enqueue(
                     chat_id=booking['user_id'],
                     text=message,
                     parse_mode="HTML"
                 )
                 sent_to.append(booking['user_id'])
-                logger.info(f"Reminder sent to user {booking['user_id']} for booking {booking['id']}")
+                logger.info(f"Reminder queued for user {booking['user_id']} for booking {booking['id']}")
                 
             except Exception as e:
                 logger.error(f"Error sending reminder to user {booking['user_id']}: {e}")
@@ -108,13 +109,13 @@ async def send_booking_reminder_for_user(bot: Bot, db: Database, user_id: int, b
         message += f"🏄 Доска: {booking['board_name']}\n"
         message += f"⏱ Длительность: {booking['duration']} час(ов)\n"
         
-        await bot.send_message(
+        await get_outbox(bot, db).enqueue(
             chat_id=user_id,
             text=message,
             parse_mode="HTML"
         )
         
-        logger.info(f"Reminder sent to user {user_id} for booking {booking_id}")
+        logger.info(f"Reminder queued for user {user_id} for booking {booking_id}")
         return True
         
     except Exception as e:
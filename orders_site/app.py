@@ -1,9 +1,10 @@
 """Flask веб-приложение"""
 import logging
+from datetime import date, timedelta
 from flask import Flask, render_template, jsonify, request
 from config import Config
-from core.database import Database
-import asyncio
+from core.data import get_sync_store, run_sync
+from services.occupancy import get_occupancy
 
 logger = logging.getLogger(__name__)
 
@@ -11,27 +12,10 @@ app = Flask(__name__)
 app.secret_key = Config.FLASK_SECRET_KEY
 app.config['DEV_MODE'] = Config.DEV_MODE
 
-# Глобальная переменная для базы данных
-db = None
-loop = None
 
-
-def get_db():
-    """Получение экземпляра базы данных"""
-    global db, loop
-    if db is None:
-        db = Database()
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(db.connect())
-    return db
-
-
-def run_async(coro):
-    """Запуск async функции в синхронном контексте"""
-    if loop is None:
-        get_db()
-    return loop.run_until_complete(coro)
+def get_store():
+    """Общие репозитории процесса (пул соединений и кэш из core.data)"""
+    return get_sync_store()
 
 
 @app.route('/')
@@ -51,11 +35,8 @@ def dev_panel():
 @app.route('/api/locations')
 def api_locations():
     """API: Список активных локаций"""
-    database = get_db()
     try:
-        locations = run_async(database.fetchall(
-            "SELECT * FROM locations WHERE is_active = 1 ORDER BY name"
-        ))
+        locations = run_sync(get_store().locations.active())
         return jsonify({"success": True, "data": locations})
     except Exception as e:
         logger.error(f"Error fetching locations: {e}")
@@ -65,24 +46,57 @@ def api_locations():
 @app.route('/api/boards/<int:location_id>')
 def api_boards(location_id):
     """API: Доски для локации"""
-    database = get_db()
     try:
-        boards = run_async(database.fetchall(
-            """SELECT * FROM boards 
-               WHERE location_id = ? AND is_active = 1 
-               ORDER BY name""",
-            (location_id,)
-        ))
+        boards = run_sync(get_store().boards.by_location(location_id))
         return jsonify({"success": True, "data": boards})
     except Exception as e:
         logger.error(f"Error fetching boards: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+async def _free_share_by_day(start: date, days: int) -> dict:
+    """Доля свободных мест всех активных досок по дням (кэш занятости)"""
+    store = get_store()
+    boards = await store.boards.active()
+    return await get_occupancy(store.db).load_by_day(
+        {board['id']: board['quantity'] for board in boards}, start, days
+    )
+
+
+@app.route('/api/availability/calendar')
+def api_availability_calendar():
+    """API: свободные места по дням для календаря (фоновые события FullCalendar)
+
+    ?start=YYYY-MM-DD&end=YYYY-MM-DD (end не включается, не больше 62 дней).
+    Месяц считается по картам занятости в памяти, а не запросом на каждый день.
+    """
+    try:
+        start = date.fromisoformat(request.args.get('start', '')[:10])
+        end = date.fromisoformat(request.args.get('end', '')[:10])
+    except ValueError:
+        return jsonify({"success": False, "error": "start and end (YYYY-MM-DD) are required"}), 400
+    try:
+        days = min(max(1, (end - start).days), 62)
+        shares = run_sync(_free_share_by_day(start, days))
+        events = [
+            {
+                "start": day.isoformat(),
+                "end": (day + timedelta(days=1)).isoformat(),
+                "display": "background",
+                "title": f"Свободно {share:.0%}",
+                "color": "#dc3545" if share < 0.2 else "#ffc107" if share < 0.5 else "#198754",
+            }
+            for day, share in shares.items()
+        ]
+        return jsonify(events)
+    except Exception as e:
+        logger.error(f"Error building availability calendar: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
 @app.route('/api/bookings', methods=['POST'])
 def api_create_booking():
     """API: Создание бронирования"""
-    database = get_db()
     try:
         data = request.get_json()
         # TODO: Валидация данных
@@ -96,7 +110,6 @@ def api_create_booking():
 @app.route('/api/webhook', methods=['POST'])
 def api_webhook():
     """Webhook для YooKassa"""
-    database = get_db()
     try:
         data = request.get_json()
         event = data.get('event')
@@ -107,10 +120,7 @@ def api_webhook():
             booking_id = metadata.get('booking_id')
             
             if booking_id:
-                run_async(database.execute(
-                    "UPDATE bookings SET status = 'active', payment_id = ? WHERE id = ?",
-                    (payment_id, booking_id)
-                ))
+                run_sync(get_store().bookings.mark_paid(int(booking_id), payment_id))
                 logger.info(f"Payment {payment_id} processed for booking {booking_id}")
         
         return jsonify({"success": True})
@@ -122,12 +132,8 @@ def api_webhook():
 @app.route('/api/booking/<int:booking_id>')
 def api_booking(booking_id):
     """API: Информация о бронировании"""
-    database = get_db()
     try:
-        booking = run_async(database.fetchone(
-            "SELECT * FROM bookings WHERE id = ?",
-            (booking_id,)
-        ))
+        booking = run_sync(get_store().bookings.get(booking_id))
         if not booking:
             return jsonify({"success": False, "error": "Booking not found"}), 404
         return jsonify({"success": True, "data": booking})
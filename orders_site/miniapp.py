@@ -1,9 +1,12 @@
 # miniapp.py - Telegram Mini App для SUPFLOT
+import logging
 from flask import Blueprint, render_template, request, jsonify
 from flask_cors import CORS
-import sqlite3
-import os
-from datetime import datetime, timedelta
+from config import Config
+from core.data import get_sync_store, run_sync
+from services.miniapp_service import MiniAppError, MiniAppService, verify_init_data
+
+logger = logging.getLogger(__name__)
 
 miniapp_bp = Blueprint('miniapp', __name__, url_prefix='/miniapp')
 CORS(miniapp_bp)
@@ -15,57 +18,78 @@ def skip_ngrok_warning(response):
     response.headers['ngrok-skip-browser-warning'] = 'true'
     return response
 
-# Используем БД бота (supbot.db в корне проекта)
-DB_NAME = os.getenv("DB_NAME", "supbot.db")
-# Путь к БД относительно корня проекта
-import sys
-from pathlib import Path
-PROJECT_ROOT = Path(__file__).parent.parent.parent
-DB_PATH = PROJECT_ROOT / DB_NAME
+# БД бота через общий слой данных (core.data): пул соединений с общими
+# PRAGMA и кэш, который сбрасывается и записями бота
+def get_service():
+    return MiniAppService(get_sync_store())
+
+def _int_arg(name, default=0):
+    try:
+        return max(0, int(request.args.get(name, default)))
+    except ValueError:
+        return default
 
-def get_db():
-    """Подключение к БД бота"""
-    conn = sqlite3.connect(str(DB_PATH))
-    conn.row_factory = sqlite3.Row
-    return conn
+def _cached(payload, max_age, public=True):
+    """JSON-ответ с ETag и Cache-Control; 304, если клиент прислал тот же ETag"""
+    response = jsonify(payload)
+    response.add_etag()
+    if public:
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+    else:
+        # Слоты меняются с каждой бронью: браузер перепроверяет каждый раз
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def _error(e):
+    if isinstance(e, MiniAppError):
+        return jsonify({"error": e.message}), e.status
+    logger.error(f"Mini App API error: {e}")
+    return jsonify({"error": str(e)}), 500
 
 @miniapp_bp.route('/')
 def index():
     """Главная страница Mini App"""
     return render_template('miniapp/index.html')
 
+@miniapp_bp.route('/api/bootstrap')
+def api_bootstrap():
+    """API: локации, доски с ценами и свободные слоты на сегодня одним ответом"""
+    try:
+        payload = run_sync(get_service().bootstrap(duration=_int_arg('duration', 60) or 60))
+        return _cached(payload, 0, public=False)
+    except Exception as e:
+        return _error(e)
+
 @miniapp_bp.route('/api/locations')
 def api_locations():
-    """API для получения локаций"""
+    """API: страница локаций (?after=<id>&limit=<n>)"""
     try:
-        conn = get_db()
-        locations = conn.execute(
-            "SELECT id, name, address, latitude, longitude FROM locations WHERE is_active=1"
-        ).fetchall()
-        conn.close()
-        return jsonify([dict(loc) for loc in locations])
+        payload = run_sync(get_service().locations(_int_arg('after'), _int_arg('limit')))
+        return _cached(payload, Config.MINIAPP_CACHE_SECONDS)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return _error(e)
 
 @miniapp_bp.route('/api/boards/<int:location_id>')
 def api_boards(location_id):
-    """API для получения досок по локации"""
+    """API: страница досок локации (?after=<id>&limit=<n>)"""
     try:
-        conn = get_db()
-        boards = conn.execute(
-            """SELECT id, name, description, price, quantity, total 
-               FROM boards WHERE location_id=? AND is_active=1""",
-            (location_id,)
-        ).fetchall()
-        conn.close()
-        return jsonify([dict(board) for board in boards])
+        payload = run_sync(get_service().boards(location_id, _int_arg('after'), _int_arg('limit')))
+        return _cached(payload, Config.MINIAPP_CACHE_SECONDS)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return _error(e)
 
 @miniapp_bp.route('/api/bookings', methods=['POST'])
 def api_create_booking():
-    """API для создания бронирования"""
-    data = request.get_json()
-    # Здесь логика создания бронирования
-    return jsonify({"success": True, "booking_id": 123})
+    """API: создание бронирования
 
+    Пользователь — из подписанного initData (заголовок X-Telegram-Init-Data).
+    Тело: {"board_id", "date": "YYYY-MM-DD", "start": "HH:MM", "duration" (мин), "quantity"}
+    """
+    try:
+        user = verify_init_data(request.headers.get('X-Telegram-Init-Data', ''))
+        result = run_sync(get_service().create_booking(user, request.get_json(silent=True) or {}))
+        return jsonify(result), 201
+    except Exception as e:
+        return _error(e)
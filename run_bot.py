@@ -98,11 +98,24 @@ async def main():
     
     dp.include_router(router)
     
+    # Запуск очереди исходящих сообщений (восстанавливает неотправленные)
+    from notifications.outbox import get_outbox
+    outbox = get_outbox(bot, db)
+    await outbox.start()
+    
     # Запуск планировщика уведомлений
     from notifications.notification_scheduler import NotificationScheduler
     scheduler = NotificationScheduler(db, bot)
     scheduler_task = asyncio.create_task(scheduler.start())
     
+    # Фоновое обновление погоды по активным локациям
+    weather_task = None
+    if Config.WEATHER_PREFETCH_MINUTES > 0 and Config.OPENWEATHER_KEY:
+        from services.weather_service import get_weather_cache
+        weather_task = asyncio.create_task(get_weather_cache().run_prefetch(
+            db, Config.OPENWEATHER_KEY, Config.WEATHER_PREFETCH_MINUTES
+        ))
+    
     try:
         logger.info("Bot started")
         await dp.start_polling(bot)
@@ -115,6 +128,11 @@ async def main():
             await scheduler_task
         except asyncio.CancelledError:
             pass
+        if weather_task:
+            weather_task.cancel()
+        await outbox.stop()
+        from core.http_client import get_http_client
+        await get_http_client().close()
         await db.close()
         await bot.session.close()
 
@@ -0,0 +1,131 @@
+"""Движок доступности: занятость доски за день по минутным корзинам
+
+Брони дня раскладываются в разностный массив, префиксная сумма дает
+занятость каждой корзины (по умолчанию 5 минут). После этого проверка
+интервала и поиск всех допустимых начал для длительности D и количества Q
+выполняются одним проходом без перебора броней на каждый слот.
+
+Модуль не зависит от БД: бот и сайт сами загружают брони и передают
+интервалы в минутах от полуночи.
+"""
+import hashlib
+from array import array
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+DAY_MINUTES = 24 * 60
+SLOT_STEP_MINUTES = 5
+
+_EPOCH = date(1970, 1, 1)
+
+
+def epoch_minutes(day: date, minute_of_day: int = 0) -> int:
+    """Абсолютная минута (локальное время без учета часового пояса)
+
+    Совпадает со значениями bookings.start_at/end_at, которые миграция
+    считает как (julianday(date) - 2440587.5) * 1440 + минута дня.
+    """
+    return (day - _EPOCH).days * DAY_MINUTES + minute_of_day
+
+
+def from_epoch_minutes(value: int) -> datetime:
+    """Обратное преобразование абсолютной минуты в datetime"""
+    return datetime(1970, 1, 1) + timedelta(minutes=value)
+
+
+def now_epoch_minutes(now: Optional[datetime] = None) -> int:
+    """Текущая абсолютная минута"""
+    now = now or datetime.now()
+    return epoch_minutes(now.date(), now.hour * 60 + now.minute)
+
+
+class DayTimeline:
+    """Занятость одной доски за один день"""
+
+    def __init__(
+        self,
+        capacity: int,
+        intervals: Iterable[Tuple[int, int, int]] = (),
+        step: int = SLOT_STEP_MINUTES
+    ):
+        """intervals — (начало, конец, количество) в минутах от полуночи.
+
+        Интервалы, выходящие за пределы суток (например, бронь предыдущего
+        дня через полночь со сдвигом -1440), обрезаются. Границы, не кратные
+        шагу, округляются наружу: корзина занята, если занята хотя бы ее часть.
+        """
+        if DAY_MINUTES % step:
+            raise ValueError(f"step must divide {DAY_MINUTES}: {step}")
+        self.capacity = int(capacity or 0)
+        self.step = step
+        size = DAY_MINUTES // step
+        diff = [0] * (size + 1)
+        for start, end, qty in intervals:
+            start = max(0, start)
+            end = min(DAY_MINUTES, end)
+            if end <= start or not qty:
+                continue
+            diff[start // step] += qty
+            diff[-(-end // step)] -= qty
+        used = []
+        level = 0
+        for delta in diff[:size]:
+            level += delta
+            used.append(level)
+        self._used = used
+
+    def digest(self) -> str:
+        """Отпечаток занятости: совпадает, пока не изменились брони дня"""
+        data = array('l', [self.capacity, self.step, *self._used]).tobytes()
+        return hashlib.sha1(data).hexdigest()
+
+    def _buckets(self, start: int, end: int) -> Tuple[int, int]:
+        start = max(0, start)
+        end = min(DAY_MINUTES, end)
+        return start // self.step, -(-end // self.step)
+
+    def used(self, start: int, end: int) -> int:
+        """Пиковая занятость на [start, end)"""
+        lo, hi = self._buckets(start, end)
+        return max(self._used[lo:hi], default=0)
+
+    def free(self, start: int, end: int) -> int:
+        """Свободное количество на всем интервале [start, end)
+
+        Часть интервала после полуночи этой шкалой не проверяется.
+        """
+        return max(0, self.capacity - self.used(start, end))
+
+    def feasible_starts(
+        self,
+        duration: int,
+        quantity: int = 1,
+        granularity: int = 15,
+        open_from: int = 0,
+        open_to: int = DAY_MINUTES,
+        not_before: Optional[int] = None
+    ) -> List[int]:
+        """Все начала (кратные granularity), где помещается бронь D×Q
+
+        Корзина «заблокирована», если свободно меньше quantity; начало
+        допустимо, если в окне длительности нет заблокированных корзин.
+        Префиксная сумма по блокировкам дает ответ для каждого начала за O(1).
+        """
+        if granularity % self.step:
+            raise ValueError(f"granularity must be a multiple of {self.step}")
+        if duration <= 0 or quantity > self.capacity:
+            return []
+        limit = self.capacity - quantity
+        blocked = [0]
+        for level in self._used:
+            blocked.append(blocked[-1] + (level > limit))
+
+        first = max(open_from, not_before or 0)
+        first = -(-first // granularity) * granularity
+        width = -(-duration // self.step)
+        starts = []
+        for start in range(first, min(open_to, DAY_MINUTES) - duration + 1, granularity):
+            lo = start // self.step
+            if blocked[lo + width] == blocked[lo]:
+                starts.append(start)
+        return starts
@@ -1,12 +1,66 @@
 """Сервис для работы с бронированиями"""
 import logging
+import time
+from dataclasses import dataclass
 from datetime import datetime, date, timedelta
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, AsyncIterator, Iterable
 from core.database import Database
+from notifications.job_queue import sync_booking_jobs
+from services.availability import DayTimeline, DAY_MINUTES, epoch_minutes, now_epoch_minutes
+from services.pricing import get_price_engine
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass(frozen=True)
+class ReservationItem:
+    """Позиция групповой брони"""
+    board_id: int
+    quantity: int
+    booking_date: date
+    start: int  # минуты от полуночи
+    duration: int  # минуты
+
+
+@dataclass
+class ReservationLine:
+    """Проверенная позиция с доской и суммой"""
+    item: ReservationItem
+    board: Dict[str, Any]
+    amount: float
+
+
+@dataclass
+class Reservation:
+    """Созданная групповая бронь"""
+    group_id: int
+    booking_ids: List[int]
+    total_amount: float
+
+
+@dataclass(frozen=True)
+class SlotOption:
+    """Найденный свободный слот: доска, дата, начало и цена"""
+    board_id: int
+    board_name: str
+    booking_date: date
+    start: int  # минуты от полуночи
+    duration: int
+    quantity: int
+    unit_price: float
+    amount: float
+    distance: int  # минуты до желаемого времени
+
+
+class ReservationError(Exception):
+    """Позицию групповой брони нельзя забронировать"""
+
+    def __init__(self, board_id: int, message: str, board_name: Optional[str] = None):
+        super().__init__(message)
+        self.board_id = board_id
+        self.board_name = board_name
+
+
 class BookingService:
     """Сервис для работы с бронированиями"""
     
@@ -28,19 +82,113 @@ class BookingService:
         partner_id: Optional[int] = None,
         employee_id: Optional[int] = None,
         status: str = "waiting_partner",
-        payment_deadline: Optional[datetime] = None
+        payment_deadline: Optional[datetime] = None,
+        group_id: Optional[int] = None
     ) -> int:
         """Создание бронирования"""
         cursor = await self.db.execute(
             """INSERT INTO bookings 
                (user_id, board_id, board_name, date, start_time, start_minute, 
-                duration, quantity, amount, status, payment_method, partner_id, employee_id, payment_deadline)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                duration, quantity, amount, status, payment_method, partner_id, employee_id, payment_deadline,
+                group_id)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
             (user_id, board_id, board_name, booking_date, start_time, start_minute,
-             duration, quantity, amount, status, payment_method, partner_id, employee_id, payment_deadline)
+             duration, quantity, amount, status, payment_method, partner_id, employee_id, payment_deadline,
+             group_id)
         )
+        # Задачи истечения оплаты / завершения / напоминания
+        await sync_booking_jobs(self.db, cursor.lastrowid)
         return cursor.lastrowid
     
+    async def quote_reservation(self, items: Iterable[ReservationItem]) -> List[ReservationLine]:
+        """Проверка и расчет позиций групповой брони без записи
+        
+        Доски читаются одним запросом, занятость — одним запросом на дату.
+        Позиции одной доски учитываются вместе: каждая следующая проверяется
+        за вычетом уже принятых пересекающихся позиций.
+        
+        Raises:
+            ReservationError: доски нет или не хватает свободных мест
+        """
+        items = list(items)
+        board_ids = sorted({item.board_id for item in items})
+        if not board_ids:
+            return []
+        boards = {
+            row['id']: row
+            for row in await self.db.fetchall(
+                f"""SELECT id, name, price, quantity, partner_id, is_active FROM boards
+                    WHERE id IN ({', '.join('?' * len(board_ids))})""",
+                tuple(board_ids)
+            )
+        }
+        timelines: Dict[date, Dict[int, DayTimeline]] = {}
+        for day in sorted({item.booking_date for item in items}):
+            timelines[day] = await self.get_day_timelines(
+                {b: boards[b]['quantity'] for b in board_ids if b in boards}, day
+            )
+        
+        engine = get_price_engine()
+        accepted: Dict[tuple, List[tuple]] = {}
+        lines = []
+        for item in items:
+            board = boards.get(item.board_id)
+            if not board or not board['is_active']:
+                raise ReservationError(item.board_id, "board not found")
+            timeline = timelines[item.booking_date][item.board_id]
+            end = item.start + item.duration
+            taken = accepted.setdefault((item.board_id, item.booking_date), [])
+            pending = sum(q for s, e, q in taken if s < end and item.start < e)
+            if item.quantity <= 0 or timeline.free(item.start, end) - pending < item.quantity:
+                raise ReservationError(item.board_id, "not enough free boards", board['name'])
+            taken.append((item.start, end, item.quantity))
+            quote = engine.quote(
+                item.board_id, board['price'], item.booking_date, timeline,
+                item.start, item.duration, item.quantity
+            )
+            lines.append(ReservationLine(item, board, quote.amount))
+        return lines
+    
+    async def reserve(
+        self,
+        user_id: int,
+        items: Iterable[ReservationItem],
+        status: str = "waiting_partner",
+        payment_deadline: Optional[datetime] = None
+    ) -> Reservation:
+        """Групповая бронь: создаются все позиции или ни одной
+        
+        BEGIN IMMEDIATE берет блокировку записи до чтения занятости, так
+        что параллельная бронь тех же досок ждет (busy_timeout) и видит уже
+        записанные позиции, а не проходит проверку по тому же снимку.
+        
+        Raises:
+            ReservationError: позицию нельзя забронировать (ничего не записано)
+        """
+        async with self.db.transaction(immediate=True):
+            lines = await self.quote_reservation(items)
+            cursor = await self.db.execute("INSERT INTO booking_groups (user_id) VALUES (?)", (user_id,))
+            group_id = cursor.lastrowid
+            booking_ids = []
+            for line in lines:
+                start_time, start_minute = divmod(line.item.start, 60)
+                booking_ids.append(await self.create_booking(
+                    user_id=user_id,
+                    board_id=line.item.board_id,
+                    board_name=line.board['name'],
+                    booking_date=line.item.booking_date,
+                    start_time=start_time,
+                    start_minute=start_minute,
+                    duration=line.item.duration,
+                    quantity=line.item.quantity,
+                    amount=line.amount,
+                    partner_id=line.board['partner_id'],
+                    status=status,
+                    payment_deadline=payment_deadline,
+                    group_id=group_id
+                ))
+        return Reservation(group_id, booking_ids, sum(line.amount for line in lines))
+    
     async def get_booking(self, booking_id: int) -> Optional[Dict[str, Any]]:
         """Получение бронирования по ID"""
         return await self.db.fetchone(
@@ -98,26 +246,194 @@ class BookingService:
                     "UPDATE bookings SET status = ? WHERE id = ?",
                     (status, booking_id)
                 )
+            await sync_booking_jobs(self.db, booking_id)
             return True
         except Exception as e:
             logger.error(f"Error updating booking status: {e}")
             return False
     
+    # Завершенные по времени активные брони: диапазон по индексу (status, end_at)
+    _TO_COMPLETE_SQL = """SELECT * FROM bookings 
+               WHERE status = 'active' 
+               AND end_at <= ?
+               ORDER BY end_at"""
+
+    # Брони доски за день и предыдущий день: индекс (board_id, date, status);
+    # к ним добавляются действующие удержания мест (services/holds.py),
+    # кроме удержания пользователя, для которого проверяется слот
+    _TIMELINE_SQL = """SELECT start_at, end_at, quantity 
+               FROM bookings 
+               WHERE board_id = ? 
+               AND date IN (?, ?) 
+               AND status IN ('waiting_partner', 'active', 'waiting_card', 'waiting_cash')
+               AND end_at > ? AND start_at < ?
+               UNION ALL
+               SELECT start_at, end_at, quantity 
+               FROM capacity_holds 
+               WHERE board_id = ? 
+               AND end_at > ? AND start_at < ? 
+               AND expires_at > ? AND user_id IS NOT ?"""
+
+    # То же для нескольких досок сразу (экран Mini App)
+    _TIMELINES_SQL = """SELECT board_id, start_at, end_at, quantity 
+               FROM bookings 
+               WHERE board_id IN ({boards}) 
+               AND date IN (?, ?) 
+               AND status IN ('waiting_partner', 'active', 'waiting_card', 'waiting_cash')
+               AND end_at > ? AND start_at < ?
+               UNION ALL
+               SELECT board_id, start_at, end_at, quantity 
+               FROM capacity_holds 
+               WHERE board_id IN ({boards}) 
+               AND end_at > ? AND start_at < ? 
+               AND expires_at > ?"""
+
+    @staticmethod
+    def _to_complete_params() -> tuple:
+        return (now_epoch_minutes(),)
+
     async def get_active_bookings_to_complete(self) -> List[Dict[str, Any]]:
         """Получение активных бронирований, которые нужно завершить"""
-        now = datetime.now()
-        today = now.date()
-        current_time = now.hour * 60 + now.minute
-        
         # Получаем активные бронирования, где время завершения уже прошло
-        bookings = await self.db.fetchall(
-            """SELECT * FROM bookings 
-               WHERE status = 'active' 
-               AND ((date < ?) OR (date = ? AND (start_time * 60 + start_minute + duration) <= ?))
-               ORDER BY date, start_time""",
-            (today, today, current_time)
-        )
+        bookings = await self.db.fetchall(self._TO_COMPLETE_SQL, self._to_complete_params())
         return bookings
+
+    async def iter_active_bookings_to_complete(self) -> AsyncIterator[Dict[str, Any]]:
+        """То же, что get_active_bookings_to_complete, но без загрузки
+        всего списка в память (после простоя бота их может быть много)"""
+        async for booking in self.db.fetchall_iter(self._TO_COMPLETE_SQL, self._to_complete_params()):
+            yield booking
+    
+    async def get_day_timeline(
+        self,
+        board_id: int,
+        booking_date: date,
+        capacity: Optional[int] = None,
+        exclude_hold_user: Optional[int] = None
+    ) -> Optional[DayTimeline]:
+        """Шкала занятости доски на день (с учетом броней через полночь)
+        
+        Удержания мест других пользователей считаются занятыми; удержание
+        exclude_hold_user не учитывается — это место он уже держит за собой.
+        """
+        if capacity is None:
+            board = await self.db.fetchone("SELECT quantity FROM boards WHERE id = ?", (board_id,))
+            if not board:
+                return None
+            capacity = board['quantity']
+        
+        day_start = epoch_minutes(booking_date)
+        rows = await self.db.fetchall(
+            self._TIMELINE_SQL,
+            (board_id, booking_date.isoformat(), (booking_date - timedelta(days=1)).isoformat(),
+             day_start, day_start + DAY_MINUTES,
+             board_id, day_start, day_start + DAY_MINUTES, time.time(), exclude_hold_user),
+            as_rows=True
+        )
+        intervals = [
+            (row['start_at'] - day_start, row['end_at'] - day_start, row['quantity'])
+            for row in rows
+        ]
+        return DayTimeline(capacity, intervals)
+    
+    async def get_day_timelines(
+        self,
+        capacities: Dict[int, int],
+        booking_date: date
+    ) -> Dict[int, DayTimeline]:
+        """Шкалы занятости нескольких досок на день одним запросом
+        
+        Args:
+            capacities: board_id -> количество досок (boards.quantity)
+        """
+        if not capacities:
+            return {}
+        day_start = epoch_minutes(booking_date)
+        intervals: Dict[int, list] = {board_id: [] for board_id in capacities}
+        placeholders = ", ".join("?" * len(capacities))
+        rows = await self.db.fetchall(
+            self._TIMELINES_SQL.format(boards=placeholders),
+            (*capacities, booking_date.isoformat(), (booking_date - timedelta(days=1)).isoformat(),
+             day_start, day_start + DAY_MINUTES,
+             *capacities, day_start, day_start + DAY_MINUTES, time.time()),
+            as_rows=True
+        )
+        for row in rows:
+            intervals[row['board_id']].append(
+                (row['start_at'] - day_start, row['end_at'] - day_start, row['quantity'])
+            )
+        return {
+            board_id: DayTimeline(capacity, intervals[board_id])
+            for board_id, capacity in capacities.items()
+        }
+    
+    async def search_slots(
+        self,
+        location_id: int,
+        date_from: date,
+        date_to: date,
+        duration: int = 60,
+        quantity: int = 1,
+        preferred_start: Optional[int] = None,
+        limit: int = 5,
+        granularity: Optional[int] = None
+    ) -> List[SlotOption]:
+        """Лучшие свободные слоты (доска, дата, начало) по всем доскам локации
+        
+        Доски локации читаются одним запросом, занятость — из карт кэша
+        занятости (services/occupancy.py) за весь диапазон дат, так что
+        повторный поиск не обращается к броням. Окна ищутся одним проходом
+        по массиву свободных мест, цена — движком цен по той же карте.
+        
+        Для каждой пары доска/дата остается лучшее начало. Порядок — по
+        удаленности от preferred_start (минуты от полуночи date_from,
+        целыми часами), затем по сумме; без preferred_start — по сумме и
+        дате. Найденный слот окончательно проверяется при удержании.
+        """
+        from config import Config
+        from services.occupancy import RESOLUTION_MINUTES, get_occupancy, map_timeline, open_range, window_starts
+        
+        boards = await self.db.fetchall(
+            "SELECT id, name, price, quantity FROM boards WHERE location_id = ? AND is_active = 1",
+            (location_id,)
+        )
+        days = (date_to - date_from).days + 1
+        if not boards or days <= 0:
+            return []
+        
+        occupancy = get_occupancy(self.db)
+        engine = get_price_engine()
+        slots = -(-duration // RESOLUTION_MINUTES)
+        step = max(1, (granularity or Config.SLOT_GRANULARITY_MINUTES) // RESOLUTION_MINUTES)
+        day_list = [date_from + timedelta(days=i) for i in range(days)]
+        best: Dict[tuple, tuple] = {}
+        for board in boards:
+            maps = await occupancy.maps(board['id'], board['quantity'], day_list)
+            for offset, day in enumerate(day_list):
+                free = maps[day]
+                lo, hi = open_range(day)
+                starts = [i for i in window_starts(free, slots, quantity, lo, hi) if i % step == 0]
+                if not starts:
+                    continue
+                timeline = map_timeline(board['quantity'], free)
+                for i in starts:
+                    start = i * RESOLUTION_MINUTES
+                    unit = engine.unit_price(board['price'], day, start, duration, timeline)
+                    amount = round(unit * duration / 60.0 * quantity, 2)
+                    if preferred_start is None:
+                        distance = 0
+                        key = (amount, offset, start)
+                    else:
+                        distance = abs(offset * DAY_MINUTES + start - preferred_start)
+                        key = (distance // 60, amount, distance)
+                    option = SlotOption(
+                        board['id'], board['name'], day, start, duration, quantity, unit, amount, distance
+                    )
+                    current = best.get((board['id'], day))
+                    if current is None or key < current[0]:
+                        best[(board['id'], day)] = (key, option)
+        ranked = sorted(best.values(), key=lambda pair: pair[0])
+        return [option for _, option in ranked[:limit]]
     
     async def check_board_availability(
         self,
@@ -129,34 +445,11 @@ class BookingService:
         quantity: int
     ) -> bool:
         """Проверка доступности доски на указанное время"""
-        # Получаем информацию о доске
-        board = await self.db.fetchone("SELECT quantity FROM boards WHERE id = ?", (board_id,))
-        if not board or board['quantity'] < quantity:
+        timeline = await self.get_day_timeline(board_id, booking_date)
+        if timeline is None:
             return False
-        
-        # Проверяем пересечения с существующими бронированиями
-        end_time_minutes = start_time * 60 + start_minute + duration
-        start_time_minutes = start_time * 60 + start_minute
-        
-        overlapping = await self.db.fetchall(
-            """SELECT SUM(quantity) as total_qty FROM bookings 
-               WHERE board_id = ? 
-               AND date = ? 
-               AND status IN ('waiting_partner', 'active', 'waiting_card', 'waiting_cash')
-               AND (
-                   (start_time * 60 + start_minute < ? AND (start_time * 60 + start_minute + duration) > ?)
-                   OR (start_time * 60 + start_minute < ? AND (start_time * 60 + start_minute + duration) > ?)
-                   OR (start_time * 60 + start_minute >= ? AND (start_time * 60 + start_minute + duration) <= ?)
-               )""",
-            (board_id, booking_date, end_time_minutes, start_time_minutes,
-             end_time_minutes, start_time_minutes, start_time_minutes, end_time_minutes)
-        )
-        
-        if overlapping and overlapping[0]['total_qty']:
-            booked_quantity = overlapping[0]['total_qty']
-            return (board['quantity'] - booked_quantity) >= quantity
-        
-        return board['quantity'] >= quantity
+        start = start_time * 60 + start_minute
+        return timeline.free(start, start + duration) >= quantity
     
     async def get_available_time_slots(
         self,
@@ -164,60 +457,43 @@ class BookingService:
         booking_date: date,
         duration: int = 60,
         quantity: int = 1,
-        current_time_minutes: Optional[int] = None
+        current_time_minutes: Optional[int] = None,
+        granularity: Optional[int] = None
     ) -> List[tuple]:
-        """Получение доступных временных слотов для доски на указанную дату"""
-        from config import Config
-        
-        if current_time_minutes is None:
-            now = datetime.now()
-            current_time_minutes = now.hour * 60 + now.minute
-        
-        board = await self.db.fetchone("SELECT quantity FROM boards WHERE id = ?", (board_id,))
-        if not board:
+        """Получение доступных временных слотов (час, минута) для доски на указанную дату"""
+        timeline = await self.get_day_timeline(board_id, booking_date)
+        if timeline is None:
             return []
-        
-        available_slots = []
-        start_hour = Config.WORK_HOURS_START
-        end_hour = Config.WORK_HOURS_END
-        
-        # Получаем все занятые слоты
-        existing_bookings = await self.db.fetchall(
-            """SELECT start_time, start_minute, duration, quantity 
-               FROM bookings 
-               WHERE board_id = ? 
-               AND date = ? 
-               AND status IN ('waiting_partner', 'active', 'waiting_card', 'waiting_cash')""",
-            (board_id, booking_date)
+        return self.timeline_slots(
+            timeline, booking_date, duration, quantity, current_time_minutes, granularity
         )
+    
+    @staticmethod
+    def timeline_slots(
+        timeline: DayTimeline,
+        booking_date: date,
+        duration: int = 60,
+        quantity: int = 1,
+        current_time_minutes: Optional[int] = None,
+        granularity: Optional[int] = None
+    ) -> List[tuple]:
+        """Доступные слоты (час, минута) по готовой шкале занятости"""
+        from config import Config
         
-        # Проверяем каждый час в рабочее время
-        for hour in range(start_hour, end_hour):
-            slot_start_minutes = hour * 60
-            
+        not_before = None
+        if booking_date == date.today():
             # Если это сегодня, пропускаем прошедшее время
-            if booking_date == date.today() and slot_start_minutes < current_time_minutes:
-                continue
-            
-            # Проверяем, есть ли пересечения с существующими бронированиями
-            slot_end_minutes = slot_start_minutes + duration
-            is_available = True
-            booked_qty = 0
-            
-            for booking in existing_bookings:
-                booking_start = booking['start_time'] * 60 + booking['start_minute']
-                booking_end = booking_start + booking['duration']
-                booking_qty = booking['quantity']
-                
-                # Проверяем пересечение
-                if not (slot_end_minutes <= booking_start or slot_start_minutes >= booking_end):
-                    booked_qty += booking_qty
-                    if booked_qty >= board['quantity']:
-                        is_available = False
-                        break
-            
-            if is_available and (board['quantity'] - booked_qty) >= quantity:
-                available_slots.append((hour, 0))
+            if current_time_minutes is None:
+                now = datetime.now()
+                current_time_minutes = now.hour * 60 + now.minute
+            not_before = current_time_minutes
         
-        return available_slots
-
+        starts = timeline.feasible_starts(
+            duration,
+            quantity,
+            granularity=granularity or Config.SLOT_GRANULARITY_MINUTES,
+            open_from=Config.WORK_HOURS_START * 60,
+            open_to=Config.WORK_HOURS_END * 60,
+            not_before=not_before
+        )
+        return [divmod(start, 60) for start in starts]
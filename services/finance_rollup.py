@@ -0,0 +1,143 @@
+"""Финансовые итоги по дням: отчеты, сверка и пересчет
+
+daily_finance_rollup ведется триггерами (core/schema.py) на bookings,
+partner_wallet_ops, employee_wallet_ops и expenses: строка на день и
+партнера. Отчет за период — сумма не более нескольких сотен строк вместо
+агрегации по всей истории.
+
+Сверка (check) считает те же итоги по сырым таблицам и сравнивает их с
+daily_finance_rollup; rebuild пересчитывает итоги периода заново.
+
+Запуск вручную:
+    python -m services.finance_rollup [--check | --rebuild] [--from YYYY-MM-DD] [--to YYYY-MM-DD]
+"""
+import asyncio
+import logging
+import sys
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from core.database import Database
+from core.schema import FINANCE_RAW_SQL
+
+logger = logging.getLogger(__name__)
+
+FINANCE_COLUMNS = ("income", "partner_payout", "employee_payout", "expenses")
+
+# Расхождение меньше копейки — погрешность сложения REAL
+_TOLERANCE = 0.005
+
+
+@dataclass
+class RollupDrift:
+    """Расхождение итогов дня с сырыми таблицами"""
+    day: str
+    partner_id: int
+    column: str
+    expected: float
+    actual: float
+
+
+def _period(date_from: Optional[str], date_to: Optional[str]) -> Tuple[str, list]:
+    """Фильтр по day для запросов к итогам"""
+    clauses, params = [], []
+    if date_from:
+        clauses.append("day >= ?")
+        params.append(date_from)
+    if date_to:
+        clauses.append("day <= ?")
+        params.append(date_to)
+    return ("WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+class FinanceRollup:
+    """Чтение и сверка daily_finance_rollup"""
+
+    def __init__(self, db: Database):
+        self.db = db
+
+    async def get_totals(
+        self,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        partner_id: Optional[int] = None
+    ) -> Dict[str, float]:
+        """Суммы income/partner_payout/employee_payout/expenses за период"""
+        where, params = _period(date_from, date_to)
+        if partner_id is not None:
+            where += (" AND " if where else "WHERE ") + "partner_id = ?"
+            params.append(partner_id)
+        row = await self.db.fetchone(
+            f"""SELECT {', '.join(f'COALESCE(SUM({c}), 0) AS {c}' for c in FINANCE_COLUMNS)}
+                FROM daily_finance_rollup {where}""",
+            tuple(params)
+        )
+        return {c: float(row[c]) for c in FINANCE_COLUMNS}
+
+    async def _raw(self, where: str, params: list) -> Dict[Tuple[str, int], dict]:
+        rows = await self.db.fetchall(FINANCE_RAW_SQL.format(where=where), tuple(params))
+        return {(row['day'], row['partner_id']): row for row in rows}
+
+    async def check(self, date_from: Optional[str] = None, date_to: Optional[str] = None) -> List[RollupDrift]:
+        """Сверка итогов периода с сырыми таблицами"""
+        where, params = _period(date_from, date_to)
+        async with self.db.transaction():
+            raw = await self._raw(where, params)
+            rollup = {
+                (row['day'], row['partner_id']): row
+                for row in await self.db.fetchall(f"SELECT * FROM daily_finance_rollup {where}", tuple(params))
+            }
+        drifts = []
+        for key in sorted(set(raw) | set(rollup), key=lambda k: (str(k[0]), k[1])):
+            expected, actual = raw.get(key), rollup.get(key)
+            for column in FINANCE_COLUMNS:
+                want = float(expected[column]) if expected else 0.0
+                have = float(actual[column]) if actual else 0.0
+                if abs(want - have) > _TOLERANCE:
+                    drifts.append(RollupDrift(key[0], key[1], column, want, have))
+        for drift in drifts:
+            logger.warning(
+                f"Finance rollup drift {drift.day}/{drift.partner_id} {drift.column}: "
+                f"{drift.actual:.2f}, raw {drift.expected:.2f}"
+            )
+        return drifts
+
+    async def rebuild(self, date_from: Optional[str] = None, date_to: Optional[str] = None) -> int:
+        """Пересчет итогов периода по сырым таблицам; возвращает число строк"""
+        where, params = _period(date_from, date_to)
+        async with self.db.transaction(immediate=True):
+            await self.db.execute(f"DELETE FROM daily_finance_rollup {where}", tuple(params))
+            cursor = await self.db.execute(
+                f"INSERT INTO daily_finance_rollup (day, partner_id, {', '.join(FINANCE_COLUMNS)}) "
+                + FINANCE_RAW_SQL.format(where=where),
+                tuple(params)
+            )
+        logger.info(f"Finance rollup rebuilt: {cursor.rowcount} rows")
+        return cursor.rowcount
+
+
+def _arg(argv: List[str], name: str) -> Optional[str]:
+    return argv[argv.index(name) + 1] if name in argv and argv.index(name) + 1 < len(argv) else None
+
+
+async def _main(argv: List[str]) -> int:
+    date_from, date_to = _arg(argv, "--from"), _arg(argv, "--to")
+    db = Database()
+    await db.connect()
+    try:
+        rollup = FinanceRollup(db)
+        if "--rebuild" in argv:
+            print(f"Rows: {await rollup.rebuild(date_from, date_to)}")
+            return 0
+        drifts = await rollup.check(date_from, date_to)
+    finally:
+        await db.close()
+    for drift in drifts:
+        print(f"{drift.day} partner {drift.partner_id} {drift.column}: "
+              f"rollup {drift.actual:.2f}, expected {drift.expected:.2f}")
+    print(f"Drifts: {len(drifts)}")
+    return 1 if drifts else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
@@ -0,0 +1,143 @@
+"""Временные удержания мест на время оформления брони
+
+Пока пользователь идет по шагам бота (время → длительность → количество),
+выбранное место удерживается за ним: удержание лежит в таблице
+capacity_holds и учитывается в занятости (BookingService.get_day_timeline)
+для всех остальных — бота, Mini App и мультиброни, в том числе в других
+процессах. Так конфликт обнаруживается при выборе слота, а не на
+последнем шаге.
+
+У пользователя одно удержание; новое заменяет прежнее. Оно действует
+HOLD_TTL_SECONDS и продлевается на каждом шаге; при отмене и после
+создания брони снимается. Просроченные удержания в занятости не
+учитываются сразу, а строки удаляет планировщик (sweep).
+
+Таблица в памяти процесса — копия его собственных удержаний: продление и
+проверка «держит ли пользователь место» обходятся без запросов.
+"""
+import logging
+import time
+import weakref
+from dataclasses import dataclass, replace
+from datetime import date
+from typing import Dict, Optional
+from config import Config
+from core.database import Database
+from services.availability import epoch_minutes
+from services.booking_service import BookingService
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Hold:
+    """Удержание: quantity мест доски на интервал start..start + duration"""
+    user_id: int
+    board_id: int
+    booking_date: date
+    start: int  # минуты от полуночи
+    duration: int
+    quantity: int
+    expires_at: float  # time.time()
+
+    @property
+    def start_at(self) -> int:
+        return epoch_minutes(self.booking_date, self.start)
+
+    @property
+    def end_at(self) -> int:
+        return self.start_at + self.duration
+
+    def expired(self, now: Optional[float] = None) -> bool:
+        return (now or time.time()) >= self.expires_at
+
+
+class CapacityHolds:
+    """Удержания мест с копией в памяти процесса"""
+
+    def __init__(self, db: Database, ttl: Optional[float] = None):
+        self.db = db
+        self.ttl = Config.HOLD_TTL_SECONDS if ttl is None else ttl
+        self.bookings = BookingService(db)
+        self._holds: Dict[int, Hold] = {}
+
+    async def hold(
+        self,
+        user_id: int,
+        board_id: int,
+        booking_date: date,
+        start: int,
+        duration: int,
+        quantity: int = 1
+    ) -> Optional[Hold]:
+        """Удержание мест (заменяет прежнее удержание пользователя)
+
+        Проверка и запись — в одной транзакции BEGIN IMMEDIATE, как при
+        создании брони: два пользователя не удержат последнее место оба.
+
+        Returns:
+            Удержание или None, если свободных мест не хватает
+        """
+        async with self.db.transaction(immediate=True):
+            timeline = await self.bookings.get_day_timeline(
+                board_id, booking_date, exclude_hold_user=user_id
+            )
+            if timeline is None or timeline.free(start, start + duration) < quantity:
+                return None
+            hold = Hold(user_id, board_id, booking_date, start, duration, quantity, time.time() + self.ttl)
+            await self.db.execute(
+                """INSERT OR REPLACE INTO capacity_holds
+                   (user_id, board_id, date, start_at, end_at, quantity, expires_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (user_id, board_id, booking_date.isoformat(), hold.start_at, hold.end_at,
+                 quantity, hold.expires_at)
+            )
+        self._holds[user_id] = hold
+        return hold
+
+    def get(self, user_id: int) -> Optional[Hold]:
+        """Действующее удержание пользователя (без запроса к БД)"""
+        hold = self._holds.get(user_id)
+        if hold is not None and hold.expired():
+            return None
+        return hold
+
+    async def extend(self, user_id: int) -> bool:
+        """Продление удержания на ttl; False — удержания нет или оно истекло"""
+        hold = self.get(user_id)
+        if hold is None:
+            return False
+        hold = replace(hold, expires_at=time.time() + self.ttl)
+        cursor = await self.db.execute(
+            "UPDATE capacity_holds SET expires_at = ? WHERE user_id = ? AND board_id = ? AND start_at = ?",
+            (hold.expires_at, user_id, hold.board_id, hold.start_at)
+        )
+        if cursor.rowcount == 0:
+            self._holds.pop(user_id, None)
+            return False
+        self._holds[user_id] = hold
+        return True
+
+    async def release(self, user_id: int):
+        """Снятие удержания (отмена, возврат назад, бронь создана)"""
+        self._holds.pop(user_id, None)
+        await self.db.execute("DELETE FROM capacity_holds WHERE user_id = ?", (user_id,))
+
+    async def sweep(self) -> int:
+        """Удаление просроченных удержаний; возвращает число удаленных строк"""
+        now = time.time()
+        for user_id in [u for u, hold in self._holds.items() if hold.expired(now)]:
+            del self._holds[user_id]
+        cursor = await self.db.execute("DELETE FROM capacity_holds WHERE expires_at <= ?", (now,))
+        return cursor.rowcount
+
+
+_holds: "weakref.WeakKeyDictionary[Database, CapacityHolds]" = weakref.WeakKeyDictionary()
+
+
+def get_holds(db: Database) -> CapacityHolds:
+    """Общие удержания для экземпляра БД"""
+    holds = _holds.get(db)
+    if holds is None:
+        holds = _holds[db] = CapacityHolds(db)
+    return holds
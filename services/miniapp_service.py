@@ -0,0 +1,234 @@
+"""API Telegram Mini App: каталог, стартовый экран и создание брони
+
+Модуль не зависит от веб-фреймворка: orders_site/miniapp.py разбирает
+запрос, вызывает MiniAppService и отдает результат с ETag и Cache-Control.
+
+Списки отдаются страницами по курсору: {"items": [...], "next": id
+последнего элемента или None}. Стартовый экран (bootstrap) собирает
+локации, доски с ценами и свободные слоты на день в один ответ, чтобы
+открытие Mini App занимало один запрос.
+
+Длительность брони — в минутах, как у бота.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl
+from config import Config
+from core.data import DataStore
+from notifications.notification_service import enqueue_new_booking_notifications
+from services.booking_service import BookingService
+from services.pricing import get_price_engine
+
+logger = logging.getLogger(__name__)
+
+LOCATION_FIELDS = ("id", "name", "address", "latitude", "longitude")
+BOARD_FIELDS = ("id", "location_id", "name", "description", "price", "quantity", "total")
+
+
+class MiniAppError(Exception):
+    """Ошибка запроса с HTTP-статусом для ответа"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def verify_init_data(init_data: str, bot_token: Optional[str] = None,
+                     max_age: Optional[float] = None) -> Dict[str, Any]:
+    """Проверка подписи initData Telegram WebApp
+
+    Returns:
+        Пользователь из initData (id, first_name, username, ...)
+
+    Raises:
+        MiniAppError(401): подпись неверна, данные устарели или нет пользователя
+    """
+    bot_token = bot_token or Config.BOT_TOKEN
+    max_age = Config.MINIAPP_INIT_DATA_TTL if max_age is None else max_age
+    fields = dict(parse_qsl(init_data or "", keep_blank_values=True))
+    received = fields.pop("hash", "")
+    if not received or not bot_token:
+        raise MiniAppError(401, "init data required")
+
+    check_string = "\n".join(f"{key}={fields[key]}" for key in sorted(fields))
+    secret = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+    expected = hmac.new(secret, check_string.encode(), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected, received):
+        raise MiniAppError(401, "bad init data signature")
+
+    auth_date = int(fields.get("auth_date") or 0)
+    if max_age and time.time() - auth_date > max_age:
+        raise MiniAppError(401, "init data expired")
+    try:
+        user = json.loads(fields.get("user") or "null")
+    except ValueError:
+        user = None
+    if not isinstance(user, dict) or not user.get("id"):
+        raise MiniAppError(401, "no user in init data")
+    return user
+
+
+def _project(row: Dict[str, Any], fields) -> Dict[str, Any]:
+    return {f: row.get(f) for f in fields}
+
+
+def _page(rows: List[Dict[str, Any]], limit: int, fields) -> Dict[str, Any]:
+    """Страница и курсор следующей (rows загружены с limit + 1)"""
+    items = [_project(row, fields) for row in rows[:limit]]
+    return {"items": items, "next": items[-1]["id"] if len(rows) > limit else None}
+
+
+class MiniAppService:
+    """Операции Mini App над общими репозиториями"""
+
+    def __init__(self, store: DataStore):
+        self.store = store
+        self.bookings = BookingService(store.db)
+        self.pricing = get_price_engine()
+
+    @staticmethod
+    def page_limit(limit: Optional[int]) -> int:
+        """Размер страницы в пределах [1, MINIAPP_PAGE_SIZE]"""
+        if not limit or limit < 1:
+            return Config.MINIAPP_PAGE_SIZE
+        return min(limit, Config.MINIAPP_PAGE_SIZE)
+
+    async def locations(self, after: int = 0, limit: Optional[int] = None) -> Dict[str, Any]:
+        """Страница активных локаций"""
+        limit = self.page_limit(limit)
+        rows = await self.store.locations.page(after, limit + 1)
+        return _page(rows, limit, LOCATION_FIELDS)
+
+    async def boards(self, location_id: int, after: int = 0, limit: Optional[int] = None) -> Dict[str, Any]:
+        """Страница активных досок локации"""
+        limit = self.page_limit(limit)
+        rows = await self.store.boards.page(location_id, after, limit + 1)
+        return _page(rows, limit, BOARD_FIELDS)
+
+    async def bootstrap(self, day: Optional[date] = None, duration: int = 60) -> Dict[str, Any]:
+        """Все данные стартового экрана одним ответом
+
+        Свободные слоты — начала брони на duration минут для одной доски;
+        занятость всех досок читается одним запросом. prices — цена часа
+        для каждого слота, quotes — котировка слота: ее передают при
+        создании брони как "quote".
+        """
+        day = day or date.today()
+        locations = await self.store.locations.active()
+        boards = await self.store.boards.active()
+        timelines = await self.bookings.get_day_timelines(
+            {board['id']: board['quantity'] for board in boards}, day
+        )
+        availability, prices, quotes = {}, {}, {}
+        for board in boards:
+            timeline = timelines[board['id']]
+            table = self.pricing.table(board['id'], board['price'], day, timeline, duration)
+            slots = BookingService.timeline_slots(timeline, day, duration)
+            key = str(board['id'])
+            availability[key] = [f"{h:02d}:{m:02d}" for h, m in slots]
+            prices[key], quotes[key] = {}, {}
+            for h, m in slots:
+                start, label = h * 60 + m, f"{h:02d}:{m:02d}"
+                prices[key][label] = table.prices[start]
+                quotes[key][label] = self.pricing.token(board['id'], day, start, duration, table.prices[start])
+        return {
+            "date": day.isoformat(),
+            "duration": duration,
+            "locations": [_project(loc, LOCATION_FIELDS) for loc in locations],
+            "boards": [_project(board, BOARD_FIELDS) for board in boards],
+            "availability": availability,
+            "prices": prices,
+            "quotes": quotes,
+        }
+
+    @staticmethod
+    def _parse_booking(payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Разбор и проверка полей брони"""
+        try:
+            board_id = int(payload["board_id"])
+            booking_date = datetime.strptime(str(payload["date"]), "%Y-%m-%d").date()
+            hour, minute = (int(part) for part in str(payload["start"]).split(":"))
+            duration = int(payload.get("duration", 60))
+            quantity = int(payload.get("quantity", 1))
+        except (KeyError, TypeError, ValueError):
+            raise MiniAppError(400, "board_id, date (YYYY-MM-DD) and start (HH:MM) are required")
+        if duration <= 0 or quantity <= 0 or not (0 <= hour < 24 and 0 <= minute < 60):
+            raise MiniAppError(400, "bad duration, quantity or start")
+        if booking_date < date.today():
+            raise MiniAppError(400, "date is in the past")
+        return {
+            "board_id": board_id, "booking_date": booking_date,
+            "start_time": hour, "start_minute": minute,
+            "duration": duration, "quantity": quantity,
+        }
+
+    async def create_booking(self, user: Dict[str, Any], payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Бронь от пользователя Mini App
+
+        Проверка слота и вставка — в одной транзакции BEGIN IMMEDIATE, так
+        что параллельные запросы бота и Mini App не займут одно место дважды.
+        Слот должен быть среди допустимых начал движка доступности (рабочие
+        часы, шаг слотов, прошедшее время сегодня, свободное количество).
+        Сумма — котировка движка цен; если передан "quote" из bootstrap (для
+        той же длительности) и цена слота с тех пор изменилась, бронь не
+        создается (409).
+
+        Raises:
+            MiniAppError: 400 — неверные поля, 404 — доски нет,
+                409 — слот занят или изменилась цена
+        """
+        fields = self._parse_booking(payload)
+        token = payload.get("quote")
+        board = await self.store.boards.get(fields["board_id"])
+        if not board or not board.get("is_active"):
+            raise MiniAppError(404, "board not found")
+
+        db = self.store.db
+        payment_deadline = datetime.now() + timedelta(minutes=Config.PAYMENT_TIMEOUT_MINUTES)
+        full_name = " ".join(filter(None, (user.get("first_name"), user.get("last_name"))))
+
+        async with db.transaction(immediate=True):
+            timeline = await self.bookings.get_day_timeline(
+                board['id'], fields["booking_date"], capacity=board['quantity']
+            )
+            slots = BookingService.timeline_slots(
+                timeline, fields["booking_date"], fields["duration"], fields["quantity"]
+            )
+            if (fields["start_time"], fields["start_minute"]) not in slots:
+                raise MiniAppError(409, "slot is not available")
+            quote = self.pricing.quote(
+                board['id'], board['price'], fields["booking_date"], timeline,
+                fields["start_time"] * 60 + fields["start_minute"], fields["duration"], fields["quantity"]
+            )
+            if token and token != quote.token:
+                raise MiniAppError(409, "price changed")
+            amount = quote.amount
+
+            await db.execute(
+                "INSERT OR IGNORE INTO users (id, username, full_name) VALUES (?, ?, ?)",
+                (user["id"], user.get("username"), full_name)
+            )
+            booking_id = await self.bookings.create_booking(
+                user_id=user["id"],
+                board_name=board['name'],
+                amount=amount,
+                partner_id=board.get('partner_id'),
+                payment_deadline=payment_deadline,
+                **fields
+            )
+
+        # Партнеру и админам — как при брони через бота; отправит outbox бота
+        await enqueue_new_booking_notifications(db, booking_id)
+        logger.info(f"Mini App booking {booking_id} by user {user['id']} for board {board['id']}")
+        return {
+            "booking_id": booking_id,
+            "amount": amount,
+            "status": "waiting_partner",
+            "payment_deadline": payment_deadline.isoformat(timespec="minutes"),
+        }
@@ -0,0 +1,279 @@
+"""Кэш занятости досок: карта свободных мест на день с шагом 15 минут
+
+Для каждой пары (доска, день) хранится array('h') из 96 значений —
+сколько мест доски свободно в каждом 15-минутном интервале. Карта
+строится один раз из броней (один запрос на доску и диапазон дней),
+а дальше меняется по журналу occupancy_changes, который ведут триггеры
+на bookings (core/schema.py): вставка, смена статуса, перенос и отмена
+брони в любом процессе сдвигают значения только затронутых интервалов.
+
+Значения знаковые: при ручной перегрузке доски свободных мест может стать
+меньше нуля, и инкрементальный возврат мест должен это учитывать.
+
+Карты — для экранов выбора даты и времени (какие дни и часы показать).
+Брони частично занимают 15-минутный интервал целиком, поэтому карта
+осторожнее шкалы DayTimeline (шаг 5 минут); удержания мест
+(services/holds.py) в ней не учитываются. Окончательная проверка при
+удержании и создании брони идет по DayTimeline.
+"""
+import asyncio
+import logging
+import math
+import weakref
+from array import array
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from config import Config
+from core.database import Database
+from services.availability import DAY_MINUTES, DayTimeline, epoch_minutes
+
+logger = logging.getLogger(__name__)
+
+RESOLUTION_MINUTES = 15
+SLOTS = DAY_MINUTES // RESOLUTION_MINUTES
+
+_EPOCH = date(1970, 1, 1)
+
+# Брони доски за диапазон дат (и день до него — брони через полночь)
+_BOOKINGS_SQL = """SELECT start_at, end_at, quantity
+           FROM bookings
+           WHERE board_id = ?
+           AND date BETWEEN ? AND ?
+           AND status IN ('waiting_partner', 'active', 'waiting_card', 'waiting_cash')
+           AND end_at > ? AND start_at < ?"""
+
+
+def _slot_range(start: int, end: int) -> Tuple[int, int]:
+    """Интервалы, которые задевает отрезок минут дня (округление наружу)"""
+    return max(0, start // RESOLUTION_MINUTES), min(SLOTS, -(-end // RESOLUTION_MINUTES))
+
+
+def window_starts(free: Sequence[int], slots: int, quantity: int = 1,
+                  lo: int = 0, hi: Optional[int] = None) -> List[int]:
+    """Индексы интервалов i в [lo, hi - slots], где free[i:i + slots] >= quantity
+
+    Один проход: длина текущей серии подходящих интервалов.
+    """
+    result = []
+    run = 0
+    for i in range(lo, len(free) if hi is None else hi):
+        if free[i] >= quantity:
+            run += 1
+            if run >= slots:
+                result.append(i - slots + 1)
+        else:
+            run = 0
+    return result
+
+
+def map_timeline(capacity: int, free: Sequence[int]) -> DayTimeline:
+    """Шкала DayTimeline по карте (занятость для правил цен без запроса броней)"""
+    return DayTimeline(capacity, [
+        (i * RESOLUTION_MINUTES, (i + 1) * RESOLUTION_MINUTES, capacity - value)
+        for i, value in enumerate(free) if value < capacity
+    ])
+
+
+def open_range(day: date, now: Optional[datetime] = None) -> Tuple[int, int]:
+    """Интервалы рабочего времени дня; сегодня — не раньше текущего момента"""
+    lo = Config.WORK_HOURS_START * 60 // RESOLUTION_MINUTES
+    hi = Config.WORK_HOURS_END * 60 // RESOLUTION_MINUTES
+    now = now or datetime.now()
+    if day == now.date():
+        lo = max(lo, -(-(now.hour * 60 + now.minute) // RESOLUTION_MINUTES))
+    return lo, hi
+
+
+class OccupancyCache:
+    """Карты свободных мест (доска, день) с обновлением по журналу изменений"""
+
+    def __init__(self, db: Database, max_maps: Optional[int] = None):
+        self.db = db
+        self.max_maps = max_maps or Config.OCCUPANCY_CACHE_MAPS
+        # (доска, день) -> [вместимость, свободные места по интервалам]
+        self._maps: "OrderedDict[Tuple[int, date], list]" = OrderedDict()
+        self._seq: Optional[int] = None
+        # Журнал применяется одной корутиной за раз, иначе записи учтутся дважды
+        self._lock = asyncio.Lock()
+
+    def clear(self):
+        self._maps.clear()
+        self._seq = None
+
+    def _apply(self, board_id: int, start_at: int, end_at: int, delta: int):
+        """Изменение занятости интервала на delta мест во всех картах в памяти"""
+        day_index = start_at // DAY_MINUTES
+        while day_index * DAY_MINUTES < end_at:
+            entry = self._maps.get((board_id, _EPOCH + timedelta(days=day_index)))
+            if entry is not None:
+                day_start = day_index * DAY_MINUTES
+                free = entry[1]
+                lo, hi = _slot_range(start_at - day_start, end_at - day_start)
+                for i in range(lo, hi):
+                    free[i] -= delta
+            day_index += 1
+
+    async def refresh(self):
+        """Применение новых записей журнала к картам в памяти (под self._lock)
+
+        Если часть журнала уже удалена (процесс долго не обращался к кэшу),
+        карты сбрасываются и строятся заново.
+        """
+        if self._seq is None or not self._maps:
+            row = await self.db.fetchone("SELECT IFNULL(MAX(seq), 0) AS seq FROM occupancy_changes")
+            self._seq = row['seq']
+            return
+        rows = await self.db.fetchall(
+            "SELECT seq, board_id, start_at, end_at, delta FROM occupancy_changes WHERE seq > ? ORDER BY seq",
+            (self._seq,),
+            as_rows=True
+        )
+        if rows and rows[0]['seq'] != self._seq + 1:
+            logger.info("Occupancy log was pruned past the cache position, rebuilding")
+            self._maps.clear()
+            self._seq = rows[-1]['seq']
+            return
+        for row in rows:
+            self._apply(row['board_id'], row['start_at'], row['end_at'], row['delta'])
+            self._seq = row['seq']
+
+    async def _load(self, board_id: int, capacity: int, days: List[date]):
+        """Построение карт доски для дней одним запросом"""
+        first, last = min(days), max(days)
+        range_start = epoch_minutes(first)
+        range_end = epoch_minutes(last) + DAY_MINUTES
+        maps = {day: array('h', [capacity]) * SLOTS for day in days}
+        rows = await self.db.fetchall(
+            _BOOKINGS_SQL,
+            (board_id, (first - timedelta(days=1)).isoformat(), last.isoformat(), range_start, range_end),
+            as_rows=True
+        )
+        for row in rows:
+            day = first + timedelta(days=(row['start_at'] - range_start) // DAY_MINUTES)
+            while day <= last and epoch_minutes(day) < row['end_at']:
+                free = maps.get(day)
+                if free is not None:
+                    day_start = epoch_minutes(day)
+                    lo, hi = _slot_range(row['start_at'] - day_start, row['end_at'] - day_start)
+                    for i in range(lo, hi):
+                        free[i] -= row['quantity'] or 0
+                day += timedelta(days=1)
+        for day, free in maps.items():
+            self._maps[(board_id, day)] = [capacity, free]
+
+    async def maps(self, board_id: int, capacity: int, days: Iterable[date]) -> Dict[date, array]:
+        """Карты свободных мест доски по дням (значения изменять нельзя)
+
+        Если карт не хватает, журнал и брони читаются в одной транзакции —
+        одном снимке БД, чтобы изменение между ними не учлось дважды.
+        """
+        days = list(days)
+        capacity = int(capacity or 0)
+        async with self._lock:
+            # refresh может сбросить карты (журнал урезан), поэтому недостающие
+            # дни считаются только после него
+            await self.refresh()
+            if any((board_id, day) not in self._maps for day in days):
+                async with self.db.transaction():
+                    await self.refresh()
+                    missing = [day for day in days if (board_id, day) not in self._maps]
+                    if missing:
+                        await self._load(board_id, capacity, missing)
+
+        result = {}
+        for day in days:
+            key = (board_id, day)
+            entry = self._maps[key]
+            if entry[0] != capacity:
+                # Изменилось количество досок: свободно столько же больше/меньше везде
+                delta = capacity - entry[0]
+                entry[1] = array('h', (value + delta for value in entry[1]))
+                entry[0] = capacity
+            self._maps.move_to_end(key)
+            result[day] = entry[1]
+        while len(self._maps) > self.max_maps:
+            self._maps.popitem(last=False)
+        return result
+
+    async def free_days(
+        self,
+        board_ids: Iterable[int],
+        capacities: Dict[int, int],
+        day_from: date,
+        days: int,
+        duration: int,
+        quantity: int = 1
+    ) -> List[date]:
+        """Дни из days дней с day_from, где у всех досок board_ids есть окно
+        duration минут на quantity мест (не обязательно в одно время)
+
+        Например, «в какие из ближайших 30 дней есть 2 часа на 3 доски».
+        """
+        slots = max(1, math.ceil(duration / RESOLUTION_MINUTES))
+        day_list = [day_from + timedelta(days=i) for i in range(days)]
+        result = set(day_list)
+        for board_id in board_ids:
+            maps = await self.maps(board_id, capacities.get(board_id, 0), day_list)
+            for day, free in maps.items():
+                if day in result and not window_starts(free, slots, quantity, *open_range(day)):
+                    result.discard(day)
+        return [day for day in day_list if day in result]
+
+    async def free_hours(
+        self,
+        board_ids: Iterable[int],
+        capacities: Dict[int, int],
+        day: date,
+        duration: int,
+        quantity: int = 1
+    ) -> List[int]:
+        """Часы дня, с начала которых все доски board_ids свободны duration минут"""
+        slots = max(1, math.ceil(duration / RESOLUTION_MINUTES))
+        lo, hi = open_range(day)
+        per_hour = 60 // RESOLUTION_MINUTES
+        hours = None
+        for board_id in board_ids:
+            free = (await self.maps(board_id, capacities.get(board_id, 0), (day,)))[day]
+            board_hours = {i // per_hour for i in window_starts(free, slots, quantity, lo, hi) if i % per_hour == 0}
+            hours = board_hours if hours is None else hours & board_hours
+        return sorted(hours or ())
+
+    async def load_by_day(self, capacities: Dict[int, int], day_from: date, days: int) -> Dict[date, float]:
+        """Доля свободных мест в рабочие часы по дням для набора досок (календарь)"""
+        day_list = [day_from + timedelta(days=i) for i in range(days)]
+        lo = Config.WORK_HOURS_START * 60 // RESOLUTION_MINUTES
+        hi = Config.WORK_HOURS_END * 60 // RESOLUTION_MINUTES
+        free_total = dict.fromkeys(day_list, 0)
+        capacity_total = sum(max(0, c or 0) for c in capacities.values()) * (hi - lo)
+        for board_id, capacity in capacities.items():
+            maps = await self.maps(board_id, capacity, day_list)
+            for day, free in maps.items():
+                free_total[day] += sum(max(0, value) for value in free[lo:hi])
+        return {
+            day: (free_total[day] / capacity_total if capacity_total else 0.0)
+            for day in day_list
+        }
+
+
+async def prune_occupancy_changes(db: Database, keep_hours: Optional[int] = None) -> int:
+    """Удаление старых записей журнала (последняя запись остается всегда)"""
+    keep_hours = Config.OCCUPANCY_LOG_HOURS if keep_hours is None else keep_hours
+    cursor = await db.execute(
+        """DELETE FROM occupancy_changes
+           WHERE changed_at < datetime('now', ?)
+           AND seq < (SELECT MAX(seq) FROM occupancy_changes)""",
+        (f"-{int(keep_hours)} hours",)
+    )
+    return cursor.rowcount
+
+
+_caches: "weakref.WeakKeyDictionary[Database, OccupancyCache]" = weakref.WeakKeyDictionary()
+
+
+def get_occupancy(db: Database) -> OccupancyCache:
+    """Общий кэш занятости для экземпляра БД"""
+    cache = _caches.get(db)
+    if cache is None:
+        cache = _caches[db] = OccupancyCache(db)
+    return cache
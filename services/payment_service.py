@@ -3,9 +3,9 @@ import logging
 import hashlib
 import uuid
 import base64
-import requests
 from typing import Optional, Dict, Any
 from config import Config
+from core.http_client import get_http_client
 
 logger = logging.getLogger(__name__)
 
@@ -67,9 +67,8 @@ class PaymentService:
         }
         
         try:
-            response = requests.post(url, json=payload, headers=headers, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            # Idempotence-Key один на все попытки, поэтому повтор не создаст второй платеж
+            data = await get_http_client().post_json(url, payload, headers=headers, timeout=10)
             
             if data.get("status") == "pending":
                 return {
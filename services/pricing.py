@@ -0,0 +1,247 @@
+"""Движок цен: правила, таблицы цен доски на день и котировки
+
+Цена часа = базовая цена доски × множители правил:
+    - время суток (первая подходящая полоса для будней/выходных);
+    - день недели;
+    - занятость доски на интервале брони (наибольший пройденный порог);
+    - срок до даты брони в днях (наибольший пройденный порог).
+Купон применяется к сумме брони (apply_discount).
+
+Занятость берется из уже загруженной шкалы DayTimeline — той же, по
+которой проверяется доступность, так что брони дня читаются один раз.
+Таблица цен (все начала дня для доски и длительности) кэшируется под
+версией: хэш правил, базовой цены и отпечатка шкалы — пока брони дня и
+цена доски не меняются, цены не пересчитываются. Котировка несет token —
+версию слота и его цены (неподписанный хэш: клиент может прислать любой).
+При оформлении брони сумма всегда пересчитывается по таблице, а token лишь
+сравнивается с новым: бронь отклоняется, если цена слота изменилась с
+момента показа. Сумма из token или от клиента не берется.
+
+Модуль не зависит от БД, как services/availability.py.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from datetime import date
+from typing import Dict, Optional, Tuple
+from services.availability import DAY_MINUTES, DayTimeline
+
+
+@dataclass(frozen=True)
+class TimeBand:
+    """Множитель для часов начала start_hour..end_hour (включительно)"""
+    days: str  # 'weekday', 'weekend' или 'all'
+    start_hour: int
+    end_hour: int
+    multiplier: float
+
+    def matches(self, day: date, hour: int) -> bool:
+        weekend = day.weekday() >= 5
+        if self.days == "weekend" and not weekend or self.days == "weekday" and weekend:
+            return False
+        return self.start_hour <= hour <= self.end_hour
+
+
+@dataclass(frozen=True)
+class PricingRules:
+    """Набор правил; по умолчанию — прежние правила сайта"""
+    time_bands: Tuple[TimeBand, ...] = (
+        TimeBand("weekend", 16, 21, 1.15),
+        TimeBand("weekday", 7, 10, 0.90),
+    )
+    # Множители по дням недели (пн = 0)
+    weekdays: Tuple[float, ...] = (1.0,) * 7
+    # (доля занятости, множитель): применяется при занятости строго больше порога
+    occupancy_tiers: Tuple[Tuple[float, float], ...] = ((0.6, 1.10),)
+    # (дней до даты брони, множитель): применяется, если до даты не меньше
+    lead_days: Tuple[Tuple[int, float], ...] = ()
+    version: str = field(default="", compare=False)
+
+    def __post_init__(self):
+        if len(self.weekdays) != 7:
+            raise ValueError("weekdays must have 7 multipliers")
+        if not self.version:
+            data = json.dumps(
+                {k: v for k, v in asdict(self).items() if k != "version"}, sort_keys=True
+            )
+            object.__setattr__(self, "version", hashlib.sha1(data.encode()).hexdigest()[:12])
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PricingRules":
+        kwargs = {}
+        if "time_bands" in data:
+            kwargs["time_bands"] = tuple(
+                TimeBand(b["days"], int(b["start_hour"]), int(b["end_hour"]), float(b["multiplier"]))
+                for b in data["time_bands"]
+            )
+        if "weekdays" in data:
+            kwargs["weekdays"] = tuple(float(m) for m in data["weekdays"])
+        if "occupancy_tiers" in data:
+            kwargs["occupancy_tiers"] = tuple((float(t), float(m)) for t, m in data["occupancy_tiers"])
+        if "lead_days" in data:
+            kwargs["lead_days"] = tuple((int(d), float(m)) for d, m in data["lead_days"])
+        return cls(**kwargs)
+
+
+def load_rules(text: Optional[str]) -> PricingRules:
+    """Правила из JSON (PRICING_RULES); пустая строка — правила по умолчанию
+
+    Raises:
+        ValueError: неверный JSON или поля правил
+    """
+    if not text or not text.strip():
+        return PricingRules()
+    try:
+        return PricingRules.from_dict(json.loads(text))
+    except (KeyError, TypeError, json.JSONDecodeError) as e:
+        raise ValueError(f"bad PRICING_RULES: {e}") from e
+
+
+def apply_discount(amount: float, kind: str, value: float) -> float:
+    """Купон: 'percent' — процент от суммы, иначе фиксированная скидка"""
+    if kind == "percent":
+        amount = amount * (1 - float(value) / 100.0)
+    else:
+        amount = amount - float(value)
+    return round(max(0.0, amount), 2)
+
+
+@dataclass(frozen=True)
+class PriceTable:
+    """Цены часа для всех начал дня при одной длительности"""
+    board_id: int
+    day: date
+    duration: int
+    version: str
+    prices: Dict[int, float]  # начало (минуты от полуночи) -> цена часа
+
+
+@dataclass(frozen=True)
+class Quote:
+    """Котировка брони; token — версия доски, слота и цены часа (не подпись)"""
+    board_id: int
+    day: date
+    start: int
+    duration: int
+    quantity: int
+    unit_price: float
+    amount: float
+    token: str
+
+
+class PriceEngine:
+    """Вычисление цен по правилам с кэшем таблиц доска/день/длительность"""
+
+    def __init__(self, rules: Optional[PricingRules] = None, max_tables: int = 1024, granularity: int = 5):
+        self.rules = rules or PricingRules()
+        self.max_tables = max_tables
+        self.granularity = granularity
+        self._tables: "OrderedDict[tuple, PriceTable]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def unit_price(
+        self,
+        base_price: float,
+        day: date,
+        start: int,
+        duration: int,
+        timeline: DayTimeline,
+        today: Optional[date] = None
+    ) -> float:
+        """Цена часа для брони с началом start (минуты от полуночи)"""
+        rules = self.rules
+        price = float(base_price) * rules.weekdays[day.weekday()]
+        for band in rules.time_bands:
+            if band.matches(day, start // 60):
+                price *= band.multiplier
+                break
+
+        occupancy = min(1.0, timeline.used(start, start + duration) / float(timeline.capacity or 1))
+        tier = max((t for t in rules.occupancy_tiers if occupancy > t[0]), default=None)
+        if tier:
+            price *= tier[1]
+
+        days_ahead = (day - (today or date.today())).days
+        lead = max((t for t in rules.lead_days if days_ahead >= t[0]), default=None)
+        if lead:
+            price *= lead[1]
+        return round(price, 2)
+
+    def _version(self, board_id: int, base_price: float, day: date, duration: int,
+                 timeline: DayTimeline, today: date) -> str:
+        # Срок до даты входит в версию: пороги lead_days сдвигаются каждый день
+        key = f"{self.rules.version}|{board_id}|{day}|{duration}|{float(base_price)}|{today}|{timeline.digest()}"
+        return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+    def token(self, board_id: int, day: date, start: int, duration: int, unit_price: float) -> str:
+        """Версия котировки слота: меняется только вместе с ценой часа
+
+        Не подпись и не секрет — только для обнаружения изменения цены.
+        """
+        key = f"{self.rules.version}|{board_id}|{day}|{start}|{duration}|{unit_price:.2f}"
+        return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+    def table(
+        self,
+        board_id: int,
+        base_price: float,
+        day: date,
+        timeline: DayTimeline,
+        duration: int,
+        today: Optional[date] = None
+    ) -> PriceTable:
+        """Таблица цен доски на день (из кэша, если версия не изменилась)"""
+        today = today or date.today()
+        version = self._version(board_id, base_price, day, duration, timeline, today)
+        key = (board_id, day, duration)
+        with self._lock:
+            cached = self._tables.get(key)
+            if cached is not None and cached.version == version:
+                self._tables.move_to_end(key)
+                return cached
+
+        prices = {
+            start: self.unit_price(base_price, day, start, duration, timeline, today)
+            for start in range(0, DAY_MINUTES - duration + 1, self.granularity)
+        }
+        table = PriceTable(board_id, day, duration, version, prices)
+        with self._lock:
+            self._tables[key] = table
+            self._tables.move_to_end(key)
+            while len(self._tables) > self.max_tables:
+                self._tables.popitem(last=False)
+        return table
+
+    def quote(
+        self,
+        board_id: int,
+        base_price: float,
+        day: date,
+        timeline: DayTimeline,
+        start: int,
+        duration: int,
+        quantity: int = 1,
+        today: Optional[date] = None
+    ) -> Quote:
+        """Котировка брони (цена — из таблицы доски на день)"""
+        table = self.table(board_id, base_price, day, timeline, duration, today)
+        unit = table.prices.get(start)
+        if unit is None:
+            unit = self.unit_price(base_price, day, start, duration, timeline, today)
+        amount = round(unit * duration / 60.0 * quantity, 2)
+        return Quote(board_id, day, start, duration, quantity, unit, amount,
+                     self.token(board_id, day, start, duration, unit))
+
+
+_engine: Optional[PriceEngine] = None
+
+
+def get_price_engine() -> PriceEngine:
+    """Общий движок цен бота и Mini App (правила из Config.PRICING_RULES)"""
+    global _engine
+    if _engine is None:
+        from config import Config
+        _engine = PriceEngine(load_rules(Config.PRICING_RULES), max_tables=Config.PRICE_TABLE_CACHE_SIZE)
+    return _engine
@@ -1,10 +1,35 @@
 """Сервис для работы с отзывами"""
 import logging
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterable, Tuple
 from core.database import Database
 
 logger = logging.getLogger(__name__)
 
+# Разрезы сводки rating_stats и колонка брони/доски с их ID
+RATING_SCOPES = {
+    "board": "board_id",
+    "location": "location_id",
+    "partner": "partner_id",
+}
+
+_REVIEW_SCOPES_SQL = """
+    SELECT b.board_id, brd.location_id, b.partner_id
+    FROM bookings b
+    LEFT JOIN boards brd ON brd.id = b.board_id
+    WHERE b.id = ?
+"""
+
+_RATING_STATS_UPSERT = """
+    INSERT INTO rating_stats (scope, scope_id, rating_sum, rating_count)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (scope, scope_id) DO UPDATE SET
+        rating_sum = rating_sum + excluded.rating_sum,
+        rating_count = rating_count + excluded.rating_count
+"""
+
+# Ограничение SQLite на число параметров запроса
+_MAX_IN_PARAMS = 500
+
 
 class ReviewService:
     """Сервис для работы с отзывами"""
@@ -55,22 +80,102 @@ class ReviewService:
                 if not partner_id:
                     partner_id = booking.get('partner_id')
         
-        # Добавляем дополнительные поля, если их нет в схеме
-        # Для совместимости проверяем наличие полей
-        cursor = await self.db.execute(
-            """INSERT INTO reviews (user_id, booking_id, rating, comment)
-               VALUES (?, ?, ?, ?)""",
-            (user_id, booking_id, rating, comment)
-        )
-        
-        review_id = cursor.lastrowid
-        
-        # Обновляем дополнительные поля, если они есть в схеме
-        # (это делается для будущего расширения схемы)
+        # Отзыв и сводка rating_stats меняются одной транзакцией
+        async with self.db.transaction():
+            cursor = await self.db.execute(
+                """INSERT INTO reviews (user_id, booking_id, rating, comment)
+                   VALUES (?, ?, ?, ?)""",
+                (user_id, booking_id, rating, comment)
+            )
+            review_id = cursor.lastrowid
+            await self._apply_rating(booking_id, rating, 1)
         
         logger.info(f"Review {review_id} created by user {user_id} for booking {booking_id}")
         return review_id
     
+    async def delete_review(self, review_id: int) -> bool:
+        """Удаление отзыва с вычитанием его оценки из сводки"""
+        async with self.db.transaction():
+            review = await self.db.fetchone(
+                "SELECT booking_id, rating FROM reviews WHERE id = ?",
+                (review_id,)
+            )
+            if not review:
+                return False
+            await self.db.execute("DELETE FROM reviews WHERE id = ?", (review_id,))
+            await self._apply_rating(review['booking_id'], review['rating'], -1)
+        return True
+    
+    async def _apply_rating(self, booking_id: Optional[int], rating: int, sign: int):
+        """Добавление (sign=1) или вычитание (sign=-1) оценки в rating_stats"""
+        if not booking_id:
+            return
+        row = await self.db.fetchone(_REVIEW_SCOPES_SQL, (booking_id,))
+        if not row:
+            return
+        params = [
+            (scope, row[column], rating * sign, sign)
+            for scope, column in RATING_SCOPES.items()
+            if row[column] is not None
+        ]
+        if params:
+            await self.db.executemany(_RATING_STATS_UPSERT, params)
+    
+    async def get_ratings(self, scope: str, ids: Iterable[int]) -> Dict[int, Tuple[float, int]]:
+        """
+        Рейтинги для списка досок, локаций или партнеров одним запросом
+        
+        Args:
+            scope: 'board', 'location' или 'partner'
+            ids: ID объектов
+        
+        Returns:
+            {id: (средняя оценка, количество отзывов)}; объекты без отзывов
+            в словарь не попадают
+        """
+        if scope not in RATING_SCOPES:
+            raise ValueError(f"Unknown rating scope: {scope}")
+        ids = list(dict.fromkeys(ids))
+        ratings: Dict[int, Tuple[float, int]] = {}
+        for i in range(0, len(ids), _MAX_IN_PARAMS):
+            chunk = ids[i:i + _MAX_IN_PARAMS]
+            rows = await self.db.fetchall(
+                f"""SELECT scope_id, rating_sum, rating_count FROM rating_stats
+                    WHERE scope = ? AND rating_count > 0
+                      AND scope_id IN ({', '.join('?' * len(chunk))})""",
+                (scope, *chunk),
+                as_rows=True
+            )
+            for row in rows:
+                ratings[row['scope_id']] = (
+                    round(row['rating_sum'] / row['rating_count'], 2),
+                    row['rating_count']
+                )
+        return ratings
+    
+    async def get_rating(
+        self,
+        board_id: Optional[int] = None,
+        location_id: Optional[int] = None,
+        partner_id: Optional[int] = None
+    ) -> Tuple[Optional[float], int]:
+        """Средняя оценка (None, если отзывов нет) и количество отзывов"""
+        for scope, scope_id in (("board", board_id), ("location", location_id), ("partner", partner_id)):
+            if scope_id:
+                return (await self.get_ratings(scope, [scope_id])).get(scope_id, (None, 0))
+        return None, 0
+    
+    async def get_rating_distribution(self, partner_id: int) -> Dict[int, int]:
+        """Количество отзывов партнера по каждой оценке: {оценка: количество}"""
+        rows = await self.db.fetchall("""
+            SELECT r.rating, COUNT(*) AS count
+            FROM reviews r
+            JOIN bookings b ON r.booking_id = b.id
+            WHERE b.partner_id = ?
+            GROUP BY r.rating
+        """, (partner_id,))
+        return {row['rating']: row['count'] for row in rows}
+    
     async def get_review(self, review_id: int) -> Optional[Dict[str, Any]]:
         """Получение отзыва по ID"""
         return await self.db.fetchone(
@@ -201,34 +306,8 @@ class ReviewService:
         Returns:
             Средняя оценка или None если отзывов нет
         """
-        if board_id:
-            result = await self.db.fetchone("""
-                SELECT AVG(r.rating) as avg_rating, COUNT(*) as count
-                FROM reviews r
-                JOIN bookings b ON r.booking_id = b.id
-                WHERE b.board_id = ?
-            """, (board_id,))
-        elif location_id:
-            result = await self.db.fetchone("""
-                SELECT AVG(r.rating) as avg_rating, COUNT(*) as count
-                FROM reviews r
-                JOIN bookings b ON r.booking_id = b.id
-                JOIN boards brd ON b.board_id = brd.id
-                WHERE brd.location_id = ?
-            """, (location_id,))
-        elif partner_id:
-            result = await self.db.fetchone("""
-                SELECT AVG(r.rating) as avg_rating, COUNT(*) as count
-                FROM reviews r
-                JOIN bookings b ON r.booking_id = b.id
-                WHERE b.partner_id = ?
-            """, (partner_id,))
-        else:
-            return None
-        
-        if result and result.get('count', 0) > 0:
-            return round(result['avg_rating'], 2)
-        return None
+        avg_rating, _ = await self.get_rating(board_id, location_id, partner_id)
+        return avg_rating
     
     async def get_review_count(
         self,
@@ -247,32 +326,8 @@ class ReviewService:
         Returns:
             Количество отзывов
         """
-        if board_id:
-            result = await self.db.fetchone("""
-                SELECT COUNT(*) as count
-                FROM reviews r
-                JOIN bookings b ON r.booking_id = b.id
-                WHERE b.board_id = ?
-            """, (board_id,))
-        elif location_id:
-            result = await self.db.fetchone("""
-                SELECT COUNT(*) as count
-                FROM reviews r
-                JOIN bookings b ON r.booking_id = b.id
-                JOIN boards brd ON b.board_id = brd.id
-                WHERE brd.location_id = ?
-            """, (location_id,))
-        elif partner_id:
-            result = await self.db.fetchone("""
-                SELECT COUNT(*) as count
-                FROM reviews r
-                JOIN bookings b ON r.booking_id = b.id
-                WHERE b.partner_id = ?
-            """, (partner_id,))
-        else:
-            return 0
-        
-        return result['count'] if result else 0
+        _, count = await self.get_rating(board_id, location_id, partner_id)
+        return count
     
     async def user_can_review_booking(
         self,
@@ -0,0 +1,260 @@
+"""Кошелек партнера: баланс и сверка с операциями
+
+Баланс хранится в wallet_balances и обновляется триггерами на
+partner_wallet_ops в той же транзакции, что и сама операция (кто бы ее
+ни записал: бот, сайт или старый код). Поэтому чтение баланса — одна
+строка по первичному ключу, а не сумма по всей истории партнера.
+
+Сверка (reconcile) пересчитывает суммы по сырым операциям и сравнивает
+их с wallet_balances. Чтобы не читать всю историю каждый раз, после
+успешной сверки записывается контрольная точка (wallet_checkpoints):
+суммы на момент последней учтенной операции. Следующая сверка
+досчитывает только операции после нее; full=True проверяет все с нуля.
+Правка или удаление уже учтенной операции удаляет точки, которые ее
+покрывают (триггеры WALLET_CHECKPOINT_TRIGGERS_SQL в core/schema.py).
+
+Начисления сотрудникам пишутся в employee_wallet_ops при завершении
+брони (сумма фиксируется по проценту на момент завершения), итог —
+в employee_balances, тоже через триггеры.
+
+Запуск вручную:
+    python -m services.wallet_ledger [--full] [--fix]
+"""
+import asyncio
+import logging
+import sys
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from core.database import Database
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Расхождение меньше копейки — погрешность сложения REAL
+_TOLERANCE = 0.005
+
+_LATEST_CHECKPOINTS_SQL = """
+    SELECT c.partner_id, c.op_id, c.credit, c.debit
+    FROM wallet_checkpoints c
+    JOIN (SELECT partner_id, MAX(id) AS id FROM wallet_checkpoints GROUP BY partner_id) last
+      ON last.id = c.id
+"""
+
+_OPS_SINCE_SQL = """
+    SELECT o.partner_id,
+           COALESCE(SUM(CASE WHEN o.type = 'credit' THEN o.amount END), 0) AS credit,
+           COALESCE(SUM(CASE WHEN o.type = 'debit' THEN o.amount END), 0) AS debit,
+           MAX(o.id) AS last_op_id
+    FROM partner_wallet_ops o
+    LEFT JOIN ({checkpoints}) cp ON cp.partner_id = o.partner_id
+    WHERE o.id > COALESCE(cp.op_id, 0)
+    GROUP BY o.partner_id
+"""
+
+
+@dataclass
+class BalanceDrift:
+    """Расхождение баланса с операциями"""
+    partner_id: int
+    expected_credit: float
+    expected_debit: float
+    actual_credit: float
+    actual_debit: float
+
+    @property
+    def expected(self) -> float:
+        return self.expected_credit - self.expected_debit
+
+    @property
+    def actual(self) -> float:
+        return self.actual_credit - self.actual_debit
+
+
+class WalletLedger:
+    """Чтение балансов и сверка с partner_wallet_ops"""
+
+    def __init__(self, db: Database):
+        self.db = db
+
+    async def get_totals(self, partner_id: int) -> Dict[str, float]:
+        """Сумма поступлений, списаний и баланс партнера"""
+        row = await self.db.fetchone(
+            "SELECT credit, debit FROM wallet_balances WHERE partner_id = ?",
+            (partner_id,)
+        )
+        credit = float(row['credit']) if row else 0.0
+        debit = float(row['debit']) if row else 0.0
+        return {"credit": credit, "debit": debit, "balance": credit - debit}
+
+    async def get_balance(self, partner_id: int) -> float:
+        """Баланс партнера: credit - debit"""
+        return (await self.get_totals(partner_id))["balance"]
+
+    async def reconcile(self, full: bool = False, fix: bool = False) -> List[BalanceDrift]:
+        """Сверка wallet_balances с операциями
+
+        Args:
+            full: пересчитать с нуля, не опираясь на контрольные точки
+            fix: исправить найденные расхождения по операциям
+
+        Returns:
+            Список расхождений. Для партнеров без расхождений (и исправленных)
+            записывается новая контрольная точка.
+        """
+        checkpoints_sql = "SELECT NULL AS partner_id, 0 AS op_id WHERE 0" if full else _LATEST_CHECKPOINTS_SQL
+        drifts = []
+        # Одна транзакция: операции, балансы и точки читаются согласованно
+        async with self.db.transaction():
+            base = {} if full else {
+                row['partner_id']: row for row in await self.db.fetchall(_LATEST_CHECKPOINTS_SQL)
+            }
+            since = {
+                row['partner_id']: row
+                for row in await self.db.fetchall(_OPS_SINCE_SQL.format(checkpoints=checkpoints_sql))
+            }
+            balances = {
+                row['partner_id']: row
+                for row in await self.db.fetchall("SELECT partner_id, credit, debit FROM wallet_balances")
+            }
+
+            checkpoints = []
+            for partner_id in set(base) | set(since) | set(balances):
+                cp = base.get(partner_id)
+                new = since.get(partner_id)
+                credit = (cp['credit'] if cp else 0.0) + (new['credit'] if new else 0.0)
+                debit = (cp['debit'] if cp else 0.0) + (new['debit'] if new else 0.0)
+                actual = balances.get(partner_id)
+                actual_credit = actual['credit'] if actual else 0.0
+                actual_debit = actual['debit'] if actual else 0.0
+
+                if abs(credit - actual_credit) > _TOLERANCE or abs(debit - actual_debit) > _TOLERANCE:
+                    drifts.append(BalanceDrift(partner_id, credit, debit, actual_credit, actual_debit))
+                    if not fix:
+                        continue
+                    await self.db.execute(
+                        """INSERT INTO wallet_balances (partner_id, credit, debit, updated_at)
+                           VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                           ON CONFLICT (partner_id) DO UPDATE SET
+                               credit = excluded.credit, debit = excluded.debit,
+                               updated_at = excluded.updated_at""",
+                        (partner_id, credit, debit)
+                    )
+                if new:
+                    checkpoints.append((partner_id, new['last_op_id'], credit, debit))
+
+            if checkpoints:
+                await self.db.executemany(
+                    "INSERT INTO wallet_checkpoints (partner_id, op_id, credit, debit) VALUES (?, ?, ?, ?)",
+                    checkpoints
+                )
+
+        for drift in drifts:
+            logger.warning(
+                f"Wallet drift for partner {drift.partner_id}: balance {drift.actual:.2f}, "
+                f"ops give {drift.expected:.2f}{' (fixed)' if fix else ''}"
+            )
+        return drifts
+
+
+class EmployeeLedger:
+    """Начисления сотрудникам: баланс и постраничная выписка"""
+
+    def __init__(self, db: Database):
+        self.db = db
+
+    async def credit(self, telegram_id, booking_id: int, amount: float,
+                     src: str = 'booking_commission') -> bool:
+        """Начисление за бронь (повторное для той же брони игнорируется)"""
+        cursor = await self.db.execute(
+            """INSERT INTO employee_wallet_ops (employee_telegram_id, booking_id, amount, src)
+               SELECT ?, ?, ?, ?
+               WHERE NOT EXISTS (
+                   SELECT 1 FROM employee_wallet_ops
+                   WHERE employee_telegram_id = ? AND booking_id = ?
+               )""",
+            (str(telegram_id), booking_id, amount, src, str(telegram_id), booking_id)
+        )
+        return cursor.rowcount > 0
+
+    async def get_balance(self, telegram_id) -> float:
+        """Сумма всех начислений сотруднику"""
+        row = await self.db.fetchone(
+            "SELECT earned FROM employee_balances WHERE employee_telegram_id = ?",
+            (str(telegram_id),)
+        )
+        return float(row['earned']) if row else 0.0
+
+    async def get_statement(
+        self,
+        telegram_id,
+        limit: int = 10,
+        before_id: Optional[int] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        Выписка начислений, от новых к старым
+        
+        Args:
+            telegram_id: Telegram ID сотрудника
+            limit: размер страницы
+            before_id: курсор — id последней операции предыдущей страницы
+        
+        Returns:
+            (операции страницы, курсор следующей страницы или None)
+        """
+        rows = await self.db.fetchall(
+            """SELECT id, booking_id, amount, src, created_at
+               FROM employee_wallet_ops
+               WHERE employee_telegram_id = ? AND id < ?
+               ORDER BY id DESC
+               LIMIT ?""",
+            (str(telegram_id), before_id if before_id is not None else 2 ** 63 - 1, limit + 1)
+        )
+        if len(rows) > limit:
+            return rows[:limit], rows[limit - 1]['id']
+        return rows, None
+
+
+async def credit_completed_booking(db: Database, booking: Dict[str, Any]):
+    """Начисления партнеру и сотруднику за завершенную бронь
+
+    Доля сотрудника считается от доли партнера по текущему проценту
+    сотрудника и записывается в employee_wallet_ops, так что последующее
+    изменение процента не меняет уже начисленное.
+    """
+    partner_id = booking['partner_id']
+    partner_amount = booking['amount'] * (1 - Config.PLATFORM_COMMISSION_PERCENT / 100)
+    
+    if booking.get('employee_id'):
+        employee = await db.fetchone(
+            "SELECT telegram_id, commission_percent FROM employees WHERE id = ?",
+            (booking['employee_id'],)
+        )
+        if employee:
+            employee_amount = partner_amount * (employee['commission_percent'] / 100)
+            partner_amount -= employee_amount
+            await EmployeeLedger(db).credit(employee['telegram_id'], booking['id'], employee_amount)
+    
+    await db.execute(
+        """INSERT INTO partner_wallet_ops (partner_id, type, amount, src, booking_id)
+           VALUES (?, 'credit', ?, ?, ?)""",
+        (partner_id, partner_amount, f"Бронирование #{booking['id']}", booking['id'])
+    )
+    logger.info(f"Credited {partner_amount:.2f} to partner {partner_id} for booking {booking['id']}")
+
+
+async def _main(argv: List[str]) -> int:
+    db = Database()
+    await db.connect()
+    try:
+        drifts = await WalletLedger(db).reconcile(full="--full" in argv, fix="--fix" in argv)
+    finally:
+        await db.close()
+    for drift in drifts:
+        print(f"partner {drift.partner_id}: balance {drift.actual:.2f}, expected {drift.expected:.2f}")
+    print(f"Drifts: {len(drifts)}")
+    return 1 if drifts and "--fix" not in argv else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
@@ -1,11 +1,128 @@
-"""Сервис для работы с погодой"""
+"""Сервис для работы с погодой
+
+Ответы OpenWeatherMap кэшируются по координатам, округленным до
+WEATHER_COORD_PRECISION знаков (2 знака — около километра, точнее погода
+все равно не меняется). Свежая запись отдается сразу; устаревшая, но не
+старше WEATHER_STALE_TTL, тоже отдается сразу, а обновление идет в фоне
+(stale-while-revalidate). Одновременные промахи по одному ключу ждут
+один общий запрос к API.
+"""
+import asyncio
 import logging
-import requests
-from typing import Optional, Dict, Any
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
 from config import Config
+from core.database import Database
+from core.http_client import get_http_client
 
 logger = logging.getLogger(__name__)
 
+# Сколько точек держать в кэше
+_MAX_ENTRIES = 1024
+
+Key = Tuple[float, float]
+
+
+def weather_key(latitude: float, longitude: float) -> Key:
+    """Ключ кэша: координаты, округленные до WEATHER_COORD_PRECISION"""
+    precision = Config.WEATHER_COORD_PRECISION
+    return round(float(latitude), precision), round(float(longitude), precision)
+
+
+class WeatherCache:
+    """Кэш сырых ответов API с TTL и объединением одновременных запросов"""
+
+    def __init__(self, ttl: Optional[float] = None, stale_ttl: Optional[float] = None):
+        self.ttl = ttl if ttl is not None else Config.WEATHER_CACHE_TTL
+        self.stale_ttl = stale_ttl if stale_ttl is not None else Config.WEATHER_STALE_TTL
+        # ключ -> (ответ API, время получения по monotonic)
+        self._entries: "OrderedDict[Key, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._inflight: Dict[Key, asyncio.Task] = {}
+
+    async def get(self, latitude: float, longitude: float, api_key: str) -> Optional[Dict[str, Any]]:
+        """Ответ API для точки; None, если данных нет и запрос не удался"""
+        key = weather_key(latitude, longitude)
+        entry = self._entries.get(key)
+        if entry is not None:
+            data, fetched_at = entry
+            age = time.monotonic() - fetched_at
+            if age < self.ttl:
+                self._entries.move_to_end(key)
+                return data
+            if age < self.ttl + self.stale_ttl:
+                # Отдаем устаревшее, обновляем в фоне
+                self._refresh(key, api_key)
+                return data
+        try:
+            # shield: отмена одного ожидающего не отменяет общий запрос
+            return await asyncio.shield(self._refresh(key, api_key))
+        except Exception:
+            # Ошибка уже записана в лог в _on_done
+            return None
+
+    def _refresh(self, key: Key, api_key: str) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.create_task(self._fetch(key, api_key))
+            task.add_done_callback(self._on_done)
+        return task
+
+    def _on_done(self, task: asyncio.Task):
+        for key, inflight in list(self._inflight.items()):
+            if inflight is task:
+                del self._inflight[key]
+        if not task.cancelled() and task.exception() is not None:
+            # Логируем здесь: фоновое обновление никто не ждет
+            logger.error(f"Error fetching weather: {task.exception()}")
+
+    async def _fetch(self, key: Key, api_key: str) -> Dict[str, Any]:
+        params = {
+            "lat": key[0],
+            "lon": key[1],
+            "appid": api_key,
+            "units": "metric",
+            "lang": "ru"
+        }
+        data = await get_http_client().get_json(WeatherService.API_URL, params=params, timeout=5)
+        self._entries[key] = (data, time.monotonic())
+        self._entries.move_to_end(key)
+        if len(self._entries) > _MAX_ENTRIES:
+            self._entries.popitem(last=False)
+        return data
+
+    async def prefetch_locations(self, db: Database, api_key: str) -> int:
+        """Обновление погоды для всех активных локаций; число точек"""
+        rows = await db.fetchall(
+            """SELECT DISTINCT latitude, longitude FROM locations
+               WHERE is_active = 1 AND latitude IS NOT NULL AND longitude IS NOT NULL"""
+        )
+        keys = {weather_key(row['latitude'], row['longitude']) for row in rows}
+        # Параллельность ограничена пулом HTTP-клиента (limit_per_host)
+        await asyncio.gather(*(self._refresh(key, api_key) for key in keys), return_exceptions=True)
+        return len(keys)
+
+    async def run_prefetch(self, db: Database, api_key: str, interval_minutes: float):
+        """Периодическое обновление погоды по локациям (фоновая задача)"""
+        while True:
+            try:
+                count = await self.prefetch_locations(db, api_key)
+                logger.debug(f"Weather prefetched for {count} locations")
+            except Exception as e:
+                logger.error(f"Weather prefetch error: {e}")
+            await asyncio.sleep(interval_minutes * 60)
+
+
+_cache: Optional[WeatherCache] = None
+
+
+def get_weather_cache() -> WeatherCache:
+    """Общий кэш погоды процесса"""
+    global _cache
+    if _cache is None:
+        _cache = WeatherCache()
+    return _cache
+
 
 class WeatherService:
     """Сервис для получения данных о погоде"""
@@ -19,28 +136,13 @@ class WeatherService:
             logger.warning("OpenWeatherMap API key not configured")
             return None
         
-        try:
-            params = {
-                "lat": latitude,
-                "lon": longitude,
-                "appid": Config.OPENWEATHER_KEY,
-                "units": "metric",
-                "lang": "ru"
-            }
-            response = requests.get(WeatherService.API_URL, params=params, timeout=5)
-            response.raise_for_status()
-            data = response.json()
-            
-            return {
-                "temp": data.get("main", {}).get("temp"),
-                "feels_like": data.get("main", {}).get("feels_like"),
-                "description": data.get("weather", [{}])[0].get("description", ""),
-                "wind_speed": data.get("wind", {}).get("speed"),
-                "humidity": data.get("main", {}).get("humidity"),
-            }
-        except Exception as e:
-            logger.error(f"Error fetching weather: {e}")
+        data = await get_weather_cache().get(latitude, longitude, Config.OPENWEATHER_KEY)
+        if data is None:
             return None
-
-
-
+        return {
+            "temp": data.get("main", {}).get("temp"),
+            "feels_like": data.get("main", {}).get("feels_like"),
+            "description": data.get("weather", [{}])[0].get("description", ""),
+            "wind_speed": data.get("wind", {}).get("speed"),
+            "humidity": data.get("main", {}).get("humidity"),
+        }
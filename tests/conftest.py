@@ -0,0 +1,51 @@
+# tests/conftest.py
+import json
+
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+
+class StubServer:
+    """Локальный HTTP-сервер вместо внешних API
+
+    server.add("POST", "/payments", (500, {...}), (200, {...})) — ответы
+    выдаются по очереди, последний повторяется. server.requests хранит
+    (method, path, headers, body) всех запросов.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", self._handle)
+        self._server = TestServer(app)
+
+    def add(self, method, path, *responses):
+        self.routes[(method, path)] = list(responses)
+
+    def url(self, path=""):
+        return str(self._server.make_url(path))
+
+    async def _handle(self, request):
+        body = await request.text()
+        self.requests.append((request.method, request.path, dict(request.headers), body))
+        responses = self.routes.get((request.method, request.path))
+        if not responses:
+            return web.json_response({"error": "not found"}, status=404)
+        status, payload = responses.pop(0) if len(responses) > 1 else responses[0]
+        return web.Response(status=status, text=json.dumps(payload), content_type="application/json")
+
+    async def start(self):
+        await self._server.start_server()
+
+    async def close(self):
+        await self._server.close()
+
+
+@pytest_asyncio.fixture
+async def stub_server():
+    server = StubServer()
+    await server.start()
+    yield server
+    await server.close()
@@ -0,0 +1,125 @@
+# tests/test_availability.py
+from datetime import date, timedelta
+
+import pytest
+import pytest_asyncio
+
+from services.availability import DayTimeline
+
+
+def test_timeline_peak_and_free():
+    # 2 доски с 10:00 до 11:30, 1 доска с 11:00 до 12:00
+    t = DayTimeline(3, [(600, 690, 2), (660, 720, 1)])
+    assert t.used(600, 660) == 2
+    assert t.used(600, 720) == 3
+    assert t.free(690, 720) == 2
+    assert t.free(720, 780) == 3
+
+
+def test_feasible_starts_respects_window_and_quantity():
+    t = DayTimeline(2, [(600, 660, 2)])
+    starts = t.feasible_starts(60, 1, granularity=30, open_from=540, open_to=720)
+    assert starts == [540, 660]
+    assert t.feasible_starts(30, 3, granularity=30) == []
+    with pytest.raises(ValueError):
+        t.feasible_starts(60, 1, granularity=7)
+
+
+def test_previous_day_spillover_is_counted():
+    t = DayTimeline(1, [(22 * 60 - 1440, 26 * 60 - 1440, 1)])
+    assert t.free(0, 60) == 0
+    assert t.free(120, 180) == 1
+
+
+@pytest_asyncio.fixture
+async def service(tmp_path):
+    from core.database import Database
+    from core.schema import init_db
+    from services.booking_service import BookingService
+    db = Database(str(tmp_path / "avail.db"), pool_size=1)
+    await db.connect()
+    await init_db(db)
+    await db.execute("INSERT INTO users (id, username) VALUES (1, 'u')")
+    await db.execute("INSERT INTO boards (id, name, price, quantity) VALUES (1, 'SUP', 500, 2)")
+    yield BookingService(db)
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_service_uses_peak_occupancy(service):
+    day = date.today() + timedelta(days=1)
+    # Две непересекающиеся брони по одной доске не должны суммироваться
+    await service.create_booking(1, 1, "SUP", day, 10, 0, 60, 1, 500, status="active")
+    await service.create_booking(1, 1, "SUP", day, 11, 0, 60, 1, 500, status="active")
+    assert await service.check_board_availability(1, day, 10, 0, 120, 1)
+    assert not await service.check_board_availability(1, day, 10, 30, 60, 2)
+    slots = await service.get_available_time_slots(1, day, duration=60, quantity=2, granularity=30)
+    assert (10, 0) not in slots and (10, 30) not in slots and (12, 0) in slots
+
+
+@pytest.mark.asyncio
+async def test_reserve_is_all_or_nothing(service):
+    from services.booking_service import ReservationError, ReservationItem
+    db = service.db
+    await db.execute("INSERT INTO boards (id, name, price, quantity) VALUES (2, 'Kayak', 300, 1)")
+    day = date.today() + timedelta(days=1)
+    first = await service.reserve(1, [ReservationItem(1, 1, day, 600, 60), ReservationItem(2, 1, day, 600, 60)])
+    assert len(first.booking_ids) == 2
+
+    # Вторая доска занята — не записывается и первая; две позиции одной доски суммируются
+    with pytest.raises(ReservationError) as e:
+        await service.reserve(1, [ReservationItem(1, 1, day, 600, 60), ReservationItem(2, 1, day, 630, 60)])
+    assert e.value.board_name == "Kayak"
+    with pytest.raises(ReservationError):
+        await service.reserve(1, [ReservationItem(1, 1, day, 600, 60), ReservationItem(1, 1, day, 630, 30)])
+    row = await db.fetchone("SELECT COUNT(*) AS n, COUNT(DISTINCT group_id) AS groups FROM bookings")
+    assert (row['n'], row['groups']) == (2, 1)
+
+    second = await service.reserve(1, [ReservationItem(1, 1, day, 600, 60)])
+    assert second.group_id == first.group_id + 1
+
+
+@pytest.mark.asyncio
+async def test_holds_count_toward_availability(service):
+    from services.holds import CapacityHolds
+    holds = CapacityHolds(service.db, ttl=600)
+    day = date.today() + timedelta(days=1)
+    # Пользователь 7 удерживает оба места доски на 10:00-11:00
+    assert await holds.hold(7, 1, day, 600, 60, quantity=2) is not None
+    assert await holds.hold(8, 1, day, 630, 30) is None
+    assert (await service.get_day_timeline(1, day, exclude_hold_user=7)).free(600, 660) == 2
+    assert (await service.get_day_timelines({1: 2}, day))[1].free(600, 660) == 0
+    assert await holds.extend(7)
+
+    await holds.release(7)
+    assert holds.get(7) is None
+    assert await holds.hold(8, 1, day, 630, 30) is not None
+
+    # Просроченное удержание места не занимает и удаляется sweep
+    expired = CapacityHolds(service.db, ttl=-1)
+    assert await expired.hold(9, 1, day, 900, 60) is not None
+    assert (await service.get_day_timeline(1, day)).free(900, 960) == 2
+    assert not await expired.extend(9)
+    assert await expired.sweep() == 1
+
+
+@pytest.mark.asyncio
+async def test_search_slots_ranks_by_distance_then_price(service):
+    db = service.db
+    await db.execute("INSERT INTO locations (id, name, address) VALUES (1, 'Берег', 'Набережная')")
+    await db.execute(
+        "INSERT INTO boards (id, name, price, quantity, location_id) VALUES "
+        "(2, 'Cheap', 300, 1, 1), (3, 'Premium', 900, 1, 1)"
+    )
+    day = date.today() + timedelta(days=3)
+    # Дешевая доска занята 13:00-16:00: ближайшее к 14:00 у нее — 16:00
+    await service.create_booking(1, 2, "Cheap", day, 13, 0, 180, 1, 0)
+
+    options = await service.search_slots(1, day, day, 60, preferred_start=14 * 60)
+    assert [(o.board_name, o.start) for o in options] == [("Premium", 840), ("Cheap", 720)]
+    assert options[1].distance == 120 and options[0].amount > options[1].amount
+
+    # Без желаемого времени — сначала дешевле
+    options = await service.search_slots(1, day, day + timedelta(days=1), 60)
+    assert options[0].board_name == "Cheap"
+    assert await service.search_slots(1, day, day, 60, quantity=2) == []
@@ -0,0 +1,100 @@
+# tests/test_data_store.py
+import pytest
+import pytest_asyncio
+
+
+@pytest_asyncio.fixture
+async def db_path(tmp_path):
+    from core.database import Database
+    from core.schema import init_db
+    path = str(tmp_path / "data.db")
+    d = Database(path, pool_size=1)
+    await d.connect()
+    try:
+        await init_db(d)
+        await d.execute("INSERT INTO partners (id, name, telegram_id) VALUES (1, 'A', 100)")
+        await d.execute(
+            "INSERT INTO locations (id, name, address, partner_id, is_active) VALUES (1, 'Озеро', 'Берег', 1, 1)"
+        )
+        await d.execute(
+            "INSERT INTO boards (id, partner_id, location_id, name, price, total) VALUES (1, 1, 1, 'SUP', 500, 2)"
+        )
+    finally:
+        await d.close()
+    return path
+
+
+@pytest.mark.asyncio
+async def test_write_from_other_process_invalidates_cache(db_path):
+    from core.database import Database
+    from core.data import DataStore, VersionedCache
+    web, bot = Database(db_path, pool_size=1), Database(db_path, pool_size=1)
+    await web.connect()
+    await bot.connect()
+    try:
+        store = DataStore(web, VersionedCache(web, ttl=60, check_interval=0))
+        assert [b['name'] for b in await store.boards.by_location(1)] == ["SUP"]
+        await store.boards.by_location(1)
+        assert (store.cache.hits, store.cache.misses) == (1, 1)
+
+        # Запись через другое соединение (бот) увеличивает версию триггером
+        await bot.execute("UPDATE boards SET price = 700 WHERE id = 1")
+        assert (await store.boards.by_location(1))[0]['price'] == 700
+        assert (await store.boards.get(1))['price'] == 700
+        # Изменение других таблиц кэш досок не сбрасывает
+        await bot.execute("UPDATE partners SET name = 'B' WHERE id = 1")
+        await store.boards.by_location(1)
+        assert store.cache.misses == 3
+        assert (await store.partners.by_telegram(100))['name'] == "B"
+        # Любой столбец кэшируемой строки, например комиссия с сайта
+        await bot.execute("UPDATE partners SET commission_percent = 7 WHERE id = 1")
+        assert (await store.partners.by_telegram(100))['commission_percent'] == 7
+    finally:
+        await web.close()
+        await bot.close()
+
+
+def test_sync_store_runs_on_shared_loop(db_path, monkeypatch):
+    from core.data import sync
+    monkeypatch.setattr(sync, "_store", None)
+    store = sync.get_sync_store(db_path)
+    try:
+        assert sync.get_sync_store() is store
+        assert [loc['name'] for loc in sync.run_sync(store.locations.active())] == ["Озеро"]
+        assert sync.run_sync(store.bookings.get(42)) is None
+    finally:
+        sync.run_sync(store.db.close())
+
+
+@pytest.mark.asyncio
+async def test_catalog_lookups_and_per_entity_ttl(db_path):
+    from core.database import Database
+    from core.data import DataStore, VersionedCache
+    db = Database(db_path, pool_size=1)
+    await db.connect()
+    try:
+        store = DataStore(db, VersionedCache(db, ttl=60, check_interval=60))
+        store.partners.ttl = 0
+        assert (await store.boards.get(1))['quantity'] == 1
+        assert await store.boards.images(1) == []
+        assert not await store.admins.is_admin(7)
+        assert await store.partners.approved(100) is None
+
+        # Столбцы, которых нет в триггерах витрины, тоже увеличивают версии;
+        # хук invalidate() показывает изменения без ожидания check_interval
+        await db.execute("UPDATE boards SET quantity = 3 WHERE id = 1")
+        await db.execute("INSERT INTO board_images (board_id, file_id) VALUES (1, 'f')")
+        await db.execute("INSERT INTO admins (user_id) VALUES (7)")
+        misses = store.cache.misses
+        await store.boards.get(1)
+        assert store.cache.misses == misses
+        store.invalidate()
+        assert (await store.boards.get(1))['quantity'] == 3
+        assert [image['file_id'] for image in await store.boards.images(1)] == ["f"]
+        assert await store.admins.is_admin(7)
+
+        # Партнеры с нулевым TTL перечитываются каждый раз
+        await db.execute("UPDATE partners SET commission_percent = 5 WHERE id = 1")
+        assert (await store.partners.get(1))['commission_percent'] == 5
+    finally:
+        await db.close()
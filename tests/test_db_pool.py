@@ -0,0 +1,106 @@
+# tests/test_db_pool.py
+import asyncio
+import pytest
+
+import pytest_asyncio
+
+
+@pytest_asyncio.fixture
+async def db(tmp_path):
+    from core.database import Database
+    d = Database(str(tmp_path / "pool.db"), pool_size=2)
+    await d.connect()
+    await d.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+    yield d
+    await d.close()
+
+
+@pytest.mark.asyncio
+async def test_pragmas_applied(db):
+    async with db._reader() as conn:
+        cur = await conn.execute("PRAGMA journal_mode")
+        assert (await cur.fetchone())[0].lower() == "wal"
+        cur = await conn.execute("PRAGMA synchronous")
+        assert (await cur.fetchone())[0] == 1  # NORMAL
+
+
+@pytest.mark.asyncio
+async def test_reads_see_committed_writes(db):
+    await db.execute("INSERT INTO items (name) VALUES (?)", ("a",))
+    rows = await asyncio.gather(*[
+        db.fetchall("SELECT name FROM items") for _ in range(10)
+    ])
+    assert all(r == [{"name": "a"}] for r in rows)
+    stats = db.pool_stats()
+    assert stats["read"]["acquired"] == 10
+    assert stats["readers_idle"] == 2
+
+
+@pytest.mark.asyncio
+async def test_memory_db_falls_back_to_single_connection():
+    from core.database import Database
+    d = Database(":memory:", pool_size=4)
+    await d.execute("CREATE TABLE t (x INTEGER)")
+    await d.execute("INSERT INTO t VALUES (1)")
+    # без пула чтение идет через писателя и видит ту же in-memory БД
+    assert await d.fetchone("SELECT x FROM t") == {"x": 1}
+    await d.close()
+
+
+@pytest.mark.asyncio
+async def test_transaction_commits_at_end(db):
+    from core.database import Database
+    other = Database(db.db_path, pool_size=1)
+    async with db.transaction():
+        await db.execute("INSERT INTO items (name) VALUES (?)", ("a",))
+        await db.execute("INSERT INTO items (name) VALUES (?)", ("b",))
+        # внутри транзакции видны свои записи, другому соединению — еще нет
+        assert await db.fetchone("SELECT COUNT(*) AS n FROM items") == {"n": 2}
+        assert await other.fetchone("SELECT COUNT(*) AS n FROM items") == {"n": 0}
+    assert await other.fetchone("SELECT COUNT(*) AS n FROM items") == {"n": 2}
+    await other.close()
+
+
+@pytest.mark.asyncio
+async def test_transaction_rollback_and_savepoint(db):
+    with pytest.raises(ValueError):
+        async with db.transaction():
+            await db.execute("INSERT INTO items (name) VALUES ('lost')")
+            raise ValueError()
+    assert await db.fetchall("SELECT name FROM items") == []
+
+    async with db.transaction():
+        await db.execute("INSERT INTO items (name) VALUES ('kept')")
+        with pytest.raises(ValueError):
+            async with db.transaction():
+                await db.execute("INSERT INTO items (name) VALUES ('inner')")
+                raise ValueError()
+    assert await db.fetchall("SELECT name FROM items") == [{"name": "kept"}]
+
+
+@pytest.mark.asyncio
+async def test_rows_share_column_index(db):
+    await db.executemany("INSERT INTO items (name) VALUES (?)", [("a",), ("b",)])
+    rows = await db.fetchall("SELECT id, name FROM items ORDER BY id", as_rows=True)
+    assert rows[0]["name"] == "a" and rows[1][1] == "b"
+    assert rows[0].get("missing") is None
+    assert dict(rows[0]) == {"id": 1, "name": "a"}
+    assert rows[0]._index is rows[1]._index
+
+    # Повторяющиеся имена: по имени — последнее значение, как у fetchone
+    rows = await db.fetchall("SELECT id, name, name || '!' AS name FROM items ORDER BY id", as_rows=True)
+    assert len(rows[0]) == len(dict(rows[0])) == 2
+    assert dict(rows[0]) == await db.fetchone("SELECT id, name, name || '!' AS name FROM items ORDER BY id")
+    assert (rows[0]["name"], rows[0][1]) == ("a!", "a")
+    again = await db.fetchall("SELECT id, name, name || '!' AS name FROM items ORDER BY id", as_rows=True)
+    assert again[0]._index is rows[0]._index
+
+
+@pytest.mark.asyncio
+async def test_fetchall_iter_streams_in_chunks(db):
+    await db.executemany("INSERT INTO items (name) VALUES (?)", [(str(i),) for i in range(25)])
+    names = [row["name"] async for row in db.fetchall_iter(
+        "SELECT name FROM items ORDER BY id", chunk_size=10
+    )]
+    assert names == [str(i) for i in range(25)]
+    assert db.pool_stats()["readers_idle"] == 2
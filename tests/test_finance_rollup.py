@@ -0,0 +1,79 @@
+# tests/test_finance_rollup.py
+import pytest
+import pytest_asyncio
+
+
+@pytest_asyncio.fixture
+async def db(tmp_path):
+    from core.database import Database
+    from core.schema import init_db
+    d = Database(str(tmp_path / "finance.db"), pool_size=1)
+    await d.connect()
+    await init_db(d)
+    await d.execute("INSERT INTO partners (id, name, telegram_id) VALUES (1, 'A', 100), (2, 'B', 200)")
+    await d.execute("INSERT INTO users (id, full_name) VALUES (1, 'U')")
+    await d.execute("INSERT INTO boards (id, partner_id, name, price) VALUES (10, 2, 'SUP', 500)")
+    yield d
+    await d.close()
+
+
+async def _booking(db, day, amount, status="completed", partner_id=1, board_id=None):
+    cursor = await db.execute(
+        """INSERT INTO bookings (user_id, board_id, board_name, date, start_time, duration, amount,
+                                 status, partner_id)
+           VALUES (1, ?, 'SUP', ?, 10, 60, ?, ?, ?)""",
+        (board_id, day, amount, status, partner_id)
+    )
+    return cursor.lastrowid
+
+
+@pytest.mark.asyncio
+async def test_rollup_follows_raw_tables(db):
+    from handlers.finance_handlers import get_finance_stats
+    from services.finance_rollup import FinanceRollup
+    rollup = FinanceRollup(db)
+    b1 = await _booking(db, "2025-06-01", 1000)
+    b2 = await _booking(db, "2025-06-02", 500, status="waiting_partner")
+    await _booking(db, "2025-06-02", 300, partner_id=None, board_id=10)
+    await db.execute(
+        "INSERT INTO partner_wallet_ops (partner_id, type, amount, src, booking_id, created_at) "
+        "VALUES (1, 'credit', 700, 'Бронирование', ?, '2025-06-01 12:00:00')", (b1,)
+    )
+    await db.execute(
+        "INSERT INTO employee_wallet_ops (employee_telegram_id, booking_id, amount) VALUES ('555', ?, 100)", (b1,)
+    )
+    await db.execute("INSERT INTO expenses (date, amount) VALUES ('2025-06-02', 50)")
+
+    assert await rollup.get_totals("2025-06-01", "2025-06-01") == {
+        "income": 1000.0, "partner_payout": 700.0, "employee_payout": 100.0, "expenses": 0.0
+    }
+    # Бронь без партнера учитывается за партнером доски
+    assert (await rollup.get_totals(partner_id=2))["income"] == 300.0
+
+    await db.execute("UPDATE bookings SET status = 'active' WHERE id = ?", (b2,))
+    await db.execute("UPDATE bookings SET date = '2025-06-03' WHERE id = ?", (b1,))
+    assert (await rollup.get_totals("2025-06-03", "2025-06-03"))["employee_payout"] == 100.0
+    await db.execute("DELETE FROM bookings WHERE id = ?", (b1,))
+
+    stats = await get_finance_stats(db, "2025-06-01", "2025-06-30")
+    assert (stats["income"], stats["expenses"], stats["employee_payout"]) == (800.0, 50.0, 0.0)
+    assert await rollup.check() == []
+
+
+@pytest.mark.asyncio
+async def test_check_and_rebuild(db):
+    from services.finance_rollup import FinanceRollup
+    rollup = FinanceRollup(db)
+    await _booking(db, "2025-06-01", 1000)
+    await _booking(db, "2025-07-01", 400)
+    await db.execute("UPDATE daily_finance_rollup SET income = income + 5 WHERE day = '2025-06-01'")
+
+    drifts = await rollup.check()
+    assert [(d.day, d.partner_id, d.column, d.expected, d.actual) for d in drifts] == [
+        ("2025-06-01", 1, "income", 1000.0, 1005.0)
+    ]
+    assert await rollup.check("2025-07-01") == []
+
+    await rollup.rebuild("2025-06-01", "2025-06-30")
+    assert await rollup.check() == []
+    assert (await rollup.get_totals())["income"] == 1400.0
@@ -0,0 +1,89 @@
+# tests/test_http_client.py
+import pytest
+
+
+@pytest.fixture
+def client():
+    from core.http_client import HttpClient
+    return HttpClient(retries=2, backoff=0.01)
+
+
+@pytest.mark.asyncio
+async def test_retries_server_errors(client, stub_server):
+    stub_server.add("GET", "/data", (503, {}), (200, {"ok": True}))
+    assert await client.get_json(stub_server.url("/data")) == {"ok": True}
+    assert len(stub_server.requests) == 2
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_client_errors_are_not_retried(client, stub_server):
+    from core.http_client import HttpError
+    stub_server.add("GET", "/bad", (400, {"error": "bad"}))
+    with pytest.raises(HttpError) as exc:
+        await client.get_json(stub_server.url("/bad"))
+    assert exc.value.status == 400
+    assert len(stub_server.requests) == 1
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_yookassa_payment_retry_keeps_idempotence_key(stub_server, monkeypatch):
+    from config import Config
+    from core import http_client
+    from services.payment_service import PaymentService
+    monkeypatch.setattr(Config, "YK_SHOP_ID", "shop")
+    monkeypatch.setattr(Config, "YK_SECRET", "secret")
+    monkeypatch.setattr(Config, "YK_API_URL", stub_server.url("/v3"))
+    monkeypatch.setattr(http_client, "_client", http_client.HttpClient(retries=2, backoff=0.01))
+    stub_server.add("POST", "/v3/payments", (500, {}), (200, {
+        "id": "yk-1", "status": "pending",
+        "confirmation": {"confirmation_url": "https://pay.example/1"},
+    }))
+
+    result = await PaymentService().create_yookassa_payment(100, "SUP", 1, "https://t.me/bot")
+    assert result["yookassa_id"] == "yk-1"
+    keys = {headers["Idempotence-Key"] for _, _, headers, _ in stub_server.requests}
+    assert len(stub_server.requests) == 2 and len(keys) == 1
+    await http_client.get_http_client().close()
+
+
+@pytest.mark.asyncio
+async def test_weather_through_shared_client(stub_server, monkeypatch):
+    from config import Config
+    from core import http_client
+    from services import weather_service
+    from services.weather_service import WeatherService
+    monkeypatch.setattr(Config, "OPENWEATHER_KEY", "key")
+    monkeypatch.setattr(weather_service, "_cache", None)
+    monkeypatch.setattr(WeatherService, "API_URL", stub_server.url("/weather"))
+    monkeypatch.setattr(http_client, "_client", http_client.HttpClient(retries=0))
+    stub_server.add("GET", "/weather", (200, {
+        "main": {"temp": 21.5, "feels_like": 20, "humidity": 60},
+        "weather": [{"description": "ясно"}], "wind": {"speed": 3},
+    }))
+    weather = await WeatherService.get_weather(55.75, 37.62)
+    assert weather["temp"] == 21.5 and weather["description"] == "ясно"
+    await http_client.get_http_client().close()
+
+
+def test_session_of_previous_loop_is_closed():
+    import asyncio
+    from core.http_client import HttpClient
+    client = HttpClient()
+    first = asyncio.new_event_loop()
+    try:
+        old = first.run_until_complete(client._get_session())
+        # Новый цикл (например, asyncio.run в синхронном коде) — новая сессия
+        new = asyncio.run(client._get_session())
+        assert new is not old and old.closed and not new.closed
+    finally:
+        first.close()
+
+    async def reopen():
+        session = await client._get_session()
+        await client.close()
+        return session
+
+    # Прежний цикл уже закрыт — сессия все равно помечается закрытой
+    assert asyncio.run(reopen()) is not new and new.closed
@@ -0,0 +1,131 @@
+# tests/test_job_queue.py
+from datetime import date, datetime, timedelta
+
+import pytest
+import pytest_asyncio
+
+
+@pytest_asyncio.fixture
+async def db(tmp_path):
+    from core.database import Database
+    from core.schema import init_db
+    d = Database(str(tmp_path / "jobs.db"), pool_size=1)
+    await d.connect()
+    await init_db(d)
+    await d.execute("INSERT INTO users (id) VALUES (1)")
+    await d.execute("INSERT INTO boards (id, name, price, quantity) VALUES (1, 'SUP', 500, 2)")
+    yield d
+    await d.close()
+
+
+@pytest.mark.asyncio
+async def test_heap_order_and_reschedule(db):
+    from notifications.job_queue import JobQueue
+    queue = JobQueue(db)
+    now = datetime.now()
+    await queue.schedule(1, "expire", now + timedelta(minutes=5))
+    await queue.schedule(2, "expire", now - timedelta(minutes=1))
+    assert queue.next_due() < now
+    # перенос задачи делает старую запись heap неактуальной
+    await queue.schedule(2, "expire", now + timedelta(minutes=10))
+    assert queue.pop_due(now) == []
+    assert [job[2] for job in queue.pop_due(now + timedelta(minutes=6))] == [1]
+
+    # после перезапуска задачи восстанавливаются из БД
+    restored = JobQueue(db)
+    await restored.load()
+    assert restored.next_due() == now + timedelta(minutes=5)
+
+
+@pytest.mark.asyncio
+async def test_booking_status_drives_jobs(db):
+    from services.booking_service import BookingService
+    service = BookingService(db)
+    day = date.today() + timedelta(days=1)
+    booking_id = await service.create_booking(
+        1, 1, "SUP", day, 10, 0, 60, 1, 500,
+        payment_deadline=datetime.now() + timedelta(minutes=30)
+    )
+    jobs = await db.fetchall("SELECT kind, status FROM scheduled_jobs ORDER BY kind")
+    assert jobs == [{"kind": "expire", "status": "pending"}]
+
+    await service.update_booking_status(booking_id, "active")
+    jobs = await db.fetchall("SELECT kind, status FROM scheduled_jobs ORDER BY kind")
+    assert jobs == [
+        {"kind": "complete", "status": "pending"},
+        {"kind": "expire", "status": "canceled"},
+        {"kind": "remind", "status": "pending"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_scheduler_runs_due_expiry(db):
+    from notifications.notification_scheduler import NotificationScheduler
+    from services.booking_service import BookingService
+    booking_id = await BookingService(db).create_booking(
+        1, 1, "SUP", date.today() + timedelta(days=1), 10, 0, 60, 1, 500,
+        payment_deadline=datetime.now() - timedelta(seconds=1)
+    )
+    scheduler = NotificationScheduler(db)
+    for job_id, kind, bid in scheduler.jobs.pop_due():
+        await scheduler._run_job(job_id, kind, bid)
+    booking = await db.fetchone("SELECT status FROM bookings WHERE id = ?", (booking_id,))
+    assert booking["status"] == "canceled"
+    job = await db.fetchone("SELECT status FROM scheduled_jobs WHERE booking_id = ?", (booking_id,))
+    assert job["status"] == "done"
+
+
+@pytest.mark.asyncio
+async def test_sweep_skips_bookings_without_deadline_or_end(db, caplog):
+    from notifications.notification_scheduler import MISSING_JOBS_SQL, NotificationScheduler
+    # Как брони сайта: суточная активная без времени и end_at, почасовая без срока оплаты
+    await db.execute(
+        """INSERT INTO bookings (id, user_id, board_name, date, start_time, duration, amount, status)
+           VALUES (1, 1, 'SUP', '2030-06-01', 0, 24, 500, 'active')"""
+    )
+    await db.execute("UPDATE bookings SET start_at = NULL, end_at = NULL WHERE id = 1")
+    await db.execute(
+        """INSERT INTO bookings (id, user_id, board_id, board_name, date, start_time, duration, amount, status)
+           VALUES (2, 1, 1, 'SUP', '2030-06-01', 12, 60, 500, 'waiting_cash')"""
+    )
+    await db.execute("DELETE FROM scheduled_jobs")
+    assert await db.fetchall(MISSING_JOBS_SQL) == []
+
+    await db.execute("UPDATE bookings SET payment_deadline = '2030-06-01 09:00:00' WHERE id = 2")
+    scheduler = NotificationScheduler(db)
+    with caplog.at_level("INFO"):
+        await scheduler._sweep_missing_jobs()
+        await scheduler._sweep_missing_jobs()
+    assert [r.message for r in caplog.records if "found by sweep" in r.message] == [
+        "Scheduled jobs for 1 bookings found by sweep"
+    ]
+
+
+@pytest.mark.asyncio
+async def test_sweep_picks_up_jobs_of_other_processes(db):
+    from notifications.job_queue import JobQueue
+    from notifications.notification_scheduler import NotificationScheduler
+    scheduler = NotificationScheduler(db)
+    await scheduler.jobs.load()
+    # Mini App ставит задачу в своей копии очереди, которую никто не выполняет
+    web = JobQueue(db)
+    due = datetime.now() - timedelta(seconds=1)
+    await web.schedule(7, "expire", due)
+    assert scheduler.jobs.next_due() is None
+
+    await scheduler._sweep_missing_jobs()
+    jobs = scheduler.jobs.pop_due()
+    assert [job[2] for job in jobs] == [7]
+    for job_id, kind, bid in jobs:
+        await scheduler._run_job(job_id, kind, bid)
+    await scheduler._sweep_missing_jobs()
+    assert scheduler.jobs.next_due() is None
+
+    # Перенос и отмена в другом процессе тоже видны после sweep
+    await web.schedule(8, "expire", due + timedelta(hours=1))
+    await web.schedule(9, "expire", due)
+    await scheduler._sweep_missing_jobs()
+    await web.schedule(8, "expire", due)
+    await web.cancel(9)
+    await scheduler._sweep_missing_jobs()
+    assert [job[2] for job in scheduler.jobs.pop_due()] == [8]
@@ -0,0 +1,86 @@
+# tests/test_miniapp_service.py
+import hashlib
+import hmac
+import json
+import time
+from datetime import date, timedelta
+from urllib.parse import urlencode
+import pytest
+import pytest_asyncio
+
+
+@pytest_asyncio.fixture
+async def store(tmp_path):
+    from core.database import Database
+    from core.schema import init_db
+    from core.data import DataStore, VersionedCache
+    d = Database(str(tmp_path / "miniapp.db"), pool_size=1)
+    await d.connect()
+    try:
+        await init_db(d)
+        await d.execute("INSERT INTO partners (id, name, telegram_id) VALUES (1, 'A', 100)")
+        await d.executemany(
+            "INSERT INTO locations (id, name, address, partner_id, is_active) VALUES (?, ?, 'Берег', 1, 1)",
+            [(i, f"Локация {i}") for i in range(1, 4)]
+        )
+        await d.execute(
+            "INSERT INTO boards (id, partner_id, location_id, name, price, total, quantity) "
+            "VALUES (1, 1, 1, 'SUP', 600, 1, 1)"
+        )
+        yield DataStore(d, VersionedCache(d, ttl=60, check_interval=0))
+    finally:
+        await d.close()
+
+
+def _init_data(token, user_id=42):
+    fields = {"auth_date": str(int(time.time())), "user": json.dumps({"id": user_id, "first_name": "Ann"})}
+    check = "\n".join(f"{k}={fields[k]}" for k in sorted(fields))
+    secret = hmac.new(b"WebAppData", token.encode(), hashlib.sha256).digest()
+    fields["hash"] = hmac.new(secret, check.encode(), hashlib.sha256).hexdigest()
+    return urlencode(fields)
+
+
+def test_verify_init_data():
+    from services.miniapp_service import MiniAppError, verify_init_data
+    init_data = _init_data("123:abc")
+    assert verify_init_data(init_data, "123:abc")["id"] == 42
+    with pytest.raises(MiniAppError) as e:
+        verify_init_data(init_data, "123:other")
+    assert e.value.status == 401
+
+
+@pytest.mark.asyncio
+async def test_pages_bootstrap_and_booking(store):
+    from services.miniapp_service import MiniAppError, MiniAppService
+    service = MiniAppService(store)
+    first = await service.locations(limit=2)
+    assert ([loc["id"] for loc in first["items"]], first["next"]) == ([1, 2], 2)
+    rest = await service.locations(after=first["next"], limit=2)
+    assert ([loc["id"] for loc in rest["items"]], rest["next"]) == ([3], None)
+
+    day = date.today() + timedelta(days=1)
+    data = await service.bootstrap(day)
+    assert [b["price"] for b in data["boards"]] == [600]
+    assert "10:00" in data["availability"]["1"]
+
+    # Котировка bootstrap (60 мин) не подходит для брони на 90 мин
+    payload = {"board_id": 1, "date": day.isoformat(), "start": "10:00", "duration": 90, "quote": data["quotes"]["1"]["10:00"]}
+    with pytest.raises(MiniAppError) as e:
+        await service.create_booking({"id": 42}, payload)
+    assert e.value.status == 409
+
+    del payload["quote"]
+    result = await service.create_booking({"id": 42, "first_name": "Ann"}, payload)
+    booking = await store.bookings.get(result["booking_id"])
+    assert (booking["user_id"], booking["duration"]) == (42, 90)
+    assert booking["amount"] == result["amount"] == data["prices"]["1"]["10:00"] * 1.5
+    # Уведомление партнеру ушло в outbox, его отправит бот
+    messages = await store.db.fetchall("SELECT chat_id, text FROM outbox WHERE chat_id = 100")
+    assert len(messages) == 1 and f"#{result['booking_id']}" in messages[0]["text"]
+
+    # Единственная доска уже занята на пересекающееся время
+    with pytest.raises(MiniAppError) as e:
+        await service.create_booking({"id": 43}, {**payload, "start": "11:00"})
+    assert e.value.status == 409
+    data = await service.bootstrap(day)
+    assert "10:00" not in data["availability"]["1"] and "11:30" in data["availability"]["1"]
@@ -0,0 +1,79 @@
+# tests/test_occupancy.py
+from datetime import date, timedelta
+
+import pytest
+import pytest_asyncio
+
+from services.occupancy import window_starts
+
+
+def test_window_starts():
+    free = [2, 2, 1, 3, 3, 3, 0, 3]
+    assert window_starts(free, 2, quantity=2) == [0, 3, 4]
+    assert window_starts(free, 3, quantity=3) == [3]
+    assert window_starts(free, 2, quantity=1, lo=5, hi=8) == []
+
+
+@pytest_asyncio.fixture
+async def db(tmp_path):
+    from core.database import Database
+    from core.schema import init_db
+    d = Database(str(tmp_path / "occupancy.db"), pool_size=1)
+    await d.connect()
+    try:
+        await init_db(d)
+        await d.execute("INSERT INTO users (id, username) VALUES (1, 'u')")
+        await d.execute("INSERT INTO boards (id, name, price, quantity) VALUES (1, 'SUP', 500, 3)")
+        yield d
+    finally:
+        await d.close()
+
+
+@pytest.mark.asyncio
+async def test_maps_follow_booking_changes(db):
+    from services.booking_service import BookingService
+    from services.occupancy import OccupancyCache
+    service = BookingService(db)
+    cache = OccupancyCache(db)
+    day = date.today() + timedelta(days=1)
+    # 10:00-12:00 на 2 доски; 23:00 предыдущего дня до 01:00 на 3 доски
+    booking_id = await service.create_booking(1, 1, "SUP", day, 10, 0, 120, 2, 0)
+    await service.create_booking(1, 1, "SUP", day - timedelta(days=1), 23, 0, 120, 3, 0)
+
+    free = (await cache.maps(1, 3, [day]))[day]
+    assert (free[0], free[4], free[40], free[47], free[48]) == (0, 3, 1, 1, 3)
+    await service.create_booking(1, 1, "SUP", day + timedelta(days=2), 0, 0, 1440, 1, 0)
+    week = await cache.free_days([1], {1: 3}, day, 7, 120, quantity=3)
+    assert len(week) == 6 and day in week and day + timedelta(days=2) not in week
+
+    # Изменения применяются из журнала, без перечитывания броней
+    await service.update_booking_status(booking_id, "cancelled")
+    await db.execute("UPDATE bookings SET start_time = 11 WHERE id = ?", (booking_id,))
+    await service.create_booking(1, 1, "SUP", day, 12, 30, 30, 1, 0)
+    free = (await cache.maps(1, 3, [day]))[day]
+    assert (free[40], free[51], free[52]) == (3, 2, 3)
+    hours = await cache.free_hours([1], {1: 3}, day, 120, quantity=3)
+    assert 10 in hours and 11 not in hours and 12 not in hours and 13 in hours
+
+    # Больше досок — больше свободных мест во всех интервалах
+    assert (await cache.maps(1, 4, [day]))[day][50] == 3
+
+
+@pytest.mark.asyncio
+async def test_maps_rebuilt_after_log_pruned(db):
+    from services.booking_service import BookingService
+    from services.occupancy import OccupancyCache, prune_occupancy_changes
+    service = BookingService(db)
+    cache = OccupancyCache(db)
+    day = date.today() + timedelta(days=1)
+    await service.create_booking(1, 1, "SUP", day, 10, 0, 60, 1, 0)
+    assert (await cache.maps(1, 3, [day]))[day][40] == 2
+
+    # Пока кэш не читали, журнал урезан дальше его позиции
+    await service.create_booking(1, 1, "SUP", day, 10, 0, 60, 1, 0)
+    await service.create_booking(1, 1, "SUP", day, 11, 0, 60, 1, 0)
+    await db.execute("UPDATE occupancy_changes SET changed_at = datetime('now', '-2 days')")
+    assert await prune_occupancy_changes(db, keep_hours=1) > 0
+
+    free = (await cache.maps(1, 3, [day]))[day]
+    assert (free[40], free[44]) == (1, 2)
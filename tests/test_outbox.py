@@ -0,0 +1,116 @@
+# tests/test_outbox.py
+import asyncio
+
+import pytest
+import pytest_asyncio
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError
+
+
+class FakeBot:
+    """Запоминает отправленные сообщения; errors — исключения по очереди"""
+
+    def __init__(self, errors=()):
+        self.sent = []
+        self.errors = list(errors)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append((chat_id, text))
+
+
+@pytest_asyncio.fixture
+async def db(tmp_path, monkeypatch):
+    from config import Config
+    from core.database import Database
+    from core.schema import init_db
+    monkeypatch.setattr(Config, "TG_CHAT_RATE", 50.0)
+    d = Database(str(tmp_path / "outbox.db"), pool_size=1)
+    await d.connect()
+    await init_db(d)
+    yield d
+    await d.close()
+
+
+async def _drain(outbox, timeout=3.0):
+    async def wait():
+        while (await outbox.db.fetchone(
+            "SELECT COUNT(*) AS n FROM outbox WHERE status = 'pending'"
+        ))["n"]:
+            await asyncio.sleep(0.01)
+    await asyncio.wait_for(wait(), timeout)
+
+
+@pytest.mark.asyncio
+async def test_per_chat_order_and_statuses(db):
+    from notifications.outbox import Outbox
+    bot = FakeBot(errors=[TelegramForbiddenError(method=None, message="blocked")])
+    outbox = Outbox(bot, db)
+    await outbox.start(workers=3)
+    await outbox.enqueue(2, "blocked")
+    for i in range(3):
+        await outbox.enqueue(1, f"m{i}")
+    await _drain(outbox)
+    await outbox.stop()
+
+    assert [text for chat, text in bot.sent if chat == 1] == ["m0", "m1", "m2"]
+    rows = await db.fetchall("SELECT chat_id, status FROM outbox ORDER BY id")
+    assert [r["status"] for r in rows] == ["failed", "sent", "sent", "sent"]
+
+
+@pytest.mark.asyncio
+async def test_retry_after_then_delivered(db):
+    from notifications.outbox import Outbox
+    bot = FakeBot(errors=[TelegramRetryAfter(method=None, message="flood", retry_after=0)])
+    outbox = Outbox(bot, db)
+    await outbox.start(workers=1)
+    await outbox.enqueue(1, "hello")
+    await _drain(outbox)
+    await outbox.stop()
+    assert bot.sent == [(1, "hello")]
+    row = await db.fetchone("SELECT status, attempts FROM outbox")
+    assert row == {"status": "sent", "attempts": 0}
+
+
+@pytest.mark.asyncio
+async def test_pending_messages_survive_restart(db):
+    from notifications.outbox import Outbox
+    # Сообщение поставлено, но рабочие не запускались (процесс упал)
+    await Outbox(FakeBot(), db).enqueue(7, "after restart")
+    bot = FakeBot()
+    outbox = Outbox(bot, db)
+    await outbox.start(workers=1)
+    await _drain(outbox)
+    await outbox.stop()
+    assert bot.sent == [(7, "after restart")]
+
+
+@pytest.mark.asyncio
+async def test_message_is_sent_only_after_commit(db, monkeypatch):
+    from config import Config
+    from notifications.outbox import Outbox, enqueue_message
+    monkeypatch.setattr(Config, "OUTBOX_POLL_SECONDS", 0.05)
+    bot = FakeBot()
+    outbox = Outbox(bot, db)
+    await outbox.start(workers=1)
+
+    with pytest.raises(RuntimeError):
+        async with db.transaction():
+            await outbox.enqueue(1, "rolled back")
+            raise RuntimeError("state change failed")
+    async with db.transaction():
+        async with db.transaction():
+            await outbox.enqueue(1, "committed")
+        with pytest.raises(RuntimeError):
+            async with db.transaction():
+                await outbox.enqueue(1, "savepoint rolled back")
+                raise RuntimeError
+        # До фиксации сообщение не в очереди отправки
+        assert outbox.pending_count() == 0
+    # Сообщение другого процесса (без бота) забирается из таблицы
+    await enqueue_message(db, 2, "from mini app")
+    await _drain(outbox)
+    await outbox.stop()
+
+    assert sorted(bot.sent) == [(1, "committed"), (2, "from mini app")]
+    assert (await db.fetchone("SELECT COUNT(*) AS n FROM outbox"))["n"] == 2
@@ -0,0 +1,162 @@
+# tests/test_payment_inbox.py
+import importlib.util
+import json
+import os
+import sys
+import time
+
+import pytest
+import requests
+
+WEBAPP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "webapp", "app.py")
+PID = "pay-1"
+
+
+@pytest.fixture(scope="module")
+def webapp(tmp_path_factory):
+    # Настройки Django и путь к БД читаются при импорте сайта
+    saved = {name: os.environ.get(name) for name in ("DB_NAME", "PAYMENT_INBOX_WORKERS")}
+    os.environ["DB_NAME"] = str(tmp_path_factory.mktemp("webapp") / "site.db")
+    os.environ["PAYMENT_INBOX_WORKERS"] = "0"
+    spec = importlib.util.spec_from_file_location("webapp_app", WEBAPP)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["webapp_app"] = module
+    spec.loader.exec_module(module)
+    module.migrate_schema()
+    yield module
+    sys.modules.pop("webapp_app", None)
+    for name, value in saved.items():
+        if value is None:
+            os.environ.pop(name, None)
+        else:
+            os.environ[name] = value
+
+
+@pytest.fixture
+def site(webapp):
+    for table in ("payment_events", "payments", "bookings", "coupons", "users"):
+        webapp.q_exec(f"DELETE FROM {table}")
+    webapp.q_exec("INSERT INTO users (id, username) VALUES (1, 'u')")
+    webapp.q_exec("INSERT INTO coupons (code, type, value, used) VALUES ('SUMMER', 'percent', 10, 0)")
+    webapp.q_exec(
+        """INSERT INTO bookings (id, user_id, board_name, date, duration, amount, status, coupon_code)
+           VALUES (1, 1, 'SUP', '2030-06-01', 1, 900, 'waiting_partner', 'SUMMER')"""
+    )
+    webapp.q_exec(
+        """INSERT INTO payments (booking_id, provider, provider_payment_id, amount, status)
+           VALUES (1, 'yookassa', ?, 900, 'pending')""",
+        (PID,)
+    )
+    return webapp
+
+
+@pytest.fixture
+def api(site, monkeypatch):
+    """Заглушка API YooKassa: ответы (или исключения) по очереди, последний повторяется"""
+    class Api:
+        calls = 0
+        responses = [{"id": PID, "status": "succeeded",
+                      "amount": {"value": "900.00", "currency": "RUB"}, "metadata": {"booking_id": 1}}]
+
+        def fetch(self, pid):
+            self.calls += 1
+            response = self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+    stub = Api()
+    monkeypatch.setattr(site, "_yookassa_fetch_payment", stub.fetch)
+    return stub
+
+
+def _deliver(site, event="payment.succeeded"):
+    from django.test import RequestFactory
+    body = json.dumps({"event": event, "object": {"id": PID}})
+    request = RequestFactory().post("/webhooks/yookassa/", data=body, content_type="application/json")
+    assert site.webhook_yookassa(request).status_code == 200
+
+
+def _booking(site):
+    return site.q_one("SELECT status, payment_status FROM bookings WHERE id = 1")
+
+
+def _coupon_used(site):
+    return site.q_one("SELECT used FROM coupons WHERE code = 'SUMMER'")[0]
+
+
+def _event(site):
+    return site.q_one("SELECT status, attempts, available_at, error FROM payment_events")
+
+
+def test_duplicate_delivery_is_applied_once(site, api):
+    for _ in range(3):
+        _deliver(site)
+    assert site.q_one("SELECT COUNT(*) FROM payment_events")[0] == 1
+
+    inbox = site.PaymentInbox(workers=0, batch=20, max_attempts=3)
+    assert inbox.process_batch() == 1
+    assert inbox.process_batch() == 0
+    assert api.calls == 1
+    assert _booking(site) == ("active", "paid")
+    assert _coupon_used(site) == 1
+    assert site.q_one("SELECT status FROM payments WHERE provider_payment_id = ?", (PID,))[0] == "succeeded"
+
+
+def test_amount_mismatch_is_rejected(site, api):
+    api.responses = [{"id": PID, "status": "succeeded",
+                      "amount": {"value": "1.00", "currency": "RUB"}, "metadata": {"booking_id": 1}}]
+    _deliver(site)
+    site.PaymentInbox(workers=0, batch=20, max_attempts=3).process_batch()
+    status, _, _, error = _event(site)
+    assert status == "rejected" and error.startswith("amount mismatch")
+    assert _booking(site) == ("waiting_partner", "unpaid")
+    assert _coupon_used(site) == 0
+
+
+def test_network_errors_back_off_then_fail(site, api):
+    api.responses = [requests.ConnectionError("down")]
+    _deliver(site)
+    inbox = site.PaymentInbox(workers=0, batch=20, max_attempts=3)
+    for attempt, delay in ((1, 30), (2, 60)):
+        before = time.time()
+        assert inbox.process_batch() == 1
+        status, attempts, available_at, error = _event(site)
+        assert (status, attempts, error) == ("new", attempt, "down")
+        assert before + delay <= available_at <= time.time() + delay
+        # До конца паузы событие не берется
+        assert inbox.process_batch() == 0
+        site.q_exec("UPDATE payment_events SET available_at = 0")
+
+    assert inbox.process_batch() == 1
+    assert _event(site)[:2] == ("failed", 3)
+    site.q_exec("UPDATE payment_events SET available_at = 0")
+    assert inbox.process_batch() == 0
+    assert api.calls == 3
+    assert _booking(site) == ("waiting_partner", "unpaid")
+
+
+def test_expired_lease_is_claimed_again(site, api):
+    _deliver(site)
+    # Поток забрал событие и упал, не отметив его
+    crashed = site.PaymentInbox(workers=0, batch=20, max_attempts=3)
+    assert len(crashed._claim()) == 1
+    inbox = site.PaymentInbox(workers=0, batch=20, max_attempts=3)
+    assert inbox.process_batch() == 0
+    assert _event(site)[0] == "processing"
+
+    site.q_exec("UPDATE payment_events SET available_at = ?", (time.time() - 1,))
+    assert inbox.process_batch() == 1
+    assert _event(site)[:2] == ("done", 2)
+    assert _booking(site) == ("active", "paid")
+
+
+def test_coupon_counted_only_on_first_paid_transition(site, api):
+    _deliver(site, "payment.waiting_for_capture")
+    _deliver(site, "payment.succeeded")
+    inbox = site.PaymentInbox(workers=0, batch=1, max_attempts=3)
+    assert inbox.process_batch() == 1
+    assert inbox.process_batch() == 1
+    assert site.q_one("SELECT COUNT(*) FROM payment_events WHERE status = 'done'")[0] == 2
+    assert _booking(site) == ("active", "paid")
+    assert _coupon_used(site) == 1
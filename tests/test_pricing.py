@@ -0,0 +1,51 @@
+# tests/test_pricing.py
+from datetime import date
+
+import pytest
+
+from services.availability import DayTimeline
+from services.pricing import PriceEngine, apply_discount, load_rules
+
+SATURDAY = date(2025, 6, 7)
+MONDAY = date(2025, 6, 9)
+
+
+def test_default_rules_match_site_pricing():
+    engine = PriceEngine()
+    empty = DayTimeline(2)
+    assert engine.unit_price(1000, SATURDAY, 17 * 60, 60, empty, today=SATURDAY) == 1150.0
+    assert engine.unit_price(1000, MONDAY, 8 * 60, 60, empty, today=SATURDAY) == 900.0
+    # Занятость 2 из 2 (> 0.6) на выходных вечером
+    busy = DayTimeline(2, [(17 * 60, 18 * 60, 2)])
+    assert engine.unit_price(1000, SATURDAY, 17 * 60, 60, busy, today=SATURDAY) == 1265.0
+    assert apply_discount(1000, "percent", 10) == 900.0
+    assert apply_discount(100, "fixed", 150) == 0.0
+
+
+def test_rules_from_json():
+    rules = load_rules('{"time_bands": [], "weekdays": [1, 1, 1, 1, 1, 2, 2], "lead_days": [[7, 0.5]]}')
+    engine = PriceEngine(rules)
+    empty = DayTimeline(1)
+    assert engine.unit_price(100, SATURDAY, 600, 60, empty, today=SATURDAY) == 200.0
+    assert engine.unit_price(100, SATURDAY, 600, 60, empty, today=date(2025, 5, 31)) == 100.0
+    with pytest.raises(ValueError):
+        load_rules('{"weekdays": [1]}')
+
+
+def test_table_is_cached_until_occupancy_changes():
+    engine = PriceEngine()
+    timeline = DayTimeline(2)
+    quote = engine.quote(1, 500, MONDAY, timeline, 12 * 60, 90, 2, today=SATURDAY)
+    assert (quote.unit_price, quote.amount) == (500.0, 1500.0)
+    table = engine.table(1, 500, MONDAY, DayTimeline(2), 90, today=SATURDAY)
+    assert engine.quote(1, 500, MONDAY, DayTimeline(2), 12 * 60, 90, 1, today=SATURDAY).token == quote.token
+    assert engine.table(1, 500, MONDAY, DayTimeline(2), 90, today=SATURDAY) is table
+
+    # Новая бронь дня пересобирает таблицу, но котировка слота с той же
+    # ценой остается в силе; другая цена — другая котировка
+    booked = DayTimeline(2, [(15 * 60, 16 * 60, 1)])
+    assert engine.table(1, 500, MONDAY, booked, 90, today=SATURDAY) is not table
+    assert engine.quote(1, 500, MONDAY, booked, 12 * 60, 90, 1, today=SATURDAY).token == quote.token
+    full = DayTimeline(2, [(12 * 60, 13 * 60, 2)])
+    assert engine.quote(1, 500, MONDAY, full, 12 * 60, 90, 1, today=SATURDAY).token != quote.token
+    assert engine.quote(1, 600, MONDAY, timeline, 12 * 60, 90, 2, today=SATURDAY).token != quote.token
@@ -0,0 +1,84 @@
+# tests/test_query_plans.py
+"""Регрессия планов запросов: выборки броней должны идти по индексам"""
+import re
+
+import pytest
+import pytest_asyncio
+
+
+@pytest_asyncio.fixture
+async def db(tmp_path):
+    from core.database import Database
+    from core.schema import init_db
+    d = Database(str(tmp_path / "plans.db"), pool_size=1)
+    await d.connect()
+    await init_db(d)
+    yield d
+    await d.close()
+
+
+async def _plan(db, query, params):
+    rows = await db.fetchall(f"EXPLAIN QUERY PLAN {query}", params)
+    return " | ".join(row['detail'] for row in rows)
+
+
+@pytest.mark.asyncio
+async def test_booking_queries_use_indexes(db):
+    from services.booking_service import BookingService
+    from notifications.notification_scheduler import MISSING_JOBS_SQL
+    from notifications.reminder_service import REMINDER_SQL
+
+    cases = [
+        (BookingService._TIMELINE_SQL, (1, "2026-01-02", "2026-01-01", 0, 1440, 1, 0, 1440, 0, None),
+         "idx_bookings_board_date_status"),
+        (BookingService._TIMELINE_SQL, (1, "2026-01-02", "2026-01-01", 0, 1440, 1, 0, 1440, 0, None),
+         "idx_capacity_holds_board"),
+        (BookingService._TO_COMPLETE_SQL, (0,), "idx_bookings_status_end"),
+        (MISSING_JOBS_SQL, (), "sqlite_autoindex_scheduled_jobs_1"),
+        (REMINDER_SQL, (0, 1), "idx_bookings_status_start"),
+    ]
+    for query, params, index in cases:
+        plan = await _plan(db, query, params)
+        assert index in plan, plan
+        assert not re.search(r"\bSCAN (b|bookings)\b", plan), plan
+
+
+@pytest.mark.asyncio
+async def test_start_end_filled_on_insert(db):
+    from services.availability import epoch_minutes
+    from datetime import date
+    await db.execute("INSERT INTO users (id) VALUES (1)")
+    await db.execute(
+        """INSERT INTO bookings (user_id, board_name, date, start_time, start_minute, duration, amount)
+           VALUES (1, 'SUP', '2026-01-02', 10, 30, 90, 0)"""
+    )
+    row = await db.fetchone("SELECT start_at, end_at FROM bookings")
+    start = epoch_minutes(date(2026, 1, 2), 10 * 60 + 30)
+    assert row == {"start_at": start, "end_at": start + 90}
+    await db.execute("UPDATE bookings SET start_time = 11")
+    row = await db.fetchone("SELECT start_at, end_at FROM bookings")
+    assert row == {"start_at": start + 60, "end_at": start + 150}
+
+
+@pytest.mark.asyncio
+async def test_site_hours_kept_in_end_at(db):
+    from core.schema import init_db
+    from services.availability import epoch_minutes
+    from datetime import date
+    start = epoch_minutes(date(2026, 1, 2), 10 * 60)
+    await db.execute("INSERT INTO users (id) VALUES (1)")
+    # Бронь сайта на 2 часа, оплаченная картой, без start_at (до миграции)
+    await db.execute(
+        """INSERT INTO bookings (id, user_id, board_name, date, start_time, start_minute, duration, amount, payment_method)
+           VALUES (1, 1, 'SUP', '2026-01-02', 10, 0, 2, 0, 'card')"""
+    )
+    assert await db.fetchone("SELECT end_at FROM bookings") == {"end_at": start + 120}
+
+    # Перенос и продление сохраняют единицу сайта
+    await db.execute("UPDATE bookings SET start_time = 11, duration = 3")
+    assert await db.fetchone("SELECT end_at FROM bookings") == {"end_at": start + 60 + 180}
+
+    # end_at, посчитанный прежней миграцией минутами, исправляется при init_db
+    await db.execute("UPDATE bookings SET end_at = start_at + duration")
+    await init_db(db)
+    assert await db.fetchone("SELECT end_at FROM bookings") == {"end_at": start + 60 + 180}
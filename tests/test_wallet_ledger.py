@@ -0,0 +1,155 @@
+# tests/test_wallet_ledger.py
+import pytest
+import pytest_asyncio
+
+
+@pytest_asyncio.fixture
+async def db(tmp_path):
+    from core.database import Database
+    from core.schema import init_db
+    d = Database(str(tmp_path / "wallet.db"), pool_size=1)
+    await d.connect()
+    await init_db(d)
+    await d.execute("INSERT INTO partners (id, name, telegram_id) VALUES (1, 'A', 100), (2, 'B', 200)")
+    yield d
+    await d.close()
+
+
+async def _op(db, partner_id, op_type, amount):
+    cursor = await db.execute(
+        "INSERT INTO partner_wallet_ops (partner_id, type, amount, src) VALUES (?, ?, ?, 'test')",
+        (partner_id, op_type, amount)
+    )
+    return cursor.lastrowid
+
+
+@pytest.mark.asyncio
+async def test_triggers_keep_balance(db):
+    from services.wallet_ledger import WalletLedger
+    ledger = WalletLedger(db)
+    await _op(db, 1, "credit", 1000)
+    op_id = await _op(db, 1, "debit", 300)
+    await _op(db, 2, "credit", 50)
+    assert await ledger.get_totals(1) == {"credit": 1000.0, "debit": 300.0, "balance": 700.0}
+
+    await db.execute("UPDATE partner_wallet_ops SET amount = 400 WHERE id = ?", (op_id,))
+    assert await ledger.get_balance(1) == 600.0
+    await db.execute("UPDATE partner_wallet_ops SET partner_id = 2 WHERE id = ?", (op_id,))
+    assert (await ledger.get_balance(1), await ledger.get_balance(2)) == (1000.0, -350.0)
+    await db.execute("DELETE FROM partner_wallet_ops WHERE id = ?", (op_id,))
+    assert await ledger.get_balance(2) == 50.0
+    assert await ledger.get_balance(3) == 0.0
+    assert await ledger.reconcile(full=True) == []
+
+
+@pytest.mark.asyncio
+async def test_reconcile_reports_and_fixes_drift(db):
+    from services.wallet_ledger import WalletLedger
+    ledger = WalletLedger(db)
+    await _op(db, 1, "credit", 1000)
+    assert await ledger.reconcile() == []
+    checkpoints = await db.fetchall("SELECT partner_id, credit FROM wallet_checkpoints")
+    assert checkpoints == [{"partner_id": 1, "credit": 1000.0}]
+
+    await _op(db, 1, "debit", 100)
+    await db.execute("UPDATE wallet_balances SET credit = credit + 5 WHERE partner_id = 1")
+    drifts = await ledger.reconcile()
+    assert [(d.partner_id, d.expected, d.actual) for d in drifts] == [(1, 900.0, 905.0)]
+    # Без --fix расхождение остается и контрольная точка не пишется
+    assert len(await ledger.reconcile()) == 1
+
+    await ledger.reconcile(fix=True)
+    assert await ledger.get_balance(1) == 900.0
+    assert await ledger.reconcile() == []
+
+
+@pytest.mark.asyncio
+async def test_editing_checkpointed_op_keeps_reconcile_correct(db):
+    from services.wallet_ledger import WalletLedger
+    ledger = WalletLedger(db)
+    await _op(db, 1, "credit", 1000)
+    op_id = await _op(db, 1, "debit", 300)
+    await _op(db, 2, "credit", 50)
+    assert await ledger.reconcile() == []
+
+    # Операция уже учтена в контрольной точке: точка сбрасывается триггером
+    await db.execute("UPDATE partner_wallet_ops SET amount = 100 WHERE id = ?", (op_id,))
+    assert await ledger.reconcile() == []
+    await db.execute("UPDATE partner_wallet_ops SET partner_id = 2 WHERE id = ?", (op_id,))
+    assert await ledger.reconcile(fix=True) == []
+    assert (await ledger.get_balance(1), await ledger.get_balance(2)) == (1000.0, -50.0)
+    await db.execute("DELETE FROM partner_wallet_ops WHERE id = ?", (op_id,))
+    assert await ledger.reconcile(fix=True) == []
+    assert await ledger.get_balance(2) == 50.0
+    assert await ledger.reconcile(full=True) == []
+
+
+@pytest.mark.asyncio
+async def test_existing_ops_are_backfilled(db):
+    from core.schema import init_db
+    from services.wallet_ledger import WalletLedger
+    # БД до появления ledger: операции есть, триггеров и балансов нет
+    for trigger in ("insert", "update", "delete"):
+        await db.execute(f"DROP TRIGGER trg_wallet_ops_{trigger}")
+    await db.execute("DROP TABLE wallet_balances")
+    await _op(db, 1, "credit", 700)
+    await _op(db, 1, "debit", 200)
+
+    await init_db(db)
+    assert await WalletLedger(db).get_balance(1) == 500.0
+    await _op(db, 1, "credit", 100)
+    assert await WalletLedger(db).get_balance(1) == 600.0
+
+
+async def _booking(db, booking_id, amount, employee_id=None):
+    await db.execute("INSERT OR IGNORE INTO users (id, full_name) VALUES (1, 'U')")
+    await db.execute(
+        """INSERT INTO bookings (id, user_id, board_name, date, start_time, duration, amount,
+                                 status, partner_id, employee_id, payment_method)
+           VALUES (?, 1, 'SUP', '2025-06-01', 10, 60, ?, 'active', 1, ?, 'cash')""",
+        (booking_id, amount, employee_id)
+    )
+    return await db.fetchone("SELECT * FROM bookings WHERE id = ?", (booking_id,))
+
+
+@pytest.mark.asyncio
+async def test_employee_share_goes_to_employee_ledger(db, monkeypatch):
+    from config import Config
+    from services.wallet_ledger import EmployeeLedger, WalletLedger, credit_completed_booking
+    monkeypatch.setattr(Config, "PLATFORM_COMMISSION_PERCENT", 10.0)
+    await db.execute("INSERT INTO employees (id, telegram_id, partner_id, commission_percent) VALUES (5, 555, 1, 20)")
+    for booking_id in range(1, 4):
+        await credit_completed_booking(db, await _booking(db, booking_id, 1000, employee_id=5))
+
+    ledger = EmployeeLedger(db)
+    # 1000 - 10% платформе = 900; сотруднику 20% от 900
+    assert await ledger.get_balance(555) == pytest.approx(540.0)
+    assert await WalletLedger(db).get_balance(1) == pytest.approx(2160.0)
+    # Комиссия сотрудника не попадает в кошелек партнера с id сотрудника
+    assert await WalletLedger(db).get_balance(5) == 0.0
+    # Смена процента не меняет уже начисленное
+    await db.execute("UPDATE employees SET commission_percent = 50 WHERE id = 5")
+    assert await ledger.get_balance("555") == pytest.approx(540.0)
+
+    page, cursor = await ledger.get_statement(555, limit=2)
+    assert [op['booking_id'] for op in page] == [3, 2]
+    page, cursor = await ledger.get_statement(555, limit=2, before_id=cursor)
+    assert [op['booking_id'] for op in page] == [1] and cursor is None
+    # Повторное начисление за ту же бронь игнорируется
+    assert not await ledger.credit(555, 1, 180.0)
+
+
+@pytest.mark.asyncio
+async def test_existing_employee_ops_are_backfilled(db):
+    from core.schema import init_db
+    from services.wallet_ledger import EmployeeLedger
+    for trigger in ("insert", "update", "delete"):
+        await db.execute(f"DROP TRIGGER trg_employee_ops_{trigger}")
+    await db.execute("DROP TABLE employee_balances")
+    await _booking(db, 1, 1000)
+    await db.execute(
+        "INSERT INTO employee_wallet_ops (employee_telegram_id, booking_id, amount) VALUES ('555', 1, 120)"
+    )
+
+    await init_db(db)
+    assert await EmployeeLedger(db).get_balance(555) == 120.0
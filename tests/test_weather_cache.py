@@ -0,0 +1,48 @@
+# tests/test_weather_cache.py
+import asyncio
+
+import pytest
+
+
+@pytest.fixture
+def weather(stub_server, monkeypatch):
+    from core import http_client
+    from services import weather_service
+    monkeypatch.setattr(weather_service.WeatherService, "API_URL", stub_server.url("/weather"))
+    monkeypatch.setattr(http_client, "_client", http_client.HttpClient(retries=0))
+    stub_server.add("GET", "/weather", (200, {"main": {"temp": 20}}))
+    return weather_service
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_request(weather, stub_server):
+    cache = weather.WeatherCache(ttl=60, stale_ttl=0)
+    results = await asyncio.gather(*(
+        cache.get(55.7512 + i * 0.0001, 37.6184, "key") for i in range(10)
+    ))
+    assert all(r == {"main": {"temp": 20}} for r in results)
+    assert len(stub_server.requests) == 1
+    # Повторный запрос в пределах TTL не идет в API
+    await cache.get(55.75, 37.62, "key")
+    assert len(stub_server.requests) == 1
+
+
+@pytest.mark.asyncio
+async def test_stale_entry_is_served_and_refreshed(weather, stub_server):
+    cache = weather.WeatherCache(ttl=0, stale_ttl=60)
+    await cache.get(55.75, 37.62, "key")
+    stub_server.add("GET", "/weather", (200, {"main": {"temp": 25}}))
+    # Устаревшее значение отдается сразу, обновление идет в фоне
+    assert await cache.get(55.75, 37.62, "key") == {"main": {"temp": 20}}
+    await asyncio.gather(*cache._inflight.values())
+    assert len(stub_server.requests) == 2
+    cache.ttl = 60
+    assert await cache.get(55.75, 37.62, "key") == {"main": {"temp": 25}}
+
+
+@pytest.mark.asyncio
+async def test_failed_fetch_returns_none(weather, stub_server):
+    stub_server.add("GET", "/weather", (500, {}))
+    cache = weather.WeatherCache(ttl=60, stale_ttl=0)
+    assert await cache.get(55.75, 37.62, "key") is None
+    assert not cache._inflight
@@ -4,6 +4,8 @@ SUP Booking — продакшн-подобный сайт в одном фай
 
 Запуск:
     python app.py runserver 8000
+    python app.py migrate_schema   # только применить миграции схемы
+    python app.py process_payment_events   # разобрать очередь уведомлений YooKassa
 
 ENV:
     DB_NAME=/path/to/SupBot.db
@@ -14,6 +16,10 @@ ENV:
     # Платежи
     YOOKASSA_SHOP_ID=1096529
     YOOKASSA_SECRET_KEY=live_kkeCU7ALrCJ_ViiVMPSGYWS3svDUuU445bXyKzUE3sM
+    YOOKASSA_TIMEOUT=10              # таймаут запросов к API (сек)
+    PAYMENT_INBOX_WORKERS=2          # потоки разбора уведомлений (0 — только командой)
+    PAYMENT_INBOX_BATCH=20
+    PAYMENT_INBOX_MAX_ATTEMPTS=8
     PAYMENT_CARD_DETAILS="Перевод на карту XXXX XXXX XXXX XXXX ФИО"
 
     # Карта (по умолчанию — Кремль, Москва)
@@ -23,25 +29,35 @@ ENV:
     YMAPS_API_KEY=...   # можно не указывать — тоже работает
 """
 
-import os, sys, json, csv, base64, uuid, hmac, hashlib
+import os, sys, json, csv, base64, uuid, hmac, hashlib, threading, time, zlib, logging
 from datetime import datetime, timedelta, date
 
 from django.conf import settings
 from django.core.management import execute_from_command_line, call_command
 from django.db import connections, transaction
-from django.http import HttpResponse, HttpResponseRedirect, HttpResponseNotFound, JsonResponse
+from django.db.utils import OperationalError
+from django.http import HttpResponse, HttpResponseRedirect, HttpResponseNotFound, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect
 from django.urls import path, re_path
 from django.middleware.csrf import get_token
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_POST, condition
+from django.utils.cache import patch_cache_control, patch_vary_headers
 
 # -----------------------------
 # Django settings (one-file)
 # -----------------------------
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DEFAULT_DB_PATH = os.environ.get("DB_NAME") or os.path.join(os.path.dirname(BASE_DIR), "SupBot.db")
+
+# Общие модули бота (движок доступности и т.п.) лежат в корне репозитория
+ROOT_DIR = os.path.dirname(BASE_DIR)
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+from services.availability import DayTimeline, DAY_MINUTES, epoch_minutes
+from services.pricing import PriceEngine, apply_discount, load_rules
 SECRET = os.environ.get("SECRET_KEY", "sup-landing-dev-secret")
+logger = logging.getLogger("webapp")
 
 if not settings.configured:
     settings.configure(
@@ -316,9 +332,10 @@ if not settings.configured:
           <div class="divider"></div>
 
           <!-- hourly -->
-          <form method="post" action="/book/">
+          <form method="post" action="/book/" id="hourlyForm">
             {% csrf_token %}
             <input type="hidden" name="mode" value="hourly">
+            <input type="hidden" name="quote" id="quoteToken">
             <div class="row g-2">
               <div class="col-md-6">
                 <label class="form-label">Локация</label>
@@ -361,6 +378,7 @@ if not settings.configured:
 
               <div class="col-12 small-muted">
                 Цена может меняться от спроса. Свободные окна считаются с учётом пересечений.
+                <span id="quoteInfo" class="fw-semibold"></span>
               </div>
 
               <div class="col-md-7">
@@ -538,6 +556,25 @@ if not settings.configured:
       selBoard.value = '';
     }
     selLocation && selLocation.addEventListener('change', filterBoards);
+
+    // котировка: цена и версия таблицы цен; при оформлении сайт сверяет версию
+    const hourlyForm = document.getElementById('hourlyForm');
+    function updateQuote() {
+      const f = new FormData(hourlyForm);
+      document.getElementById('quoteToken').value = '';
+      if (!f.get('board_id') || !f.get('date')) return;
+      const qs = new URLSearchParams({board_id: f.get('board_id'), date: f.get('date'),
+                                      start: f.get('start'), hours: f.get('hours'), qty: f.get('qty')});
+      fetch('/api/quote/?' + qs).then(r => r.ok ? r.json() : null).then(q => {
+        const info = document.getElementById('quoteInfo');
+        if (!q) { info.textContent = ''; return; }
+        document.getElementById('quoteToken').value = q.quote;
+        info.textContent = q.available
+          ? `${q.unit_price} ₽/ч · итого ${q.amount} ₽`
+          : `Нет свободных досок на это время (доступно ${q.free})`;
+      });
+    }
+    hourlyForm && hourlyForm.addEventListener('change', updateQuote);
   </script>
 {% endblock %}
 ''',
@@ -1226,8 +1263,23 @@ if not settings.configured:
       <div class="card shadow-sm mt-3">
         <div class="card-body">
           <h5 class="card-title">Экспорт</h5>
-          <a class="btn btn-outline-dark btn-sm" href="/admin/{{ tg_id }}/finance/export/bookings/">Экспорт броней (CSV)</a>
-          <a class="btn btn-outline-dark btn-sm ms-2" href="/admin/{{ tg_id }}/finance/export/payments/">Экспорт платежей (CSV)</a>
+          <form class="row g-2" method="get" action="/admin/{{ tg_id }}/finance/export/bookings/">
+            <div class="col-6"><input type="date" name="date_from" class="form-control form-control-sm" title="С даты"></div>
+            <div class="col-6"><input type="date" name="date_to" class="form-control form-control-sm" title="По дату"></div>
+            <div class="col-4"><input type="number" name="partner" class="form-control form-control-sm" placeholder="ID партнёра"></div>
+            <div class="col-4">
+              <select name="format" class="form-select form-select-sm">
+                <option value="csv">CSV</option>
+                <option value="parquet">Parquet</option>
+                <option value="arrow">Arrow IPC</option>
+              </select>
+            </div>
+            <div class="col-4 form-check pt-1"><input type="checkbox" name="gzip" value="1" class="form-check-input" id="export-gzip"><label class="form-check-label" for="export-gzip">gzip</label></div>
+            <div class="col-12">
+              <button class="btn btn-outline-dark btn-sm">Экспорт броней</button>
+              <button class="btn btn-outline-dark btn-sm ms-2" formaction="/admin/{{ tg_id }}/finance/export/payments/">Экспорт платежей</button>
+            </div>
+          </form>
         </div>
       </div>
     </div>
@@ -1316,6 +1368,17 @@ if not settings.configured:
 import django
 django.setup()
 
+# Соединения Django к общей с ботом БД получают те же PRAGMA (WAL,
+# busy_timeout, synchronous), что и пул бота (core.data)
+from django.db.backends.signals import connection_created
+from core.data import apply_sqlite_pragmas
+
+def _on_connection_created(sender, connection, **kwargs):
+    if connection.vendor == "sqlite":
+        apply_sqlite_pragmas(connection.connection, connection.settings_dict["NAME"])
+
+connection_created.connect(_on_connection_created)
+
 # -----------------------------
 # SQL helpers
 # -----------------------------
@@ -1336,6 +1399,16 @@ def q_exec(sql: str, params=()):
     with connections["default"].cursor() as c:
         c.execute(_adapt_sql(sql), params)
 
+def q_iter(sql: str, params=(), chunk: int = 2000):
+    """Чтение результата порциями по chunk строк (для потоковых выгрузок)"""
+    with connections["default"].cursor() as c:
+        c.execute(_adapt_sql(sql), params)
+        while True:
+            rows = c.fetchmany(chunk)
+            if not rows:
+                return
+            yield rows
+
 # -----------------------------
 # Schema bootstrap / migrations
 # -----------------------------
@@ -1454,6 +1527,8 @@ SCHEMA_SQL = [
         daily_board_id INTEGER,
         coupon_code TEXT,
         partner_credited INTEGER DEFAULT 0,
+        start_at INTEGER,
+        end_at INTEGER,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         FOREIGN KEY(board_id) REFERENCES boards(id) ON DELETE RESTRICT,
         FOREIGN KEY(daily_board_id) REFERENCES daily_boards(id) ON DELETE SET NULL
@@ -1571,6 +1646,15 @@ SCHEMA_SQL = [
     )
     """,
     """
+    CREATE TABLE IF NOT EXISTS rating_stats (
+        scope TEXT NOT NULL CHECK(scope IN ('board', 'location', 'partner')),
+        scope_id INTEGER NOT NULL,
+        rating_sum INTEGER NOT NULL DEFAULT 0,
+        rating_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (scope, scope_id)
+    ) WITHOUT ROWID
+    """,
+    """
     CREATE TABLE IF NOT EXISTS booking_photos (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         booking_id INTEGER NOT NULL,
@@ -1588,98 +1672,355 @@ INDEXES_SQL = [
     "CREATE INDEX IF NOT EXISTS idx_bookings_board ON bookings(board_id)",
     "CREATE INDEX IF NOT EXISTS idx_bookings_status ON bookings(status)",
     "CREATE INDEX IF NOT EXISTS idx_bookings_date ON bookings(date)",
+    "CREATE INDEX IF NOT EXISTS idx_bookings_board_date_status ON bookings(board_id, date, status)",
+    "CREATE INDEX IF NOT EXISTS idx_bookings_status_start ON bookings(status, start_at)",
+    "CREATE INDEX IF NOT EXISTS idx_bookings_status_end ON bookings(status, end_at)",
     "CREATE INDEX IF NOT EXISTS idx_payments_booking ON payments(booking_id)",
     "CREATE INDEX IF NOT EXISTS idx_coupons_code ON coupons(code)",
     "CREATE INDEX IF NOT EXISTS idx_employees_partner ON employees(partner_id)",
+    "CREATE INDEX IF NOT EXISTS idx_ratings_partner ON ratings(partner_id)",
     "CREATE INDEX IF NOT EXISTS idx_employee_ops_emp ON employee_wallet_ops(employee_telegram_id)"
 ]
 
-def ensure_schema():
+def _migration_0001_baseline():
+    """Базовая схема сайта (идемпотентна: БД до версионирования уже частично ее содержат)"""
+    for sql in SCHEMA_SQL:
+        q_exec(sql)
+    # Добавим недостающие колонки для обратной совместимости
+    def table_cols(name):
+        return {r[1]: r for r in q_all(f"PRAGMA table_info({name})")}
+    # locations.kind
+    if "kind" not in table_cols("locations"):
+        q_exec("ALTER TABLE locations ADD COLUMN kind TEXT DEFAULT 'spot'")
+    # bookings extras
+    bcols = table_cols("bookings")
+    if "payment_status" not in bcols:
+        q_exec("ALTER TABLE bookings ADD COLUMN payment_status TEXT DEFAULT 'unpaid'")
+    if "started_at" not in bcols:
+        q_exec("ALTER TABLE bookings ADD COLUMN started_at TIMESTAMP")
+    if "ended_at" not in bcols:
+        q_exec("ALTER TABLE bookings ADD COLUMN ended_at TIMESTAMP")
+    if "daily_board_id" not in bcols:
+        q_exec("ALTER TABLE bookings ADD COLUMN daily_board_id INTEGER")
+    if "coupon_code" not in bcols:
+        q_exec("ALTER TABLE bookings ADD COLUMN coupon_code TEXT")
+    if "partner_credited" not in bcols:
+        q_exec("ALTER TABLE bookings ADD COLUMN partner_credited INTEGER DEFAULT 0")
+    # start_at/end_at — абсолютные минуты (см. core/schema.py), duration сайта в часах
+    if "start_at" not in bcols:
+        q_exec("ALTER TABLE bookings ADD COLUMN start_at INTEGER")
+    if "end_at" not in bcols:
+        q_exec("ALTER TABLE bookings ADD COLUMN end_at INTEGER")
+
+    # partner_wallet_ops.booking_id
+    pwcols = table_cols("partner_wallet_ops")
+    if "booking_id" not in pwcols:
+        q_exec("ALTER TABLE partner_wallet_ops ADD COLUMN booking_id INTEGER")
+
+    # payments.confirmation_url
+    pcols = table_cols("payments")
+    if "confirmation_url" not in pcols:
+        q_exec("ALTER TABLE payments ADD COLUMN confirmation_url TEXT")
+
+    # Если вдруг в старой таблице bookings.board_id был NOT NULL — переливаем
+    info_b = q_all("PRAGMA table_info(bookings)")
+    board_col = next((r for r in info_b if r[1] == "board_id"), None)
+    if board_col and board_col[3] == 1:  # notnull
+        q_exec("""
+            CREATE TABLE IF NOT EXISTS bookings_new(
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                board_id INTEGER,
+                board_name TEXT,
+                date DATE NOT NULL,
+                start_time INTEGER,
+                start_minute INTEGER,
+                duration INTEGER NOT NULL,
+                quantity INTEGER NOT NULL DEFAULT 1,
+                amount REAL NOT NULL DEFAULT 0,
+                status TEXT DEFAULT 'waiting_partner'
+                    CHECK(status IN ('waiting_partner','active','canceled','completed',
+                                     'waiting_card','waiting_cash','waiting_daily')),
+                payment_method TEXT,
+                payment_status TEXT DEFAULT 'unpaid'
+                    CHECK(payment_status IN ('unpaid','pending','paid','failed','refunded')),
+                started_at TIMESTAMP,
+                ended_at TIMESTAMP,
+                daily_board_id INTEGER,
+                coupon_code TEXT,
+                partner_credited INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        q_exec("""
+            INSERT INTO bookings_new
+            (id,user_id,board_id,board_name,date,start_time,start_minute,duration,quantity,amount,status,payment_method,payment_status,started_at,ended_at,daily_board_id,coupon_code,partner_credited,created_at)
+            SELECT id,user_id,board_id,board_name,date,start_time,start_minute,duration,quantity,amount,status,payment_method,
+                   COALESCE(payment_status,'unpaid'),started_at,ended_at,
+                   CASE WHEN EXISTS(SELECT 1 FROM pragma_table_info('bookings') WHERE name='daily_board_id') THEN daily_board_id ELSE NULL END,
+                   CASE WHEN EXISTS(SELECT 1 FROM pragma_table_info('bookings') WHERE name='coupon_code') THEN coupon_code ELSE NULL END,
+                   0,
+                   created_at
+            FROM bookings
+        """)
+        q_exec("DROP TABLE bookings")
+        q_exec("ALTER TABLE bookings_new RENAME TO bookings")
+
+    q_exec("""
+        UPDATE bookings
+        SET start_at = CAST(ROUND(julianday(date(date)) - 2440587.5) AS INTEGER) * 1440
+                       + start_time * 60 + COALESCE(start_minute, 0)
+        WHERE start_at IS NULL AND start_time IS NOT NULL
+    """)
+    q_exec("""
+        UPDATE bookings
+        SET end_at = start_at + CASE WHEN payment_method = 'site' THEN duration * 60 ELSE duration END
+        WHERE end_at IS NULL AND start_at IS NOT NULL
+    """)
+
+    for idx in INDEXES_SQL:
+        q_exec(idx)
+
+def _migration_0002_cache_versions():
+    """Счетчики изменений таблиц витрины; триггеры срабатывают и на записи бота
+    (таблицы и столбцы — CACHE_VERSION_TABLES в core/schema.py)"""
+    from core.schema import CACHE_VERSIONS_SQL
+    for query in CACHE_VERSIONS_SQL:
+        q_exec(query)
+
+def _migration_0003_wallet_ledger():
+    """Баланс партнера в wallet_balances, обновляемый триггерами (как core/schema.py бота)"""
+    if q_one("SELECT 1 FROM sqlite_master WHERE type='trigger' AND name='trg_wallet_ops_insert'"):
+        return  # уже создано ботом
+    q_exec("""
+        CREATE TABLE IF NOT EXISTS wallet_balances (
+            partner_id INTEGER PRIMARY KEY,
+            credit REAL NOT NULL DEFAULT 0,
+            debit REAL NOT NULL DEFAULT 0,
+            last_op_id INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    q_exec("""
+        CREATE TABLE IF NOT EXISTS wallet_checkpoints (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            partner_id INTEGER NOT NULL,
+            op_id INTEGER NOT NULL,
+            credit REAL NOT NULL,
+            debit REAL NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    q_exec("CREATE INDEX IF NOT EXISTS idx_wallet_checkpoints_partner ON wallet_checkpoints(partner_id, id)")
+    q_exec("""
+        CREATE TRIGGER IF NOT EXISTS trg_wallet_ops_insert AFTER INSERT ON partner_wallet_ops
+        BEGIN
+            INSERT INTO wallet_balances (partner_id, credit, debit, last_op_id, updated_at)
+            VALUES (NEW.partner_id,
+                    CASE WHEN NEW.type = 'credit' THEN NEW.amount ELSE 0 END,
+                    CASE WHEN NEW.type = 'debit' THEN NEW.amount ELSE 0 END,
+                    NEW.id, CURRENT_TIMESTAMP)
+            ON CONFLICT (partner_id) DO UPDATE SET
+                credit = credit + excluded.credit,
+                debit = debit + excluded.debit,
+                last_op_id = MAX(last_op_id, excluded.last_op_id),
+                updated_at = excluded.updated_at;
+        END
+    """)
+    q_exec("""
+        CREATE TRIGGER IF NOT EXISTS trg_wallet_ops_update
+        AFTER UPDATE OF partner_id, type, amount ON partner_wallet_ops
+        BEGIN
+            UPDATE wallet_balances SET
+                credit = credit - CASE WHEN OLD.type = 'credit' THEN OLD.amount ELSE 0 END,
+                debit = debit - CASE WHEN OLD.type = 'debit' THEN OLD.amount ELSE 0 END,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE partner_id = OLD.partner_id;
+            INSERT INTO wallet_balances (partner_id, credit, debit, last_op_id, updated_at)
+            VALUES (NEW.partner_id,
+                    CASE WHEN NEW.type = 'credit' THEN NEW.amount ELSE 0 END,
+                    CASE WHEN NEW.type = 'debit' THEN NEW.amount ELSE 0 END,
+                    NEW.id, CURRENT_TIMESTAMP)
+            ON CONFLICT (partner_id) DO UPDATE SET
+                credit = credit + excluded.credit,
+                debit = debit + excluded.debit,
+                updated_at = excluded.updated_at;
+        END
+    """)
+    q_exec("""
+        CREATE TRIGGER IF NOT EXISTS trg_wallet_ops_delete AFTER DELETE ON partner_wallet_ops
+        BEGIN
+            UPDATE wallet_balances SET
+                credit = credit - CASE WHEN OLD.type = 'credit' THEN OLD.amount ELSE 0 END,
+                debit = debit - CASE WHEN OLD.type = 'debit' THEN OLD.amount ELSE 0 END,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE partner_id = OLD.partner_id;
+        END
+    """)
+    q_exec("DELETE FROM wallet_balances")
+    q_exec("""
+        INSERT INTO wallet_balances (partner_id, credit, debit, last_op_id)
+        SELECT partner_id,
+               COALESCE(SUM(CASE WHEN type = 'credit' THEN amount END), 0),
+               COALESCE(SUM(CASE WHEN type = 'debit' THEN amount END), 0),
+               MAX(id)
+        FROM partner_wallet_ops
+        GROUP BY partner_id
+    """)
+
+def _migration_0004_employee_ledger():
+    """Итог начислений сотрудника в employee_balances, обновляемый триггерами (как core/schema.py бота)"""
+    from core.schema import EMPLOYEE_BALANCES_BACKFILL_SQL, EMPLOYEE_LEDGER_SQL
+    if q_one("SELECT 1 FROM sqlite_master WHERE type='trigger' AND name='trg_employee_ops_insert'"):
+        return  # уже создано ботом
+    for query in EMPLOYEE_LEDGER_SQL:
+        q_exec(query)
+    q_exec("DELETE FROM employee_balances")
+    q_exec(EMPLOYEE_BALANCES_BACKFILL_SQL)
+
+def _migration_0005_export_indexes():
+    """Индексы для фильтров выгрузок: брони суточных досок по дате, платежи по дате"""
+    q_exec("CREATE INDEX IF NOT EXISTS idx_bookings_daily_board_date ON bookings(daily_board_id, date)")
+    q_exec("CREATE INDEX IF NOT EXISTS idx_daily_boards_partner ON daily_boards(partner_id)")
+    q_exec("CREATE INDEX IF NOT EXISTS idx_payments_created ON payments(created_at)")
+
+def _migration_0006_payment_events():
+    """Входящие уведомления платежных систем: сырое событие + состояние обработки"""
+    q_exec("""
+        CREATE TABLE IF NOT EXISTS payment_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            provider TEXT NOT NULL,
+            event_id TEXT NOT NULL,
+            event TEXT,
+            object_id TEXT,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'new'
+                CHECK(status IN ('new','processing','done','rejected','failed')),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            available_at REAL NOT NULL DEFAULT 0,
+            claim TEXT,
+            error TEXT,
+            received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            processed_at TIMESTAMP,
+            UNIQUE(provider, event_id)
+        )
+    """)
+    q_exec("CREATE INDEX IF NOT EXISTS idx_payment_events_queue ON payment_events(status, available_at)")
+    q_exec("CREATE INDEX IF NOT EXISTS idx_payments_provider_id ON payments(provider, provider_payment_id)")
+
+def _migration_0007_capacity_holds():
+    """Удержания мест ботом на время оформления брони (services/holds.py бота)"""
+    from core.schema import CAPACITY_HOLDS_SQL
+    for query in CAPACITY_HOLDS_SQL:
+        q_exec(query)
+
+def _migration_0008_occupancy_changes():
+    """Журнал изменений занятости для кэша бота (те же таблица и триггеры, что в core/schema.py)"""
+    from core.schema import OCCUPANCY_CHANGES_SQL
+    for query in OCCUPANCY_CHANGES_SQL:
+        q_exec(query)
+
+def _migration_0009_catalog_versions():
+    """Счетчики справочников бота (те же триггеры, что в core/schema.py)"""
+    from core.schema import CATALOG_VERSIONS_SQL
+    for query in CATALOG_VERSIONS_SQL:
+        q_exec(query)
+
+def _migration_0010_wallet_checkpoint_triggers():
+    """Сброс контрольных точек сверки при правке и удалении операций (как core/schema.py бота)"""
+    from core.schema import WALLET_CHECKPOINT_TRIGGERS_SQL
+    for query in WALLET_CHECKPOINT_TRIGGERS_SQL:
+        q_exec(query)
+
+def _migration_0011_booking_time_units():
+    """Срок оплаты с индексом (как у бота) и end_at броней сайта, которые
+    миграция 1 посчитала минутами после смены payment_method на 'card'"""
+    from core.schema import BOOKING_DEADLINE_INDEX_SQL, BOOKING_END_REPAIR_SQL
+    bcols = {r[1] for r in q_all("PRAGMA table_info(bookings)")}
+    if "payment_deadline" not in bcols:
+        q_exec("ALTER TABLE bookings ADD COLUMN payment_deadline TIMESTAMP")
+    q_exec(BOOKING_DEADLINE_INDEX_SQL)
+    q_exec(BOOKING_END_REPAIR_SQL)
+
+def _migration_0012_catalog_row_versions():
+    """Счетчики справочников бота растут при изменении любого столбца
+    partners/locations/boards (например, комиссии партнера с сайта)"""
+    from core.schema import CATALOG_VERSIONS_SQL
+    for query in CATALOG_VERSIONS_SQL:
+        q_exec(query)
+
+# Версионированные миграции: (версия, название, функция). Новые изменения
+# схемы — только новой записью в конце списка, старые не редактируются.
+MIGRATIONS = [
+    (1, "baseline", _migration_0001_baseline),
+    (2, "cache_versions", _migration_0002_cache_versions),
+    (3, "wallet_ledger", _migration_0003_wallet_ledger),
+    (4, "employee_ledger", _migration_0004_employee_ledger),
+    (5, "export_indexes", _migration_0005_export_indexes),
+    (6, "payment_events", _migration_0006_payment_events),
+    (7, "capacity_holds", _migration_0007_capacity_holds),
+    (8, "occupancy_changes", _migration_0008_occupancy_changes),
+    (9, "catalog_versions", _migration_0009_catalog_versions),
+    (10, "wallet_checkpoint_triggers", _migration_0010_wallet_checkpoint_triggers),
+    (11, "booking_time_units", _migration_0011_booking_time_units),
+    (12, "catalog_row_versions", _migration_0012_catalog_row_versions),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+def schema_version() -> int:
+    try:
+        row = q_one("SELECT MAX(version) FROM schema_version")
+    except OperationalError:
+        return 0
+    return int(row[0] or 0) if row else 0
+
+def migrate_schema():
+    """Применение недостающих миграций (при старте процесса или командой
+    `python app.py migrate_schema`)"""
     try:
         call_command("migrate", interactive=False, run_syncdb=True, verbosity=0)
     except Exception:
         pass
-    with transaction.atomic():
-        for sql in SCHEMA_SQL:
-            q_exec(sql)
-
-        # Добавим недостающие колонки для обратной совместимости
-        def table_cols(name):
-            return {r[1]: r for r in q_all(f"PRAGMA table_info({name})")}
-        # locations.kind
-        if "kind" not in table_cols("locations"):
-            q_exec("ALTER TABLE locations ADD COLUMN kind TEXT DEFAULT 'spot'")
-        # bookings extras
-        bcols = table_cols("bookings")
-        if "payment_status" not in bcols:
-            q_exec("ALTER TABLE bookings ADD COLUMN payment_status TEXT DEFAULT 'unpaid'")
-        if "started_at" not in bcols:
-            q_exec("ALTER TABLE bookings ADD COLUMN started_at TIMESTAMP")
-        if "ended_at" not in bcols:
-            q_exec("ALTER TABLE bookings ADD COLUMN ended_at TIMESTAMP")
-        if "daily_board_id" not in bcols:
-            q_exec("ALTER TABLE bookings ADD COLUMN daily_board_id INTEGER")
-        if "coupon_code" not in bcols:
-            q_exec("ALTER TABLE bookings ADD COLUMN coupon_code TEXT")
-        if "partner_credited" not in bcols:
-            q_exec("ALTER TABLE bookings ADD COLUMN partner_credited INTEGER DEFAULT 0")
-
-        # partner_wallet_ops.booking_id
-        pwcols = table_cols("partner_wallet_ops")
-        if "booking_id" not in pwcols:
-            q_exec("ALTER TABLE partner_wallet_ops ADD COLUMN booking_id INTEGER")
-
-        # payments.confirmation_url
-        pcols = table_cols("payments")
-        if "confirmation_url" not in pcols:
-            q_exec("ALTER TABLE payments ADD COLUMN confirmation_url TEXT")
-
-        # Если вдруг в старой таблице bookings.board_id был NOT NULL — переливаем
-        info_b = q_all("PRAGMA table_info(bookings)")
-        board_col = next((r for r in info_b if r[1] == "board_id"), None)
-        if board_col and board_col[3] == 1:  # notnull
-            q_exec("""
-                CREATE TABLE IF NOT EXISTS bookings_new(
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    board_id INTEGER,
-                    board_name TEXT,
-                    date DATE NOT NULL,
-                    start_time INTEGER,
-                    start_minute INTEGER,
-                    duration INTEGER NOT NULL,
-                    quantity INTEGER NOT NULL DEFAULT 1,
-                    amount REAL NOT NULL DEFAULT 0,
-                    status TEXT DEFAULT 'waiting_partner'
-                        CHECK(status IN ('waiting_partner','active','canceled','completed',
-                                         'waiting_card','waiting_cash','waiting_daily')),
-                    payment_method TEXT,
-                    payment_status TEXT DEFAULT 'unpaid'
-                        CHECK(payment_status IN ('unpaid','pending','paid','failed','refunded')),
-                    started_at TIMESTAMP,
-                    ended_at TIMESTAMP,
-                    daily_board_id INTEGER,
-                    coupon_code TEXT,
-                    partner_credited INTEGER DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            q_exec("""
-                INSERT INTO bookings_new
-                (id,user_id,board_id,board_name,date,start_time,start_minute,duration,quantity,amount,status,payment_method,payment_status,started_at,ended_at,daily_board_id,coupon_code,partner_credited,created_at)
-                SELECT id,user_id,board_id,board_name,date,start_time,start_minute,duration,quantity,amount,status,payment_method,
-                       COALESCE(payment_status,'unpaid'),started_at,ended_at,
-                       CASE WHEN EXISTS(SELECT 1 FROM pragma_table_info('bookings') WHERE name='daily_board_id') THEN daily_board_id ELSE NULL END,
-                       CASE WHEN EXISTS(SELECT 1 FROM pragma_table_info('bookings') WHERE name='coupon_code') THEN coupon_code ELSE NULL END,
-                       0,
-                       created_at
-                FROM bookings
-            """)
-            q_exec("DROP TABLE bookings")
-            q_exec("ALTER TABLE bookings_new RENAME TO bookings")
-
-        for idx in INDEXES_SQL:
-            q_exec(idx)
+    q_exec("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    for version, name, migration in MIGRATIONS:
+        with transaction.atomic():
+            # Пустая запись сразу берет блокировку записи: параллельно
+            # стартующий процесс дождется ее и увидит уже примененную версию
+            q_exec("DELETE FROM schema_version WHERE 0")
+            if q_one("SELECT 1 FROM schema_version WHERE version=?", (version,)):
+                continue
+            migration()
+            q_exec("INSERT INTO schema_version(version, name) VALUES(?, ?)", (version, name))
+    ensure_admins_from_env()
+
+def ensure_schema():
+    """Проверка версии схемы перед обработкой запроса
+
+    После первой успешной проверки — только чтение флага в памяти;
+    миграции выполняются не чаще одного раза за процесс.
+    """
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+        if schema_version() < SCHEMA_VERSION:
+            migrate_schema()
+        else:
+            ensure_admins_from_env()
+        _schema_ready = True
+    # Уведомления, оставшиеся с прошлого запуска, разбираются сразу
+    payment_inbox.start()
 
 def ensure_admins_from_env():
     admin_env = os.environ.get("ADMIN_IDS", "")
@@ -1724,9 +2065,9 @@ def partner_id_by_tg(tg_id: int):
     return row[0] if row else None
 
 def partner_balance(partner_id: int) -> float:
-    cr = q_one("SELECT COALESCE(SUM(amount),0) FROM partner_wallet_ops WHERE partner_id = ? AND type='credit'", (partner_id,))
-    db = q_one("SELECT COALESCE(SUM(amount),0) FROM partner_wallet_ops WHERE partner_id = ? AND type='debit'", (partner_id,))
-    return float((cr[0] if cr else 0) - (db[0] if db else 0))
+    # wallet_balances ведут триггеры на partner_wallet_ops (см. миграцию 3)
+    row = q_one("SELECT credit - debit FROM wallet_balances WHERE partner_id = ?", (partner_id,))
+    return float(row[0]) if row else 0.0
 
 def csrf_token(request):
     return get_token(request)
@@ -1737,30 +2078,38 @@ def _require_self(request, tg_id:int) -> bool:
     except Exception:
         return False
 
-def overlapping_quantity(board_id:int, date_iso:str, start_h:int, start_m:int, duration_h:int) -> int:
-    s0 = start_h*60 + start_m
-    e0 = s0 + duration_h*60
+def board_day_timeline(board_id:int, date_iso:str, total:int=None) -> DayTimeline:
+    """Шкала занятости доски на день по start_at/end_at (индекс board_id, date, status)
+
+    Действующие удержания мест ботом (capacity_holds) тоже считаются занятыми.
+    """
+    if total is None:
+        tot = q_one("SELECT total FROM boards WHERE id = ?", (board_id,))
+        total = int((tot[0] if tot else 0) or 0)
+    try:
+        day = date.fromisoformat(date_iso)
+    except Exception:
+        return DayTimeline(total)
+    day_start = epoch_minutes(day)
     rows = q_all("""
-      SELECT start_time, start_minute, duration, quantity
+      SELECT start_at, end_at, quantity
       FROM bookings
-      WHERE board_id = ? AND date = ? AND status IN ('waiting_partner','active','waiting_card','waiting_cash')
-    """, (board_id, date_iso))
-    used = 0
-    for st, mn, dur, q in rows:
-        if st is None:
-            continue
-        s1 = int(st)*60 + int(mn or 0)
-        e1 = s1 + int(dur or 0)*60
-        if s1 < e0 and e1 > s0:
-            used += int(q or 0)
-    return used
-
-def check_availability(board_id:int, date_iso:str, start_h:int, start_m:int, duration_h:int, qty:int):
-    tot = q_one("SELECT total FROM boards WHERE id = ?", (board_id,))
-    total = int((tot[0] if tot else 0) or 0)
-    used = overlapping_quantity(board_id, date_iso, start_h, start_m, duration_h)
-    avail = max(0, total - used)
-    return (qty <= avail, avail, total)
+      WHERE board_id = ? AND date IN (?, ?) AND status IN ('waiting_partner','active','waiting_card','waiting_cash')
+        AND end_at > ? AND start_at < ?
+      UNION ALL
+      SELECT start_at, end_at, quantity
+      FROM capacity_holds
+      WHERE board_id = ? AND end_at > ? AND start_at < ? AND expires_at > ?
+    """, (board_id, date_iso, (day - timedelta(days=1)).isoformat(), day_start, day_start + DAY_MINUTES,
+          board_id, day_start, day_start + DAY_MINUTES, time.time()))
+    return DayTimeline(total, [(s1 - day_start, e1 - day_start, int(q or 0)) for s1, e1, q in rows])
+
+def check_availability(board_id:int, date_iso:str, start_h:int, start_m:int, duration_h:int, qty:int, timeline:DayTimeline=None):
+    if timeline is None:
+        timeline = board_day_timeline(board_id, date_iso)
+    s0 = start_h*60 + start_m
+    avail = timeline.free(s0, s0 + duration_h*60)
+    return (qty <= avail, avail, timeline.capacity)
 
 def daily_available(daily_id:int, date_iso:str) -> tuple[bool,int,int]:
     total_row = q_one("SELECT available_quantity FROM daily_boards WHERE id=? AND is_active=1", (daily_id,))
@@ -1775,18 +2124,14 @@ def daily_available(daily_id:int, date_iso:str) -> tuple[bool,int,int]:
     avail = max(0, total - used)
     return (avail > 0, avail, total)
 
-def dyn_price_for_board(board_id:int, base_price:float, date_iso:str, start_h:int, duration_h:int, qty:int) -> float:
-    try: dt = datetime.fromisoformat(date_iso)
-    except Exception: dt = datetime.now()
-    price = float(base_price)
-    weekend = dt.weekday() >= 5
-    if weekend and 16 <= start_h <= 21: price *= 1.15
-    elif not weekend and 7 <= start_h <= 10: price *= 0.90
-    used = overlapping_quantity(board_id, date_iso, start_h, 0, duration_h)
-    total = q_one("SELECT total FROM boards WHERE id = ?", (board_id,))[0] or 1
-    occ = min(1.0, used / float(total))
-    if occ > 0.6: price *= 1.10
-    return round(price, 2)
+# Движок цен (services/pricing.py): правила из PRICING_RULES, таблицы цен
+# доска/день кэшируются под версией занятости
+pricing = PriceEngine(load_rules(os.environ.get("PRICING_RULES")))
+
+def quote_board(board_id:int, base_price:float, date_iso:str, start_h:int, start_m:int, duration_h:int, qty:int, timeline:DayTimeline):
+    """Котировка по уже загруженной шкале занятости (без повторного чтения броней)"""
+    return pricing.quote(board_id, base_price, date.fromisoformat(date_iso), timeline,
+                         start_h*60 + start_m, duration_h*60, qty)
 
 def ymaps_api_url():
     key = os.environ.get("YMAPS_API_KEY")
@@ -1827,15 +2172,8 @@ def _ensure_logged(request, tg_id:int):
 # -----------------------------
 # Views — public / core
 # -----------------------------
-def landing(request):
-    ensure_schema()
-    ensure_admins_from_env()
-
-    loc_cnt = q_one("SELECT COUNT(*) FROM locations WHERE COALESCE(is_active,1)=1") or (0,)
-    brd_cnt = q_one("SELECT COALESCE(SUM(total),0) FROM boards WHERE COALESCE(is_active,1)=1") or (0,)
-    today = date.today().isoformat()
-    act_cnt = q_one("SELECT COUNT(*) FROM bookings WHERE date = ? AND status='active'", (today,)) or (0,)
-
+# ---------- Снимок главной страницы ----------
+def _landing_markers():
     # Агрегируем маркеры по локациям (а не по партнёрам, чтобы не дублировать totals)
     rows = q_all("""
       SELECT p.id, COALESCE(p.name,'Партнёр') as pname,
@@ -1852,30 +2190,120 @@ def landing(request):
     for pid, pname, lat, lon, kind, min_price, total in rows:
         markers.append({"partner_id": pid, "name": pname, "lat": float(lat), "lon": float(lon),
                         "kind": kind, "min_price": int(min_price or 0), "total": int(total or 0)})
+    return json.dumps(markers, ensure_ascii=False)
 
-    locs = [dict(id=r[0], name=r[1]) for r in q_all("SELECT id, name FROM locations WHERE COALESCE(is_active,1)=1 ORDER BY name")]
-    boards = [dict(id=r[0], name=r[1], price=r[2], total=r[3], location_id=r[4]) for r in q_all(
+def _landing_locations():
+    return [dict(id=r[0], name=r[1]) for r in q_all("SELECT id, name FROM locations WHERE COALESCE(is_active,1)=1 ORDER BY name")]
+
+def _landing_boards():
+    return [dict(id=r[0], name=r[1], price=r[2], total=r[3], location_id=r[4]) for r in q_all(
         "SELECT id, name, price, total, COALESCE(location_id,0) FROM boards WHERE COALESCE(is_active,1)=1 ORDER BY name"
     )]
-    daily_offers = [dict(id=r[0], name=r[1], price=r[2], partner_id=r[3], address=r[4]) for r in q_all(
+
+def _landing_daily_offers():
+    return [dict(id=r[0], name=r[1], price=r[2], partner_id=r[3], address=r[4]) for r in q_all(
         "SELECT id, name, daily_price, partner_id, COALESCE(address,'') FROM daily_boards WHERE is_active=1 ORDER BY id DESC"
     )]
 
+def _landing_stat():
+    loc_cnt = q_one("SELECT COUNT(*) FROM locations WHERE COALESCE(is_active,1)=1") or (0,)
+    brd_cnt = q_one("SELECT COALESCE(SUM(total),0) FROM boards WHERE COALESCE(is_active,1)=1") or (0,)
+    return {"locations": loc_cnt[0], "boards": int(brd_cnt[0])}
+
+# Раздел снимка: (функция сборки, таблицы, от которых он зависит)
+LANDING_SECTIONS = {
+    "markers_json": (_landing_markers, ("partners", "locations", "boards")),
+    "locations": (_landing_locations, ("locations",)),
+    "boards": (_landing_boards, ("boards",)),
+    "daily_offers": (_landing_daily_offers, ("daily_boards",)),
+    "stat": (_landing_stat, ("locations", "boards")),
+}
+
+class LandingSnapshot:
+    """Готовые данные главной страницы
+
+    Пока не истек ttl, страница собирается без обращений к БД. Затем
+    читаются счетчики cache_versions (их ведут триггеры) и пересобираются
+    только разделы, чьи таблицы изменились. Число активных броней за день
+    меняется слишком часто для триггеров — оно просто обновляется раз в ttl.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.sections = {}
+        self.active = 0
+        self.day = None
+        self.etag = ""
+        self.last_modified = None
+        self._versions = {}
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _fresh(self) -> bool:
+        return time.monotonic() - self._checked < self.ttl and self.day == date.today()
+
+    def get(self) -> "LandingSnapshot":
+        if not self._fresh():
+            with self._lock:
+                if not self._fresh():
+                    self._refresh()
+        return self
+
+    def invalidate(self):
+        self._checked = 0.0
+
+    def _refresh(self):
+        versions = dict(q_all("SELECT name, version FROM cache_versions"))
+        today = date.today()
+        changed = self.day != today
+        for name, (build, tables) in LANDING_SECTIONS.items():
+            if name not in self.sections or any(versions.get(t) != self._versions.get(t) for t in tables):
+                self.sections[name] = build()
+                changed = True
+        active = (q_one("SELECT COUNT(*) FROM bookings WHERE date = ? AND status='active'", (today.isoformat(),)) or (0,))[0]
+        if changed or active != self.active:
+            self.active = active
+            self.day = today
+            self.etag = hashlib.sha1(json.dumps([versions, active, today.isoformat()], sort_keys=True).encode()).hexdigest()
+            self.last_modified = datetime.now().replace(microsecond=0)
+        self._versions = versions
+        self._checked = time.monotonic()
+
+landing_snapshot = LandingSnapshot(float(os.environ.get("LANDING_SNAPSHOT_TTL", "30")))
+
+def _landing_etag(request):
+    # Страница содержит CSRF-токен и tg_id из сессии — они входят в ETag
+    ensure_schema()
+    visitor = f"{request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')}:{request.session.get('tg_id', '')}"
+    return hashlib.sha1(f"{landing_snapshot.get().etag}:{visitor}".encode()).hexdigest()
+
+def _landing_last_modified(request):
+    ensure_schema()
+    return landing_snapshot.get().last_modified
+
+@condition(etag_func=_landing_etag, last_modified_func=_landing_last_modified)
+def landing(request):
+    ensure_schema()
+    snap = landing_snapshot.get()
     ctx = {
-        "stat": {"locations": loc_cnt[0], "boards": int(brd_cnt[0]), "active": act_cnt[0]},
-        "locations": locs,
-        "boards": boards,
-        "daily_offers": daily_offers,
-        "today": today,
+        "stat": dict(snap.sections["stat"], active=snap.active),
+        "locations": snap.sections["locations"],
+        "boards": snap.sections["boards"],
+        "daily_offers": snap.sections["daily_offers"],
+        "today": snap.day.isoformat(),
         "map": {
             "lat": float(os.environ.get("MAP_DEFAULT_LAT", "55.751244")),
             "lon": float(os.environ.get("MAP_DEFAULT_LON", "37.618423")),
             "zoom": int(os.environ.get("MAP_DEFAULT_ZOOM", "11")),
-            "markers_json": json.dumps(markers, ensure_ascii=False),
+            "markers_json": snap.sections["markers_json"],
         },
         "ymaps_api": ymaps_api_url(),
     }
-    return render(request, "index.html", ctx)
+    response = render(request, "index.html", ctx)
+    # Персональная страница: кэшировать только в браузере, с перепроверкой
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ("Cookie",))
+    return response
 
 def about(request):
     ensure_schema()
@@ -1935,12 +2363,8 @@ def apply_coupon(code:str|None, amount:float) -> tuple[float, str|None]:
     if vf and today < date.fromisoformat(vf): return (amount, None)
     if vt and today > date.fromisoformat(vt): return (amount, None)
     if max_uses and used >= max_uses: return (amount, None)
-    if ctype == "percent":
-        amount = max(0.0, amount * (1 - float(val)/100.0))
-    else:
-        amount = max(0.0, amount - float(val))
     # ВНИМАНИЕ: не увеличиваем used здесь — только после оплаты в вебхуке
-    return (round(amount, 2), code.strip())
+    return (apply_discount(amount, ctype, val), code.strip())
 
 def book(request):
     ensure_schema()
@@ -1963,23 +2387,31 @@ def book(request):
                 if not row: return HttpResponse("Доска не найдена", status=404)
                 bname, base_price, total = row
 
-                price = dyn_price_for_board(board_id, base_price, date_iso, st_h, hours, qty)
-                amount = float(price) * hours * qty
-
-                ok, avail, total = check_availability(board_id, date_iso, st_h, st_m, hours, qty)
+                # Брони дня читаются один раз: и для доступности, и для цены
+                timeline = board_day_timeline(board_id, date_iso, int(total or 0))
+                ok, avail, total = check_availability(board_id, date_iso, st_h, st_m, hours, qty, timeline)
                 if not ok:
                     return HttpResponse(f"Недостаточно слотов: доступно {avail} из {total}", status=409)
 
-                amount, applied = apply_coupon(coupon_code, amount)
+                quote = quote_board(board_id, base_price, date_iso, st_h, st_m, hours, qty, timeline)
+                token = request.POST.get("quote")
+                if token and token != quote.token:
+                    return HttpResponse(f"Цена изменилась: {quote.unit_price:.2f} ₽/ч, итого {quote.amount:.2f} ₽. "
+                                        f"Отправьте бронь ещё раз.", status=409)
+
+                amount, applied = apply_coupon(coupon_code, quote.amount)
 
+                start_at = epoch_minutes(date.fromisoformat(date_iso), st_h*60 + st_m)
                 q_exec("""
                     INSERT INTO bookings(
                         user_id, board_id, board_name,
                         date, start_time, start_minute,
                         duration, quantity, amount,
-                        status, payment_method, payment_status, coupon_code, created_at
-                    ) VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, 'waiting_partner', 'site', 'unpaid', ?, datetime('now','localtime'))
-                """, (tg_id, board_id, bname, date_iso, st_h, st_m, hours, qty, amount, applied))
+                        status, payment_method, payment_status, coupon_code, created_at,
+                        start_at, end_at
+                    ) VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, 'waiting_partner', 'site', 'unpaid', ?, datetime('now','localtime'), ?, ?)
+                """, (tg_id, board_id, bname, date_iso, st_h, st_m, hours, qty, amount, applied,
+                      start_at, start_at + hours*60))
 
             else:  # daily
                 daily_id = int(request.POST.get("daily_board_id"))
@@ -2010,6 +2442,26 @@ def book(request):
     except Exception as e:
         return HttpResponse(f"Ошибка брони: {e}", status=400)
 
+def api_quote(request):
+    """Котировка почасовой брони для формы: цена, свободное количество и версия цен"""
+    ensure_schema()
+    try:
+        board_id = int(request.GET["board_id"])
+        date_iso = date.fromisoformat(request.GET["date"]).isoformat()
+        st_h, st_m = [int(x) for x in (request.GET.get("start") or "10:00").split(":")]
+        hours = max(1, int(request.GET.get("hours") or 1))
+        qty = max(1, int(request.GET.get("qty") or 1))
+    except Exception:
+        return JsonResponse({"error": "bad params"}, status=400)
+    row = q_one("SELECT price, total FROM boards WHERE id = ? AND COALESCE(is_active,1)=1", (board_id,))
+    if not row:
+        return JsonResponse({"error": "not found"}, status=404)
+    timeline = board_day_timeline(board_id, date_iso, int(row[1] or 0))
+    ok, avail, _ = check_availability(board_id, date_iso, st_h, st_m, hours, qty, timeline)
+    quote = quote_board(board_id, row[0], date_iso, st_h, st_m, hours, qty, timeline)
+    return JsonResponse({"unit_price": quote.unit_price, "amount": quote.amount, "quote": quote.token,
+                         "available": ok, "free": avail})
+
 # ---------- USER ----------
 def user_dashboard(request, tg_id: int):
     ensure_schema()
@@ -2052,6 +2504,18 @@ def _booking_amount(booking_id:int):
 
 import requests
 
+# Пул соединений к API YooKassa: создание платежей и сверка уведомлений
+YOOKASSA_API = "https://api.yookassa.ru/v3"
+YOOKASSA_TIMEOUT = float(os.environ.get("YOOKASSA_TIMEOUT", "10"))
+PAYMENT_STATUSES = ("pending", "succeeded", "canceled", "refunded", "failed")
+_yookassa_http = requests.Session()
+_yookassa_http.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=16))
+
+def _yookassa_auth():
+    shop_id = os.environ.get("YOOKASSA_SHOP_ID")
+    secret = os.environ.get("YOOKASSA_SECRET_KEY")
+    return (shop_id, secret) if shop_id and secret else None
+
 def _existing_pending_payment_url(booking_id:int):
     row = q_one("""
       SELECT confirmation_url, payload FROM payments
@@ -2085,9 +2549,8 @@ def pay_yookassa(request, booking_id:int):
     if pending_url:
         return redirect(pending_url)
 
-    shop_id = os.environ.get("YOOKASSA_SHOP_ID")
-    secret = os.environ.get("YOOKASSA_SECRET_KEY")
-    if not (shop_id and secret):
+    auth = _yookassa_auth()
+    if not auth:
         return HttpResponse("ЮKassa не настроена (env).", status=500)
 
     idempotence_key = str(uuid.uuid4())
@@ -2100,11 +2563,11 @@ def pay_yookassa(request, booking_id:int):
         "description": f"SUP Booking #{booking_id}",
         "metadata": {"booking_id": booking_id}
     }
-    resp = requests.post(
-        "https://api.yookassa.ru/v3/payments",
-        auth=(shop_id, secret),
+    resp = _yookassa_http.post(
+        f"{YOOKASSA_API}/payments",
+        auth=auth,
         headers={"Idempotence-Key": idempotence_key, "Content-Type":"application/json"},
-        json=payload, timeout=30
+        json=payload, timeout=YOOKASSA_TIMEOUT
     )
     if resp.status_code not in (200, 201):
         return HttpResponse(f"ЮKassa error: {resp.status_code} {resp.text}", status=502)
@@ -2118,58 +2581,166 @@ def pay_yookassa(request, booking_id:int):
     return redirect(confirmation_url or conf_url)
 
 def _yookassa_fetch_payment(pid:str):
-    shop_id = os.environ.get("YOOKASSA_SHOP_ID")
-    secret = os.environ.get("YOOKASSA_SECRET_KEY")
-    if not (shop_id and secret): return None
-    r = requests.get(f"https://api.yookassa.ru/v3/payments/{pid}", auth=(shop_id, secret), timeout=30)
+    """Платеж из API YooKassa; None — платежа нет или ЮKassa не настроена.
+    Сетевые ошибки и 5xx/429 пробрасываются: такое событие стоит повторить"""
+    auth = _yookassa_auth()
+    if not auth: return None
+    r = _yookassa_http.get(f"{YOOKASSA_API}/payments/{pid}", auth=auth, timeout=YOOKASSA_TIMEOUT)
+    if r.status_code == 429 or r.status_code >= 500:
+        r.raise_for_status()
     if r.status_code != 200: return None
     return r.json()
 
-@csrf_exempt
-def webhook_yookassa(request):
-    ensure_schema()
-    try:
-        data = json.loads(request.body.decode("utf-8"))
-        pid = data.get("object", {}).get("id")
-        status = data.get("object", {}).get("status")
-        meta = data.get("object", {}).get("metadata", {})
-        booking_id = int(meta.get("booking_id"))
-    except Exception:
-        return HttpResponse("bad", status=400)
+def _apply_yookassa_payment(pid:str, safe):
+    """Статусы платежа и брони по данным API YooKassa (вызывается в транзакции)
 
-    # обновим локально запись платежа
-    q_exec("UPDATE payments SET status=?, payload=?, updated_at=CURRENT_TIMESTAMP WHERE provider='yookassa' AND provider_payment_id=?",
-           (status, json.dumps(data, ensure_ascii=False), pid))
-
-    # Сверка через API YooKassa (anti-spoof)
-    safe = _yookassa_fetch_payment(pid)
+    Применяется текущее состояние платежа, а не содержимое уведомления,
+    поэтому повтор и порядок событий не важны; купон засчитывается только
+    при переходе брони в paid. Возвращает причину отклонения или None.
+    """
     if not safe:
-        return HttpResponse("bad", status=400)
-
+        return "payment not verified via API"
+    status = safe.get("status")
+    # Сначала запись: транзакция сразу берет блокировку записи
+    q_exec("UPDATE payments SET status=COALESCE(?, status), payload=?, updated_at=CURRENT_TIMESTAMP WHERE provider='yookassa' AND provider_payment_id=?",
+           (status if status in PAYMENT_STATUSES else None, json.dumps(safe, ensure_ascii=False), pid))
     try:
         s_amount = float((safe.get("amount") or {}).get("value") or 0)
         s_currency = (safe.get("amount") or {}).get("currency")
-        s_booking = int((safe.get("metadata") or {}).get("booking_id") or 0)
-        if s_booking != booking_id:
-            return HttpResponse("bad", status=400)
-        bamt = _booking_amount(booking_id)
-        if not bamt: return HttpResponse("bad", status=400)
-        b_amount, b_cur = bamt
-        if abs(s_amount - b_amount) > 0.01 or s_currency != b_cur:
-            return HttpResponse("bad", status=400)
-    except Exception:
-        return HttpResponse("bad", status=400)
+        booking_id = int((safe.get("metadata") or {}).get("booking_id") or 0)
+    except (TypeError, ValueError):
+        return "bad payment object"
+    row = q_one("SELECT amount, coupon_code FROM bookings WHERE id=?", (booking_id,))
+    if not row:
+        return f"booking {booking_id} not found"
+    if abs(s_amount - float(row[0])) > 0.01 or s_currency != "RUB":
+        return f"amount mismatch: {s_amount} {s_currency}, booking {row[0]} RUB"
 
-    status = safe.get("status")
     if status == "succeeded":
-        q_exec("UPDATE bookings SET payment_status='paid', status=CASE WHEN status IN ('waiting_partner','waiting_card','waiting_cash','waiting_daily') THEN 'active' ELSE status END WHERE id=?", (booking_id,))
+        with connections["default"].cursor() as c:
+            c.execute("UPDATE bookings SET payment_status='paid', status=CASE WHEN status IN ('waiting_partner','waiting_card','waiting_cash','waiting_daily') THEN 'active' ELSE status END WHERE id=? AND COALESCE(payment_status,'')<>'paid'", (booking_id,))
+            newly_paid = c.rowcount > 0
         # инкремент купона, если был применён
-        crow = q_one("SELECT coupon_code FROM bookings WHERE id=?", (booking_id,))
-        if crow and crow[0]:
-            q_exec("UPDATE coupons SET used = COALESCE(used,0) + 1 WHERE code=?", (crow[0],))
+        if newly_paid and row[1]:
+            q_exec("UPDATE coupons SET used = COALESCE(used,0) + 1 WHERE code=?", (row[1],))
     elif status in ("canceled","refunded"):
         q_exec("UPDATE bookings SET payment_status='failed' WHERE id=?", (booking_id,))
+    return None
+
+class PaymentInbox:
+    """Фоновая обработка уведомлений из payment_events пулом потоков
+
+    Поток забирает пачку событий одним UPDATE (метка claim и срок аренды
+    в available_at — события упавшего потока или процесса вернутся в
+    очередь по истечении аренды), сверяет каждый платеж с API один раз на
+    пачку и применяет изменения вместе с отметкой события в одной
+    транзакции. Сетевые ошибки — повтор с растущей паузой, после
+    max_attempts событие остается в статусе failed.
+    """
+
+    def __init__(self, workers: int, batch: int, max_attempts: int, lease: float = 300, idle: float = 5):
+        self.workers = workers
+        self.batch = batch
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self.idle = idle
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._started = False
+
+    def start(self):
+        if self._started or self.workers <= 0:
+            return
+        with self._lock:
+            if self._started:
+                return
+            for i in range(self.workers):
+                threading.Thread(target=self._run, name=f"payment-inbox-{i}", daemon=True).start()
+            self._started = True
+
+    def wake(self):
+        self.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            try:
+                processed = self.process_batch()
+            except Exception:
+                logger.exception("payment inbox batch failed")
+                processed = 0
+            if not processed:
+                self._wake.wait(self.idle)
+                self._wake.clear()
+
+    def _claim(self):
+        token = uuid.uuid4().hex
+        now = time.time()
+        q_exec("""
+            UPDATE payment_events SET status='processing', claim=?, attempts=attempts+1, available_at=?
+            WHERE id IN (
+                SELECT id FROM payment_events
+                WHERE status IN ('new','processing') AND available_at <= ?
+                ORDER BY id LIMIT ?
+            )
+        """, (token, now + self.lease, now, self.batch))
+        return q_all("SELECT id, provider, object_id, attempts FROM payment_events WHERE claim=? ORDER BY id", (token,))
+
+    def process_batch(self) -> int:
+        """Одна пачка событий; возвращает число обработанных"""
+        events = self._claim()
+        # Одно обращение к API на платеж, даже если по нему несколько событий
+        verified = {}
+        for _, provider, pid, _ in events:
+            if (provider, pid) in verified:
+                continue
+            try:
+                verified[(provider, pid)] = _yookassa_fetch_payment(pid) if provider == "yookassa" else None
+            except requests.RequestException as e:
+                verified[(provider, pid)] = e
+        for event_id, provider, pid, attempts in events:
+            safe = verified[(provider, pid)]
+            if isinstance(safe, Exception):
+                self._retry(event_id, attempts, str(safe))
+                continue
+            with transaction.atomic():
+                error = _apply_yookassa_payment(pid, safe)
+                q_exec("UPDATE payment_events SET status=?, error=?, claim=NULL, processed_at=CURRENT_TIMESTAMP WHERE id=?",
+                       ("rejected" if error else "done", error, event_id))
+            if error:
+                logger.warning(f"payment event {event_id} rejected: {error}")
+        return len(events)
+
+    def _retry(self, event_id:int, attempts:int, error:str):
+        failed = attempts >= self.max_attempts
+        q_exec("UPDATE payment_events SET status=?, available_at=?, claim=NULL, error=? WHERE id=?",
+               ("failed" if failed else "new", time.time() + min(3600, 30 * 2 ** (attempts - 1)), error[:500], event_id))
+
+payment_inbox = PaymentInbox(
+    workers=int(os.environ.get("PAYMENT_INBOX_WORKERS", "2")),
+    batch=int(os.environ.get("PAYMENT_INBOX_BATCH", "20")),
+    max_attempts=int(os.environ.get("PAYMENT_INBOX_MAX_ATTEMPTS", "8")),
+)
 
+@csrf_exempt
+def webhook_yookassa(request):
+    """Уведомление YooKassa: запись в payment_events и сразу ответ 200
+
+    Сверка с API и смена статусов — в PaymentInbox. Повтор того же
+    уведомления упирается в UNIQUE(provider, event_id) и ничего не меняет.
+    """
+    ensure_schema()
+    try:
+        raw = request.body.decode("utf-8")
+        data = json.loads(raw)
+        event = str(data["event"])
+        pid = str(data["object"]["id"])
+    except Exception:
+        return HttpResponse("bad", status=400)
+
+    q_exec("INSERT OR IGNORE INTO payment_events(provider, event_id, event, object_id, payload) VALUES('yookassa', ?, ?, ?, ?)",
+           (f"{event}:{pid}", event, pid, raw))
+    payment_inbox.wake()
     return HttpResponse("ok")
 
 # -----------------------------
@@ -2642,9 +3213,15 @@ def owner_showcase(request, partner_id: int):
     if not prow:
         return HttpResponseNotFound("Партнёр не найден")
     name = prow[0]
-    rating_row = q_one("SELECT COALESCE(AVG(value),0), COUNT(*) FROM ratings WHERE partner_id=?", (partner_id,))
-    rating = float(rating_row[0] or 0)
+    # Отзывы из бота — готовая сводка rating_stats (ведет ReviewService), плюс оценки сайта
+    rating_row = q_one("""
+        SELECT COALESCE((SELECT rating_sum FROM rating_stats WHERE scope='partner' AND scope_id=?), 0)
+               + COALESCE((SELECT SUM(value) FROM ratings WHERE partner_id=?), 0),
+               COALESCE((SELECT rating_count FROM rating_stats WHERE scope='partner' AND scope_id=?), 0)
+               + (SELECT COUNT(*) FROM ratings WHERE partner_id=?)
+    """, (partner_id, partner_id, partner_id, partner_id))
     rcount = int(rating_row[1] or 0)
+    rating = float(rating_row[0]) / rcount if rcount else 0.0
 
     boards = q_all("""
         SELECT brd.name, COALESCE(l.name,'—'), brd.price, brd.total
@@ -2835,37 +3412,177 @@ def admin_finance_partner_set_commission(request, tg_id:int, pid:int):
     return redirect(f"/admin/{tg_id}/finance/partner/{pid}/")
 
 # ---------- EXPORTS ----------
+# Выгрузки отдаются потоком: строки читаются с курсора порциями (q_iter)
+# и сразу уходят клиенту, так что память не зависит от объема истории.
+# Parquet/Arrow — для аналитиков, при установленном pyarrow.
+
+# (заголовок столбца, тип Arrow)
+BOOKING_EXPORT_COLUMNS = [
+    ("id", "int64"), ("user_id", "int64"), ("board", "string"), ("date", "string"),
+    ("start_h", "int64"), ("start_m", "int64"), ("hours", "float64"), ("qty", "int64"),
+    ("amount", "float64"), ("status", "string"), ("payment", "string"), ("created_at", "string"),
+]
+PAYMENT_EXPORT_COLUMNS = [
+    ("id", "int64"), ("booking_id", "int64"), ("provider", "string"), ("provider_payment_id", "string"),
+    ("amount", "float64"), ("currency", "string"), ("status", "string"),
+    ("created_at", "string"), ("updated_at", "string"),
+]
+EXPORT_FORMATS = {
+    # формат: (content type, расширение)
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+_ARROW_CAST = {"int64": int, "float64": float, "string": str}
+
+# Брони партнера: через обычные и суточные доски (индексы по board_id/daily_board_id)
+_PARTNER_BOOKINGS_SQL = """(b.board_id IN (SELECT id FROM boards WHERE partner_id = ?)
+    OR b.daily_board_id IN (SELECT id FROM daily_boards WHERE partner_id = ?))"""
+
+class _Echo:
+    """Псевдофайл для csv.writer: writerow возвращает готовую строку"""
+    def write(self, value):
+        return value
+
+class _ChunkSink:
+    """Псевдофайл для pyarrow: накапливает байты до очередной отдачи клиенту"""
+    closed = False
+
+    def __init__(self):
+        self._parts = []
+        self._pos = 0
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+def _csv_stream(columns, chunks):
+    w = csv.writer(_Echo())
+    yield w.writerow([name for name, _ in columns]).encode("utf-8")
+    for rows in chunks:
+        yield "".join(w.writerow(r) for r in rows).encode("utf-8")
+
+def _arrow_stream(columns, chunks, fmt: str):
+    import pyarrow as pa
+    schema = pa.schema([(name, pa.type_for_alias(kind)) for name, kind in columns])
+    sink = _ChunkSink()
+    out = pa.PythonFile(sink, mode="w")
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(out, schema)
+    else:
+        writer = pa.ipc.new_stream(out, schema)
+    for rows in chunks:
+        arrays = []
+        for i, (_, kind) in enumerate(columns):
+            cast = _ARROW_CAST[kind]
+            arrays.append([None if r[i] is None else cast(r[i]) for r in rows])
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+def _gzip_stream(parts):
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 — формат gzip
+    for part in parts:
+        data = z.compress(part)
+        if data:
+            yield data
+    yield z.flush()
+
+def _export_filters(request):
+    """Фильтры выгрузки из GET: (date_from, date_to, partner_id) или ValueError"""
+    date_from = request.GET.get("date_from") or None
+    date_to = request.GET.get("date_to") or None
+    partner = request.GET.get("partner") or None
+    if date_from:
+        date_from = date.fromisoformat(date_from).isoformat()
+    if date_to:
+        date_to = date.fromisoformat(date_to).isoformat()
+    return date_from, date_to, int(partner) if partner else None
+
+def _export_response(request, name: str, columns, sql: str, params):
+    fmt = request.GET.get("format") or "csv"
+    if fmt not in EXPORT_FORMATS:
+        return HttpResponse("unknown format", status=400)
+    if fmt != "csv":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return HttpResponse("pyarrow не установлен: доступна только выгрузка в CSV", status=501)
+    content_type, ext = EXPORT_FORMATS[fmt]
+    chunks = q_iter(sql, params)
+    body = _csv_stream(columns, chunks) if fmt == "csv" else _arrow_stream(columns, chunks, fmt)
+    if request.GET.get("gzip"):
+        body = _gzip_stream(body)
+        content_type, ext = "application/gzip", ext + ".gz"
+    resp = StreamingHttpResponse(body, content_type=content_type)
+    resp["Content-Disposition"] = f'attachment; filename="{name}.{ext}"'
+    return resp
+
 def export_bookings_csv(request, tg_id:int):
     ensure_schema()
     forb = _ensure_admin(request, tg_id)
     if forb: return forb
-    rows = q_all("""
-        SELECT id, user_id, board_name, date, start_time, start_minute, duration, quantity, amount, status, payment_status, created_at
-        FROM bookings ORDER BY id DESC
-    """)
-    resp = HttpResponse(content_type="text/csv; charset=utf-8")
-    resp["Content-Disposition"] = 'attachment; filename="bookings.csv"'
-    w = csv.writer(resp)
-    w.writerow(["id","user_id","board","date","start_h","start_m","hours","qty","amount","status","payment","created_at"])
-    for r in rows:
-        w.writerow(r)
-    return resp
+    try:
+        date_from, date_to, partner = _export_filters(request)
+    except ValueError:
+        return HttpResponse("bad filter", status=400)
+    where, params = [], []
+    if date_from:
+        where.append("b.date >= ?"); params.append(date_from)
+    if date_to:
+        where.append("b.date <= ?"); params.append(date_to)
+    if partner is not None:
+        where.append(_PARTNER_BOOKINGS_SQL); params += [partner, partner]
+    sql = f"""
+        SELECT b.id, b.user_id, b.board_name, b.date, b.start_time, b.start_minute, b.duration,
+               b.quantity, b.amount, b.status, b.payment_status, b.created_at
+        FROM bookings b
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY b.id DESC
+    """
+    return _export_response(request, "bookings", BOOKING_EXPORT_COLUMNS, sql, params)
 
 def export_payments_csv(request, tg_id:int):
     ensure_schema()
     forb = _ensure_admin(request, tg_id)
     if forb: return forb
-    rows = q_all("""
-        SELECT id, booking_id, provider, provider_payment_id, amount, currency, status, created_at, updated_at
-        FROM payments ORDER BY id DESC
-    """)
-    resp = HttpResponse(content_type="text/csv; charset=utf-8")
-    resp["Content-Disposition"] = 'attachment; filename="payments.csv"'
-    w = csv.writer(resp)
-    w.writerow(["id","booking_id","provider","provider_payment_id","amount","currency","status","created_at","updated_at"])
-    for r in rows:
-        w.writerow(r)
-    return resp
+    try:
+        date_from, date_to, partner = _export_filters(request)
+    except ValueError:
+        return HttpResponse("bad filter", status=400)
+    where, params = [], []
+    if date_from:
+        where.append("p.created_at >= ?"); params.append(date_from)
+    if date_to:
+        where.append("p.created_at < date(?, '+1 day')"); params.append(date_to)
+    if partner is not None:
+        where.append(f"p.booking_id IN (SELECT b.id FROM bookings b WHERE {_PARTNER_BOOKINGS_SQL})")
+        params += [partner, partner]
+    sql = f"""
+        SELECT p.id, p.booking_id, p.provider, p.provider_payment_id, p.amount, p.currency,
+               p.status, p.created_at, p.updated_at
+        FROM payments p
+        {"WHERE " + " AND ".join(where) if where else ""}
+        ORDER BY p.id DESC
+    """
+    return _export_response(request, "payments", PAYMENT_EXPORT_COLUMNS, sql, params)
 
 # ---------- STATIC UPLOADS SERVE ----------
 def serve_upload(request, fname:str):
@@ -2894,6 +3611,7 @@ urlpatterns = [
     path("logout/", logout_view),
 
     path("book/", book),
+    path("api/quote/", api_quote),
 
     # User
     path("user/<int:tg_id>/", user_dashboard),
@@ -2956,6 +3674,16 @@ urlpatterns = [
 # Entry
 # -----------------------------
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["migrate_schema"]:
+        migrate_schema()
+        print(f"Schema version: {schema_version()}")
+        sys.exit(0)
+    if sys.argv[1:2] == ["process_payment_events"]:
+        migrate_schema()
+        total = 0
+        while (n := payment_inbox.process_batch()):
+            total += n
+        print(f"Payment events processed: {total}")
+        sys.exit(0)
     ensure_schema()
-    ensure_admins_from_env()
     execute_from_command_line(sys.argv)